@@ -1,6 +1,7 @@
 import type { HttpContext } from '@adonisjs/core/http'
 import Municipio from '#models/municipio'
 import CacheService from '#services/cache_service'
+import { futronicService } from '#services/futronic_service'
 import os from 'os'
 
 export default class MonitoramentoController {
@@ -30,6 +31,9 @@ export default class MonitoramentoController {
       const municipios = await Municipio.query().where('ativo', true).count('* as total')
       const poolsAtivos = Number(municipios[0].$extras.total) || 0
 
+      // Biometria (API Futronic) - null quando a API está fora do ar
+      const biometria = await futronicService.obterMetricas()
+
       // Versões
       const nodeVersion = process.version
       const platform = os.platform()
@@ -64,6 +68,9 @@ export default class MonitoramentoController {
           poolsAtivos,
           status: 'online',
         },
+        biometria: biometria
+          ? { status: 'online', ...biometria }
+          : { status: 'offline' },
         timestamp: new Date().toISOString(),
       })
     } catch (error: any) {
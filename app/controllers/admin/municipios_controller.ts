@@ -2,6 +2,7 @@ import type { HttpContext } from '@adonisjs/core/http'
 import Municipio from '#models/municipio'
 import AuditService from '#services/audit_service'
 import DatabaseManagerService from '#services/database_manager_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
 import fs from 'node:fs'
 import path from 'node:path'
 import { fileURLToPath } from 'node:url'
@@ -244,6 +245,7 @@ export default class MunicipiosController {
 
       municipio.merge(dados)
       await municipio.save()
+      configuracaoMunicipioService.invalidar(municipio.id)
 
       // Registra auditoria
       await AuditService.logFromContext(
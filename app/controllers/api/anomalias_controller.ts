@@ -241,6 +241,9 @@ export default class AnomaliasController {
                 RETURNING id, data_hora, tipo
             `, [funcionarioId, dataHora, tipo, observacao || 'Registro adicionado manualmente'])
 
+            const { espelhoIncrementalService } = await import('#services/espelho_incremental_service')
+            await espelhoIncrementalService.marcarDias(municipioId, Number(funcionarioId), [result[0].data_hora])
+
             // Registra auditoria
             try {
                 await dbManager.queryMunicipio(municipioId, `
@@ -705,6 +708,9 @@ export default class AnomaliasController {
                 DELETE FROM registros_ponto WHERE id = $1
             `, [registroId])
 
+            const { espelhoIncrementalService } = await import('#services/espelho_incremental_service')
+            await espelhoIncrementalService.marcarDias(municipioId, registro[0].funcionario_id, [registro[0].data_hora])
+
             // Auditoria
             try {
                 await dbManager.queryMunicipio(municipioId, `
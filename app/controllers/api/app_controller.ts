@@ -427,6 +427,9 @@ export default class AppController {
 
             const logGps = latitude ? ` GPS: ${latitude},${longitude}` : ''
             const logOffline = isOffline ? ' [OFFLINE]' : ''
+            // Espelho aberto atualizado só no dia da batida
+            await this.marcarDiasEspelho(schema, funcionarioId, now, '[App Mobile]')
+
             console.log(`[App Mobile] ${funcionario.nome} - ${sentido} às ${now.toLocaleTimeString('pt-BR')}${logGps}${logOffline}`)
 
             // Emite WebSocket
@@ -2040,6 +2043,9 @@ export default class AppController {
                  latitude || null, longitude || null, new Date()]
             )
 
+            // Espelho aberto atualizado só no dia da batida
+            await this.marcarDiasEspelho(schema, funcionarioEncontrado.id, dataHoraRegistro, "[Sync Offline]")
+
             console.log(`[Sync Offline] ${funcionarioEncontrado.nome} - ${sentido} em ${dataHoraRegistro.toLocaleString("pt-BR")}`)
 
             try {
@@ -2090,4 +2096,23 @@ export default class AppController {
         }
     }
 
-}
\ No newline at end of file
+    /**
+     * Marca o dia da batida para a atualização incremental do espelho. As
+     * sessões do app guardam o schema da entidade: o município é o dono do
+     * schema. Falha aqui não desfaz a batida já gravada.
+     */
+    private async marcarDiasEspelho(schema: string, funcionarioId: number, dataHora: Date, prefixo: string) {
+        try {
+            const { dbManager } = await import('#services/database_manager_service')
+            const { espelhoIncrementalService } = await import('#services/espelho_incremental_service')
+            const municipio = await dbManager.queryCentral<{ id: number }>(
+                `SELECT id FROM public.municipios WHERE db_schema = $1 LIMIT 1`,
+                [schema]
+            )
+            if (municipio.length === 0) return
+            await espelhoIncrementalService.marcarDias(municipio[0].id, Number(funcionarioId), [dataHora])
+        } catch (error: any) {
+            console.error(`${prefixo} Erro ao marcar dia do espelho:`, error.message)
+        }
+    }
+}
@@ -1,5 +1,11 @@
 import type { HttpContext } from '@adonisjs/core/http'
 import { dbManager } from '#services/database_manager_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
+import {
+  bancoHorasSaldoService,
+  efeitoNoSaldo,
+  COLUNAS_MOVIMENTO,
+} from '#services/banco_horas_saldo_service'
 import { DateTime } from 'luxon'
 import AuditLog from '#models/audit_log'
 
@@ -17,23 +23,33 @@ export default class BancoHorasController {
       const mesAtual = mes || DateTime.now().month
       const anoAtual = ano || DateTime.now().year
 
+      await bancoHorasSaldoService.garantirTabelas(tenant.municipioId)
+
+      // Saldos materializados: fechamento do mês, último fechamento até o mês
+      // (saldo no fim do mês) e saldo corrente
       let query = `
         SELECT
           f.id as funcionario_id,
           f.nome,
           f.matricula,
           l.nome as lotacao_nome,
-          COALESCE(bhs.saldo_final, 0) as saldo_atual,
+          COALESCE(fm.saldo_final, 0) as saldo_atual,
           COALESCE(bhs.creditos, 0) as creditos_mes,
           COALESCE(bhs.debitos, 0) as debitos_mes,
           COALESCE(bhs.compensacoes, 0) as compensacoes_mes,
-          (SELECT COALESCE(SUM(CASE WHEN tipo_operacao = 'CREDITO' THEN minutos ELSE -minutos END), 0)
-           FROM banco_horas bh WHERE bh.funcionario_id = f.id) as saldo_total
+          COALESCE(bsa.saldo, 0) as saldo_total
         FROM funcionarios f
         LEFT JOIN lotacoes l ON l.id = f.lotacao_id
         LEFT JOIN secretarias s ON s.id = l.secretaria_id
         LEFT JOIN banco_horas_saldo bhs ON bhs.funcionario_id = f.id
           AND bhs.mes = $1 AND bhs.ano = $2
+        LEFT JOIN LATERAL (
+          SELECT saldo_final FROM banco_horas_saldo
+          WHERE funcionario_id = f.id AND (ano, mes) <= ($2::int, $1::int)
+          ORDER BY ano DESC, mes DESC
+          LIMIT 1
+        ) fm ON true
+        LEFT JOIN banco_horas_saldo_atual bsa ON bsa.funcionario_id = f.id
         WHERE f.ativo = true
       `
       const params: any[] = [mesAtual, anoAtual]
@@ -119,27 +135,14 @@ export default class BancoHorasController {
 
       const movimentacoes = await dbManager.queryMunicipio(tenant.municipioId, query, params)
 
-      // Calcula saldo total
-      const [saldoResult] = await dbManager.queryMunicipio<{ saldo: number }>(
-        tenant.municipioId,
-        `SELECT COALESCE(SUM(
-          CASE
-            WHEN tipo_operacao IN ('CREDITO', 'AJUSTE') AND minutos > 0 THEN minutos
-            WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO', 'VENCIMENTO') THEN -ABS(minutos)
-            WHEN tipo_operacao = 'AJUSTE' AND minutos < 0 THEN minutos
-            ELSE 0
-          END
-        ), 0) as saldo
-        FROM banco_horas
-        WHERE funcionario_id = $1`,
-        [funcionario_id]
-      )
+      // Saldo total (materializado)
+      const saldo = await bancoHorasSaldoService.saldoAtual(tenant.municipioId, Number(funcionario_id))
 
       return response.json({
         funcionario,
         movimentacoes,
-        saldo_total: saldoResult?.saldo || 0,
-        saldo_formatado: formatarMinutos(saldoResult?.saldo || 0)
+        saldo_total: saldo,
+        saldo_formatado: formatarMinutos(saldo)
       })
     } catch (error) {
       console.error('Erro ao obter extrato:', error)
@@ -169,13 +172,7 @@ export default class BancoHorasController {
 
     try {
       // Busca configurações de limite
-      const config = await dbManager.queryMunicipioOne<{
-        limite_acumulo_positivo: number
-        limite_acumulo_negativo: number
-      }>(
-        tenant.municipioId,
-        `SELECT limite_acumulo_positivo, limite_acumulo_negativo FROM banco_horas_config WHERE id = 1`
-      )
+      const { bancoHoras: config } = await configuracaoMunicipioService.obter(tenant.municipioId)
 
       const limitePositivo = config?.limite_acumulo_positivo || 2400 // 40h
       const limiteNegativo = config?.limite_acumulo_negativo || 600 // 10h
@@ -209,31 +206,31 @@ export default class BancoHorasController {
         })
       }
 
-      // Busca saldo atual
-      const [saldoAtual] = await dbManager.queryMunicipio<{ saldo: number }>(
-        tenant.municipioId,
-        `SELECT COALESCE(SUM(
-          CASE
-            WHEN tipo_operacao IN ('CREDITO', 'AJUSTE') AND minutos > 0 THEN minutos
-            WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO', 'VENCIMENTO') THEN -ABS(minutos)
-            WHEN tipo_operacao = 'AJUSTE' AND minutos < 0 THEN minutos
-            ELSE 0
-          END
-        ), 0) as saldo
-        FROM banco_horas
-        WHERE funcionario_id = $1`,
-        [funcionario_id]
-      )
+      // Ajuste guarda o sinal (negativo = retirada); as demais operações o valor absoluto
+      const minutosGravados = tipo_operacao === 'AJUSTE' ? Number(minutos) : Math.abs(minutos)
 
-      const saldoAnterior = saldoAtual?.saldo || 0
-      let novoSaldo = saldoAnterior
+      // Saldo travado, limites conferidos e movimentação gravada na mesma transação
+      await bancoHorasSaldoService.garantirTabelas(tenant.municipioId)
+      const gravacao = await dbManager.transactionMunicipio(tenant.municipioId, async (client) => {
+        const saldos = await bancoHorasSaldoService.travar(client, [funcionario_id])
+        const saldoAnterior = saldos.get(Number(funcionario_id)) ?? 0
+        const novoSaldo = saldoAnterior + efeitoNoSaldo(tipo_operacao, minutosGravados)
 
-      // Calcula novo saldo
-      if (['CREDITO'].includes(tipo_operacao) || (tipo_operacao === 'AJUSTE' && minutos > 0)) {
-        novoSaldo += Math.abs(minutos)
-      } else {
-        novoSaldo -= Math.abs(minutos)
-      }
+        if (novoSaldo > limitePositivo || novoSaldo < -limiteNegativo) {
+          return { id: null, saldoAnterior, novoSaldo }
+        }
+
+        const { rows: [movimento] } = await client.query(
+          `INSERT INTO banco_horas
+            (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao, observacao, aprovado, aprovado_por, aprovado_em)
+           VALUES ($1, $2, $3, $4, $5, $6, 'MANUAL', $7, $8, true, $9, NOW())
+           RETURNING id, ${COLUNAS_MOVIMENTO}`,
+          [funcionario_id, data, tipo_operacao, minutosGravados, saldoAnterior, novoSaldo, descricao, observacao, tenant.usuario?.funcionario_id]
+        )
+        await bancoHorasSaldoService.registrar(client, [movimento])
+        return { id: movimento.id as number, saldoAnterior, novoSaldo }
+      })
+      const { saldoAnterior, novoSaldo } = gravacao
 
       // Valida limites de acúmulo
       if (novoSaldo > limitePositivo) {
@@ -286,23 +283,13 @@ export default class BancoHorasController {
         )
       }
 
-      // Insere movimentação
-      const [result] = await dbManager.queryMunicipio<{ id: number }>(
-        tenant.municipioId,
-        `INSERT INTO banco_horas
-          (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao, observacao, aprovado, aprovado_por, aprovado_em)
-         VALUES ($1, $2, $3, $4, $5, $6, 'MANUAL', $7, $8, true, $9, NOW())
-         RETURNING id`,
-        [funcionario_id, data, tipo_operacao, Math.abs(minutos), saldoAnterior, novoSaldo, descricao, observacao, tenant.usuario?.funcionario_id]
-      )
-
       // Auditoria
       await AuditLog.registrar({
         usuarioId: tenant.usuario?.id,
         usuarioTipo: tenant.isSuperAdmin ? 'master' : 'municipal',
         acao: 'ADICIONAR_BANCO_HORAS',
         tabela: 'banco_horas',
-        registroId: result.id,
+        registroId: gravacao.id!,
         dadosNovos: { funcionario_id, data, tipo_operacao, minutos, descricao },
         ip: request.ip(),
         userAgent: request.header('user-agent'),
@@ -310,7 +297,7 @@ export default class BancoHorasController {
 
       return response.created({
         success: true,
-        id: result.id,
+        id: gravacao.id,
         saldo_anterior: saldoAnterior,
         saldo_atual: novoSaldo,
         saldo_formatado: formatarMinutos(novoSaldo),
@@ -359,48 +346,40 @@ export default class BancoHorasController {
         })
       }
 
-      // Verifica saldo disponível
-      const [saldoAtual] = await dbManager.queryMunicipio<{ saldo: number }>(
-        tenant.municipioId,
-        `SELECT COALESCE(SUM(
-          CASE
-            WHEN tipo_operacao IN ('CREDITO', 'AJUSTE') AND minutos > 0 THEN minutos
-            WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO', 'VENCIMENTO') THEN -ABS(minutos)
-            WHEN tipo_operacao = 'AJUSTE' AND minutos < 0 THEN minutos
-            ELSE 0
-          END
-        ), 0) as saldo
-        FROM banco_horas
-        WHERE funcionario_id = $1`,
-        [funcionario_id]
-      )
+      // Verifica saldo disponível e registra a compensação com o saldo travado
+      await bancoHorasSaldoService.garantirTabelas(tenant.municipioId)
+      const compensacao = await dbManager.transactionMunicipio(tenant.municipioId, async (client) => {
+        const saldos = await bancoHorasSaldoService.travar(client, [funcionario_id])
+        const saldoDisponivel = saldos.get(Number(funcionario_id)) ?? 0
+        if (saldoDisponivel < minutos) {
+          return { id: null, saldo: saldoDisponivel, novoSaldo: saldoDisponivel }
+        }
 
-      const saldo = saldoAtual?.saldo || 0
+        const saldoFinal = saldoDisponivel - Math.abs(minutos)
+        const { rows: [movimento] } = await client.query(
+          `INSERT INTO banco_horas
+            (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao, aprovado, aprovado_por, aprovado_em)
+           VALUES ($1, $2, 'COMPENSACAO', $3, $4, $5, 'MANUAL', $6, true, $7, NOW())
+           RETURNING id, ${COLUNAS_MOVIMENTO}`,
+          [funcionario_id, data, Math.abs(minutos), saldoDisponivel, saldoFinal, descricao || 'Compensação de horas', tenant.usuario?.funcionario_id]
+        )
+        await bancoHorasSaldoService.registrar(client, [movimento])
+        return { id: movimento.id as number, saldo: saldoDisponivel, novoSaldo: saldoFinal }
+      })
+      const { saldo, novoSaldo } = compensacao
 
-      if (saldo < minutos) {
+      if (compensacao.id === null) {
         return response.badRequest({
           error: `Saldo insuficiente. Disponível: ${formatarMinutos(saldo)}, Solicitado: ${formatarMinutos(minutos)}`
         })
       }
 
-      const novoSaldo = saldo - Math.abs(minutos)
-
-      // Registra compensação
-      const [result] = await dbManager.queryMunicipio<{ id: number }>(
-        tenant.municipioId,
-        `INSERT INTO banco_horas
-          (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao, aprovado, aprovado_por, aprovado_em)
-         VALUES ($1, $2, 'COMPENSACAO', $3, $4, $5, 'MANUAL', $6, true, $7, NOW())
-         RETURNING id`,
-        [funcionario_id, data, Math.abs(minutos), saldo, novoSaldo, descricao || 'Compensação de horas', tenant.usuario?.funcionario_id]
-      )
-
       await AuditLog.registrar({
         usuarioId: tenant.usuario?.id,
         usuarioTipo: tenant.isSuperAdmin ? 'master' : 'municipal',
         acao: 'COMPENSAR_BANCO_HORAS',
         tabela: 'banco_horas',
-        registroId: result.id,
+        registroId: compensacao.id,
         dadosNovos: { funcionario_id, data, minutos, descricao },
         ip: request.ip(),
         userAgent: request.header('user-agent'),
@@ -497,6 +476,7 @@ export default class BancoHorasController {
           dados.ativo
         ]
       )
+      configuracaoMunicipioService.invalidar(tenant.municipioId)
 
       return response.json({ success: true, message: 'Configurações atualizadas' })
     } catch (error) {
@@ -514,62 +494,32 @@ export default class BancoHorasController {
     }
 
     try {
+      await bancoHorasSaldoService.garantirTabelas(tenant.municipioId)
+
       // Total de funcionários com saldo positivo
       const [positivos] = await dbManager.queryMunicipio<{ count: number; total: number }>(
         tenant.municipioId,
-        `SELECT COUNT(DISTINCT funcionario_id) as count,
-                COALESCE(SUM(saldo), 0) as total
-         FROM (
-           SELECT funcionario_id,
-                  SUM(CASE
-                    WHEN tipo_operacao IN ('CREDITO', 'AJUSTE') AND minutos > 0 THEN minutos
-                    WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO', 'VENCIMENTO') THEN -ABS(minutos)
-                    WHEN tipo_operacao = 'AJUSTE' AND minutos < 0 THEN minutos
-                    ELSE 0
-                  END) as saldo
-           FROM banco_horas
-           GROUP BY funcionario_id
-           HAVING SUM(CASE
-                    WHEN tipo_operacao IN ('CREDITO', 'AJUSTE') AND minutos > 0 THEN minutos
-                    WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO', 'VENCIMENTO') THEN -ABS(minutos)
-                    WHEN tipo_operacao = 'AJUSTE' AND minutos < 0 THEN minutos
-                    ELSE 0
-                  END) > 0
-         ) sub`
+        `SELECT COUNT(*) as count, COALESCE(SUM(saldo), 0) as total
+         FROM banco_horas_saldo_atual
+         WHERE saldo > 0`
       )
 
       // Total de funcionários com saldo negativo
       const [negativos] = await dbManager.queryMunicipio<{ count: number; total: number }>(
         tenant.municipioId,
-        `SELECT COUNT(DISTINCT funcionario_id) as count,
-                COALESCE(SUM(saldo), 0) as total
-         FROM (
-           SELECT funcionario_id,
-                  SUM(CASE
-                    WHEN tipo_operacao IN ('CREDITO', 'AJUSTE') AND minutos > 0 THEN minutos
-                    WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO', 'VENCIMENTO') THEN -ABS(minutos)
-                    WHEN tipo_operacao = 'AJUSTE' AND minutos < 0 THEN minutos
-                    ELSE 0
-                  END) as saldo
-           FROM banco_horas
-           GROUP BY funcionario_id
-           HAVING SUM(CASE
-                    WHEN tipo_operacao IN ('CREDITO', 'AJUSTE') AND minutos > 0 THEN minutos
-                    WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO', 'VENCIMENTO') THEN -ABS(minutos)
-                    WHEN tipo_operacao = 'AJUSTE' AND minutos < 0 THEN minutos
-                    ELSE 0
-                  END) < 0
-         ) sub`
+        `SELECT COUNT(*) as count, COALESCE(SUM(saldo), 0) as total
+         FROM banco_horas_saldo_atual
+         WHERE saldo < 0`
       )
 
-      // Movimentações do mês atual
+      // Movimentações do mês atual (fechamentos do mês)
       const [movMes] = await dbManager.queryMunicipio<{ creditos: number; debitos: number }>(
         tenant.municipioId,
         `SELECT
-          COALESCE(SUM(CASE WHEN tipo_operacao = 'CREDITO' THEN minutos ELSE 0 END), 0) as creditos,
-          COALESCE(SUM(CASE WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO') THEN minutos ELSE 0 END), 0) as debitos
-         FROM banco_horas
-         WHERE EXTRACT(MONTH FROM data) = $1 AND EXTRACT(YEAR FROM data) = $2`,
+          COALESCE(SUM(creditos), 0) as creditos,
+          COALESCE(SUM(debitos + compensacoes), 0) as debitos
+         FROM banco_horas_saldo
+         WHERE mes = $1 AND ano = $2`,
         [DateTime.now().month, DateTime.now().year]
       )
 
@@ -637,23 +587,27 @@ export default class BancoHorasController {
 
       const movimentacoes = await dbManager.queryMunicipio(tenant.municipioId, query, params)
 
-      // Resumo
+      await bancoHorasSaldoService.garantirTabelas(tenant.municipioId)
+
+      // Resumo (fechamentos mensais)
       const [resumoResult] = await dbManager.queryMunicipio<{
         creditos: number
         debitos: number
         compensacoes: number
+        saldo: number
       }>(
         tenant.municipioId,
         `SELECT
-          COALESCE(SUM(CASE WHEN tipo_operacao = 'CREDITO' THEN minutos ELSE 0 END), 0) as creditos,
-          COALESCE(SUM(CASE WHEN tipo_operacao = 'DEBITO' THEN ABS(minutos) ELSE 0 END), 0) as debitos,
-          COALESCE(SUM(CASE WHEN tipo_operacao = 'COMPENSACAO' THEN ABS(minutos) ELSE 0 END), 0) as compensacoes
-         FROM banco_horas`
+          COALESCE(SUM(creditos), 0) as creditos,
+          COALESCE(SUM(debitos), 0) as debitos,
+          COALESCE(SUM(compensacoes), 0) as compensacoes,
+          COALESCE(SUM(variacao), 0) as saldo
+         FROM banco_horas_saldo`
       )
 
-      const saldo = (resumoResult?.creditos || 0) - (resumoResult?.debitos || 0) - (resumoResult?.compensacoes || 0)
+      const saldo = Number(resumoResult?.saldo || 0)
 
-      // Saldos por funcionário
+      // Saldos por funcionário (saldo corrente e totais dos fechamentos)
       const saldos = await dbManager.queryMunicipio(
         tenant.municipioId,
         `SELECT
@@ -661,21 +615,16 @@ export default class BancoHorasController {
           f.nome,
           f.matricula,
           l.nome as lotacao_nome,
-          COALESCE(SUM(CASE WHEN bh.tipo_operacao = 'CREDITO' THEN bh.minutos ELSE 0 END), 0) as creditos,
-          COALESCE(SUM(CASE WHEN bh.tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO') THEN ABS(bh.minutos) ELSE 0 END), 0) as debitos,
-          COALESCE(SUM(
-            CASE
-              WHEN bh.tipo_operacao = 'CREDITO' THEN bh.minutos
-              WHEN bh.tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO') THEN -ABS(bh.minutos)
-              ELSE 0
-            END
-          ), 0) as saldo
-         FROM funcionarios f
+          COALESCE(SUM(bhs.creditos), 0) as creditos,
+          COALESCE(SUM(bhs.debitos + bhs.compensacoes + bhs.pagamentos), 0) as debitos,
+          a.saldo
+         FROM banco_horas_saldo_atual a
+         JOIN funcionarios f ON f.id = a.funcionario_id
          LEFT JOIN lotacoes l ON l.id = f.lotacao_id
-         LEFT JOIN banco_horas bh ON bh.funcionario_id = f.id
+         LEFT JOIN banco_horas_saldo bhs ON bhs.funcionario_id = a.funcionario_id
          WHERE f.ativo = true
-         GROUP BY f.id, f.nome, f.matricula, l.nome
-         HAVING SUM(CASE WHEN bh.id IS NOT NULL THEN 1 ELSE 0 END) > 0
+         GROUP BY f.id, f.nome, f.matricula, l.nome, a.saldo
+         HAVING COUNT(bhs.id) > 0
          ORDER BY f.nome`
       )
 
@@ -728,40 +677,44 @@ export default class BancoHorasController {
       }
 
       // Busca configurações de limite
-      const config = await dbManager.queryMunicipioOne<{
-        limite_acumulo_positivo: number
-        limite_acumulo_negativo: number
-      }>(
-        tenant.municipioId,
-        `SELECT limite_acumulo_positivo, limite_acumulo_negativo FROM banco_horas_config WHERE id = 1`
-      )
+      const { bancoHoras: config } = await configuracaoMunicipioService.obter(tenant.municipioId)
 
       const limitePositivo = config?.limite_acumulo_positivo || 2400
       const limiteNegativo = config?.limite_acumulo_negativo || 600
 
-      // Busca saldo atual
-      const [saldoAtual] = await dbManager.queryMunicipio<{ saldo: number }>(
-        tenant.municipioId,
-        `SELECT COALESCE(SUM(
-          CASE
-            WHEN tipo_operacao = 'CREDITO' THEN minutos
-            WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO') THEN -ABS(minutos)
-            ELSE 0
-          END
-        ), 0) as saldo
-        FROM banco_horas
-        WHERE funcionario_id = $1`,
-        [funcionario_id]
-      )
+      // Saldo travado, limites conferidos e movimentação gravada na mesma transação
+      await bancoHorasSaldoService.garantirTabelas(tenant.municipioId)
+      const gravacao = await dbManager.transactionMunicipio(tenant.municipioId, async (client) => {
+        const saldos = await bancoHorasSaldoService.travar(client, [funcionario_id])
+        const saldoAnterior = saldos.get(Number(funcionario_id)) ?? 0
+        const novoSaldo = saldoAnterior + efeitoNoSaldo(tipo_operacao, minutos)
 
-      const saldoAnterior = saldoAtual?.saldo || 0
-      let novoSaldo = saldoAnterior
+        if (novoSaldo > limitePositivo || novoSaldo < -limiteNegativo) {
+          return { id: null, saldoAnterior, novoSaldo }
+        }
 
-      if (tipo_operacao === 'CREDITO') {
-        novoSaldo += Math.abs(minutos)
-      } else {
-        novoSaldo -= Math.abs(minutos)
-      }
+        const { rows: [movimento] } = await client.query(
+          `INSERT INTO banco_horas
+            (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao, aprovado, aprovado_por, aprovado_em)
+           VALUES ($1, $2, $3, $4, $5, $6, 'MANUAL', $7, $8, $9, $10)
+           RETURNING id, ${COLUNAS_MOVIMENTO}`,
+          [
+            funcionario_id,
+            data,
+            tipo_operacao,
+            minutos,
+            saldoAnterior,
+            novoSaldo,
+            descricao,
+            aprovado === true || aprovado === 'true',
+            aprovado ? tenant.usuario?.funcionario_id : null,
+            aprovado ? DateTime.now().toSQL() : null
+          ]
+        )
+        await bancoHorasSaldoService.registrar(client, [movimento])
+        return { id: movimento.id as number, saldoAnterior, novoSaldo }
+      })
+      const { saldoAnterior, novoSaldo } = gravacao
 
       // Valida limites de acúmulo
       if (novoSaldo > limitePositivo) {
@@ -776,38 +729,18 @@ export default class BancoHorasController {
         })
       }
 
-      const [result] = await dbManager.queryMunicipio<{ id: number }>(
-        tenant.municipioId,
-        `INSERT INTO banco_horas
-          (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao, aprovado, aprovado_por, aprovado_em)
-         VALUES ($1, $2, $3, $4, $5, $6, 'MANUAL', $7, $8, $9, $10)
-         RETURNING id`,
-        [
-          funcionario_id,
-          data,
-          tipo_operacao,
-          minutos,
-          saldoAnterior,
-          novoSaldo,
-          descricao,
-          aprovado === true || aprovado === 'true',
-          aprovado ? tenant.usuario?.funcionario_id : null,
-          aprovado ? DateTime.now().toSQL() : null
-        ]
-      )
-
       await AuditLog.registrar({
         usuarioId: tenant.usuario?.id,
         usuarioTipo: tenant.isSuperAdmin ? 'master' : 'municipal',
         acao: 'CRIAR_BANCO_HORAS',
         tabela: 'banco_horas',
-        registroId: result.id,
+        registroId: gravacao.id!,
         dadosNovos: { funcionario_id, data, tipo_operacao, minutos },
         ip: request.ip(),
         userAgent: request.header('user-agent'),
       })
 
-      return response.created({ success: true, id: result.id })
+      return response.created({ success: true, id: gravacao.id })
     } catch (error) {
       console.error('Erro ao criar movimentação:', error)
       return response.internalServerError({ error: 'Erro ao criar movimentação' })
@@ -889,11 +822,15 @@ export default class BancoHorasController {
         })
       }
 
-      await dbManager.queryMunicipio(
-        tenant.municipioId,
-        `DELETE FROM banco_horas WHERE id = $1`,
-        [params.id]
-      )
+      await bancoHorasSaldoService.garantirTabelas(tenant.municipioId)
+      await dbManager.transactionMunicipio(tenant.municipioId, async (client) => {
+        await bancoHorasSaldoService.travar(client, [movimentacao.funcionario_id])
+        const { rows: removidas } = await client.query(
+          `DELETE FROM banco_horas WHERE id = $1 RETURNING ${COLUNAS_MOVIMENTO}`,
+          [params.id]
+        )
+        await bancoHorasSaldoService.registrar(client, removidas, -1)
+      })
 
       await AuditLog.registrar({
         usuarioId: tenant.usuario?.id,
@@ -1,6 +1,7 @@
 import type { HttpContext } from '@adonisjs/core/http'
 import { dbManager } from '#services/database_manager_service'
 import { cacheService } from '#services/cache_service'
+import { escalaPlantaoService } from '#services/escala_plantao_service'
 import type { Funcionario, DataTableResponse } from '#models/tenant/types'
 import AuditLog from '#models/audit_log'
 
@@ -424,6 +425,11 @@ export default class FuncionariosController {
         ]
       )
 
+      // Troca de jornada: a escala de plantão gravada deixa de valer
+      if (data.jornada_id && Number(data.jornada_id) !== Number(anterior.jornada_id)) {
+        await escalaPlantaoService.invalidarFuncionarios(tenant.municipioId, [Number(params.id)])
+      }
+
       // Registra auditoria
       await AuditLog.registrar({
         usuarioId: tenant.usuario?.id,
@@ -533,6 +539,8 @@ export default class FuncionariosController {
         `DELETE FROM anomalias WHERE funcionario_id = $1`,
         `DELETE FROM afastamentos WHERE funcionario_id = $1`,
         `DELETE FROM banco_horas WHERE funcionario_id = $1`,
+        `DELETE FROM banco_horas_saldo WHERE funcionario_id = $1`,
+        `DELETE FROM banco_horas_saldo_atual WHERE funcionario_id = $1`,
         `DELETE FROM folgas_programadas WHERE funcionario_id = $1`,
         `DELETE FROM funcionarios_setor WHERE funcionario_id = $1`,
       ]
@@ -624,6 +632,7 @@ export default class FuncionariosController {
         `UPDATE funcionarios SET jornada_id = $1, updated_at = NOW() WHERE id = $2`,
         [jornada_id, params.id]
       )
+      await escalaPlantaoService.invalidarFuncionarios(tenant.municipioId, [Number(params.id)])
 
       return response.json({ success: true })
     } catch (error) {
@@ -665,6 +674,7 @@ export default class FuncionariosController {
 
       // Invalida cache
       cacheService.clearEntidade(tenant.municipioId, 'funcionarios', tenant.entidadeId)
+      await escalaPlantaoService.invalidarFuncionarios(tenant.municipioId, funcionario_ids.map(Number))
 
       return response.json({ success: true, atualizados: funcionario_ids.length })
     } catch (error) {
@@ -4,6 +4,15 @@ import { DateTime } from 'luxon'
 import AuditLog from '#models/audit_log'
 import { calculoPontoService } from '#services/calculo_ponto_service'
 import EspelhoPontoService from '#services/espelho_ponto_service'
+import { fechamentoPeriodoService } from '#services/fechamento_periodo_service'
+import { espelhoIncrementalService } from '#services/espelho_incremental_service'
+import { espelhoCacheService } from '#services/espelho_cache_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
+import {
+  bancoHorasSaldoService,
+  COLUNAS_MOVIMENTO,
+  type MovimentoBancoHoras,
+} from '#services/banco_horas_saldo_service'
 
 export default class PontoController {
   /**
@@ -139,6 +148,9 @@ export default class PontoController {
         [funcionario_id, data_hora, tipo || null, justificativa, tenant.usuario?.funcionario_id]
       )
 
+      // Atualiza o espelho aberto só no dia alterado
+      await espelhoIncrementalService.marcarDias(tenant.municipioId, Number(funcionario_id), [data_hora])
+
       // Auditoria
       await AuditLog.registrar({
         usuarioId: tenant.usuario?.id,
@@ -159,6 +171,9 @@ export default class PontoController {
 
   /**
    * Obtém espelho de ponto de um funcionário
+   *
+   * Servido pelo cache de espelhos (espelho_cache_service): a versão é
+   * conferida a cada leitura e muda com qualquer alteração de marcação.
    */
   async obterEspelho({ request, response, tenant }: HttpContext) {
     if (!tenant?.municipioId) {
@@ -172,71 +187,15 @@ export default class PontoController {
     }
 
     try {
-      // Busca espelho existente no banco
-      const espelhoSalvo = await dbManager.queryMunicipioOne<{
-        id: number
-        funcionario_id: number
-        mes: number
-        ano: number
-        dias_trabalhados: number
-        horas_trabalhadas: number
-        horas_extras: number
-        horas_faltantes: number
-        atrasos: number
-        faltas: number
-        status: string
-        dados: any
-      }>(
-        tenant.municipioId,
-        `SELECT * FROM espelhos_ponto WHERE funcionario_id = $1 AND mes = $2 AND ano = $3`,
-        [funcionario_id, mes, ano]
-      )
-
-      // Busca funcionário
-      const funcionario = await dbManager.queryMunicipioOne(
-        tenant.municipioId,
-        `SELECT f.*, j.nome as jornada_nome, j.carga_horaria_diaria, j.carga_horaria_semanal,
-                l.nome as lotacao_nome, s.nome as secretaria_nome
-         FROM funcionarios f
-         LEFT JOIN jornadas j ON j.id = f.jornada_id
-         LEFT JOIN lotacoes l ON l.id = f.lotacao_id
-         LEFT JOIN secretarias s ON s.id = f.secretaria_id
-         WHERE f.id = $1`,
-        [funcionario_id]
-      )
-
-      // Se tem espelho salvo, retorna com os dados
-      if (espelhoSalvo) {
-        return response.json({
-          ...espelhoSalvo,
-          funcionario,
-          calculado: false,
-        })
-      }
-
-      // Se não existe, calcula em tempo real
-      const espelhoCalculado = await calculoPontoService.calcularEspelho(
+      // Espelho salvo (ou calculado em tempo real) da versão atual dos dados
+      const espelho = await espelhoCacheService.obter(
         tenant.municipioId,
         Number(funcionario_id),
         Number(mes),
         Number(ano)
       )
 
-      return response.json({
-        funcionario_id: Number(funcionario_id),
-        mes: Number(mes),
-        ano: Number(ano),
-        status: 'ABERTO',
-        dias_trabalhados: espelhoCalculado.totais.diasTrabalhados,
-        horas_trabalhadas: espelhoCalculado.totais.horasTrabalhadas,
-        horas_extras: espelhoCalculado.totais.horasExtras,
-        horas_faltantes: espelhoCalculado.totais.horasFaltantes,
-        atrasos: espelhoCalculado.totais.atrasos,
-        faltas: espelhoCalculado.totais.faltas,
-        dados: { dias: espelhoCalculado.dias },
-        funcionario,
-        calculado: true,
-      })
+      return response.json(espelho)
     } catch (error) {
       console.error('Erro ao obter espelho:', error)
       return response.internalServerError({ error: 'Erro ao obter espelho' })
@@ -251,11 +210,17 @@ export default class PontoController {
       return response.unauthorized({ error: 'Município não selecionado' })
     }
 
-    const { funcionario_id, mes, ano, status, lotacao_id, jornada_id } = request.qs()
+    const { funcionario_id, mes, ano, status, lotacao_id, jornada_id, completo } = request.qs()
 
     try {
+      // A listagem usa só os totais: o JSON dia a dia (dados) vem apenas com ?completo=true
+      const colunas = completo === 'true' || completo === '1'
+        ? 'ep.*'
+        : `ep.id, ep.funcionario_id, ep.mes, ep.ano, ep.dias_trabalhados, ep.horas_trabalhadas,
+           ep.horas_extras, ep.horas_faltantes, ep.atrasos, ep.faltas, ep.status,
+           ep.aprovado_por, ep.aprovado_em, ep.created_at, ep.updated_at`
       let query = `
-        SELECT ep.*, f.nome as funcionario_nome, f.matricula,
+        SELECT ${colunas}, f.nome as funcionario_nome, f.matricula,
                l.nome as lotacao_nome, j.nome as jornada_nome
         FROM espelhos_ponto ep
         JOIN funcionarios f ON f.id = ep.funcionario_id
@@ -309,6 +274,10 @@ export default class PontoController {
   /**
    * Processa/fecha período de ponto
    * Calcula horas trabalhadas, extras, faltantes, atrasos e faltas
+   *
+   * O processamento roda em segundo plano (fechamento_periodo_service): a
+   * resposta traz o ID e o progresso chega pelo evento 'progresso-espelho'.
+   * Repetir o pedido de um processamento interrompido retoma de onde parou.
    */
   async processarPeriodo({ request, response, tenant }: HttpContext) {
     if (!tenant?.municipioId) {
@@ -319,36 +288,55 @@ export default class PontoController {
       return response.forbidden({ error: 'Sem permissão' })
     }
 
-    const { mes, ano, funcionario_ids } = request.only(['mes', 'ano', 'funcionario_ids'])
+    const { mes, ano, funcionario_ids, concorrencia } = request.only([
+      'mes',
+      'ano',
+      'funcionario_ids',
+      'concorrencia',
+    ])
 
     if (!mes || !ano) {
       return response.badRequest({ error: 'Informe mês e ano' })
     }
 
     try {
-      // Usa o serviço para processar o período
-      const resultado = await calculoPontoService.processarPeriodo(
+      const { processamento, situacao } = await fechamentoPeriodoService.iniciar(
         tenant.municipioId,
         Number(mes),
         Number(ano),
-        funcionario_ids
+        {
+          funcionarioIds: funcionario_ids,
+          usuarioId: tenant.usuario?.id,
+          concorrencia: concorrencia ? Number(concorrencia) : undefined,
+        }
       )
 
+      if (situacao === 'EM_ANDAMENTO') {
+        return response.conflict({
+          error: `Já existe um processamento em andamento (${processamento.mes}/${processamento.ano})`,
+          processamento,
+        })
+      }
+
       // Auditoria
       await AuditLog.registrar({
         usuarioId: tenant.usuario?.id,
         usuarioTipo: tenant.isSuperAdmin ? 'master' : 'municipal',
         acao: 'PROCESSAR_PERIODO',
         tabela: 'espelhos_ponto',
-        dadosNovos: { mes, ano, funcionario_ids, resultado },
+        dadosNovos: { mes, ano, funcionario_ids, processamento_id: processamento.id, situacao },
         ip: request.ip(),
         userAgent: request.header('user-agent'),
       })
 
-      return response.json({
+      return response.accepted({
         success: true,
-        message: `Período processado com sucesso. ${resultado.processados} funcionários processados, ${resultado.erros} erros.`,
-        ...resultado,
+        message:
+          situacao === 'RETOMADO'
+            ? 'Processamento retomado de onde parou.'
+            : 'Processamento iniciado.',
+        situacao,
+        processamento,
       })
     } catch (error) {
       console.error('Erro ao processar período:', error)
@@ -356,6 +344,62 @@ export default class PontoController {
     }
   }
 
+  /**
+   * Situação de um processamento de período
+   */
+  async statusProcessamento({ params, response, tenant }: HttpContext) {
+    if (!tenant?.municipioId) {
+      return response.unauthorized({ error: 'Município não selecionado' })
+    }
+
+    try {
+      const processamento = await fechamentoPeriodoService.buscar(tenant.municipioId, Number(params.id))
+      if (!processamento) {
+        return response.notFound({ error: 'Processamento não encontrado' })
+      }
+      return response.json(processamento)
+    } catch (error) {
+      console.error('Erro ao buscar processamento:', error)
+      return response.internalServerError({ error: 'Erro ao buscar processamento' })
+    }
+  }
+
+  /**
+   * Cancela um processamento de período em andamento
+   * (os espelhos já processados são mantidos; processar de novo retoma)
+   */
+  async cancelarProcessamento({ params, request, response, tenant }: HttpContext) {
+    if (!tenant?.municipioId) {
+      return response.unauthorized({ error: 'Município não selecionado' })
+    }
+
+    if (!tenant.isSuperAdmin && !['ADMIN', 'RH'].includes(tenant.usuario?.perfil || '')) {
+      return response.forbidden({ error: 'Sem permissão' })
+    }
+
+    try {
+      const cancelado = await fechamentoPeriodoService.cancelar(tenant.municipioId, Number(params.id))
+      if (!cancelado) {
+        return response.notFound({ error: 'Processamento não está em andamento' })
+      }
+
+      await AuditLog.registrar({
+        usuarioId: tenant.usuario?.id,
+        usuarioTipo: tenant.isSuperAdmin ? 'master' : 'municipal',
+        acao: 'CANCELAR_PROCESSAMENTO',
+        tabela: 'processamentos_periodo',
+        registroId: Number(params.id),
+        ip: request.ip(),
+        userAgent: request.header('user-agent'),
+      })
+
+      return response.json({ success: true, message: 'Cancelamento solicitado' })
+    } catch (error) {
+      console.error('Erro ao cancelar processamento:', error)
+      return response.internalServerError({ error: 'Erro ao cancelar processamento' })
+    }
+  }
+
   /**
    * Aprova espelho de ponto
    * Quando aprovado, integra automaticamente com banco de horas:
@@ -399,13 +443,7 @@ export default class PontoController {
       }
 
       // Verifica configuração de banco de horas
-      const configBH = await dbManager.queryMunicipioOne<{
-        ativo: boolean
-        converter_he_50_para_banco: boolean
-      }>(
-        tenant.municipioId,
-        `SELECT ativo, converter_he_50_para_banco FROM banco_horas_config WHERE id = 1`
-      )
+      const { bancoHoras: configBH } = await configuracaoMunicipioService.obter(tenant.municipioId)
 
       const bancoHorasAtivo = configBH?.ativo !== false
 
@@ -423,56 +461,7 @@ export default class PontoController {
 
       // Integração com Banco de Horas (se ativo)
       if (bancoHorasAtivo) {
-        const dataReferencia = `${espelho.ano}-${String(espelho.mes).padStart(2, '0')}-01`
-
-        // Busca saldo atual do funcionário
-        const [saldoAtual] = await dbManager.queryMunicipio<{ saldo: number }>(
-          tenant.municipioId,
-          `SELECT COALESCE(SUM(minutos), 0) as saldo FROM banco_horas WHERE funcionario_id = $1`,
-          [espelho.funcionario_id]
-        )
-        const saldoAnterior = saldoAtual?.saldo || 0
-
-        // Se tem horas extras, cria crédito
-        if (espelho.horas_extras > 0) {
-          const novoSaldo = saldoAnterior + espelho.horas_extras
-          await dbManager.queryMunicipio(
-            tenant.municipioId,
-            `INSERT INTO banco_horas
-              (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao)
-             VALUES ($1, $2, 'CREDITO', $3, $4, $5, 'ESPELHO', $6)
-             ON CONFLICT DO NOTHING`,
-            [
-              espelho.funcionario_id,
-              dataReferencia,
-              espelho.horas_extras,
-              saldoAnterior,
-              novoSaldo,
-              `Horas extras - Espelho ${String(espelho.mes).padStart(2, '0')}/${espelho.ano}`
-            ]
-          )
-        }
-
-        // Se tem horas faltantes, cria débito
-        if (espelho.horas_faltantes > 0) {
-          const saldoAposCredito = saldoAnterior + (espelho.horas_extras || 0)
-          const novoSaldo = saldoAposCredito - espelho.horas_faltantes
-          await dbManager.queryMunicipio(
-            tenant.municipioId,
-            `INSERT INTO banco_horas
-              (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao)
-             VALUES ($1, $2, 'DEBITO', $3, $4, $5, 'ESPELHO', $6)
-             ON CONFLICT DO NOTHING`,
-            [
-              espelho.funcionario_id,
-              dataReferencia,
-              -espelho.horas_faltantes, // Negativo para débito
-              saldoAposCredito,
-              novoSaldo,
-              `Horas faltantes - Espelho ${String(espelho.mes).padStart(2, '0')}/${espelho.ano}`
-            ]
-          )
-        }
+        await this.lancarBancoHorasAprovacao(tenant.municipioId, espelho)
       }
 
       // Criar notificação para o funcionário
@@ -823,10 +812,7 @@ export default class PontoController {
 
     try {
       // Verifica configuração de banco de horas
-      const configBH = await dbManager.queryMunicipioOne<{ ativo: boolean }>(
-        tenant.municipioId,
-        `SELECT ativo FROM banco_horas_config WHERE id = 1`
-      )
+      const { bancoHoras: configBH } = await configuracaoMunicipioService.obter(tenant.municipioId)
       const bancoHorasAtivo = configBH?.ativo !== false
 
       // Busca dados dos espelhos antes de aprovar (para integração com banco de horas)
@@ -867,56 +853,7 @@ export default class PontoController {
       // Integração com Banco de Horas (se ativo)
       if (bancoHorasAtivo && espelhos.length > 0) {
         for (const espelho of espelhos) {
-          const dataReferencia = `${espelho.ano}-${String(espelho.mes).padStart(2, '0')}-01`
-
-          // Busca saldo atual do funcionário
-          const [saldoAtual] = await dbManager.queryMunicipio<{ saldo: number }>(
-            tenant.municipioId,
-            `SELECT COALESCE(SUM(minutos), 0) as saldo FROM banco_horas WHERE funcionario_id = $1`,
-            [espelho.funcionario_id]
-          )
-          const saldoAnterior = saldoAtual?.saldo || 0
-
-          // Se tem horas extras, cria crédito
-          if (espelho.horas_extras > 0) {
-            const novoSaldo = saldoAnterior + espelho.horas_extras
-            await dbManager.queryMunicipio(
-              tenant.municipioId,
-              `INSERT INTO banco_horas
-                (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao)
-               VALUES ($1, $2, 'CREDITO', $3, $4, $5, 'ESPELHO', $6)
-               ON CONFLICT DO NOTHING`,
-              [
-                espelho.funcionario_id,
-                dataReferencia,
-                espelho.horas_extras,
-                saldoAnterior,
-                novoSaldo,
-                `Horas extras - Espelho ${String(espelho.mes).padStart(2, '0')}/${espelho.ano}`
-              ]
-            )
-          }
-
-          // Se tem horas faltantes, cria débito
-          if (espelho.horas_faltantes > 0) {
-            const saldoAposCredito = saldoAnterior + (espelho.horas_extras || 0)
-            const novoSaldo = saldoAposCredito - espelho.horas_faltantes
-            await dbManager.queryMunicipio(
-              tenant.municipioId,
-              `INSERT INTO banco_horas
-                (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao)
-               VALUES ($1, $2, 'DEBITO', $3, $4, $5, 'ESPELHO', $6)
-               ON CONFLICT DO NOTHING`,
-              [
-                espelho.funcionario_id,
-                dataReferencia,
-                -espelho.horas_faltantes,
-                saldoAposCredito,
-                novoSaldo,
-                `Horas faltantes - Espelho ${String(espelho.mes).padStart(2, '0')}/${espelho.ano}`
-              ]
-            )
-          }
+          await this.lancarBancoHorasAprovacao(tenant.municipioId, espelho)
         }
       }
 
@@ -1009,6 +946,12 @@ export default class PontoController {
         [data_hora, justificativa, tenant.usuario?.funcionario_id, params.id]
       )
 
+      // O dia de origem e o de destino da marcação
+      await espelhoIncrementalService.marcarDias(tenant.municipioId, registro.funcionario_id, [
+        registro.data_hora,
+        data_hora,
+      ])
+
       await AuditLog.registrar({
         usuarioId: tenant.usuario?.id,
         usuarioTipo: tenant.isSuperAdmin ? 'master' : 'municipal',
@@ -1084,6 +1027,8 @@ export default class PontoController {
         [params.id]
       )
 
+      await espelhoIncrementalService.marcarDias(tenant.municipioId, registro.funcionario_id, [registro.data_hora])
+
       await AuditLog.registrar({
         usuarioId: tenant.usuario?.id,
         usuarioTipo: tenant.isSuperAdmin ? 'master' : 'municipal',
@@ -1278,4 +1223,65 @@ export default class PontoController {
       return response.internalServerError({ error: 'Erro ao exportar registros' })
     }
   }
+
+  /**
+   * Lançamentos do banco de horas na aprovação do espelho: crédito das horas
+   * extras e débito das faltantes, com o saldo materializado travado
+   */
+  private async lancarBancoHorasAprovacao(municipioId: number, espelho: any): Promise<void> {
+    const dataReferencia = `${espelho.ano}-${String(espelho.mes).padStart(2, '0')}-01`
+    const mesAno = `${String(espelho.mes).padStart(2, '0')}/${espelho.ano}`
+
+    await bancoHorasSaldoService.garantirTabelas(municipioId)
+    await dbManager.transactionMunicipio(municipioId, async (client) => {
+      const saldos = await bancoHorasSaldoService.travar(client, [espelho.funcionario_id])
+      const saldoAnterior = saldos.get(Number(espelho.funcionario_id)) ?? 0
+      const lancados: MovimentoBancoHoras[] = []
+
+      // Se tem horas extras, cria crédito
+      if (espelho.horas_extras > 0) {
+        const novoSaldo = saldoAnterior + espelho.horas_extras
+        const { rows } = await client.query(
+          `INSERT INTO banco_horas
+            (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao)
+           VALUES ($1, $2, 'CREDITO', $3, $4, $5, 'ESPELHO', $6)
+           ON CONFLICT DO NOTHING
+           RETURNING ${COLUNAS_MOVIMENTO}`,
+          [
+            espelho.funcionario_id,
+            dataReferencia,
+            espelho.horas_extras,
+            saldoAnterior,
+            novoSaldo,
+            `Horas extras - Espelho ${mesAno}`
+          ]
+        )
+        lancados.push(...rows)
+      }
+
+      // Se tem horas faltantes, cria débito
+      if (espelho.horas_faltantes > 0) {
+        const saldoAposCredito = saldoAnterior + (espelho.horas_extras || 0)
+        const novoSaldo = saldoAposCredito - espelho.horas_faltantes
+        const { rows } = await client.query(
+          `INSERT INTO banco_horas
+            (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao)
+           VALUES ($1, $2, 'DEBITO', $3, $4, $5, 'ESPELHO', $6)
+           ON CONFLICT DO NOTHING
+           RETURNING ${COLUNAS_MOVIMENTO}`,
+          [
+            espelho.funcionario_id,
+            dataReferencia,
+            -espelho.horas_faltantes, // Negativo para débito
+            saldoAposCredito,
+            novoSaldo,
+            `Horas faltantes - Espelho ${mesAno}`
+          ]
+        )
+        lancados.push(...rows)
+      }
+
+      await bancoHorasSaldoService.registrar(client, lancados)
+    })
+  }
 }
@@ -1,5 +1,6 @@
 import type { HttpContext } from '@adonisjs/core/http'
 import { dbManager } from '#services/database_manager_service'
+import { bancoHorasSaldoService } from '#services/banco_horas_saldo_service'
 import { DateTime } from 'luxon'
 
 export default class DashboardController {
@@ -103,18 +104,10 @@ export default class DashboardController {
       }
 
       // Alerta de funcionarios com saldo negativo critico
+      await bancoHorasSaldoService.garantirTabelas(municipioId)
       const [saldoCritico] = await dbManager.queryMunicipio<{ count: number }>(
         municipioId,
-        `SELECT COUNT(*) as count FROM (
-          SELECT funcionario_id
-          FROM banco_horas
-          GROUP BY funcionario_id
-          HAVING SUM(
-            CASE WHEN tipo_operacao = 'CREDITO' THEN minutos
-                 WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO') THEN -ABS(minutos)
-                 ELSE minutos END
-          ) < -300
-        ) sub`
+        `SELECT COUNT(*) as count FROM banco_horas_saldo_atual WHERE saldo < -300`
       )
 
       if (Number(saldoCritico?.count) > 0) {
@@ -40,6 +40,8 @@
 import type { HttpContext } from '@adonisjs/core/http'
 import { dbManager } from '#services/database_manager_service'
 import { websocketService } from '#services/websocket_service'
+import { espelhoIncrementalService } from '#services/espelho_incremental_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
 
 /**
  * Data inicial para filtrar registros antigos
@@ -254,11 +256,7 @@ export default class WebhookControlIdController {
       // =========================================================================
       // ETAPA 10: Buscar cooldown configurado
       // =========================================================================
-      const cooldownConfig = await dbManager.queryMunicipio(
-        municipioId,
-        `SELECT valor FROM configuracoes_sistema WHERE chave = 'cooldown_terminal'`
-      )
-      const cooldownSegundos = parseInt(cooldownConfig[0]?.valor || '60')
+      const { cooldownTerminal: cooldownSegundos } = await configuracaoMunicipioService.obter(municipioId)
 
       // =========================================================================
       // ETAPA 11: Verificar duplicidade (cooldown global)
@@ -302,6 +300,9 @@ export default class WebhookControlIdController {
         [funcionarioId, equipamentoId, dataHoraStr, sentido, nsr, pis || '']
       )
 
+      // Espelho aberto atualizado só no dia da batida (alguns segundos depois)
+      await espelhoIncrementalService.marcarDias(municipioId, funcionarioId, [dataHoraStr])
+
       // =========================================================================
       // ETAPA 13: Atualizar status do equipamento
       // =========================================================================
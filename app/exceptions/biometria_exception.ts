@@ -124,6 +124,19 @@ export default class BiometriaException extends Exception {
     })
   }
 
+  /**
+   * Face já cadastrada para outro funcionário
+   */
+  static faceJaCadastrada(nomes: string[]) {
+    return new BiometriaException(
+      `Esta face já está cadastrada para: ${nomes.join(', ')}. Confira o cadastro antes de continuar.`,
+      {
+        status: 409,
+        code: 'E_FACE_JA_CADASTRADA',
+      }
+    )
+  }
+
   /**
    * Rosto não detectado na foto
    */
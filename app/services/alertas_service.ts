@@ -5,6 +5,8 @@
  */
 
 import { emailService } from './email_service.js'
+import { configuracaoMunicipioService } from './configuracao_municipio_service.js'
+import { bancoHorasSaldoService } from './banco_horas_saldo_service.js'
 
 interface AlertaConfig {
     limiteNegativoMinutos: number  // Ex: -120 (2 horas negativas)
@@ -23,12 +25,8 @@ async function verificarBancoHorasNegativo(
     config: AlertaConfig = { limiteNegativoMinutos: -120, alertarGestor: true, alertarFuncionario: true }
 ) {
     try {
-        // Busca saldo atual do funcionário
-        const [saldo] = await dbManager.queryMunicipio(municipioId, `
-      SELECT COALESCE(SUM(minutos), 0) as saldo FROM banco_horas WHERE funcionario_id = $1
-    `, [funcionarioId])
-
-        const saldoAtual = saldo?.saldo || 0
+        // Saldo atual do funcionário (materializado)
+        const saldoAtual = await bancoHorasSaldoService.saldoAtual(municipioId, funcionarioId)
 
         // Se saldo está abaixo do limite, gera alerta
         if (saldoAtual < config.limiteNegativoMinutos) {
@@ -113,11 +111,11 @@ async function verificarTodosBancosNegativos(
 ) {
     try {
         // Busca funcionários com saldo negativo
+        await bancoHorasSaldoService.garantirTabelas(municipioId)
         const funcionarios = await dbManager.queryMunicipio(municipioId, `
-      SELECT funcionario_id, SUM(minutos) as saldo
-      FROM banco_horas
-      GROUP BY funcionario_id
-      HAVING SUM(minutos) < $1
+      SELECT funcionario_id, saldo
+      FROM banco_horas_saldo_atual
+      WHERE saldo < $1
     `, [config?.limiteNegativoMinutos || -120])
 
         let alertasGerados = 0
@@ -161,6 +159,10 @@ async function verificarAnomaliasPonto(
         const dataObj = new Date(data + 'T12:00:00')
         const diaSemana = dataObj.getDay()
 
+        // Horários e feriados vêm da configuração em memória do município
+        const config = await configuracaoMunicipioService.obter(municipioId)
+        const feriado = configuracaoMunicipioService.ehFeriado(config, data)
+
         for (const func of funcionarios) {
             // Busca batidas do dia
             const batidas = await dbManager.queryMunicipio(municipioId, `
@@ -176,10 +178,7 @@ async function verificarAnomaliasPonto(
             // Verifica se deveria trabalhar nesse dia
             let deveTrabalhar = true
             if (func.jornada_id) {
-                const [horarioDia] = await dbManager.queryMunicipio(municipioId, `
-                    SELECT folga FROM jornada_horarios
-                    WHERE jornada_id = $1 AND dia_semana = $2
-                `, [func.jornada_id, diaSemana])
+                const horarioDia = config.horarios.get(func.jornada_id)?.get(diaSemana)
                 if (horarioDia?.folga) {
                     deveTrabalhar = false
                 }
@@ -197,12 +196,6 @@ async function verificarAnomaliasPonto(
             }
 
             // Verifica se é feriado
-            const [feriado] = await dbManager.queryMunicipio(municipioId, `
-                SELECT id FROM feriados
-                WHERE (data = $1 OR (recorrente = true AND EXTRACT(MONTH FROM data) = EXTRACT(MONTH FROM $1::date) AND EXTRACT(DAY FROM data) = EXTRACT(DAY FROM $1::date)))
-                AND ativo = true
-            `, [data])
-
             if (feriado) {
                 deveTrabalhar = false
             }
@@ -378,25 +371,21 @@ async function monitorarBatidasPendentes(
             AND j.tipo != 'PLANTAO'
         `)
 
+        // Horários das jornadas da configuração em memória do município
+        const config = await configuracaoMunicipioService.obter(municipioId)
+
         for (const func of funcionarios) {
-            // Busca horário de saída esperado para hoje
-            const [horarioDia] = await dbManager.queryMunicipio(municipioId, `
-                SELECT
-                    folga,
-                    saida_1,
-                    saida_2,
-                    EXTRACT(HOUR FROM COALESCE(saida_2, saida_1)) * 60 +
-                    EXTRACT(MINUTE FROM COALESCE(saida_2, saida_1)) as saida_minutos
-                FROM jornada_horarios
-                WHERE jornada_id = $1 AND dia_semana = $2
-            `, [func.jornada_id, diaSemana])
+            // Horário de saída esperado para hoje
+            const horarioDia = config.horarios.get(func.jornada_id)?.get(diaSemana)
+            const saida = horarioDia?.saida_2 || horarioDia?.saida_1
 
             // Se é folga ou não tem horário configurado, pula
-            if (!horarioDia || horarioDia.folga || !horarioDia.saida_minutos) {
+            if (!horarioDia || horarioDia.folga || !saida) {
                 continue
             }
 
-            const horarioSaidaEsperado = parseInt(horarioDia.saida_minutos)
+            const [hora, minuto] = saida.split(':').map(Number)
+            const horarioSaidaEsperado = hora * 60 + minuto
             const horarioLimite = horarioSaidaEsperado + toleranciaMinutos
 
             // Se ainda não passou do horário limite, pula
@@ -0,0 +1,344 @@
+/**
+ * Saldo materializado do banco de horas
+ *
+ * O saldo de um funcionário não é somado sobre todo o histórico de
+ * banco_horas a cada consulta:
+ *
+ * - banco_horas_saldo guarda um fechamento por funcionário e mês: créditos,
+ *   débitos, compensações e pagamentos do mês, a variação líquida e os
+ *   saldos inicial e final acumulados
+ * - banco_horas_saldo_atual guarda o saldo corrente (leitura indexada)
+ *
+ * Toda gravação em banco_horas chama registrar() na mesma transação (sinal
+ * -1 para exclusões): os contadores do mês recebem a diferença e os saldos
+ * acumulados do funcionário são refeitos a partir das variações mensais.
+ * Quem precisa do saldo antes de gravar (saldo_anterior, limites) chama
+ * travar() antes de tocar em banco_horas: a linha do funcionário fica
+ * travada até o fim da transação e gravações simultâneas não se perdem.
+ *
+ * O efeito de cada movimentação no saldo segue uma única regra
+ * (efeitoNoSaldo e SQL_EFEITO). reconstruir() refaz os saldos a partir do
+ * histórico e divergencias() compara os dois (comando banco_horas:conciliar).
+ */
+
+import app from '@adonisjs/core/services/app'
+import { readFile } from 'node:fs/promises'
+import { dbManager } from '#services/database_manager_service'
+
+/** Movimentação como gravada em banco_horas (data YYYY-MM-DD) */
+export interface MovimentoBancoHoras {
+  funcionario_id: number
+  data: string
+  tipo_operacao: string
+  minutos: number
+}
+
+export interface DivergenciaSaldo {
+  funcionario_id: number
+  saldo_materializado: number
+  saldo_historico: number
+}
+
+/** Colunas de banco_horas no formato de MovimentoBancoHoras (RETURNING/SELECT) */
+export const COLUNAS_MOVIMENTO = `funcionario_id, TO_CHAR(data, 'YYYY-MM-DD') as data, tipo_operacao, minutos`
+
+/** Efeito de uma linha de banco_horas no saldo, em SQL (mesma regra de efeitoNoSaldo) */
+export const SQL_EFEITO = `CASE
+    WHEN tipo_operacao IN ('CREDITO', 'AJUSTE') AND minutos > 0 THEN minutos
+    WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO', 'VENCIMENTO') THEN -ABS(minutos)
+    WHEN tipo_operacao = 'AJUSTE' AND minutos < 0 THEN minutos
+    ELSE 0
+  END`
+
+/**
+ * Efeito da movimentação no saldo (minutos): crédito e ajuste positivo
+ * somam, ajuste negativo soma o próprio valor e débito, compensação,
+ * pagamento e vencimento subtraem o valor absoluto
+ */
+export function efeitoNoSaldo(tipoOperacao: string, minutos: number): number {
+  const valor = Number(minutos) || 0
+  if (['CREDITO', 'AJUSTE'].includes(tipoOperacao) && valor > 0) return valor
+  if (['DEBITO', 'COMPENSACAO', 'PAGAMENTO', 'VENCIMENTO'].includes(tipoOperacao)) return -Math.abs(valor)
+  if (tipoOperacao === 'AJUSTE' && valor < 0) return valor
+  return 0
+}
+
+interface FechamentoMes {
+  funcionario_id: number
+  ano: number
+  mes: number
+  creditos: number
+  debitos: number
+  compensacoes: number
+  pagamentos: number
+  variacao: number
+}
+
+class BancoHorasSaldoService {
+  private tabelasVerificadas = new Set<number>()
+
+  /**
+   * Trava a linha de saldo dos funcionários até o fim da transação e devolve
+   * o saldo corrente de cada um (funcionário sem linha começa em zero)
+   */
+  async travar(client: any, funcionarioIds: number[]): Promise<Map<number, number>> {
+    // Ordem fixa: transações com funcionários em comum não se travam mutuamente
+    const ids = [...new Set(funcionarioIds.map(Number))].sort((a, b) => a - b)
+    const saldos = new Map<number, number>()
+    if (ids.length === 0) return saldos
+
+    await client.query(
+      `INSERT INTO banco_horas_saldo_atual (funcionario_id)
+       SELECT unnest($1::int[])
+       ON CONFLICT (funcionario_id) DO NOTHING`,
+      [ids]
+    )
+    const { rows } = await client.query(
+      `SELECT funcionario_id, saldo FROM banco_horas_saldo_atual
+       WHERE funcionario_id = ANY($1)
+       ORDER BY funcionario_id
+       FOR UPDATE`,
+      [ids]
+    )
+    for (const row of rows) {
+      saldos.set(row.funcionario_id, Number(row.saldo))
+    }
+    return saldos
+  }
+
+  /**
+   * Aplica movimentações gravadas (sinal 1) ou excluídas (sinal -1) em
+   * banco_horas aos fechamentos mensais e ao saldo corrente, dentro da
+   * transação da gravação. Devolve o novo saldo de cada funcionário.
+   */
+  async registrar(
+    client: any,
+    movimentos: MovimentoBancoHoras[],
+    sinal: 1 | -1 = 1
+  ): Promise<Map<number, number>> {
+    if (movimentos.length === 0) return new Map()
+    const ids = movimentos.map((m) => Number(m.funcionario_id))
+    await this.travar(client, ids)
+
+    const fechamentos = new Map<string, FechamentoMes>()
+    for (const movimento of movimentos) {
+      const chave = `${movimento.funcionario_id}:${movimento.data.slice(0, 7)}`
+      let fechamento = fechamentos.get(chave)
+      if (!fechamento) {
+        fechamento = {
+          funcionario_id: Number(movimento.funcionario_id),
+          ano: Number(movimento.data.slice(0, 4)),
+          mes: Number(movimento.data.slice(5, 7)),
+          creditos: 0,
+          debitos: 0,
+          compensacoes: 0,
+          pagamentos: 0,
+          variacao: 0,
+        }
+        fechamentos.set(chave, fechamento)
+      }
+
+      // Contadores em valor absoluto; a variação leva o sinal do efeito
+      const efeito = efeitoNoSaldo(movimento.tipo_operacao, movimento.minutos)
+      fechamento.variacao += sinal * efeito
+      if (efeito > 0) fechamento.creditos += sinal * efeito
+      else if (movimento.tipo_operacao === 'COMPENSACAO') fechamento.compensacoes -= sinal * efeito
+      else if (movimento.tipo_operacao === 'PAGAMENTO') fechamento.pagamentos -= sinal * efeito
+      else fechamento.debitos -= sinal * efeito
+    }
+
+    const linhas = [...fechamentos.values()]
+    await client.query(
+      `INSERT INTO banco_horas_saldo
+         (funcionario_id, ano, mes, creditos, debitos, compensacoes, pagamentos, variacao)
+       SELECT * FROM unnest($1::int[], $2::int[], $3::int[], $4::int[], $5::int[], $6::int[], $7::int[], $8::int[])
+       ON CONFLICT (funcionario_id, ano, mes) DO UPDATE SET
+         creditos = COALESCE(banco_horas_saldo.creditos, 0) + EXCLUDED.creditos,
+         debitos = COALESCE(banco_horas_saldo.debitos, 0) + EXCLUDED.debitos,
+         compensacoes = COALESCE(banco_horas_saldo.compensacoes, 0) + EXCLUDED.compensacoes,
+         pagamentos = COALESCE(banco_horas_saldo.pagamentos, 0) + EXCLUDED.pagamentos,
+         variacao = COALESCE(banco_horas_saldo.variacao, 0) + EXCLUDED.variacao,
+         updated_at = NOW()`,
+      [
+        linhas.map((l) => l.funcionario_id),
+        linhas.map((l) => l.ano),
+        linhas.map((l) => l.mes),
+        linhas.map((l) => l.creditos),
+        linhas.map((l) => l.debitos),
+        linhas.map((l) => l.compensacoes),
+        linhas.map((l) => l.pagamentos),
+        linhas.map((l) => l.variacao),
+      ]
+    )
+
+    return this.acumular(client, ids)
+  }
+
+  /**
+   * Saldo corrente do funcionário (0 sem movimentações)
+   */
+  async saldoAtual(municipioId: number, funcionarioId: number): Promise<number> {
+    await this.garantirTabelas(municipioId)
+    const linha = await dbManager.queryMunicipioOne<{ saldo: number }>(
+      municipioId,
+      `SELECT saldo FROM banco_horas_saldo_atual WHERE funcionario_id = $1`,
+      [funcionarioId]
+    )
+    return Number(linha?.saldo ?? 0)
+  }
+
+  /**
+   * Saldo do funcionário no início do mês (saldo final do último mês com
+   * movimentações antes dele)
+   */
+  async saldoAntesDoMes(municipioId: number, funcionarioId: number, ano: number, mes: number): Promise<number> {
+    await this.garantirTabelas(municipioId)
+    const linha = await dbManager.queryMunicipioOne<{ saldo_final: number }>(
+      municipioId,
+      `SELECT saldo_final FROM banco_horas_saldo
+       WHERE funcionario_id = $1 AND (ano, mes) < ($2, $3)
+       ORDER BY ano DESC, mes DESC
+       LIMIT 1`,
+      [funcionarioId, ano, mes]
+    )
+    return Number(linha?.saldo_final ?? 0)
+  }
+
+  /**
+   * Funcionários cujo saldo materializado difere da soma do histórico
+   */
+  async divergencias(municipioId: number): Promise<DivergenciaSaldo[]> {
+    await this.garantirTabelas(municipioId)
+    const linhas = await dbManager.queryMunicipio<DivergenciaSaldo>(
+      municipioId,
+      `SELECT COALESCE(h.funcionario_id, a.funcionario_id) as funcionario_id,
+              COALESCE(a.saldo, 0) as saldo_materializado,
+              COALESCE(h.saldo, 0)::int as saldo_historico
+       FROM (
+         SELECT funcionario_id, SUM(${SQL_EFEITO}) as saldo
+         FROM banco_horas
+         GROUP BY funcionario_id
+       ) h
+       FULL JOIN banco_horas_saldo_atual a ON a.funcionario_id = h.funcionario_id
+       WHERE COALESCE(a.saldo, 0) <> COALESCE(h.saldo, 0)
+       ORDER BY 1`
+    )
+    return linhas.map((l) => ({
+      funcionario_id: l.funcionario_id,
+      saldo_materializado: Number(l.saldo_materializado),
+      saldo_historico: Number(l.saldo_historico),
+    }))
+  }
+
+  /**
+   * Refaz fechamentos mensais e saldos a partir do histórico (todos os
+   * funcionários ou os informados). Devolve quantos funcionários foram refeitos.
+   */
+  async reconstruir(municipioId: number, funcionarioIds?: number[]): Promise<number> {
+    await this.garantirTabelas(municipioId)
+    return dbManager.transactionMunicipio(municipioId, (client) => this.refazer(client, funcionarioIds))
+  }
+
+  async garantirTabelas(municipioId: number) {
+    if (this.tabelasVerificadas.has(municipioId)) return
+    const sql = await readFile(app.makePath('database/migrations/tenant/017_banco_horas_saldo_atual.sql'), 'utf-8')
+    await dbManager.queryMunicipio(municipioId, sql)
+
+    // Primeiro uso no município: saldos materializados a partir do histórico
+    const pendente = await dbManager.queryMunicipioOne<{ pendente: boolean }>(
+      municipioId,
+      `SELECT NOT EXISTS (SELECT 1 FROM banco_horas_saldo_atual)
+              AND EXISTS (SELECT 1 FROM banco_horas) as pendente`
+    )
+    if (pendente?.pendente) {
+      const total = await dbManager.transactionMunicipio(municipioId, (client) => this.refazer(client))
+      console.log(`[Banco de Horas] Saldos materializados de ${total} funcionário(s) no município ${municipioId}`)
+    }
+    this.tabelasVerificadas.add(municipioId)
+  }
+
+  /**
+   * Saldos inicial/final de cada mês (soma acumulada das variações) e saldo
+   * corrente dos funcionários
+   */
+  private async acumular(client: any, funcionarioIds: number[]): Promise<Map<number, number>> {
+    const ids = [...new Set(funcionarioIds.map(Number))]
+    await client.query(
+      `UPDATE banco_horas_saldo s
+       SET saldo_inicial = c.acumulado - c.variacao,
+           saldo_final = c.acumulado,
+           updated_at = NOW()
+       FROM (
+         SELECT id, COALESCE(variacao, 0) as variacao,
+                SUM(COALESCE(variacao, 0)) OVER (PARTITION BY funcionario_id ORDER BY ano, mes) as acumulado
+         FROM banco_horas_saldo
+         WHERE funcionario_id = ANY($1)
+       ) c
+       WHERE s.id = c.id
+         AND (s.saldo_final IS DISTINCT FROM c.acumulado OR s.saldo_inicial IS DISTINCT FROM c.acumulado - c.variacao)`,
+      [ids]
+    )
+    const { rows } = await client.query(
+      `UPDATE banco_horas_saldo_atual a
+       SET saldo = t.saldo, atualizado_em = NOW()
+       FROM (
+         SELECT f.id, COALESCE(SUM(s.variacao), 0) as saldo
+         FROM unnest($1::int[]) AS f(id)
+         LEFT JOIN banco_horas_saldo s ON s.funcionario_id = f.id
+         GROUP BY f.id
+       ) t
+       WHERE a.funcionario_id = t.id
+       RETURNING a.funcionario_id, a.saldo`,
+      [ids]
+    )
+    return new Map(rows.map((r: any) => [r.funcionario_id, Number(r.saldo)]))
+  }
+
+  /**
+   * Reconstrução dentro da transação; gravações em banco_horas esperam o fim
+   */
+  private async refazer(client: any, funcionarioIds?: number[]): Promise<number> {
+    // Mesma ordem das gravações (saldo travado antes de banco_horas)
+    await client.query(`LOCK TABLE banco_horas_saldo_atual, banco_horas IN SHARE ROW EXCLUSIVE MODE`)
+
+    const filtro = funcionarioIds ? `WHERE funcionario_id = ANY($1::int[])` : ''
+    const params = funcionarioIds ? [funcionarioIds] : []
+
+    await client.query(`DELETE FROM banco_horas_saldo ${filtro}`, params)
+    await client.query(
+      `INSERT INTO banco_horas_saldo
+         (funcionario_id, ano, mes, creditos, debitos, compensacoes, pagamentos, variacao)
+       SELECT funcionario_id, ano, mes,
+              SUM(CASE WHEN efeito > 0 THEN efeito ELSE 0 END),
+              SUM(CASE WHEN efeito < 0 AND tipo_operacao NOT IN ('COMPENSACAO', 'PAGAMENTO') THEN -efeito ELSE 0 END),
+              SUM(CASE WHEN tipo_operacao = 'COMPENSACAO' THEN -efeito ELSE 0 END),
+              SUM(CASE WHEN tipo_operacao = 'PAGAMENTO' THEN -efeito ELSE 0 END),
+              SUM(efeito)
+       FROM (
+         SELECT funcionario_id,
+                EXTRACT(YEAR FROM data)::int as ano,
+                EXTRACT(MONTH FROM data)::int as mes,
+                tipo_operacao,
+                ${SQL_EFEITO} as efeito
+         FROM banco_horas
+         ${filtro}
+       ) m
+       GROUP BY funcionario_id, ano, mes`,
+      params
+    )
+
+    const { rows } = await client.query(
+      `SELECT funcionario_id FROM banco_horas_saldo ${filtro}
+       UNION
+       SELECT funcionario_id FROM banco_horas_saldo_atual ${filtro}`,
+      params
+    )
+    const ids = rows.map((r: any) => r.funcionario_id)
+    await this.travar(client, ids)
+    await this.acumular(client, ids)
+    return ids.length
+  }
+}
+
+export const bancoHorasSaldoService = new BancoHorasSaldoService()
+export default bancoHorasSaldoService
@@ -0,0 +1,191 @@
+/**
+ * Cliente dos Serviços Biométricos
+ * ================================
+ *
+ * Base HTTP comum dos serviços deepface-api (faces) e futronic-api (digitais),
+ * que compartilham o mesmo núcleo (biometria_core/): tenant no header X-Tenant,
+ * timeouts por tipo de operação, respostas NDJSON dos endpoints de lote e
+ * leitura do /metrics (Prometheus).
+ *
+ * Uso:
+ *   const cliente = new ClienteBiometria('Futronic', FUTRONIC_URL)
+ *   const lista = await cliente.doTenant(municipioId).requisitar<Lista>('/listar')
+ */
+
+/** Timeouts (ms) por tipo de operação, os mesmos nos dois serviços */
+export const TIMEOUTS_BIOMETRIA = {
+  /** /health e /metrics */
+  saude: 3000,
+  /** Status, listagem, remoção, sincronização */
+  consulta: 5000,
+  /** Cadastro e reconhecimento (extração + busca na galeria) */
+  processamento: 10000,
+  /** Captura no leitor (espera o dedo) */
+  captura: 15000,
+  /** Captura dentro de uma sessão de cadastro */
+  capturaSessao: 40000,
+  /** Lotes: base + por item */
+  lote: 10000,
+  lotePorItem: 200,
+} as const
+
+export interface OpcoesRequisicao {
+  metodo?: 'GET' | 'POST' | 'DELETE'
+  /** Enviado como JSON */
+  corpo?: unknown
+  timeoutMs?: number
+  /** Sobrescreve o exigirOk do cliente nesta requisição */
+  exigirOk?: boolean
+}
+
+export interface AmostraMetrica {
+  nome: string
+  rotulos: Record<string, string>
+  valor: number
+}
+
+export class ClienteBiometria {
+  readonly baseUrl: string
+  readonly tenant?: string
+
+  /**
+   * @param nome Nome do serviço nas mensagens de erro
+   * @param exigirOk Se true, respostas 4xx/5xx viram exceção; se false, o corpo
+   *   JSON é devolvido como veio (a API futronic responde erros no corpo)
+   */
+  constructor(
+    readonly nome: string,
+    baseUrl: string,
+    tenant?: string | number,
+    readonly exigirOk = true
+  ) {
+    this.baseUrl = baseUrl.replace(/\/$/, '')
+    this.tenant = tenant === undefined ? undefined : String(tenant)
+  }
+
+  /**
+   * Cliente restrito à galeria de um tenant
+   */
+  doTenant(tenant: string | number): ClienteBiometria {
+    return new ClienteBiometria(this.nome, this.baseUrl, tenant, this.exigirOk)
+  }
+
+  /**
+   * Cabeçalhos das requisições, com o X-Tenant quando houver
+   */
+  cabecalhos(json = false): Record<string, string> {
+    const cabecalhos: Record<string, string> = json ? { 'Content-Type': 'application/json' } : {}
+    if (this.tenant) cabecalhos['X-Tenant'] = this.tenant
+    return cabecalhos
+  }
+
+  /**
+   * Faz a requisição e devolve o JSON da resposta
+   */
+  async requisitar<T>(caminho: string, opcoes: OpcoesRequisicao = {}): Promise<T> {
+    const response = await fetch(`${this.baseUrl}${caminho}`, {
+      method: opcoes.metodo ?? 'GET',
+      headers: this.cabecalhos(opcoes.corpo !== undefined),
+      body: opcoes.corpo !== undefined ? JSON.stringify(opcoes.corpo) : undefined,
+      signal: AbortSignal.timeout(opcoes.timeoutMs ?? TIMEOUTS_BIOMETRIA.consulta),
+    })
+
+    if ((opcoes.exigirOk ?? this.exigirOk) && !response.ok) {
+      const corpo = await response.text().catch(() => '')
+      throw new Error(
+        `${this.nome} ${caminho} falhou (${response.status} ${response.statusText})${corpo ? ` - ${corpo}` : ''}`
+      )
+    }
+
+    return (await response.json()) as T
+  }
+
+  /**
+   * Envia um lote e lê a resposta NDJSON linha a linha
+   */
+  async *lote<T>(caminho: string, itens: unknown[]): AsyncGenerator<T> {
+    let response: Response
+    try {
+      response = await fetch(`${this.baseUrl}${caminho}`, {
+        method: 'POST',
+        headers: this.cabecalhos(true),
+        body: JSON.stringify({ itens }),
+        signal: AbortSignal.timeout(TIMEOUTS_BIOMETRIA.lote + itens.length * TIMEOUTS_BIOMETRIA.lotePorItem),
+      })
+    } catch (error) {
+      console.error(`[${this.nome}] Erro ao processar lote:`, error)
+      throw new Error(`Erro ao conectar com a API ${this.nome}`)
+    }
+
+    const contentType = response.headers.get('content-type') ?? ''
+    if (!response.ok || !contentType.includes('ndjson') || !response.body) {
+      const corpo = await response.json().catch(() => ({}))
+      throw new Error(corpo.error ?? corpo.detail ?? `Erro ${response.status} ao processar lote`)
+    }
+
+    const decoder = new TextDecoder()
+    let pendente = ''
+    for await (const parte of response.body as unknown as AsyncIterable<Uint8Array>) {
+      pendente += decoder.decode(parte, { stream: true })
+      const linhas = pendente.split('\n')
+      pendente = linhas.pop() ?? ''
+      for (const linha of linhas) {
+        if (linha.trim()) yield JSON.parse(linha)
+      }
+    }
+    if (pendente.trim()) yield JSON.parse(pendente)
+  }
+
+  /**
+   * Lê o /metrics do serviço (null se offline)
+   */
+  async metricas(): Promise<AmostraMetrica[] | null> {
+    const response = await fetch(`${this.baseUrl}/metrics`, {
+      method: 'GET',
+      signal: AbortSignal.timeout(TIMEOUTS_BIOMETRIA.saude),
+    })
+    if (!response.ok) {
+      return null
+    }
+    return lerMetricas(await response.text())
+  }
+}
+
+/**
+ * Converte o formato texto do Prometheus em amostras (ignora comentários)
+ */
+export function lerMetricas(texto: string): AmostraMetrica[] {
+  const amostras: AmostraMetrica[] = []
+  for (const linha of texto.split('\n')) {
+    const match = linha.match(/^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$/)
+    if (!match) continue
+
+    const rotulos: Record<string, string> = {}
+    for (const [, nome, valor] of (match[2] ?? '').matchAll(/(\w+)="((?:[^"\\]|\\.)*)"/g)) {
+      rotulos[nome] = valor.replace(/\\n/g, '\n').replace(/\\(.)/g, '$1')
+    }
+    amostras.push({ nome: match[1], rotulos, valor: Number(match[3]) })
+  }
+  return amostras
+}
+
+/**
+ * Soma das amostras de uma métrica (filtrando por rótulos)
+ */
+export function somarMetrica(
+  amostras: AmostraMetrica[],
+  nome: string,
+  filtro: Record<string, string> = {}
+): number {
+  return amostras
+    .filter((a) => a.nome === nome && Object.entries(filtro).every(([k, v]) => a.rotulos[k] === v))
+    .reduce((total, a) => total + a.valor, 0)
+}
+
+/**
+ * Média de um histograma (soma/contagem), null sem amostras
+ */
+export function mediaMetrica(amostras: AmostraMetrica[], histograma: string, escala = 1): number | null {
+  const quantidade = somarMetrica(amostras, `${histograma}_count`)
+  return quantidade > 0 ? (somarMetrica(amostras, `${histograma}_sum`) / quantidade) * escala : null
+}
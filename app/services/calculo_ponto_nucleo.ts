@@ -0,0 +1,860 @@
+/**
+ * Núcleo do cálculo de ponto
+ *
+ * Funções puras do espelho (agrupamento por dia, tolerâncias, escala de
+ * plantão, turno que cruza o fechamento, totais): recebem os dados já
+ * carregados e não acessam o banco. Por isso podem rodar fora do processo
+ * principal, nas threads do calculo_ponto_pool.
+ */
+
+import { DateTime } from 'luxon'
+
+export interface RegistroPonto {
+  id: number
+  funcionario_id: number
+  data_hora: Date | string
+  tipo: string
+  sentido: string | null
+  origem: string
+}
+
+export interface Jornada {
+  id: number
+  carga_horaria_diaria: number // em minutos
+  tolerancia_entrada: number
+  tolerancia_saida: number
+  // Novos campos para suportar plantão e horário corrido
+  tipo: 'NORMAL' | 'PLANTAO' | 'CORRIDA' // NORMAL = seg-sex, PLANTAO = escala, CORRIDA = sem intervalo
+  horas_plantao: number | null // Para plantão: horas trabalhadas (12, 24)
+  horas_folga: number | null // Para plantão: horas de folga (36, 72)
+  tem_intervalo: boolean // Se tem intervalo para refeição
+  duracao_intervalo: number // Duração do intervalo em minutos
+  marcacoes_dia: number // 2 = entrada/saída, 4 = com intervalo
+}
+
+export interface JornadaHorario {
+  dia_semana: number
+  entrada_1: string | null
+  saida_1: string | null
+  entrada_2: string | null
+  saida_2: string | null
+  folga: boolean
+}
+
+export interface DiaTrabalhado {
+  data: string
+  diaSemana: number
+  registros: DateTime[]
+  horasPrevistas: number // em minutos
+  horasTrabalhadas: number // em minutos
+  atraso: number // em minutos
+  horaExtra: number // em minutos
+  horaFaltante: number // em minutos
+  feriado: boolean
+  folga: boolean
+  falta: boolean
+  ocorrencias: string[]
+}
+
+export interface EspelhoCalculado {
+  funcionario_id: number
+  mes: number
+  ano: number
+  dias: DiaTrabalhado[]
+  totais: {
+    diasUteis: number
+    diasTrabalhados: number
+    horasPrevistas: number
+    horasTrabalhadas: number
+    atrasos: number
+    horasExtras: number
+    horasFaltantes: number
+    faltas: number
+  }
+}
+
+export interface FuncionarioPonto {
+  id: number
+  nome: string
+  jornada_id: number
+  data_admissao: string
+  data_demissao: string | null
+}
+
+export interface FolgaProgramada {
+  data: string
+  tipo: string
+  motivo: string | null
+}
+
+/**
+ * Dados do município para o período, os mesmos para todos os funcionários
+ * (carregados uma vez por processamento)
+ */
+export interface ContextoPeriodo {
+  mes: number
+  ano: number
+  inicioMes: DateTime
+  /** Fim do período calculado: fim do mês ou hoje, o que vier antes */
+  fimMes: DateTime
+  dataFechamento: DateTime
+  dataInicioSistema: DateTime | null
+  feriados: Set<string>
+  jornadas: Map<number, Jornada>
+  /** Horários por jornada e dia da semana */
+  horarios: Map<number, Map<number, JornadaHorario>>
+}
+
+/**
+ * Dados de um funcionário no período
+ */
+export interface DadosFuncionarioPeriodo {
+  funcionario: FuncionarioPonto
+  /** Registros do mês até o limite da saída do turno que cruza o fechamento, em ordem */
+  registros: RegistroPonto[]
+  folgas: Map<string, FolgaProgramada>
+  /** Último registro antes do mês (referência da escala de plantão) */
+  ultimoRegistroAnterior: Date | string | null
+  /**
+   * Dias de plantão do mês já calculados (escala_plantao_service); sem eles
+   * a escala é calculada a partir do ultimoRegistroAnterior
+   */
+  escalaPlantao?: Map<string, boolean> | null
+}
+
+/**
+ * Jornada do funcionário já com os valores padrão (ver prepararJornada)
+ */
+export interface ParametrosJornada {
+  jornada: Jornada | null
+  cargaHorariaDiaria: number
+  toleranciaEntrada: number
+  toleranciaSaida: number
+  tipoJornada: Jornada['tipo']
+  marcacoesDia: number
+  horariosMap: Map<number, JornadaHorario>
+  /** Dias de plantão do mês (só para jornada PLANTAO com escala definida) */
+  escalaPlantao: Map<string, boolean> | null
+}
+
+/**
+ * Espelho como é salvo e transferido entre threads: registros em ISO
+ * (o DateTime do luxon não passa pelo postMessage)
+ */
+export type EspelhoSerializado = Omit<EspelhoCalculado, 'dias'> & {
+  dias: Array<Omit<DiaTrabalhado, 'registros'> & { registros: string[] }>
+}
+
+/** Data enviada a uma thread: instante e fuso */
+interface DataTransferida {
+  ms: number
+  zona: string
+}
+
+/**
+ * Contexto do período enviado às threads de cálculo (Map e Set passam pelo
+ * postMessage, as datas vão como instante e fuso)
+ */
+export type ContextoTransferido = Omit<
+  ContextoPeriodo,
+  'inicioMes' | 'fimMes' | 'dataFechamento' | 'dataInicioSistema'
+> & {
+  inicioMes: DataTransferida
+  fimMes: DataTransferida
+  dataFechamento: DataTransferida
+  dataInicioSistema: DataTransferida | null
+}
+
+/** Resultado do cálculo de um funcionário */
+export interface ResultadoCalculo {
+  funcionarioId: number
+  espelho?: EspelhoSerializado
+  erro?: string
+}
+
+export const ZONA = 'America/Sao_Paulo'
+
+export class CalculoPontoNucleo {
+  /**
+   * Calcula o espelho a partir dos dados já carregados (sem acesso ao banco)
+   */
+  public static montarEspelho(
+    contexto: ContextoPeriodo,
+    dadosFuncionario: DadosFuncionarioPeriodo
+  ): EspelhoCalculado {
+    const { inicioMes, fimMes } = contexto
+    const parametros = CalculoPontoNucleo.prepararJornada(contexto, dadosFuncionario)
+
+    // Registros do período (os seguintes só entram no turno que cruza o fechamento)
+    const limitePeriodo = fimMes.toMillis()
+    const registrosPeriodo = dadosFuncionario.registros.filter(
+      (r) => new Date(r.data_hora).getTime() <= limitePeriodo
+    )
+
+    // Agrupa registros por dia
+    const registrosPorDia = CalculoPontoNucleo.agruparRegistrosPorDia(registrosPeriodo)
+
+    // Processa cada dia do mês
+    const dias: DiaTrabalhado[] = []
+    for (let diaAtual = inicioMes; diaAtual <= fimMes; diaAtual = diaAtual.plus({ days: 1 })) {
+      const dataStr = diaAtual.toISODate()!
+      dias.push(
+        CalculoPontoNucleo.calcularDia(
+          contexto,
+          parametros,
+          diaAtual,
+          registrosPorDia[dataStr] || [],
+          dadosFuncionario.folgas.get(dataStr)
+        )
+      )
+    }
+
+    const fechamento = CalculoPontoNucleo.calcularFechamento(contexto, dadosFuncionario.registros)
+    return CalculoPontoNucleo.totalizar(contexto, dadosFuncionario.funcionario.id, dias, fechamento)
+  }
+
+  /**
+   * Jornada do funcionário com os valores padrão e a escala de plantão do mês
+   */
+  public static prepararJornada(
+    contexto: ContextoPeriodo,
+    dadosFuncionario: Pick<DadosFuncionarioPeriodo, 'funcionario' | 'ultimoRegistroAnterior' | 'escalaPlantao'>
+  ): ParametrosJornada {
+    const { funcionario } = dadosFuncionario
+    const jornada = contexto.jornadas.get(funcionario.jornada_id) ?? null
+
+    // Valores padrão se não tiver jornada
+    const tipoJornada = jornada?.tipo || 'NORMAL'
+    const temIntervalo = jornada?.tem_intervalo ?? true
+
+    // Para jornada tipo PLANTAO, precisamos calcular a escala
+    // Ex: 12x36 = trabalha 12h, folga 36h | 24x72 = trabalha 24h, folga 72h
+    let escalaPlantao: Map<string, boolean> | null = null
+    if (tipoJornada === 'PLANTAO' && jornada?.horas_plantao && jornada?.horas_folga) {
+      escalaPlantao = dadosFuncionario.escalaPlantao ?? CalculoPontoNucleo.calcularEscalaPlantao(
+        dadosFuncionario.ultimoRegistroAnterior,
+        jornada.horas_plantao,
+        jornada.horas_folga,
+        contexto.inicioMes,
+        contexto.fimMes
+      )
+    }
+
+    return {
+      jornada,
+      cargaHorariaDiaria: jornada?.carga_horaria_diaria || 480, // 8h
+      toleranciaEntrada: jornada?.tolerancia_entrada || 10,
+      toleranciaSaida: jornada?.tolerancia_saida || 10,
+      tipoJornada,
+      marcacoesDia: jornada?.marcacoes_dia || (temIntervalo ? 4 : 2),
+      // Mapa de horários por dia da semana
+      horariosMap: contexto.horarios.get(funcionario.jornada_id) ?? new Map<number, JornadaHorario>(),
+      escalaPlantao,
+    }
+  }
+
+  /**
+   * Calcula um dia do espelho a partir dos registros do dia
+   */
+  public static calcularDia(
+    contexto: ContextoPeriodo,
+    parametros: ParametrosJornada,
+    diaAtual: DateTime,
+    registrosDia: DateTime[],
+    folgaProgramada?: FolgaProgramada
+  ): DiaTrabalhado {
+    const { dataInicioSistema } = contexto
+    const {
+      jornada,
+      cargaHorariaDiaria,
+      toleranciaEntrada,
+      toleranciaSaida,
+      tipoJornada,
+      marcacoesDia,
+      horariosMap,
+      escalaPlantao,
+    } = parametros
+    const dataStr = diaAtual.toISODate()!
+    const diaSemana = CalculoPontoNucleo.getDiaSemana(diaAtual)
+
+    // Verifica se é anterior à data de início do sistema
+    const isAntesDaDataInicio = dataInicioSistema && diaAtual < dataInicioSistema
+
+    // Verifica se é feriado
+    const isFeriado = contexto.feriados.has(dataStr)
+
+    // Verifica se é folga programada (escala de folgas)
+    const isFolgaProgramada = !!folgaProgramada
+
+    // Determina se é dia de trabalho com base no tipo de jornada
+    let isDiaTrabalho = false
+    let horasPrevistasDia = 0
+    const horarioDia = horariosMap.get(diaSemana)
+
+    // Se é anterior à data de início do sistema, não conta como dia de trabalho
+    if (isAntesDaDataInicio) {
+      return {
+        data: dataStr,
+        diaSemana,
+        registros: [],
+        horasPrevistas: 0,
+        horasTrabalhadas: 0,
+        atraso: 0,
+        horaExtra: 0,
+        horaFaltante: 0,
+        feriado: false,
+        folga: true,
+        falta: false,
+        ocorrencias: ['ANTES DO INÍCIO DO SISTEMA'],
+      }
+    }
+
+    if (tipoJornada === 'PLANTAO' && escalaPlantao) {
+      // Para plantão, verifica a escala calculada
+      isDiaTrabalho = escalaPlantao.get(dataStr) === true && !isFolgaProgramada
+      if (isDiaTrabalho) {
+        // Horas previstas = horas do plantão (em minutos)
+        horasPrevistasDia = (jornada?.horas_plantao || 12) * 60
+      }
+    } else {
+      // Para NORMAL e CORRIDA, verifica configuração da jornada para o dia
+      // Só é folga se: não tem horário configurado OU campo folga = true OU folga programada
+      const isFolga = !horarioDia || horarioDia.folga === true || isFolgaProgramada
+      isDiaTrabalho = !isFolga && !isFeriado
+      if (isDiaTrabalho && horarioDia) {
+        // Calcula horas previstas baseado nos horários configurados para o dia
+        horasPrevistasDia = CalculoPontoNucleo.calcularHorasPrevistasDia(horarioDia)
+      } else if (isDiaTrabalho) {
+        horasPrevistasDia = cargaHorariaDiaria
+      }
+    }
+
+    // Se não é dia de trabalho (folga, feriado ou escala de plantão)
+    if (!isDiaTrabalho || isFeriado) {
+      const horasTrabalhadasDia = CalculoPontoNucleo.calcularHorasTrabalhadas(registrosDia)
+      return {
+        data: dataStr,
+        diaSemana,
+        registros: registrosDia,
+        horasPrevistas: 0,
+        horasTrabalhadas: horasTrabalhadasDia,
+        atraso: 0,
+        horaExtra: horasTrabalhadasDia, // Trabalho em folga/feriado = hora extra
+        horaFaltante: 0,
+        feriado: isFeriado,
+        folga: !isDiaTrabalho && !isFeriado,
+        falta: false,
+        ocorrencias: CalculoPontoNucleo.gerarOcorrenciasFolga(isFeriado, tipoJornada, horasTrabalhadasDia, folgaProgramada),
+      }
+    }
+
+    // Dia de trabalho
+    const horasTrabalhadas = CalculoPontoNucleo.calcularHorasTrabalhadas(registrosDia)
+
+    // Calcula atraso (se entrou depois do horário + tolerância)
+    let atraso = 0
+    if (horarioDia?.entrada_1 && registrosDia.length > 0) {
+      const [h, m] = horarioDia.entrada_1.split(':').map(Number)
+      const horarioPrevisto = diaAtual.set({ hour: h, minute: m })
+      const primeiroRegistro = registrosDia[0]
+      const diffMinutos = primeiroRegistro.diff(horarioPrevisto, 'minutes').minutes
+
+      if (diffMinutos > toleranciaEntrada) {
+        atraso = Math.round(diffMinutos - toleranciaEntrada)
+      }
+    }
+
+    // Calcula horas extras ou faltantes
+    let horaExtra = 0
+    let horaFaltante = 0
+    const diff = horasTrabalhadas - horasPrevistasDia
+
+    if (diff > toleranciaSaida) {
+      horaExtra = Math.round(diff - toleranciaSaida)
+    } else if (diff < -toleranciaSaida) {
+      horaFaltante = Math.abs(Math.round(diff + toleranciaSaida))
+    }
+
+    // Verifica falta (nenhum registro no dia de trabalho)
+    const isFalta = CalculoPontoNucleo.identificarFalta(registrosDia, false, false)
+
+    // Verifica marcações esperadas baseado na jornada configurada para o dia
+    // Se não tem período da tarde, espera só 2 marcações (entrada e saída)
+    let marcacoesEsperadas = marcacoesDia
+    if (horarioDia && (!horarioDia.entrada_2 || !horarioDia.saida_2)) {
+      marcacoesEsperadas = 2 // Só manhã = 2 marcações
+    }
+    const registrosImpares = registrosDia.length % 2 !== 0
+    const marcacoesIncompletas = registrosDia.length > 0 && registrosDia.length < marcacoesEsperadas
+
+    const ocorrencias: string[] = []
+    if (isFalta) ocorrencias.push('FALTA')
+    if (atraso > 0) ocorrencias.push(`ATRASO ${atraso}min`)
+    if (horaExtra > 0) ocorrencias.push(`HORA EXTRA ${CalculoPontoNucleo.minutosParaHHMM(horaExtra)}`)
+    if (horaFaltante > 0) ocorrencias.push(`HORA FALTANTE ${CalculoPontoNucleo.minutosParaHHMM(horaFaltante)}`)
+    if (registrosImpares) ocorrencias.push('REGISTRO IMPAR')
+    if (marcacoesIncompletas && !registrosImpares) {
+      ocorrencias.push(`MARCACOES INCOMPLETAS (${registrosDia.length}/${marcacoesEsperadas})`)
+    }
+    if (tipoJornada === 'PLANTAO') ocorrencias.push('PLANTAO')
+
+    return {
+      data: dataStr,
+      diaSemana,
+      registros: registrosDia,
+      horasPrevistas: horasPrevistasDia,
+      horasTrabalhadas,
+      atraso,
+      horaExtra,
+      horaFaltante,
+      feriado: false,
+      folga: false,
+      falta: isFalta,
+      ocorrencias,
+    }
+  }
+
+  /**
+   * Verifica se há turno noturno que cruza o dia de fechamento
+   * (entrada no dia do fechamento, saída no dia seguinte)
+   * Aplica para qualquer jornada (NORMAL, PLANTAO, CORRIDA)
+   *
+   * @param registros Registros do funcionário que incluam o dia do fechamento e o seguinte
+   */
+  public static calcularFechamento(
+    contexto: Pick<ContextoPeriodo, 'dataFechamento'>,
+    registros: RegistroPonto[]
+  ): { horasParaProximoPeriodo: number; registrosAfetados: string[] } {
+    const { dataFechamento } = contexto
+    const diaApos = dataFechamento.plus({ days: 1 })
+    const limiteSaida = CalculoPontoNucleo.limiteSaidaFechamento(dataFechamento)
+    // Só converte os registros próximos do fechamento (folga de um dia para o fuso)
+    const inicioFechamento = dataFechamento.minus({ days: 1 }).startOf('day').toMillis()
+    const registrosComData = registros
+      .filter((r) => new Date(r.data_hora).getTime() >= inicioFechamento)
+      .map((r) => ({ dt: CalculoPontoNucleo.paraDateTime(r.data_hora), sentido: r.sentido }))
+    return CalculoPontoNucleo.dividirTurnoFechamento(
+      registrosComData.filter((r) => r.dt.toISODate() === dataFechamento.toISODate()),
+      registrosComData.filter((r) => r.dt.toISODate() === diaApos.toISODate() && r.dt < limiteSaida),
+      dataFechamento
+    )
+  }
+
+  /**
+   * Totais do espelho a partir dos dias e do turno que cruza o fechamento
+   */
+  public static totalizar(
+    contexto: ContextoPeriodo,
+    funcionarioId: number,
+    dias: DiaTrabalhado[],
+    fechamento: { horasParaProximoPeriodo: number; registrosAfetados: string[] }
+  ): EspelhoCalculado {
+    const { mes, ano, dataFechamento } = contexto
+    const horasParaProximoPeriodo = fechamento.horasParaProximoPeriodo
+    const observacoesFechamento = fechamento.registrosAfetados
+
+    // Se houver horas para o próximo período, adiciona observação no dia do fechamento
+    if (horasParaProximoPeriodo > 0) {
+      const diaFechamentoStr = dataFechamento.toISODate()
+      const diaEncontrado = dias.find(d => d.data === diaFechamentoStr)
+      // Um dia reaproveitado de um espelho salvo (atualização incremental) já tem a observação
+      const jaObservado = diaEncontrado?.ocorrencias.some((o) => o.startsWith('TURNO CRUZA FECHAMENTO'))
+      if (diaEncontrado && !jaObservado) {
+        diaEncontrado.ocorrencias.push(
+          `TURNO CRUZA FECHAMENTO: ${CalculoPontoNucleo.minutosParaHHMM(horasParaProximoPeriodo)} para próximo período`
+        )
+      }
+    }
+
+    // Calcula totais
+    const horasTrabalhadasBruto = dias.reduce((acc, d) => acc + d.horasTrabalhadas, 0)
+    // Subtrai as horas que vão para o próximo período
+    const horasTrabalhadasLiquido = horasTrabalhadasBruto - horasParaProximoPeriodo
+
+    const totais = {
+      diasUteis: dias.filter((d) => !d.folga && !d.feriado).length,
+      diasTrabalhados: dias.filter((d) => d.horasTrabalhadas > 0).length,
+      horasPrevistas: dias.reduce((acc, d) => acc + d.horasPrevistas, 0),
+      horasTrabalhadas: horasTrabalhadasLiquido, // Já descontando horas do próximo período
+      horasTrabalhadasBruto, // Total bruto sem desconto
+      horasParaProximoPeriodo, // Horas que vão para o próximo mês
+      atrasos: dias.reduce((acc, d) => acc + d.atraso, 0),
+      horasExtras: dias.reduce((acc, d) => acc + d.horaExtra, 0),
+      horasFaltantes: dias.reduce((acc, d) => acc + d.horaFaltante, 0),
+      faltas: dias.filter((d) => d.falta).length,
+      observacoesFechamento, // Detalhes dos plantões que cruzaram o fechamento
+    }
+
+    return {
+      funcionario_id: funcionarioId,
+      mes,
+      ano,
+      dias,
+      totais,
+    }
+  }
+
+  /**
+   * Calcula a escala de plantão a partir do último registro antes do mês
+   */
+  private static calcularEscalaPlantao(
+    ultimoRegistro: Date | string | null,
+    horasTrabalho: number,
+    horasFolga: number,
+    inicioMes: DateTime,
+    fimMes: DateTime
+  ): Map<string, boolean> {
+    return CalculoPontoNucleo.calendarioPlantao(
+      // Usa timezone de São Paulo para garantir data correta
+      ultimoRegistro ? CalculoPontoNucleo.paraDateTime(ultimoRegistro).startOf('day') : null,
+      horasTrabalho,
+      horasFolga,
+      inicioMes,
+      fimMes
+    )
+  }
+
+  /**
+   * Dias de plantão do período, contados a partir do dia de referência
+   * (o do último registro antes do mês)
+   */
+  public static calendarioPlantao(
+    diaReferencia: DateTime | null,
+    horasTrabalho: number,
+    horasFolga: number,
+    inicioMes: DateTime,
+    fimMes: DateTime
+  ): Map<string, boolean> {
+    const escala = new Map<string, boolean>()
+
+    // Se não houver registros, assume o primeiro dia do mês como referência
+    let diaAtual = diaReferencia ?? inicioMes
+    while (diaAtual <= fimMes) {
+      // Dia de trabalho
+      escala.set(diaAtual.toISODate()!, true)
+
+      // Avança para o próximo dia de trabalho
+      const proximoDiaTrabalho = diaAtual.plus({ hours: horasTrabalho + horasFolga })
+      diaAtual = proximoDiaTrabalho.startOf('day')
+    }
+
+    return escala
+  }
+
+  /**
+   * Gera ocorrências para dias de folga/feriado
+   */
+  private static gerarOcorrenciasFolga(
+    isFeriado: boolean,
+    tipoJornada: string,
+    horasTrabalhadas: number,
+    folgaProgramada?: { tipo: string; motivo: string | null } | null
+  ): string[] {
+    const ocorrencias: string[] = []
+    if (isFeriado) {
+      ocorrencias.push('FERIADO')
+    } else if (folgaProgramada) {
+      const tipoFolga = folgaProgramada.tipo || 'FOLGA'
+      const motivo = folgaProgramada.motivo ? ` - ${folgaProgramada.motivo}` : ''
+      ocorrencias.push(`${tipoFolga} PROGRAMADA${motivo}`)
+    } else {
+      ocorrencias.push('FOLGA')
+    }
+
+    if (horasTrabalhadas > 0) {
+      ocorrencias.push(`TRABALHO EM FOLGA/FERIADO (${CalculoPontoNucleo.minutosParaHHMM(horasTrabalhadas)})`)
+    }
+    if (tipoJornada === 'PLANTAO') ocorrencias.push('PLANTAO')
+
+    return ocorrencias
+  }
+
+  /**
+   * Calcula as horas previstas para um dia baseado nos horários configurados
+   * Se não tem horário da tarde configurado, conta apenas a manhã
+   */
+  public static calcularHorasPrevistasDia(horarioDia: JornadaHorario): number {
+    let totalMinutos = 0
+
+    // Período da manhã (entrada_1 e saida_1)
+    if (horarioDia.entrada_1 && horarioDia.saida_1) {
+      const [h1, m1] = horarioDia.entrada_1.split(':').map(Number)
+      const [h2, m2] = horarioDia.saida_1.split(':').map(Number)
+      totalMinutos += (h2 * 60 + m2) - (h1 * 60 + m1)
+    }
+
+    // Período da tarde (entrada_2 e saida_2) - só conta se estiver configurado
+    if (horarioDia.entrada_2 && horarioDia.saida_2) {
+      const [h3, m3] = horarioDia.entrada_2.split(':').map(Number)
+      const [h4, m4] = horarioDia.saida_2.split(':').map(Number)
+      totalMinutos += (h4 * 60 + m4) - (h3 * 60 + m3)
+    }
+
+    return totalMinutos
+  }
+
+  /**
+   * Calcula o total de horas trabalhadas em um dia
+   */
+  public static calcularHorasTrabalhadas(registros: DateTime[]): number {
+    let totalMinutos = 0
+    for (let i = 0; i < registros.length; i += 2) {
+      if (registros[i + 1]) {
+        const diff = registros[i + 1].diff(registros[i], 'minutes').minutes
+        totalMinutos += diff
+      }
+    }
+    return Math.round(totalMinutos)
+  }
+
+  /**
+   * Calcula o atraso em minutos, considerando a tolerância
+   */
+  public static calcularAtraso(
+    horaEntrada: DateTime,
+    horaPrevistoEntrada: DateTime,
+    tolerancia: number
+  ): number {
+    const diffMinutos = horaEntrada.diff(horaPrevistoEntrada, 'minutes').minutes
+    return diffMinutos > tolerancia ? Math.round(diffMinutos - tolerancia) : 0
+  }
+
+  /**
+   * Calcula a hora extra em minutos
+   */
+  public static calcularHoraExtra(horasTrabalhadas: number, horasPrevistas: number): number {
+    const diff = horasTrabalhadas - horasPrevistas
+    return diff > 0 ? diff : 0
+  }
+
+  /**
+   * Calcula a hora faltante em minutos
+   */
+  public static calcularHoraFaltante(horasTrabalhadas: number, horasPrevistas: number): number {
+    const diff = horasPrevistas - horasTrabalhadas
+    return diff > 0 ? diff : 0
+  }
+
+  /**
+   * Identifica se o dia foi uma falta
+   */
+  public static identificarFalta(
+    registros: DateTime[],
+    ehFolga: boolean,
+    ehFeriado: boolean
+  ): boolean {
+    return registros.length === 0 && !ehFolga && !ehFeriado
+  }
+
+  /**
+   * Converte minutos para formato HH:MM
+   */
+  public static minutosParaHHMM(minutos: number): string {
+    if (minutos === 0) return '00:00'
+    const h = Math.floor(minutos / 60)
+      .toString()
+      .padStart(2, '0')
+    const m = (minutos % 60).toString().padStart(2, '0')
+    return `${h}:${m}`
+  }
+
+  /**
+   * Agrupa registros por dia
+   * Usa timezone de São Paulo para garantir que registros noturnos não sejam
+   * atribuídos ao dia seguinte
+   */
+  public static agruparRegistrosPorDia(registros: RegistroPonto[]): Record<string, DateTime[]> {
+    const agrupados: Record<string, DateTime[]> = {}
+    const zone = 'America/Sao_Paulo'
+
+    for (const registro of registros) {
+      // data_hora pode ser Date (do PostgreSQL) ou string (de JSON)
+      // Sempre usa timezone de São Paulo para garantir agrupamento correto
+      let dt: DateTime
+      if (registro.data_hora instanceof Date) {
+        dt = DateTime.fromJSDate(registro.data_hora, { zone })
+      } else {
+        dt = DateTime.fromISO(registro.data_hora as string, { zone })
+      }
+
+      const data = dt.toISODate()!
+      if (!agrupados[data]) {
+        agrupados[data] = []
+      }
+      agrupados[data].push(dt)
+    }
+    return agrupados
+  }
+
+  /**
+   * Obtém o dia da semana (0=Dom, 1=Seg, ...)
+   */
+  public static getDiaSemana(data: DateTime): number {
+    return data.weekday % 7
+  }
+
+  /**
+   * Verifica se é um dia útil
+   */
+  public static isDiaUtil(data: DateTime, ehFeriado: boolean): boolean {
+    const diaSemana = this.getDiaSemana(data)
+    return diaSemana >= 1 && diaSemana <= 5 && !ehFeriado
+  }
+
+  /**
+   * Calcula horas trabalhadas considerando plantões que cruzam o fechamento
+   *
+   * Se um plantão começa antes do fechamento e termina depois:
+   * - Horas até 23:59:59 do dia do fechamento = período atual
+   * - Horas de 00:00:00 em diante = próximo período
+   *
+   * @param registros Array de registros de entrada/saída (DateTime)
+   * @param dataFechamento Data limite do período
+   * @returns { horasPeriodoAtual: number, horasProximoPeriodo: number }
+   */
+  public static calcularHorasComFechamento(
+    registros: DateTime[],
+    dataFechamento: DateTime
+  ): { horasPeriodoAtual: number; horasProximoPeriodo: number } {
+    let horasPeriodoAtual = 0
+    let horasProximoPeriodo = 0
+
+    for (let i = 0; i < registros.length; i += 2) {
+      const entrada = registros[i]
+      const saida = registros[i + 1]
+
+      if (!saida) continue
+
+      // Verifica se o plantão cruza o fechamento
+      const fimDiaFechamento = dataFechamento.endOf('day')
+      const inicioDiaAposFechamento = dataFechamento.plus({ days: 1 }).startOf('day')
+
+      if (entrada <= fimDiaFechamento && saida > fimDiaFechamento) {
+        // Plantão cruza o fechamento - divide as horas
+        // Horas até a meia-noite do dia do fechamento
+        const minutosAteFechamento = fimDiaFechamento.diff(entrada, 'minutes').minutes
+        horasPeriodoAtual += Math.max(0, Math.round(minutosAteFechamento))
+
+        // Horas do dia seguinte em diante
+        const minutosAposFechamento = saida.diff(inicioDiaAposFechamento, 'minutes').minutes
+        horasProximoPeriodo += Math.max(0, Math.round(minutosAposFechamento))
+      } else if (entrada <= fimDiaFechamento && saida <= fimDiaFechamento) {
+        // Plantão totalmente dentro do período atual
+        const minutos = saida.diff(entrada, 'minutes').minutes
+        horasPeriodoAtual += Math.round(minutos)
+      } else {
+        // Plantão totalmente no próximo período
+        const minutos = saida.diff(entrada, 'minutes').minutes
+        horasProximoPeriodo += Math.round(minutos)
+      }
+    }
+
+    return { horasPeriodoAtual, horasProximoPeriodo }
+  }
+
+  /**
+   * Horário até onde um registro do dia seguinte ao fechamento ainda é
+   * considerado a saída do turno iniciado no dia do fechamento
+   */
+  public static limiteSaidaFechamento(dataFechamento: DateTime): DateTime {
+    return dataFechamento.plus({ days: 1 }).set({ hour: 12 })
+  }
+
+  /**
+   * Divide o turno iniciado no dia do fechamento e encerrado no dia seguinte
+   *
+   * @param registrosDia Registros do dia do fechamento, em ordem
+   * @param registrosSaida Registros do dia seguinte até o limite da saída, em ordem
+   */
+  public static dividirTurnoFechamento(
+    registrosDia: { dt: DateTime; sentido: string | null }[],
+    registrosSaida: { dt: DateTime; sentido: string | null }[],
+    dataFechamento: DateTime
+  ): { horasParaProximoPeriodo: number; registrosAfetados: string[] } {
+    let horasParaProximoPeriodo = 0
+    const registrosAfetados: string[] = []
+    const diaApos = dataFechamento.plus({ days: 1 })
+
+    // Verifica se há entrada no dia do fechamento com saída no dia seguinte
+    const ultimaEntrada = registrosDia.filter((r, i) => r.sentido === 'E' || i % 2 === 0).pop()
+    const primeiraSaida = registrosSaida[0]
+
+    if (ultimaEntrada && primeiraSaida) {
+      const dtEntrada = ultimaEntrada.dt
+      const dtSaida = primeiraSaida.dt
+
+      // Se a entrada é no dia do fechamento e a saída é no dia seguinte
+      if (dtEntrada.toISODate() === dataFechamento.toISODate() &&
+          dtSaida.toISODate() === diaApos.toISODate()) {
+
+        // Horas que devem ir para o próximo período (00:00 até a saída)
+        const inicioDia = diaApos.startOf('day')
+        horasParaProximoPeriodo = Math.round(dtSaida.diff(inicioDia, 'minutes').minutes)
+        registrosAfetados.push(
+          `Turno ${dtEntrada.toFormat('dd/MM HH:mm')} - ${dtSaida.toFormat('dd/MM HH:mm')}: ` +
+          `${CalculoPontoNucleo.minutosParaHHMM(horasParaProximoPeriodo)} vão para o próximo período`
+        )
+      }
+    }
+
+    return { horasParaProximoPeriodo, registrosAfetados }
+  }
+
+  /**
+   * Converte data_hora (Date do PostgreSQL ou string de JSON) no horário de São Paulo
+   */
+  public static paraDateTime(dataHora: Date | string): DateTime {
+    return dataHora instanceof Date
+      ? DateTime.fromJSDate(dataHora, { zone: ZONA })
+      : DateTime.fromISO(dataHora, { zone: ZONA })
+  }
+
+  /**
+   * Calcula os espelhos de um bloco de funcionários; o erro de um não impede os demais
+   */
+  public static calcularBloco(
+    contexto: ContextoPeriodo,
+    funcionarios: DadosFuncionarioPeriodo[]
+  ): ResultadoCalculo[] {
+    return funcionarios.map((dados) => {
+      try {
+        const espelho = CalculoPontoNucleo.montarEspelho(contexto, dados)
+        return { funcionarioId: dados.funcionario.id, espelho: CalculoPontoNucleo.serializarEspelho(espelho) }
+      } catch (err: any) {
+        return { funcionarioId: dados.funcionario.id, erro: err.message }
+      }
+    })
+  }
+
+  /**
+   * Espelho com os registros em ISO, como fica no JSON salvo
+   */
+  public static serializarEspelho(espelho: EspelhoCalculado): EspelhoSerializado {
+    return {
+      ...espelho,
+      dias: espelho.dias.map((dia) => ({ ...dia, registros: dia.registros.map((r) => r.toISO()!) })),
+    }
+  }
+
+  public static contextoParaTransferencia(contexto: ContextoPeriodo): ContextoTransferido {
+    const transferir = (data: DateTime) => ({ ms: data.toMillis(), zona: data.zoneName! })
+    return {
+      ...contexto,
+      inicioMes: transferir(contexto.inicioMes),
+      fimMes: transferir(contexto.fimMes),
+      dataFechamento: transferir(contexto.dataFechamento),
+      dataInicioSistema: contexto.dataInicioSistema ? transferir(contexto.dataInicioSistema) : null,
+    }
+  }
+
+  public static contextoDeTransferencia(contexto: ContextoTransferido): ContextoPeriodo {
+    const restaurar = (data: DataTransferida) => DateTime.fromMillis(data.ms, { zone: data.zona })
+    return {
+      ...contexto,
+      inicioMes: restaurar(contexto.inicioMes),
+      fimMes: restaurar(contexto.fimMes),
+      dataFechamento: restaurar(contexto.dataFechamento),
+      dataInicioSistema: contexto.dataInicioSistema ? restaurar(contexto.dataInicioSistema) : null,
+    }
+  }
+}
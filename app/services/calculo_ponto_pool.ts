@@ -0,0 +1,216 @@
+/**
+ * Pool de threads para o cálculo dos espelhos
+ *
+ * O fechamento do mês calcula milhares de espelhos: no processo principal o
+ * cálculo trava o event loop (requisições HTTP e heartbeat do Socket.io). O
+ * pool divide os funcionários em tarefas e as distribui entre threads
+ * (worker_threads) que executam o CalculoPontoNucleo sobre os dados já
+ * carregados e devolvem os espelhos prontos para salvar.
+ *
+ * - CALCULO_THREADS: quantidade de threads (padrão: núcleos - 1; 0 calcula
+ *   no processo principal)
+ * - as threads são criadas no primeiro uso e não seguram o processo aberto
+ *   quando ociosas
+ * - thread que cai durante uma tarefa é recriada
+ * - threads que saem antes de concluir alguma tarefa (ex.: sem o loader do
+ *   TypeScript, falta de memória) pausam o pool com espera crescente; nesse
+ *   tempo o cálculo roda no processo principal. Depois de
+ *   FALHAS_PARA_DESATIVAR tentativas seguidas sem sucesso o pool fica
+ *   desativado até o processo reiniciar
+ */
+
+import os from 'node:os'
+import { extname } from 'node:path'
+import { fileURLToPath } from 'node:url'
+import { Worker } from 'node:worker_threads'
+import {
+  CalculoPontoNucleo,
+  type ContextoPeriodo,
+  type ContextoTransferido,
+  type DadosFuncionarioPeriodo,
+  type ResultadoCalculo,
+} from '#services/calculo_ponto_nucleo'
+
+/** Funcionários por tarefa enviada a uma thread */
+const FUNCIONARIOS_POR_TAREFA = 25
+/** Espera depois da primeira tentativa de criar as threads que falhou (dobra a cada falha seguida) */
+const ESPERA_INICIAL_MS = 1000
+const ESPERA_MAXIMA_MS = 5 * 60 * 1000
+/** Tentativas seguidas sem nenhuma thread concluir tarefa até desativar o pool */
+const FALHAS_PARA_DESATIVAR = 5
+
+/** Mesma extensão deste arquivo: .ts em desenvolvimento, .js no build */
+const ARQUIVO_THREAD = new URL(
+  `./calculo_ponto_worker${extname(fileURLToPath(import.meta.url))}`,
+  import.meta.url
+)
+
+interface Tarefa {
+  id: number
+  contexto: ContextoTransferido
+  funcionarios: DadosFuncionarioPeriodo[]
+  resolve: (resultados: ResultadoCalculo[]) => void
+  reject: (error: Error) => void
+}
+
+interface Thread {
+  worker: Worker
+  tarefa: Tarefa | null
+  concluidas: number
+  /** Tentativa de criação das threads em que esta nasceu */
+  tentativa: number
+}
+
+class CalculoPontoPool {
+  private threads: Thread[] = []
+  private fila: Tarefa[] = []
+  private proximoId = 1
+  /** As threads não iniciaram em FALHAS_PARA_DESATIVAR tentativas: cálculo no processo principal */
+  private indisponivel = false
+  /** Pausa depois de uma tentativa que falhou (cálculo no processo principal até lá) */
+  private pausadoAte = 0
+  private tentativa = 0
+  private tentativaComFalha = 0
+  private falhasSeguidas = 0
+
+  /**
+   * Quantidade de threads (CALCULO_THREADS ou núcleos - 1)
+   */
+  get tamanho(): number {
+    const configurado = Number.parseInt(process.env.CALCULO_THREADS ?? '')
+    if (Number.isFinite(configurado)) return Math.max(0, configurado)
+    const nucleos = typeof os.availableParallelism === 'function' ? os.availableParallelism() : os.cpus().length
+    return Math.max(1, nucleos - 1)
+  }
+
+  /**
+   * Threads podem ser usadas agora (nem desativadas nem em pausa)
+   */
+  get disponivel(): boolean {
+    return !this.indisponivel && Date.now() >= this.pausadoAte
+  }
+
+  /**
+   * Calcula os espelhos dos funcionários, na mesma ordem recebida
+   */
+  async calcular(contexto: ContextoPeriodo, funcionarios: DadosFuncionarioPeriodo[]): Promise<ResultadoCalculo[]> {
+    if (funcionarios.length === 0) return []
+    if (!this.disponivel || this.tamanho === 0) {
+      return CalculoPontoNucleo.calcularBloco(contexto, funcionarios)
+    }
+
+    const transferido = CalculoPontoNucleo.contextoParaTransferencia(contexto)
+    const partes: Promise<ResultadoCalculo[]>[] = []
+    for (let inicio = 0; inicio < funcionarios.length; inicio += FUNCIONARIOS_POR_TAREFA) {
+      partes.push(this.enviar(transferido, funcionarios.slice(inicio, inicio + FUNCIONARIOS_POR_TAREFA)))
+    }
+
+    try {
+      return (await Promise.all(partes)).flat()
+    } catch (error: any) {
+      console.error('[Calculo Pool] Falha nas threads, calculando no processo principal:', error.message)
+      return CalculoPontoNucleo.calcularBloco(contexto, funcionarios)
+    }
+  }
+
+  private enviar(contexto: ContextoTransferido, funcionarios: DadosFuncionarioPeriodo[]) {
+    return new Promise<ResultadoCalculo[]>((resolve, reject) => {
+      this.fila.push({ id: this.proximoId++, contexto, funcionarios, resolve, reject })
+      this.despachar()
+    })
+  }
+
+  /**
+   * Entrega as tarefas da fila às threads livres
+   */
+  private despachar() {
+    this.iniciarThreads()
+    for (const thread of this.threads) {
+      if (this.fila.length === 0) break
+      if (thread.tarefa) continue
+
+      const tarefa = this.fila.shift()!
+      thread.tarefa = tarefa
+      thread.worker.ref() // Com tarefa em andamento, o processo espera a thread
+      thread.worker.postMessage({ id: tarefa.id, contexto: tarefa.contexto, funcionarios: tarefa.funcionarios })
+    }
+  }
+
+  private iniciarThreads() {
+    if (!this.disponivel || this.threads.length >= this.tamanho) return
+    this.tentativa++
+    while (this.threads.length < this.tamanho) {
+      const thread: Thread = {
+        worker: new Worker(ARQUIVO_THREAD),
+        tarefa: null,
+        concluidas: 0,
+        tentativa: this.tentativa,
+      }
+      thread.worker.unref()
+
+      thread.worker.on('message', ({ id, resultados }: { id: number; resultados: ResultadoCalculo[] }) => {
+        const tarefa = thread.tarefa
+        if (tarefa?.id !== id) return
+        thread.tarefa = null
+        thread.concluidas++
+        this.falhasSeguidas = 0
+        thread.worker.unref()
+        tarefa.resolve(resultados)
+        this.despachar()
+      })
+
+      thread.worker.on('error', (error) => {
+        console.error('[Calculo Pool] Erro na thread de cálculo:', error.message)
+      })
+
+      thread.worker.on('exit', (codigo) => {
+        this.threads = this.threads.filter((t) => t !== thread)
+        const tarefa = thread.tarefa
+        thread.tarefa = null
+        tarefa?.reject(new Error(`Thread de cálculo encerrada (código ${codigo})`))
+
+        // Não chegou a calcular nada: conta uma falha por tentativa (as threads
+        // de uma mesma tentativa costumam cair juntas)
+        if (thread.concluidas === 0 && thread.tentativa !== this.tentativaComFalha) {
+          this.tentativaComFalha = thread.tentativa
+          this.registrarFalhaInicio()
+        }
+
+        if (this.fila.length === 0) return
+        if (this.threads.length === 0 && !this.disponivel) {
+          for (const pendente of this.fila.splice(0)) {
+            pendente.reject(new Error('Threads de cálculo indisponíveis'))
+          }
+        } else {
+          this.despachar()
+        }
+      })
+
+      this.threads.push(thread)
+    }
+  }
+
+  /**
+   * Tentativa de criar as threads sem sucesso: pausa com espera crescente ou,
+   * depois de FALHAS_PARA_DESATIVAR seguidas, desativa o pool
+   */
+  private registrarFalhaInicio() {
+    this.falhasSeguidas++
+    if (this.falhasSeguidas >= FALHAS_PARA_DESATIVAR) {
+      this.indisponivel = true
+      console.error(
+        `[Calculo Pool] Threads de cálculo não iniciaram em ${this.falhasSeguidas} tentativas: cálculo no processo principal`
+      )
+      return
+    }
+
+    const espera = Math.min(ESPERA_MAXIMA_MS, ESPERA_INICIAL_MS * 2 ** (this.falhasSeguidas - 1))
+    this.pausadoAte = Date.now() + espera
+    console.warn(
+      `[Calculo Pool] Threads de cálculo não iniciaram (falha ${this.falhasSeguidas}/${FALHAS_PARA_DESATIVAR}): nova tentativa em ${espera / 1000}s`
+    )
+  }
+}
+
+export const calculoPontoPool = new CalculoPontoPool()
+export default calculoPontoPool
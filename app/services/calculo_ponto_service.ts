@@ -8,74 +8,57 @@
  * - Cálculo de atrasos, horas extras e horas faltantes
  */
 
+import app from '@adonisjs/core/services/app'
+import { readFile } from 'node:fs/promises'
 import { dbManager } from '#services/database_manager_service'
 import { DateTime } from 'luxon'
+import {
+  CalculoPontoNucleo,
+  ZONA,
+  type ContextoPeriodo,
+  type DadosFuncionarioPeriodo,
+  type EspelhoCalculado,
+  type EspelhoSerializado,
+  type FolgaProgramada,
+  type FuncionarioPonto,
+  type RegistroPonto,
+} from '#services/calculo_ponto_nucleo'
+import { calculoPontoPool } from '#services/calculo_ponto_pool'
+import { escalaPlantaoService } from '#services/escala_plantao_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
+import { bancoHorasSaldoService, COLUNAS_MOVIMENTO } from '#services/banco_horas_saldo_service'
+
+export type {
+  ContextoPeriodo,
+  DiaTrabalhado,
+  EspelhoCalculado,
+  EspelhoSerializado,
+  FolgaProgramada,
+  FuncionarioPonto,
+  RegistroPonto,
+} from '#services/calculo_ponto_nucleo'
+
+/** Funcionários carregados por vez no processamento do período */
+export const LOTE_FUNCIONARIOS = 500
+/** Espelhos gravados por transação (upsert de várias linhas) */
+export const ESPELHOS_POR_GRAVACAO = 100
+/** Vezes que um funcionário com marcações alteradas durante o processamento é recalculado */
+export const RODADAS_ALTERADOS = 3
 
-interface RegistroPonto {
-  id: number
-  funcionario_id: number
-  data_hora: Date | string
-  tipo: string
-  sentido: string | null
-  origem: string
-}
-
-interface Jornada {
-  id: number
-  carga_horaria_diaria: number // em minutos
-  tolerancia_entrada: number
-  tolerancia_saida: number
-  // Novos campos para suportar plantão e horário corrido
-  tipo: 'NORMAL' | 'PLANTAO' | 'CORRIDA' // NORMAL = seg-sex, PLANTAO = escala, CORRIDA = sem intervalo
-  horas_plantao: number | null // Para plantão: horas trabalhadas (12, 24)
-  horas_folga: number | null // Para plantão: horas de folga (36, 72)
-  tem_intervalo: boolean // Se tem intervalo para refeição
-  duracao_intervalo: number // Duração do intervalo em minutos
-  marcacoes_dia: number // 2 = entrada/saída, 4 = com intervalo
-}
-
-interface JornadaHorario {
-  dia_semana: number
-  entrada_1: string | null
-  saida_1: string | null
-  entrada_2: string | null
-  saida_2: string | null
-  folga: boolean
-}
-
-interface DiaTrabalhado {
-  data: string
-  diaSemana: number
-  registros: DateTime[]
-  horasPrevistas: number // em minutos
-  horasTrabalhadas: number // em minutos
-  atraso: number // em minutos
-  horaExtra: number // em minutos
-  horaFaltante: number // em minutos
-  feriado: boolean
-  folga: boolean
-  falta: boolean
-  ocorrencias: string[]
+/**
+ * Estado das marcações antes da carga dos dados de um lote (iniciarCarga):
+ * salvarEspelhos não grava por cima do espelho de quem mudou depois dela
+ */
+export interface CargaEspelhos {
+  /** Relógio do banco antes da carga */
+  em: Date
+  /** Versão das marcações do período por funcionário (espelhos_versoes) */
+  versoes: Map<number, number>
 }
 
-interface EspelhoCalculado {
-  funcionario_id: number
-  mes: number
-  ano: number
-  dias: DiaTrabalhado[]
-  totais: {
-    diasUteis: number
-    diasTrabalhados: number
-    horasPrevistas: number
-    horasTrabalhadas: number
-    atrasos: number
-    horasExtras: number
-    horasFaltantes: number
-    faltas: number
-  }
-}
+export class CalculoPontoService extends CalculoPontoNucleo {
+  private tabelasVerificadas = new Set<number>()
 
-export class CalculoPontoService {
   /**
    * Calcula as horas trabalhadas de um funcionário em um período
    */
@@ -86,73 +69,10 @@ export class CalculoPontoService {
     ano: number,
     diaFechamentoCustom?: number // Permite passar dia de fechamento customizado
   ): Promise<EspelhoCalculado> {
-    // Define período
-    const inicioMes = DateTime.local(ano, mes, 1).startOf('day')
-    const fimMesOriginal = inicioMes.endOf('month')
-    const hoje = DateTime.now().endOf('day') // endOf para incluir registros de hoje
-    // Não conta dias futuros - usa o menor entre fim do mês e hoje
-    const fimMes = fimMesOriginal < hoje ? fimMesOriginal : hoje
+    const contexto = await this.carregarContextoPeriodo(municipioId, mes, ano, diaFechamentoCustom)
 
-    // Busca configuração de dia de fechamento (padrão: último dia do mês)
-    let diaFechamento = diaFechamentoCustom
-    if (!diaFechamento) {
-      const configFechamento = await dbManager.queryMunicipioOne<{ valor: string }>(
-        municipioId,
-        `SELECT valor FROM configuracoes WHERE chave = 'dia_fechamento'`,
-        []
-      )
-      diaFechamento = configFechamento ? parseInt(configFechamento.valor) : 0 // 0 = fim do mês
-    }
-
-    // Data de fechamento do período atual
-    const dataFechamento = diaFechamento > 0 && diaFechamento <= 28
-      ? DateTime.local(ano, mes, diaFechamento).endOf('day')
-      : fimMesOriginal
-
-    // Busca data de início do sistema.
-    // Prioridade:
-    // 1) configuracao_tenant (schema do município)
-    // 2) public.municipios (fallback para bases legadas)
-    let dataInicioSistema: DateTime | null = null
-
-    try {
-      const cfgTenant = await dbManager.queryMunicipioOne<{ data_inicio_sistema: Date | null }>(
-        municipioId,
-        `SELECT data_inicio_sistema FROM configuracao_tenant LIMIT 1`,
-        []
-      )
-
-      if (cfgTenant?.data_inicio_sistema) {
-        dataInicioSistema = DateTime.fromJSDate(cfgTenant.data_inicio_sistema, {
-          zone: 'America/Sao_Paulo',
-        }).startOf('day')
-      }
-    } catch {
-      // Ignora e tenta fallback no banco central
-    }
-
-    if (!dataInicioSistema) {
-      const [municipio] = await dbManager.queryCentral<{ data_inicio_sistema: Date | null }>(
-        `SELECT data_inicio_sistema FROM public.municipios WHERE id = $1 LIMIT 1`,
-        [municipioId]
-      )
-
-      if (municipio?.data_inicio_sistema) {
-        dataInicioSistema = DateTime.fromJSDate(municipio.data_inicio_sistema, {
-          zone: 'America/Sao_Paulo',
-        }).startOf('day')
-      }
-    }
-    console.log(`[Espelho] dataInicioSistema=`, dataInicioSistema?.toISODate())
-
-    // Busca funcionário e jornada
-    const funcionario = await dbManager.queryMunicipioOne<{
-      id: number
-      nome: string
-      jornada_id: number
-      data_admissao: string
-      data_demissao: string | null
-    }>(
+    // Busca funcionário
+    const funcionario = await dbManager.queryMunicipioOne<FuncionarioPonto>(
       municipioId,
       `SELECT id, nome, jornada_id, data_admissao, data_demissao
        FROM funcionarios WHERE id = $1`,
@@ -163,507 +83,140 @@ export class CalculoPontoService {
       throw new Error('Funcionário não encontrado')
     }
 
-    // Busca jornada com todos os campos
-    const jornada = await dbManager.queryMunicipioOne<Jornada>(
-      municipioId,
-      `SELECT id, carga_horaria_diaria, tolerancia_entrada, tolerancia_saida,
-              COALESCE(tipo, 'NORMAL') as tipo,
-              horas_plantao, horas_folga,
-              COALESCE(tem_intervalo, true) as tem_intervalo,
-              COALESCE(duracao_intervalo, 60) as duracao_intervalo,
-              COALESCE(marcacoes_dia, 4) as marcacoes_dia
-       FROM jornadas WHERE id = $1`,
-      [funcionario.jornada_id]
-    )
-
-    // Valores padrão se não tiver jornada
-    const cargaHorariaDiaria = jornada?.carga_horaria_diaria || 480 // 8h
-    const toleranciaEntrada = jornada?.tolerancia_entrada || 10
-    const toleranciaSaida = jornada?.tolerancia_saida || 10
-    const tipoJornada = jornada?.tipo || 'NORMAL'
-    const temIntervalo = jornada?.tem_intervalo ?? true
-    const marcacoesDia = jornada?.marcacoes_dia || (temIntervalo ? 4 : 2)
-
-    // Busca horários da jornada por dia da semana
-    const horarios = await dbManager.queryMunicipio<JornadaHorario>(
-      municipioId,
-      `SELECT dia_semana, entrada_1, saida_1, entrada_2, saida_2, folga
-       FROM jornada_horarios WHERE jornada_id = $1`,
-      [funcionario.jornada_id || 0]
-    )
-
-    // Mapa de horários por dia da semana
-    const horariosMap = new Map<number, JornadaHorario>()
-    horarios.forEach((h) => horariosMap.set(h.dia_semana, h))
-
-    // Busca feriados do período
-    const feriados = await dbManager.queryMunicipio<{ data: string }>(
-      municipioId,
-      `SELECT TO_CHAR(data, 'YYYY-MM-DD') as data FROM feriados
-       WHERE data BETWEEN $1 AND $2
-       OR (recorrente = true AND EXTRACT(MONTH FROM data) = $3)`,
-      [inicioMes.toISODate(), fimMes.toISODate(), mes]
-    )
-    const feriadosSet = new Set(feriados.map((f) => f.data))
-
-    // Busca folgas programadas do funcionário no período
-    const folgasProgramadas = await dbManager.queryMunicipio<{ data: string; tipo: string; motivo: string | null }>(
-      municipioId,
-      `SELECT TO_CHAR(data, 'YYYY-MM-DD') as data, tipo, motivo FROM folgas_programadas
-       WHERE funcionario_id = $1 AND data BETWEEN $2 AND $3`,
-      [funcionarioId, inicioMes.toISODate(), fimMes.toISODate()]
-    )
-    const folgasProgramadasMap = new Map(folgasProgramadas.map((f) => [f.data, f]))
-
-    // Busca registros do período
-    const registros = await dbManager.queryMunicipio<RegistroPonto>(
-      municipioId,
-      `SELECT id, funcionario_id, data_hora, tipo, sentido, origem
-       FROM registros_ponto
-       WHERE funcionario_id = $1
-       AND data_hora >= $2 AND data_hora <= $3
-       ORDER BY data_hora`,
-      [funcionarioId, inicioMes.toISO(), fimMes.toISO()]
-    )
-
-    // Agrupa registros por dia
-    const registrosPorDia = CalculoPontoService.agruparRegistrosPorDia(registros)
-
-    // Para jornada tipo PLANTAO, precisamos calcular a escala
-    // Ex: 12x36 = trabalha 12h, folga 36h | 24x72 = trabalha 24h, folga 72h
-    let escalaPlantao: Map<string, boolean> | null = null
-    if (tipoJornada === 'PLANTAO' && jornada?.horas_plantao && jornada?.horas_folga) {
-      escalaPlantao = await this.calcularEscalaPlantao(
-        municipioId,
-        funcionarioId,
-        jornada.horas_plantao,
-        jornada.horas_folga,
-        inicioMes,
-        fimMes
-      )
-    }
-
-    // Processa cada dia do mês
-    const dias: DiaTrabalhado[] = []
-    let diaAtual = inicioMes
-
-    while (diaAtual <= fimMes) {
-      const dataStr = diaAtual.toISODate()!
-      const diaSemana = CalculoPontoService.getDiaSemana(diaAtual)
-
-      // Verifica se é anterior à data de início do sistema
-      const isAntesDaDataInicio = dataInicioSistema && diaAtual < dataInicioSistema
-
-      // Verifica se é feriado
-      const isFeriado = feriadosSet.has(dataStr)
-
-      // Verifica se é folga programada (escala de folgas)
-      const folgaProgramada = folgasProgramadasMap.get(dataStr)
-      const isFolgaProgramada = !!folgaProgramada
-
-      // Registros do dia (acessando como objeto, não Map)
-      const registrosDia = registrosPorDia[dataStr] || []
-
-      // Determina se é dia de trabalho com base no tipo de jornada
-      let isDiaTrabalho = false
-      let horasPrevistasDia = 0
-      const horarioDia = horariosMap.get(diaSemana)
-
-      // Se é anterior à data de início do sistema, não conta como dia de trabalho
-      if (isAntesDaDataInicio) {
-        dias.push({
-          data: dataStr,
-          diaSemana,
-          registros: [],
-          horasPrevistas: 0,
-          horasTrabalhadas: 0,
-          atraso: 0,
-          horaExtra: 0,
-          horaFaltante: 0,
-          feriado: false,
-          folga: true,
-          falta: false,
-          ocorrencias: ['ANTES DO INÍCIO DO SISTEMA'],
-        })
-        diaAtual = diaAtual.plus({ days: 1 })
-        continue
-      }
-
-      if (tipoJornada === 'PLANTAO' && escalaPlantao) {
-        // Para plantão, verifica a escala calculada
-        isDiaTrabalho = escalaPlantao.get(dataStr) === true && !isFolgaProgramada
-        if (isDiaTrabalho) {
-          // Horas previstas = horas do plantão (em minutos)
-          horasPrevistasDia = (jornada?.horas_plantao || 12) * 60
-        }
-      } else {
-        // Para NORMAL e CORRIDA, verifica configuração da jornada para o dia
-        // Só é folga se: não tem horário configurado OU campo folga = true OU folga programada
-        const isFolga = !horarioDia || horarioDia.folga === true || isFolgaProgramada
-        isDiaTrabalho = !isFolga && !isFeriado
-        if (isDiaTrabalho && horarioDia) {
-          // Calcula horas previstas baseado nos horários configurados para o dia
-          horasPrevistasDia = CalculoPontoService.calcularHorasPrevistasDia(horarioDia)
-        } else if (isDiaTrabalho) {
-          horasPrevistasDia = cargaHorariaDiaria
-        }
-      }
-
-      // Se não é dia de trabalho (folga, feriado ou escala de plantão)
-      if (!isDiaTrabalho || isFeriado) {
-        const horasTrabalhadasDia = CalculoPontoService.calcularHorasTrabalhadas(registrosDia)
-        dias.push({
-          data: dataStr,
-          diaSemana,
-          registros: registrosDia,
-          horasPrevistas: 0,
-          horasTrabalhadas: horasTrabalhadasDia,
-          atraso: 0,
-          horaExtra: horasTrabalhadasDia, // Trabalho em folga/feriado = hora extra
-          horaFaltante: 0,
-          feriado: isFeriado,
-          folga: !isDiaTrabalho && !isFeriado,
-          falta: false,
-          ocorrencias: this.gerarOcorrenciasFolga(isFeriado, tipoJornada, horasTrabalhadasDia, folgaProgramada),
-        })
-      } else {
-        // Dia de trabalho
-        const horasTrabalhadas = CalculoPontoService.calcularHorasTrabalhadas(registrosDia)
-
-        // Calcula atraso (se entrou depois do horário + tolerância)
-        let atraso = 0
-        if (horarioDia?.entrada_1 && registrosDia.length > 0) {
-          const [h, m] = horarioDia.entrada_1.split(':').map(Number)
-          const horarioPrevisto = diaAtual.set({ hour: h, minute: m })
-          const primeiroRegistro = registrosDia[0]
-          const diffMinutos = primeiroRegistro.diff(horarioPrevisto, 'minutes').minutes
-
-          if (diffMinutos > toleranciaEntrada) {
-            atraso = Math.round(diffMinutos - toleranciaEntrada)
-          }
-        }
-
-        // Calcula horas extras ou faltantes
-        let horaExtra = 0
-        let horaFaltante = 0
-        const diff = horasTrabalhadas - horasPrevistasDia
-
-        if (diff > toleranciaSaida) {
-          horaExtra = Math.round(diff - toleranciaSaida)
-        } else if (diff < -toleranciaSaida) {
-          horaFaltante = Math.abs(Math.round(diff + toleranciaSaida))
-        }
-
-        // Verifica falta (nenhum registro no dia de trabalho)
-        const isFalta = CalculoPontoService.identificarFalta(registrosDia, false, false)
-
-        // Verifica marcações esperadas baseado na jornada configurada para o dia
-        // Se não tem período da tarde, espera só 2 marcações (entrada e saída)
-        let marcacoesEsperadas = marcacoesDia
-        if (horarioDia && (!horarioDia.entrada_2 || !horarioDia.saida_2)) {
-          marcacoesEsperadas = 2 // Só manhã = 2 marcações
-        }
-        const registrosImpares = registrosDia.length % 2 !== 0
-        const marcacoesIncompletas = registrosDia.length > 0 && registrosDia.length < marcacoesEsperadas
-
-        const ocorrencias: string[] = []
-        if (isFalta) ocorrencias.push('FALTA')
-        if (atraso > 0) ocorrencias.push(`ATRASO ${atraso}min`)
-        if (horaExtra > 0) ocorrencias.push(`HORA EXTRA ${CalculoPontoService.minutosParaHHMM(horaExtra)}`)
-        if (horaFaltante > 0) ocorrencias.push(`HORA FALTANTE ${CalculoPontoService.minutosParaHHMM(horaFaltante)}`)
-        if (registrosImpares) ocorrencias.push('REGISTRO IMPAR')
-        if (marcacoesIncompletas && !registrosImpares) {
-          ocorrencias.push(`MARCACOES INCOMPLETAS (${registrosDia.length}/${marcacoesEsperadas})`)
-        }
-        if (tipoJornada === 'PLANTAO') ocorrencias.push('PLANTAO')
-
-        dias.push({
-          data: dataStr,
-          diaSemana,
-          registros: registrosDia,
-          horasPrevistas: horasPrevistasDia,
-          horasTrabalhadas,
-          atraso,
-          horaExtra,
-          horaFaltante,
-          feriado: false,
-          folga: false,
-          falta: isFalta,
-          ocorrencias,
-        })
-      }
-
-      diaAtual = diaAtual.plus({ days: 1 })
-    }
-
-    // Verifica se há turno noturno que cruza o dia de fechamento
-    // (entrada no dia do fechamento, saída no dia seguinte)
-    // Aplica para qualquer jornada (NORMAL, PLANTAO, CORRIDA)
-    let horasParaProximoPeriodo = 0
-    let observacoesFechamento: string[] = []
-
-    // Usa dataFechamento (último dia do mês ou dia customizado)
-    const resultadoFechamento = await this.calcularHorasTurnoComFechamento(
-      municipioId,
-      funcionarioId,
-      dataFechamento,
-      mes,
-      ano
-    )
-    horasParaProximoPeriodo = resultadoFechamento.horasParaProximoPeriodo
-    observacoesFechamento = resultadoFechamento.registrosAfetados
+    const dados = await this.carregarDadosFuncionarios(municipioId, contexto, [funcionario])
+    return CalculoPontoService.montarEspelho(contexto, dados.get(funcionarioId)!)
+  }
 
-    // Se houver horas para o próximo período, adiciona observação no dia do fechamento
-    if (horasParaProximoPeriodo > 0) {
-      const diaFechamentoStr = dataFechamento.toISODate()
-      const diaEncontrado = dias.find(d => d.data === diaFechamentoStr)
-      if (diaEncontrado) {
-        diaEncontrado.ocorrencias.push(
-          `TURNO CRUZA FECHAMENTO: ${CalculoPontoService.minutosParaHHMM(horasParaProximoPeriodo)} para próximo período`
-        )
-      }
-    }
+  /**
+   * Carrega os dados do município usados no cálculo do período:
+   * dia de fechamento, data de início do sistema, feriados e jornadas com horários
+   */
+  async carregarContextoPeriodo(
+    municipioId: number,
+    mes: number,
+    ano: number,
+    diaFechamentoCustom?: number
+  ): Promise<ContextoPeriodo> {
+    // Define período
+    const inicioMes = DateTime.local(ano, mes, 1).startOf('day')
+    const fimMesOriginal = inicioMes.endOf('month')
+    const hoje = DateTime.now().endOf('day') // endOf para incluir registros de hoje
+    // Não conta dias futuros - usa o menor entre fim do mês e hoje
+    const fimMes = fimMesOriginal < hoje ? fimMesOriginal : hoje
 
-    // Calcula totais
-    const horasTrabalhadasBruto = dias.reduce((acc, d) => acc + d.horasTrabalhadas, 0)
-    // Subtrai as horas que vão para o próximo período
-    const horasTrabalhadasLiquido = horasTrabalhadasBruto - horasParaProximoPeriodo
+    // Configurações, jornadas e feriados do retrato em memória do município
+    const config = await configuracaoMunicipioService.obter(municipioId)
+    const diaFechamento = diaFechamentoCustom || config.diaFechamento // 0 = fim do mês
 
-    const totais = {
-      diasUteis: dias.filter((d) => !d.folga && !d.feriado).length,
-      diasTrabalhados: dias.filter((d) => d.horasTrabalhadas > 0).length,
-      horasPrevistas: dias.reduce((acc, d) => acc + d.horasPrevistas, 0),
-      horasTrabalhadas: horasTrabalhadasLiquido, // Já descontando horas do próximo período
-      horasTrabalhadasBruto, // Total bruto sem desconto
-      horasParaProximoPeriodo, // Horas que vão para o próximo mês
-      atrasos: dias.reduce((acc, d) => acc + d.atraso, 0),
-      horasExtras: dias.reduce((acc, d) => acc + d.horaExtra, 0),
-      horasFaltantes: dias.reduce((acc, d) => acc + d.horaFaltante, 0),
-      faltas: dias.filter((d) => d.falta).length,
-      observacoesFechamento, // Detalhes dos plantões que cruzaram o fechamento
-    }
+    // Data de fechamento do período atual
+    const dataFechamento = diaFechamento > 0 && diaFechamento <= 28
+      ? DateTime.local(ano, mes, diaFechamento).endOf('day')
+      : fimMesOriginal
 
     return {
-      funcionario_id: funcionarioId,
       mes,
       ano,
-      dias,
-      totais,
+      inicioMes,
+      fimMes,
+      dataFechamento,
+      dataInicioSistema: config.dataInicioSistema,
+      feriados: configuracaoMunicipioService.feriadosNoPeriodo(config, inicioMes.toISODate()!, fimMes.toISODate()!),
+      jornadas: config.jornadas,
+      horarios: config.horarios,
     }
   }
 
   /**
-   * Calcula a escala de plantão para um funcionário
+   * Registra o relógio do banco e a versão das marcações do período antes de
+   * carregar os dados dos funcionários (chamar antes de carregarDadosFuncionarios)
    */
-  private async calcularEscalaPlantao(
+  async iniciarCarga(
     municipioId: number,
-    funcionarioId: number,
-    horasTrabalho: number,
-    horasFolga: number,
-    inicioMes: DateTime,
-    fimMes: DateTime
-  ): Promise<Map<string, boolean>> {
-    const escala = new Map<string, boolean>()
-
-    // Busca o último dia trabalhado antes do início do mês
-    const ultimoRegistro = await dbManager.queryMunicipioOne<{ data_hora: string }>(
+    mes: number,
+    ano: number,
+    funcionarioIds: number[]
+  ): Promise<CargaEspelhos> {
+    await this.garantirTabelas(municipioId)
+    const [relogio] = await dbManager.queryMunicipio<{ em: Date }>(municipioId, `SELECT clock_timestamp() AS em`)
+    const versoes = await dbManager.queryMunicipio<{ funcionario_id: number; versao: string }>(
       municipioId,
-      `SELECT data_hora FROM registros_ponto
-       WHERE funcionario_id = $1 AND data_hora < $2
-       ORDER BY data_hora DESC LIMIT 1`,
-      [funcionarioId, inicioMes.toISO()]
+      `SELECT funcionario_id, versao FROM espelhos_versoes
+       WHERE funcionario_id = ANY($1) AND ano = $2 AND mes = $3`,
+      [funcionarioIds, ano, mes]
     )
-
-    let diaReferencia: DateTime
-    if (ultimoRegistro) {
-      // data_hora pode ser Date (do PostgreSQL) ou string
-      // Usa timezone de São Paulo para garantir data correta
-      const dataHora = ultimoRegistro.data_hora
-      const zone = 'America/Sao_Paulo'
-      diaReferencia = (dataHora instanceof Date
-        ? DateTime.fromJSDate(dataHora, { zone })
-        : DateTime.fromISO(dataHora, { zone })).startOf('day')
-    } else {
-      // Se não houver registros, assume o primeiro dia do mês como referência
-      diaReferencia = inicioMes
-    }
-
-    let diaAtual = diaReferencia
-    while (diaAtual <= fimMes) {
-      // Dia de trabalho
-      escala.set(diaAtual.toISODate()!, true)
-
-      // Avança para o próximo dia de trabalho
-      const proximoDiaTrabalho = diaAtual.plus({ hours: horasTrabalho + horasFolga })
-      diaAtual = proximoDiaTrabalho.startOf('day')
-    }
-
-    return escala
-  }
-
-  /**
-   * Gera ocorrências para dias de folga/feriado
-   */
-  private gerarOcorrenciasFolga(
-    isFeriado: boolean,
-    tipoJornada: string,
-    horasTrabalhadas: number,
-    folgaProgramada?: { tipo: string; motivo: string | null } | null
-  ): string[] {
-    const ocorrencias: string[] = []
-    if (isFeriado) {
-      ocorrencias.push('FERIADO')
-    } else if (folgaProgramada) {
-      const tipoFolga = folgaProgramada.tipo || 'FOLGA'
-      const motivo = folgaProgramada.motivo ? ` - ${folgaProgramada.motivo}` : ''
-      ocorrencias.push(`${tipoFolga} PROGRAMADA${motivo}`)
-    } else {
-      ocorrencias.push('FOLGA')
-    }
-
-    if (horasTrabalhadas > 0) {
-      ocorrencias.push(`TRABALHO EM FOLGA/FERIADO (${CalculoPontoService.minutosParaHHMM(horasTrabalhadas)})`)
+    return {
+      em: new Date(relogio.em),
+      versoes: new Map(versoes.map((v) => [v.funcionario_id, Number(v.versao)])),
     }
-    if (tipoJornada === 'PLANTAO') ocorrencias.push('PLANTAO')
-
-    return ocorrencias
   }
 
   /**
-   * Calcula as horas previstas para um dia baseado nos horários configurados
-   * Se não tem horário da tarde configurado, conta apenas a manhã
+   * Carrega folgas e registros de vários funcionários com consultas por faixa
+   * (funcionario_id = ANY) e agrupa em memória por funcionário
    */
-  public static calcularHorasPrevistasDia(horarioDia: JornadaHorario): number {
-    let totalMinutos = 0
-
-    // Período da manhã (entrada_1 e saida_1)
-    if (horarioDia.entrada_1 && horarioDia.saida_1) {
-      const [h1, m1] = horarioDia.entrada_1.split(':').map(Number)
-      const [h2, m2] = horarioDia.saida_1.split(':').map(Number)
-      totalMinutos += (h2 * 60 + m2) - (h1 * 60 + m1)
+  async carregarDadosFuncionarios(
+    municipioId: number,
+    contexto: ContextoPeriodo,
+    funcionarios: FuncionarioPonto[]
+  ): Promise<Map<number, DadosFuncionarioPeriodo>> {
+    const { inicioMes, fimMes } = contexto
+    const ids = funcionarios.map((f) => f.id)
+    // Registros até a saída do turno que cruza o fechamento (pode ser no mês seguinte)
+    const limiteSaida = CalculoPontoService.limiteSaidaFechamento(contexto.dataFechamento)
+    const fimRegistros = limiteSaida > fimMes ? limiteSaida : fimMes
+
+    const [folgas, registros, escalas] = await Promise.all([
+      dbManager.queryMunicipio<FolgaProgramada & { funcionario_id: number }>(
+        municipioId,
+        `SELECT funcionario_id, TO_CHAR(data, 'YYYY-MM-DD') as data, tipo, motivo
+         FROM folgas_programadas
+         WHERE funcionario_id = ANY($1) AND data BETWEEN $2 AND $3`,
+        [ids, inicioMes.toISODate(), fimMes.toISODate()]
+      ),
+      dbManager.queryMunicipio<RegistroPonto>(
+        municipioId,
+        `SELECT id, funcionario_id, data_hora, tipo, sentido, origem
+         FROM registros_ponto
+         WHERE funcionario_id = ANY($1)
+         AND data_hora >= $2 AND data_hora <= $3
+         ORDER BY funcionario_id, data_hora`,
+        [ids, inicioMes.toISO(), fimRegistros.toISO()]
+      ),
+      // Calendário de plantão (só quem está em jornada de plantão)
+      escalaPlantaoService.carregarEscalas(municipioId, contexto, funcionarios),
+    ])
+
+    const dados = new Map<number, DadosFuncionarioPeriodo>()
+    for (const funcionario of funcionarios) {
+      dados.set(funcionario.id, {
+        funcionario,
+        registros: [],
+        folgas: new Map(),
+        ultimoRegistroAnterior: null,
+      })
     }
-
-    // Período da tarde (entrada_2 e saida_2) - só conta se estiver configurado
-    if (horarioDia.entrada_2 && horarioDia.saida_2) {
-      const [h3, m3] = horarioDia.entrada_2.split(':').map(Number)
-      const [h4, m4] = horarioDia.saida_2.split(':').map(Number)
-      totalMinutos += (h4 * 60 + m4) - (h3 * 60 + m3)
+    for (const folga of folgas) {
+      dados.get(folga.funcionario_id)?.folgas.set(folga.data, folga)
     }
-
-    return totalMinutos
-  }
-
-  /**
-   * Calcula o total de horas trabalhadas em um dia
-   */
-  public static calcularHorasTrabalhadas(registros: DateTime[]): number {
-    let totalMinutos = 0
-    for (let i = 0; i < registros.length; i += 2) {
-      if (registros[i + 1]) {
-        const diff = registros[i + 1].diff(registros[i], 'minutes').minutes
-        totalMinutos += diff
-      }
-    }
-    return Math.round(totalMinutos)
-  }
-
-  /**
-   * Calcula o atraso em minutos, considerando a tolerância
-   */
-  public static calcularAtraso(
-    horaEntrada: DateTime,
-    horaPrevistoEntrada: DateTime,
-    tolerancia: number
-  ): number {
-    const diffMinutos = horaEntrada.diff(horaPrevistoEntrada, 'minutes').minutes
-    return diffMinutos > tolerancia ? Math.round(diffMinutos - tolerancia) : 0
-  }
-
-  /**
-   * Calcula a hora extra em minutos
-   */
-  public static calcularHoraExtra(horasTrabalhadas: number, horasPrevistas: number): number {
-    const diff = horasTrabalhadas - horasPrevistas
-    return diff > 0 ? diff : 0
-  }
-
-  /**
-   * Calcula a hora faltante em minutos
-   */
-  public static calcularHoraFaltante(horasTrabalhadas: number, horasPrevistas: number): number {
-    const diff = horasPrevistas - horasTrabalhadas
-    return diff > 0 ? diff : 0
-  }
-
-  /**
-   * Identifica se o dia foi uma falta
-   */
-  public static identificarFalta(
-    registros: DateTime[],
-    ehFolga: boolean,
-    ehFeriado: boolean
-  ): boolean {
-    return registros.length === 0 && !ehFolga && !ehFeriado
-  }
-
-  /**
-   * Converte minutos para formato HH:MM
-   */
-  public static minutosParaHHMM(minutos: number): string {
-    if (minutos === 0) return '00:00'
-    const h = Math.floor(minutos / 60)
-      .toString()
-      .padStart(2, '0')
-    const m = (minutos % 60).toString().padStart(2, '0')
-    return `${h}:${m}`
-  }
-
-  /**
-   * Agrupa registros por dia
-   * Usa timezone de São Paulo para garantir que registros noturnos não sejam
-   * atribuídos ao dia seguinte
-   */
-  public static agruparRegistrosPorDia(registros: RegistroPonto[]): Record<string, DateTime[]> {
-    const agrupados: Record<string, DateTime[]> = {}
-    const zone = 'America/Sao_Paulo'
-
     for (const registro of registros) {
-      // data_hora pode ser Date (do PostgreSQL) ou string (de JSON)
-      // Sempre usa timezone de São Paulo para garantir agrupamento correto
-      let dt: DateTime
-      if (registro.data_hora instanceof Date) {
-        dt = DateTime.fromJSDate(registro.data_hora, { zone })
-      } else {
-        dt = DateTime.fromISO(registro.data_hora as string, { zone })
-      }
-
-      const data = dt.toISODate()!
-      if (!agrupados[data]) {
-        agrupados[data] = []
-      }
-      agrupados[data].push(dt)
+      dados.get(registro.funcionario_id)?.registros.push(registro)
     }
-    return agrupados
-  }
-
-  /**
-   * Obtém o dia da semana (0=Dom, 1=Seg, ...)
-   */
-  public static getDiaSemana(data: DateTime): number {
-    return data.weekday % 7
-  }
-
-  /**
-   * Verifica se é um dia útil
-   */
-  public static isDiaUtil(data: DateTime, ehFeriado: boolean): boolean {
-    const diaSemana = this.getDiaSemana(data)
-    return diaSemana >= 1 && diaSemana <= 5 && !ehFeriado
+    for (const [funcionarioId, escala] of escalas) {
+      const item = dados.get(funcionarioId)
+      if (item) item.escalaPlantao = escala
+    }
+    return dados
   }
 
   /**
    * Processa o período para múltiplos funcionários
    * Calcula espelho de ponto de todos os funcionários do município
+   *
+   * Os dados do município são carregados uma vez e os dos funcionários em
+   * lotes de LOTE_FUNCIONARIOS (folgas e registros por faixa); o cálculo dos
+   * espelhos roda nas threads do calculo_ponto_pool e a gravação é feita em
+   * blocos de ESPELHOS_POR_GRAVACAO. Funcionários com marcações alteradas
+   * entre a carga e a gravação são recalculados (até RODADAS_ALTERADOS vezes).
    */
   async processarPeriodo(
     municipioId: number,
@@ -680,7 +233,7 @@ export class CalculoPontoService {
     try {
       // Busca funcionários ativos do município
       let query = `
-        SELECT id, nome FROM funcionarios
+        SELECT id, nome, jornada_id, data_admissao, data_demissao FROM funcionarios
         WHERE ativo = true
       `
       const params: any[] = []
@@ -692,33 +245,85 @@ export class CalculoPontoService {
 
       query += ` ORDER BY nome`
 
-      const funcionarios = await dbManager.queryMunicipio(municipioId, query, params)
-
-      // Processa cada funcionário
-      for (const func of funcionarios) {
-        try {
-          const espelho = await this.calcularEspelho(municipioId, func.id, mes, ano)
-
-          // Salva ou atualiza o espelho
-          await this.salvarEspelho(municipioId, func.id, mes, ano, espelho)
+      const funcionarios = await dbManager.queryMunicipio<FuncionarioPonto>(municipioId, query, params)
+
+      // Configuração, feriados e jornadas: uma vez para todos
+      const contexto = await this.carregarContextoPeriodo(municipioId, mes, ano)
+
+      // Quem teve marcações alteradas entre a carga e a gravação é recalculado na rodada seguinte
+      let fila = funcionarios
+      for (let rodada = 1; fila.length > 0; rodada++) {
+        if (rodada > RODADAS_ALTERADOS) {
+          erros += fila.length
+          for (const func of fila) {
+            detalhes.push({
+              funcionarioId: func.id,
+              nome: func.nome,
+              status: 'ERRO',
+              erro: 'Marcações alteradas durante o processamento'
+            })
+          }
+          break
+        }
 
-          processados++
-          detalhes.push({
-            funcionarioId: func.id,
-            nome: func.nome,
-            status: 'OK',
-            horasTrabalhadas: espelho.totais.horasTrabalhadas
-          })
-        } catch (err: any) {
-          erros++
-          console.error(`[Espelho] Erro ao processar funcionário ${func.id} (${func.nome}):`, err.message)
-          detalhes.push({
-            funcionarioId: func.id,
-            nome: func.nome,
-            status: 'ERRO',
-            erro: err.message
-          })
+        const alterados: FuncionarioPonto[] = []
+        for (let inicio = 0; inicio < fila.length; inicio += LOTE_FUNCIONARIOS) {
+          // Folgas e registros do lote em poucas consultas por faixa
+          const lote = fila.slice(inicio, inicio + LOTE_FUNCIONARIOS)
+          const carga = await this.iniciarCarga(municipioId, mes, ano, lote.map((f) => f.id))
+          const dados = await this.carregarDadosFuncionarios(municipioId, contexto, lote)
+
+          // Cálculo do lote nas threads do pool, fora do event loop
+          const resultados = await calculoPontoPool.calcular(contexto, lote.map((f) => dados.get(f.id)!))
+
+          // Grava os espelhos em blocos (uma transação por bloco)
+          for (let bloco = 0; bloco < lote.length; bloco += ESPELHOS_POR_GRAVACAO) {
+            const calculados: { func: FuncionarioPonto; espelho: EspelhoSerializado }[] = []
+            for (let i = bloco; i < Math.min(bloco + ESPELHOS_POR_GRAVACAO, lote.length); i++) {
+              const func = lote[i]
+              const { espelho, erro } = resultados[i]
+              if (espelho) {
+                calculados.push({ func, espelho })
+              } else {
+                erros++
+                console.error(`[Espelho] Erro ao processar funcionário ${func.id} (${func.nome}):`, erro)
+                detalhes.push({
+                  funcionarioId: func.id,
+                  nome: func.nome,
+                  status: 'ERRO',
+                  erro
+                })
+              }
+            }
+
+            try {
+              const naoGravados = new Set(
+                await this.salvarEspelhos(municipioId, mes, ano, calculados.map((c) => c.espelho), carga)
+              )
+              for (const { func, espelho } of calculados) {
+                if (naoGravados.has(func.id)) {
+                  alterados.push(func)
+                  continue
+                }
+                processados++
+                detalhes.push({
+                  funcionarioId: func.id,
+                  nome: func.nome,
+                  status: 'OK',
+                  horasTrabalhadas: espelho.totais.horasTrabalhadas
+                })
+              }
+            } catch (err: any) {
+              // Nada do bloco foi gravado
+              erros += calculados.length
+              console.error(`[Espelho] Erro ao salvar ${calculados.length} espelho(s):`, err.message)
+              for (const { func } of calculados) {
+                detalhes.push({ funcionarioId: func.id, nome: func.nome, status: 'ERRO', erro: err.message })
+              }
+            }
+          }
         }
+        fila = alterados
       }
 
       return { processados, erros, detalhes }
@@ -731,203 +336,231 @@ export class CalculoPontoService {
   /**
    * Salva ou atualiza o espelho de ponto no banco
    */
-  private async salvarEspelho(
+  async salvarEspelho(
     municipioId: number,
     funcionarioId: number,
     mes: number,
     ano: number,
     espelho: EspelhoCalculado
   ): Promise<void> {
-    const { dbManager } = await import('#services/database_manager_service')
+    await this.salvarEspelhos(municipioId, mes, ano, [{ ...espelho, funcionario_id: funcionarioId }])
+  }
 
-    // Verifica se já existe
-    const existe = await dbManager.queryMunicipio(
-      municipioId,
-      `SELECT id FROM espelhos_ponto WHERE funcionario_id = $1 AND mes = $2 AND ano = $3`,
-      [funcionarioId, mes, ano]
+  /**
+   * Salva os espelhos de vários funcionários do mesmo período em uma transação:
+   * upsert de várias linhas em espelhos_ponto e lançamentos do banco de horas
+   * por conjunto. O lote é gravado inteiro ou não é gravado.
+   *
+   * Com `carga` (iniciarCarga antes de carregar os dados), os espelhos de quem
+   * teve marcações alteradas ou o espelho regravado depois da carga não são
+   * gravados por cima.
+   *
+   * @returns Funcionários não gravados por terem mudado depois da carga
+   */
+  async salvarEspelhos(
+    municipioId: number,
+    mes: number,
+    ano: number,
+    espelhos: Array<EspelhoCalculado | EspelhoSerializado>,
+    carga?: CargaEspelhos
+  ): Promise<number[]> {
+    if (espelhos.length === 0) return []
+    const bancoHorasAtivo = await this.prepararGravacao(municipioId)
+    const alterados = await dbManager.transactionMunicipio(municipioId, (client) =>
+      this.gravarEspelhos(client, mes, ano, espelhos, bancoHorasAtivo, carga)
     )
 
-    // Prepara dados para salvar (nomes de colunas conforme tabela)
-    const diasTrabalhados = espelho.totais.diasTrabalhados
-    const horasTrabalhadas = espelho.totais.horasTrabalhadas
-    const horasExtras = espelho.totais.horasExtras
-    const horasFalta = espelho.totais.horasFaltantes
-    const horasFaltantes = espelho.totais.horasFaltantes
-    const atrasos = espelho.totais.atrasos
-    const faltas = espelho.totais.faltas
-    const diasJson = JSON.stringify(espelho.dias)
-    // Estrutura de dados completa para o frontend
-    const dadosJson = JSON.stringify({
-      dias: espelho.dias,
-      totais: espelho.totais
-    })
-
-    if (existe.length > 0) {
-      await dbManager.queryMunicipio(
-        municipioId,
-        `UPDATE espelhos_ponto SET
-          dias_trabalhados = $1,
-          horas_trabalhadas = $2,
-          horas_extras = $3,
-          horas_falta = $4,
-          horas_faltantes = $5,
-          atrasos = $6,
-          faltas = $7,
-          dias = $8,
-          dados = $9,
-          updated_at = NOW()
-        WHERE id = $10`,
-        [diasTrabalhados, horasTrabalhadas, horasExtras, horasFalta, horasFaltantes, atrasos, faltas, diasJson, dadosJson, existe[0].id]
-      )
-    } else {
-      await dbManager.queryMunicipio(
-        municipioId,
-        `INSERT INTO espelhos_ponto
-          (funcionario_id, mes, ano, dias_trabalhados, horas_trabalhadas, horas_extras,
-           horas_falta, horas_faltantes, atrasos, faltas, dias, dados, status, created_at, updated_at)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, 'ABERTO', NOW(), NOW())`,
-        [funcionarioId, mes, ano, diasTrabalhados, horasTrabalhadas, horasExtras, horasFalta, horasFaltantes, atrasos, faltas, diasJson, dadosJson]
-      )
+    if (bancoHorasAtivo) {
+      const gravados = new Set(espelhos.map((e) => e.funcionario_id)).size - alterados.length
+      console.log(`[Banco de Horas] Atualizado ${gravados} funcionário(s) mes=${mes}/${ano}`)
     }
+    return alterados
+  }
 
-    // Contabilização automática do banco de horas
-    await this.atualizarBancoHoras(municipioId, funcionarioId, mes, ano, horasExtras, horasFaltantes)
+  /**
+   * Tabelas usadas na gravação, verificadas fora da transação (que ocupa uma
+   * conexão do pool do município)
+   *
+   * @returns Se o banco de horas está ativo (lançamentos na gravação)
+   */
+  async prepararGravacao(municipioId: number): Promise<boolean> {
+    await this.garantirTabelas(municipioId)
+    const bancoHorasAtivo = await this.bancoHorasAtivo(municipioId)
+    if (bancoHorasAtivo) {
+      await bancoHorasSaldoService.garantirTabelas(municipioId)
+    }
+    return bancoHorasAtivo
   }
 
   /**
-   * Atualiza o banco de horas automaticamente após processar o espelho
+   * Grava os espelhos em uma transação já aberta (salvarEspelhos; antes,
+   * prepararGravacao)
    */
-  private async atualizarBancoHoras(
-    municipioId: number,
-    funcionarioId: number,
+  async gravarEspelhos(
+    client: any,
     mes: number,
     ano: number,
-    horasExtras: number,
-    horasFaltantes: number
-  ): Promise<void> {
-    const { dbManager } = await import('#services/database_manager_service')
-
-    try {
-      // Verifica se banco de horas está ativo
-      const configResult = await dbManager.queryMunicipio<{ ativo: boolean }>(
-        municipioId,
-        `SELECT ativo FROM banco_horas_config WHERE id = 1`
-      )
-      
-      if (!configResult.length || configResult[0].ativo === false) {
-        return // Banco de horas desativado
-      }
-
-      const dataReferencia = `${ano}-${String(mes).padStart(2, '0')}-01`
-      const descricaoMes = `Espelho ${String(mes).padStart(2, '0')}/${ano}`
-
-      // Remove registros anteriores do mesmo período (para recalcular)
-      await dbManager.queryMunicipio(
-        municipioId,
-        `DELETE FROM banco_horas 
-         WHERE funcionario_id = $1 
-         AND data = $2 
-         AND origem = 'ESPELHO'`,
-        [funcionarioId, dataReferencia]
+    espelhos: Array<EspelhoCalculado | EspelhoSerializado>,
+    bancoHorasAtivo: boolean,
+    carga?: CargaEspelhos
+  ): Promise<number[]> {
+    // Um funcionário por linha: o ON CONFLICT não atualiza a mesma linha duas vezes
+    const porFuncionario = new Map(espelhos.map((e) => [e.funcionario_id, e]))
+    if (porFuncionario.size === 0) return []
+
+    const alterados: number[] = []
+    if (carga) {
+      const ids = [...porFuncionario.keys()]
+      // Espera a atualização incremental em andamento e segura novas marcações
+      // destes funcionários (gatilho de espelhos_versoes) até o fim da transação
+      const { rows: gravados } = await client.query(
+        `SELECT funcionario_id, updated_at FROM espelhos_ponto
+         WHERE funcionario_id = ANY($1) AND mes = $2 AND ano = $3
+         ORDER BY funcionario_id
+         FOR UPDATE`,
+        [ids, mes, ano]
       )
-
-      // Busca saldo atual (antes das novas operações)
-      const saldoResult = await dbManager.queryMunicipio<{ saldo: number }>(
-        municipioId,
-        `SELECT COALESCE(SUM(
-            CASE 
-                WHEN tipo_operacao = 'CREDITO' THEN minutos
-                WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO') THEN -ABS(minutos)
-                ELSE minutos
-            END
-        ), 0) as saldo
-        FROM banco_horas
-        WHERE funcionario_id = $1`,
-        [funcionarioId]
+      const { rows: versoes } = await client.query(
+        `SELECT funcionario_id, versao FROM espelhos_versoes
+         WHERE funcionario_id = ANY($1) AND ano = $2 AND mes = $3
+         ORDER BY funcionario_id
+         FOR UPDATE`,
+        [ids, ano, mes]
       )
-      let saldoAtual = saldoResult.length > 0 ? saldoResult[0].saldo : 0
-
-      // Registra horas extras como crédito (se houver)
-      if (horasExtras > 0) {
-        const novoSaldo = saldoAtual + horasExtras
-        await dbManager.queryMunicipio(
-          municipioId,
-          `INSERT INTO banco_horas
-            (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao, aprovado, created_at)
-           VALUES ($1, $2, 'CREDITO', $3, $4, $5, 'ESPELHO', $6, true, NOW())`,
-          [funcionarioId, dataReferencia, horasExtras, saldoAtual, novoSaldo, `Horas extras - ${descricaoMes}`]
-        )
-        saldoAtual = novoSaldo
+      const mudaram = new Set<number>()
+      for (const linha of gravados) {
+        if (linha.updated_at && new Date(linha.updated_at) > carga.em) mudaram.add(linha.funcionario_id)
       }
-
-      // Registra horas faltantes como débito (se houver)
-      if (horasFaltantes > 0) {
-        const novoSaldo = saldoAtual - horasFaltantes
-        await dbManager.queryMunicipio(
-          municipioId,
-          `INSERT INTO banco_horas
-            (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao, aprovado, created_at)
-           VALUES ($1, $2, 'DEBITO', $3, $4, $5, 'ESPELHO', $6, true, NOW())`,
-          [funcionarioId, dataReferencia, horasFaltantes, saldoAtual, novoSaldo, `Horas faltantes - ${descricaoMes}`]
-        )
+      for (const linha of versoes) {
+        if (Number(linha.versao) !== (carga.versoes.get(linha.funcionario_id) ?? 0)) mudaram.add(linha.funcionario_id)
+      }
+      for (const funcionarioId of mudaram) {
+        porFuncionario.delete(funcionarioId)
+        alterados.push(funcionarioId)
       }
+    }
 
-      console.log(`[Banco de Horas] Atualizado func=${funcionarioId} mes=${mes}/${ano} extras=${horasExtras}min faltantes=${horasFaltantes}min`)
-    } catch (error: any) {
-      console.error('[Banco de Horas] Erro ao atualizar:', error.message)
-      // Não propaga o erro para não quebrar o processamento do espelho
+    const lote = [...porFuncionario.values()]
+    if (lote.length === 0) return alterados
+
+    // Prepara dados para salvar (nomes de colunas conforme tabela): uma linha
+    // de VALUES por funcionário, os tipos vêm das colunas como no INSERT simples
+    const params: any[] = [mes, ano]
+    const linhas = lote.map((espelho) => {
+      const posicoes = [
+        espelho.funcionario_id,
+        espelho.totais.diasTrabalhados,
+        espelho.totais.horasTrabalhadas,
+        espelho.totais.horasExtras,
+        espelho.totais.horasFaltantes, // horas_falta
+        espelho.totais.horasFaltantes,
+        espelho.totais.atrasos,
+        espelho.totais.faltas,
+        JSON.stringify(espelho.dias),
+        // Estrutura de dados completa para o frontend
+        JSON.stringify({ dias: espelho.dias, totais: espelho.totais }),
+      ].map((valor) => {
+        params.push(valor)
+        return `$${params.length}`
+      })
+      return `(${posicoes[0]}, $1, $2, ${posicoes.slice(1).join(', ')}, 'ABERTO', NOW(), NOW())`
+    })
+
+    await client.query(
+      `INSERT INTO espelhos_ponto
+        (funcionario_id, mes, ano, dias_trabalhados, horas_trabalhadas, horas_extras,
+         horas_falta, horas_faltantes, atrasos, faltas, dias, dados, status, created_at, updated_at)
+      VALUES ${linhas.join(', ')}
+      ON CONFLICT (funcionario_id, mes, ano) DO UPDATE SET
+        dias_trabalhados = EXCLUDED.dias_trabalhados,
+        horas_trabalhadas = EXCLUDED.horas_trabalhadas,
+        horas_extras = EXCLUDED.horas_extras,
+        horas_falta = EXCLUDED.horas_falta,
+        horas_faltantes = EXCLUDED.horas_faltantes,
+        atrasos = EXCLUDED.atrasos,
+        faltas = EXCLUDED.faltas,
+        dias = EXCLUDED.dias,
+        dados = EXCLUDED.dados,
+        updated_at = NOW()`,
+      params
+    )
+
+    // Contabilização automática do banco de horas
+    if (bancoHorasAtivo) {
+      await this.lancarBancoHoras(client, mes, ano, lote)
     }
+    return alterados
   }
 
   /**
-   * Calcula horas trabalhadas considerando plantões que cruzam o fechamento
-   *
-   * Se um plantão começa antes do fechamento e termina depois:
-   * - Horas até 23:59:59 do dia do fechamento = período atual
-   * - Horas de 00:00:00 em diante = próximo período
-   *
-   * @param registros Array de registros de entrada/saída (DateTime)
-   * @param dataFechamento Data limite do período
-   * @returns { horasPeriodoAtual: number, horasProximoPeriodo: number }
+   * Verifica se o banco de horas está ativo no município
+   * (sem a configuração, os espelhos são salvos sem lançamentos)
    */
-  public static calcularHorasComFechamento(
-    registros: DateTime[],
-    dataFechamento: DateTime
-  ): { horasPeriodoAtual: number; horasProximoPeriodo: number } {
-    let horasPeriodoAtual = 0
-    let horasProximoPeriodo = 0
-
-    for (let i = 0; i < registros.length; i += 2) {
-      const entrada = registros[i]
-      const saida = registros[i + 1]
-
-      if (!saida) continue
-
-      // Verifica se o plantão cruza o fechamento
-      const fimDiaFechamento = dataFechamento.endOf('day')
-      const inicioDiaAposFechamento = dataFechamento.plus({ days: 1 }).startOf('day')
-
-      if (entrada <= fimDiaFechamento && saida > fimDiaFechamento) {
-        // Plantão cruza o fechamento - divide as horas
-        // Horas até a meia-noite do dia do fechamento
-        const minutosAteFechamento = fimDiaFechamento.diff(entrada, 'minutes').minutes
-        horasPeriodoAtual += Math.max(0, Math.round(minutosAteFechamento))
-
-        // Horas do dia seguinte em diante
-        const minutosAposFechamento = saida.diff(inicioDiaAposFechamento, 'minutes').minutes
-        horasProximoPeriodo += Math.max(0, Math.round(minutosAposFechamento))
-      } else if (entrada <= fimDiaFechamento && saida <= fimDiaFechamento) {
-        // Plantão totalmente dentro do período atual
-        const minutos = saida.diff(entrada, 'minutes').minutes
-        horasPeriodoAtual += Math.round(minutos)
-      } else {
-        // Plantão totalmente no próximo período
-        const minutos = saida.diff(entrada, 'minutes').minutes
-        horasProximoPeriodo += Math.round(minutos)
-      }
+  private async bancoHorasAtivo(municipioId: number): Promise<boolean> {
+    try {
+      const { bancoHoras } = await configuracaoMunicipioService.obter(municipioId)
+      return bancoHoras !== null && bancoHoras.ativo !== false
+    } catch (error: any) {
+      console.error('[Banco de Horas] Erro ao verificar configuração:', error.message)
+      return false
     }
+  }
 
-    return { horasPeriodoAtual, horasProximoPeriodo }
+  /**
+   * Refaz os lançamentos do banco de horas do período para os espelhos do lote
+   * (crédito das horas extras e débito das faltantes), dentro da transação,
+   * mantendo os saldos materializados (banco_horas_saldo_service)
+   */
+  private async lancarBancoHoras(
+    client: any,
+    mes: number,
+    ano: number,
+    espelhos: Array<EspelhoCalculado | EspelhoSerializado>
+  ): Promise<void> {
+    const dataReferencia = `${ano}-${String(mes).padStart(2, '0')}-01`
+    const descricaoMes = `Espelho ${String(mes).padStart(2, '0')}/${ano}`
+    const ids = espelhos.map((e) => e.funcionario_id)
+
+    // Saldos travados antes de tocar em banco_horas
+    const saldos = await bancoHorasSaldoService.travar(client, ids)
+
+    // Remove registros anteriores do mesmo período (para recalcular)
+    const { rows: removidos } = await client.query(
+      `DELETE FROM banco_horas
+       WHERE funcionario_id = ANY($1)
+       AND data = $2
+       AND origem = 'ESPELHO'
+       RETURNING ${COLUNAS_MOVIMENTO}`,
+      [ids, dataReferencia]
+    )
+    const saldosAposRemocao = await bancoHorasSaldoService.registrar(client, removidos, -1)
+
+    // A partir do saldo atual de cada funcionário: crédito e depois débito
+    const { rows: lancados } = await client.query(
+      `WITH lancamentos AS (
+         SELECT * FROM unnest($1::int[], $2::int[], $3::int[], $4::int[])
+           AS n(funcionario_id, extras, faltantes, saldo)
+       )
+       INSERT INTO banco_horas
+         (funcionario_id, data, tipo_operacao, minutos, saldo_anterior, saldo_atual, origem, descricao, aprovado, created_at)
+       SELECT funcionario_id, $5::date, 'CREDITO', extras, saldo, saldo + extras, 'ESPELHO', $6, true, NOW()
+       FROM lancamentos WHERE extras > 0
+       UNION ALL
+       SELECT funcionario_id, $5::date, 'DEBITO', faltantes,
+              saldo + GREATEST(extras, 0), saldo + GREATEST(extras, 0) - faltantes, 'ESPELHO', $7, true, NOW()
+       FROM lancamentos WHERE faltantes > 0
+       RETURNING ${COLUNAS_MOVIMENTO}`,
+      [
+        ids,
+        espelhos.map((e) => Math.round(e.totais.horasExtras)),
+        espelhos.map((e) => Math.round(e.totais.horasFaltantes)),
+        ids.map((id) => saldosAposRemocao.get(id) ?? saldos.get(id) ?? 0),
+        dataReferencia,
+        `Horas extras - ${descricaoMes}`,
+        `Horas faltantes - ${descricaoMes}`,
+      ]
+    )
+    await bancoHorasSaldoService.registrar(client, lancados)
   }
 
   /**
@@ -985,73 +618,25 @@ export class CalculoPontoService {
     mes: number,
     ano: number
   ): Promise<{ horasParaProximoPeriodo: number; registrosAfetados: string[] }> {
-    const { dbManager } = await import('#services/database_manager_service')
-
-    // Busca registros do dia do fechamento
-    const registros = await dbManager.queryMunicipio<{
-      data_hora: string
-      sentido: string
-    }>(
-      municipioId,
-      `SELECT data_hora, sentido FROM registros_ponto
-       WHERE funcionario_id = $1
-       AND data_hora::date = $2
-       ORDER BY data_hora`,
-      [funcionarioId, dataFechamento.toISODate()]
-    )
-
-    if (registros.length === 0) {
-      return { horasParaProximoPeriodo: 0, registrosAfetados: [] }
-    }
-
-    // Busca o próximo registro (saída do dia seguinte)
-    const diaApos = dataFechamento.plus({ days: 1 })
-    const registrosSaida = await dbManager.queryMunicipio<{
-      data_hora: string
-      sentido: string
-    }>(
+    // Dia do fechamento até o limite da saída no dia seguinte, pelo índice (funcionario_id, data_hora)
+    const inicio = dataFechamento.setZone(ZONA).startOf('day')
+    const registros = await dbManager.queryMunicipio<RegistroPonto>(
       municipioId,
-      `SELECT data_hora, sentido FROM registros_ponto
+      `SELECT id, funcionario_id, data_hora, tipo, sentido, origem FROM registros_ponto
        WHERE funcionario_id = $1
-       AND data_hora::date = $2
-       AND data_hora < $3
+       AND data_hora >= $2 AND data_hora < $3
        ORDER BY data_hora`,
-      [funcionarioId, diaApos.toISODate(), diaApos.set({ hour: 12 }).toISO()]
+      [funcionarioId, inicio.toISO(), CalculoPontoService.limiteSaidaFechamento(dataFechamento).toISO()]
     )
 
-    let horasParaProximoPeriodo = 0
-    const registrosAfetados: string[] = []
-
-    // Verifica se há entrada no dia do fechamento com saída no dia seguinte
-    const ultimaEntrada = registros.filter(r => r.sentido === 'E' || registros.indexOf(r) % 2 === 0).pop()
-    const primeiraSaida = registrosSaida[0]
-
-    if (ultimaEntrada && primeiraSaida) {
-      // data_hora pode ser Date (do PostgreSQL) ou string
-      // Usa timezone de São Paulo para garantir data correta
-      const zone = 'America/Sao_Paulo'
-      const dtEntrada = ultimaEntrada.data_hora instanceof Date
-        ? DateTime.fromJSDate(ultimaEntrada.data_hora, { zone })
-        : DateTime.fromISO(ultimaEntrada.data_hora, { zone })
-      const dtSaida = primeiraSaida.data_hora instanceof Date
-        ? DateTime.fromJSDate(primeiraSaida.data_hora, { zone })
-        : DateTime.fromISO(primeiraSaida.data_hora, { zone })
-
-      // Se a entrada é no dia do fechamento e a saída é no dia seguinte
-      if (dtEntrada.toISODate() === dataFechamento.toISODate() &&
-          dtSaida.toISODate() === diaApos.toISODate()) {
-
-        // Horas que devem ir para o próximo período (00:00 até a saída)
-        const inicioDia = diaApos.startOf('day')
-        horasParaProximoPeriodo = Math.round(dtSaida.diff(inicioDia, 'minutes').minutes)
-        registrosAfetados.push(
-          `Turno ${dtEntrada.toFormat('dd/MM HH:mm')} - ${dtSaida.toFormat('dd/MM HH:mm')}: ` +
-          `${CalculoPontoService.minutosParaHHMM(horasParaProximoPeriodo)} vão para o próximo período`
-        )
-      }
-    }
+    return CalculoPontoService.calcularFechamento({ dataFechamento }, registros)
+  }
 
-    return { horasParaProximoPeriodo, registrosAfetados }
+  private async garantirTabelas(municipioId: number) {
+    if (this.tabelasVerificadas.has(municipioId)) return
+    const sql = await readFile(app.makePath('database/migrations/tenant/018_espelhos_versoes.sql'), 'utf-8')
+    await dbManager.queryMunicipio(municipioId, sql)
+    this.tabelasVerificadas.add(municipioId)
   }
 }
 
@@ -0,0 +1,28 @@
+/**
+ * Thread de cálculo do espelho (ver calculo_ponto_pool)
+ *
+ * Recebe o contexto do período e os dados já carregados de um bloco de
+ * funcionários e devolve os espelhos calculados. Só importa o núcleo do
+ * cálculo: a thread não inicia a aplicação nem acessa o banco.
+ */
+
+import { parentPort } from 'node:worker_threads'
+import {
+  CalculoPontoNucleo,
+  type ContextoTransferido,
+  type DadosFuncionarioPeriodo,
+} from '#services/calculo_ponto_nucleo'
+
+interface MensagemCalculo {
+  id: number
+  contexto: ContextoTransferido
+  funcionarios: DadosFuncionarioPeriodo[]
+}
+
+parentPort!.on('message', (mensagem: MensagemCalculo) => {
+  const contexto = CalculoPontoNucleo.contextoDeTransferencia(mensagem.contexto)
+  parentPort!.postMessage({
+    id: mensagem.id,
+    resultados: CalculoPontoNucleo.calcularBloco(contexto, mensagem.funcionarios),
+  })
+})
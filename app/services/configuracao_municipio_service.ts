@@ -0,0 +1,256 @@
+/**
+ * Configuração do município em memória
+ *
+ * Retrato tipado das configurações lidas pelo cálculo, pelo webhook e pelos
+ * relatórios, carregado de uma vez (consultas em paralelo) e reaproveitado:
+ *
+ * - configuracoes e configuracoes_sistema (chave/valor): dia de fechamento,
+ *   concorrência do fechamento, cooldown do terminal
+ * - data de início do sistema (configuracao_tenant ou municipios no central)
+ * - banco_horas_config
+ * - jornadas com os horários por dia da semana
+ * - feriados ativos por ano (os recorrentes valem em todos os anos)
+ *
+ * Invalidação por versão: invalidar() sobe a versão do município e descarta
+ * o retrato; uma carga iniciada antes disso não é guardada. As telas que
+ * alteram essas tabelas chamam invalidar(). Alterações feitas por fora
+ * (scripts, outra instância) passam a valer em até VALIDADE_MS.
+ *
+ * O retrato é compartilhado: somente leitura.
+ */
+
+import { DateTime } from 'luxon'
+import { dbManager } from '#services/database_manager_service'
+import { ZONA, type Jornada, type JornadaHorario } from '#services/calculo_ponto_nucleo'
+
+/** Tempo máximo de um retrato em memória (alterações feitas fora da aplicação) */
+const VALIDADE_MS = 5 * 60 * 1000
+
+/** Cooldown do terminal quando não configurado (segundos) */
+const COOLDOWN_TERMINAL_PADRAO = 60
+
+export interface BancoHorasConfig {
+  ativo: boolean | null
+  converter_he_50_para_banco: boolean | null
+  limite_acumulo_positivo: number | null
+  limite_acumulo_negativo: number | null
+}
+
+export interface ConfiguracaoMunicipio {
+  versao: number
+  carregadaEm: number
+  /** configuracoes (chave/valor) */
+  configuracoes: Map<string, string>
+  /** configuracoes_sistema (chave/valor) */
+  configuracoesSistema: Map<string, string>
+  /** Dia de fechamento (0 = último dia do mês) */
+  diaFechamento: number
+  /** Concorrência configurada para o fechamento (null = padrão do serviço) */
+  fechamentoConcorrencia: number | null
+  /** Intervalo mínimo entre marcações do mesmo funcionário, em segundos */
+  cooldownTerminal: number
+  dataInicioSistema: DateTime | null
+  /** null = município sem banco_horas_config */
+  bancoHoras: BancoHorasConfig | null
+  jornadas: Map<number, Jornada>
+  /** Horários por jornada e dia da semana (0 = domingo) */
+  horarios: Map<number, Map<number, JornadaHorario>>
+  /** Feriados ativos por ano (YYYY-MM-DD) */
+  feriadosPorAno: Map<number, Set<string>>
+  /** Feriados recorrentes ativos (MM-DD) */
+  feriadosRecorrentes: Set<string>
+}
+
+class ConfiguracaoMunicipioService {
+  private retratos = new Map<number, ConfiguracaoMunicipio>()
+  private cargas = new Map<number, Promise<ConfiguracaoMunicipio>>()
+  private versoes = new Map<number, number>()
+
+  /**
+   * Retrato atual do município (carrega se não houver ou estiver vencido;
+   * chamadas simultâneas compartilham a mesma carga)
+   */
+  async obter(municipioId: number): Promise<ConfiguracaoMunicipio> {
+    const retrato = this.retratos.get(municipioId)
+    if (retrato && Date.now() - retrato.carregadaEm < VALIDADE_MS) {
+      return retrato
+    }
+
+    const emAndamento = this.cargas.get(municipioId)
+    if (emAndamento) return emAndamento
+
+    const carga = this.carregar(municipioId, this.versao(municipioId)).finally(() => {
+      if (this.cargas.get(municipioId) === carga) this.cargas.delete(municipioId)
+    })
+    this.cargas.set(municipioId, carga)
+    return carga
+  }
+
+  /**
+   * Descarta o retrato do município (chamar após alterar configurações,
+   * jornadas, horários ou feriados)
+   */
+  invalidar(municipioId: number): void {
+    this.versoes.set(municipioId, this.versao(municipioId) + 1)
+    this.retratos.delete(municipioId)
+    this.cargas.delete(municipioId)
+  }
+
+  /**
+   * Feriados entre duas datas (YYYY-MM-DD, inclusive)
+   */
+  feriadosNoPeriodo(config: ConfiguracaoMunicipio, inicio: string, fim: string): Set<string> {
+    const feriados = new Set<string>()
+    for (let ano = Number(inicio.slice(0, 4)); ano <= Number(fim.slice(0, 4)); ano++) {
+      for (const data of config.feriadosPorAno.get(ano) ?? []) {
+        if (data >= inicio && data <= fim) feriados.add(data)
+      }
+      for (const diaMes of config.feriadosRecorrentes) {
+        const data = `${ano}-${diaMes}`
+        if (data >= inicio && data <= fim) feriados.add(data)
+      }
+    }
+    return feriados
+  }
+
+  /**
+   * Verifica se a data (YYYY-MM-DD) é feriado
+   */
+  ehFeriado(config: ConfiguracaoMunicipio, data: string): boolean {
+    return (
+      config.feriadosPorAno.get(Number(data.slice(0, 4)))?.has(data) === true ||
+      config.feriadosRecorrentes.has(data.slice(5))
+    )
+  }
+
+  private versao(municipioId: number): number {
+    return this.versoes.get(municipioId) ?? 0
+  }
+
+  private async carregar(municipioId: number, versao: number): Promise<ConfiguracaoMunicipio> {
+    // Tabelas que podem não existir em bases antigas: ausência = sem configuração
+    const opcional = <T>(consulta: Promise<T>, padrao: T): Promise<T> => consulta.catch(() => padrao)
+
+    const [configuracoes, configuracoesSistema, cfgTenant, bancoHoras, jornadas, horarios, feriados] =
+      await Promise.all([
+        opcional(
+          dbManager.queryMunicipio<{ chave: string; valor: string }>(
+            municipioId,
+            `SELECT chave, valor FROM configuracoes`
+          ),
+          []
+        ),
+        opcional(
+          dbManager.queryMunicipio<{ chave: string; valor: string }>(
+            municipioId,
+            `SELECT chave, valor FROM configuracoes_sistema`
+          ),
+          []
+        ),
+        opcional(
+          dbManager.queryMunicipioOne<{ data_inicio_sistema: Date | null }>(
+            municipioId,
+            `SELECT data_inicio_sistema FROM configuracao_tenant LIMIT 1`
+          ),
+          null
+        ),
+        opcional(
+          dbManager.queryMunicipioOne<BancoHorasConfig>(
+            municipioId,
+            `SELECT ativo, converter_he_50_para_banco, limite_acumulo_positivo, limite_acumulo_negativo
+             FROM banco_horas_config WHERE id = 1`
+          ),
+          null
+        ),
+        dbManager.queryMunicipio<Jornada>(
+          municipioId,
+          `SELECT id, carga_horaria_diaria, tolerancia_entrada, tolerancia_saida,
+                  COALESCE(tipo, 'NORMAL') as tipo,
+                  horas_plantao, horas_folga,
+                  COALESCE(tem_intervalo, true) as tem_intervalo,
+                  COALESCE(duracao_intervalo, 60) as duracao_intervalo,
+                  COALESCE(marcacoes_dia, 4) as marcacoes_dia
+           FROM jornadas`
+        ),
+        dbManager.queryMunicipio<JornadaHorario & { jornada_id: number }>(
+          municipioId,
+          `SELECT jornada_id, dia_semana, entrada_1, saida_1, entrada_2, saida_2, folga
+           FROM jornada_horarios`
+        ),
+        dbManager.queryMunicipio<{ data: string; recorrente: boolean }>(
+          municipioId,
+          `SELECT TO_CHAR(data, 'YYYY-MM-DD') as data, COALESCE(recorrente, false) as recorrente
+           FROM feriados WHERE ativo IS DISTINCT FROM false`
+        ),
+      ])
+
+    // Data de início do sistema: configuracao_tenant, senão municipios (bases legadas)
+    let inicioSistema = cfgTenant?.data_inicio_sistema ?? null
+    if (!inicioSistema) {
+      const [municipio] = await opcional(
+        dbManager.queryCentral<{ data_inicio_sistema: Date | null }>(
+          `SELECT data_inicio_sistema FROM public.municipios WHERE id = $1 LIMIT 1`,
+          [municipioId]
+        ),
+        []
+      )
+      inicioSistema = municipio?.data_inicio_sistema ?? null
+    }
+    const dataInicioSistema = inicioSistema
+      ? DateTime.fromJSDate(inicioSistema, { zone: ZONA }).startOf('day')
+      : null
+
+    const porChave = new Map(configuracoes.map((c) => [c.chave, c.valor]))
+    const porChaveSistema = new Map(configuracoesSistema.map((c) => [c.chave, c.valor]))
+    const inteiro = (valor: string | undefined): number | null => {
+      const numero = parseInt(valor ?? '')
+      return Number.isFinite(numero) ? numero : null
+    }
+
+    const horariosPorJornada = new Map<number, Map<number, JornadaHorario>>()
+    for (const h of horarios) {
+      if (!horariosPorJornada.has(h.jornada_id)) horariosPorJornada.set(h.jornada_id, new Map())
+      horariosPorJornada.get(h.jornada_id)!.set(h.dia_semana, h)
+    }
+
+    const feriadosPorAno = new Map<number, Set<string>>()
+    const feriadosRecorrentes = new Set<string>()
+    for (const feriado of feriados) {
+      if (feriado.recorrente) {
+        feriadosRecorrentes.add(feriado.data.slice(5))
+        continue
+      }
+      const ano = Number(feriado.data.slice(0, 4))
+      if (!feriadosPorAno.has(ano)) feriadosPorAno.set(ano, new Set())
+      feriadosPorAno.get(ano)!.add(feriado.data)
+    }
+
+    const retrato: ConfiguracaoMunicipio = {
+      versao,
+      carregadaEm: Date.now(),
+      configuracoes: porChave,
+      configuracoesSistema: porChaveSistema,
+      diaFechamento: inteiro(porChave.get('dia_fechamento')) ?? 0,
+      fechamentoConcorrencia: inteiro(porChave.get('fechamento_concorrencia')),
+      cooldownTerminal: inteiro(porChaveSistema.get('cooldown_terminal')) ?? COOLDOWN_TERMINAL_PADRAO,
+      dataInicioSistema,
+      bancoHoras,
+      jornadas: new Map(jornadas.map((j) => [j.id, j])),
+      horarios: horariosPorJornada,
+      feriadosPorAno,
+      feriadosRecorrentes,
+    }
+
+    // Invalidado durante a carga: serve quem pediu, mas não fica em memória
+    if (versao === this.versao(municipioId)) {
+      this.retratos.set(municipioId, retrato)
+    }
+    console.log(
+      `[Configuração] Município ${municipioId} carregado (versão ${versao}, dataInicioSistema=${dataInicioSistema?.toISODate() ?? '-'})`
+    )
+    return retrato
+  }
+}
+
+export const configuracaoMunicipioService = new ConfiguracaoMunicipioService()
+export default configuracaoMunicipioService
@@ -505,6 +505,22 @@ export default class DatabaseManagerService {
     }
   }
 
+  /**
+   * Usa um pool já aberto para o município, sem consultar o cadastro
+   *
+   * Para ferramentas que trabalham com municípios fora de operação (ex: o
+   * município sintético do benchmark, cadastrado como inativo). O pool é
+   * fechado por removePoolMunicipio.
+   *
+   * @param municipioId - ID do município
+   * @param pool - Pool conectado ao banco do município
+   * @param schema - Schema usado no search_path das queries
+   */
+  registrarPoolMunicipio(municipioId: number, pool: Pool, schema: string): void {
+    this.municipioPools.set(municipioId, pool)
+    this.municipioSchemas.set(municipioId, schema)
+  }
+
   /**
    * Fecha todas as conexões
    *
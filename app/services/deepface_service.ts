@@ -43,7 +43,9 @@
  * --------------------------------------
  * - deepface-api/main.py - Servidor FastAPI
  * - deepface-api/faces/ - Imagens das faces cadastradas
- * - deepface-api/faces/embeddings_cache.json - Cache de embeddings
+ * - deepface-api/faces/embeddings_cache.json - Cadastros (nome, PIS)
+ * - deepface-api/faces/embeddings_cache.bin - Embeddings (float32)
+ * - deepface-api/faces/tenants/{tenant}/ - Galerias dos demais tenants
  *
  * @author Luiz Miguel
  * @version 1.0.0
@@ -52,6 +54,8 @@
  * ===========================================================================
  */
 
+import { ClienteBiometria, TIMEOUTS_BIOMETRIA } from '#services/biometria_client'
+
 // =============================================================================
 // CONFIGURAÇÃO
 // =============================================================================
@@ -69,7 +73,6 @@
  * ```
  */
 const DEEPFACE_URL = process.env.DEEPFACE_URL || 'http://localhost:5000'
-const DEFAULT_TIMEOUT_MS = 5000
 
 // =============================================================================
 // INTERFACES DE TIPOS
@@ -91,6 +94,18 @@ interface DeepFaceStatus {
   version: string
 }
 
+/**
+ * Funcionário já cadastrado com uma face parecida demais com a enviada
+ */
+interface CandidatoDuplicata {
+  /** ID do funcionário já cadastrado */
+  funcionario_id: number
+  /** Nome do funcionário */
+  nome?: string
+  /** Distância entre as faces (abaixo de DEEPFACE_LIMIAR_DUPLICATA) */
+  distance: number
+}
+
 /**
  * Resposta do cadastro de face
  *
@@ -107,6 +122,11 @@ interface CadastroResponse {
   message?: string
   /** Mensagem de erro (se falhou) */
   error?: string
+  /**
+   * Funcionários com face parecida demais (HTTP 409: cadastro recusado;
+   * com permitirDuplicata: gravado mesmo assim)
+   */
+  candidatos?: CandidatoDuplicata[]
 }
 
 /**
@@ -152,6 +172,26 @@ interface ListaFaces {
   }[]
 }
 
+/**
+ * Item de um lote de reconhecimento
+ */
+interface ItemLoteFace {
+  /** Identificador devolvido na linha do resultado */
+  id?: string
+  /** Foto em Base64 */
+  fotoBase64: string
+}
+
+/**
+ * Linha da resposta NDJSON de POST /reconhecer/lote
+ */
+interface ResultadoLoteFace extends ReconhecimentoResponse {
+  /** Posição do item no lote */
+  indice: number
+  /** id enviado no item */
+  id?: string
+}
+
 // =============================================================================
 // CLASSE DO SERVIÇO
 // =============================================================================
@@ -181,42 +221,26 @@ interface ListaFaces {
  */
 class DeepFaceService {
   // ===========================================================================
-  // PROPRIEDADES
+  // CONSTRUTOR
   // ===========================================================================
 
   /**
-   * URL base da API (sem barra final)
+   * Inicializa o serviço com o cliente HTTP comum dos serviços biométricos
+   *
+   * Respostas 4xx/5xx viram exceção (tratadas em cada método).
    */
-  private baseUrl: string
+  constructor(private cliente = new ClienteBiometria('DeepFace', DEEPFACE_URL)) {}
 
   /**
-   * Executa requisição com timeout e validação de status
-   */
-  private async request<T>(path: string, init: RequestInit = {}, timeoutMs = DEFAULT_TIMEOUT_MS) {
-    const signal = init.signal ?? AbortSignal.timeout(timeoutMs)
-    const response = await fetch(`${this.baseUrl}${path}`, { ...init, signal })
-
-    if (!response.ok) {
-      const body = await response.text().catch(() => '')
-      throw new Error(
-        `DeepFace ${path} falhou (${response.status} ${response.statusText})${body ? ` - ${body}` : ''}`
-      )
-    }
-
-    return (await response.json()) as T
-  }
-
-  // ===========================================================================
-  // CONSTRUTOR
-  // ===========================================================================
-
-  /**
-   * Inicializa o serviço com a URL da API
+   * Serviço restrito à galeria de faces de um tenant (header X-Tenant)
    *
-   * Remove barra final da URL se houver para evitar URLs com //
+   * @example
+   * ```typescript
+   * const resultado = await deepfaceService.doTenant(municipioId).reconhecerFace(foto)
+   * ```
    */
-  constructor() {
-    this.baseUrl = DEEPFACE_URL.replace(/\/$/, '')
+  doTenant(tenant: string | number): DeepFaceService {
+    return new DeepFaceService(this.cliente.doTenant(tenant))
   }
 
   // ===========================================================================
@@ -241,7 +265,7 @@ class DeepFaceService {
    */
   async isAvailable(): Promise<boolean> {
     try {
-      await this.request('/health', { method: 'GET' }, 3000)
+      await this.cliente.requisitar('/health', { timeoutMs: TIMEOUTS_BIOMETRIA.saude })
       return true
     } catch {
       // Qualquer erro (timeout, conexão recusada, etc) = não disponível
@@ -267,7 +291,7 @@ class DeepFaceService {
    */
   async getStatus(): Promise<DeepFaceStatus | null> {
     try {
-      return await this.request<DeepFaceStatus>('/')
+      return await this.cliente.requisitar<DeepFaceStatus>('/')
     } catch (err) {
       console.error('[DeepFace] Erro ao obter status:', err)
       return null
@@ -284,8 +308,9 @@ class DeepFaceService {
    * Envia a foto do funcionário para a API, que:
    * 1. Detecta o rosto na imagem
    * 2. Extrai o embedding facial (512 dimensões)
-   * 3. Salva a imagem em disco (deepface-api/faces/)
-   * 4. Atualiza o cache de embeddings
+   * 3. Recusa se a face já pertence a outro funcionário (retorna `candidatos`)
+   * 4. Salva a imagem em disco (deepface-api/faces/)
+   * 5. Atualiza o cache de embeddings
    *
    * REQUISITOS DA FOTO:
    * - Formato: JPEG ou PNG
@@ -297,6 +322,8 @@ class DeepFaceService {
    * @param nome - Nome completo do funcionário
    * @param pis - Número do PIS (11 dígitos)
    * @param fotoBase64 - Foto em formato Base64 (com ou sem prefixo data:image)
+   * @param permitirDuplicata - Grava mesmo se a face parecer com a de outro funcionário
+   *   (ex: gêmeos, depois de conferido pelo RH)
    * @returns Objeto com resultado do cadastro
    *
    * @example
@@ -311,6 +338,8 @@ class DeepFaceService {
    *
    * if (resultado.success) {
    *   console.log('Face cadastrada com sucesso!')
+   * } else if (resultado.candidatos) {
+   *   console.error(`Face já cadastrada: ${resultado.candidatos.map((c) => c.nome).join(', ')}`)
    * } else {
    *   console.error(`Erro: ${resultado.error}`)
    * }
@@ -320,22 +349,30 @@ class DeepFaceService {
     funcionarioId: number,
     nome: string,
     pis: string,
-    fotoBase64: string
+    fotoBase64: string,
+    permitirDuplicata = false
   ): Promise<CadastroResponse> {
     try {
       console.log(`[DeepFace] Cadastrando: ${nome} (ID: ${funcionarioId})`)
 
-      // Envia para API DeepFace
-      const data = await this.request<CadastroResponse>('/cadastrar', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          funcionario_id: funcionarioId,
-          nome: nome,
-          pis: pis,
-          foto_base64: fotoBase64,
-        }),
-      })
+      // Envia para API DeepFace (erros 4xx vêm no corpo: 409 traz os candidatos)
+      const resposta = await this.cliente.requisitar<CadastroResponse & { detail?: string }>(
+        '/cadastrar',
+        {
+          metodo: 'POST',
+          corpo: {
+            funcionario_id: funcionarioId,
+            nome: nome,
+            pis: pis,
+            foto_base64: fotoBase64,
+            permitir_duplicata: permitirDuplicata,
+          },
+          timeoutMs: TIMEOUTS_BIOMETRIA.processamento,
+          exigirOk: false,
+        }
+      )
+      const data: CadastroResponse =
+        resposta.detail !== undefined ? { success: false, error: resposta.detail } : resposta
 
       // Log do resultado
       if (data.success) {
@@ -400,10 +437,10 @@ class DeepFaceService {
   async reconhecerFace(fotoBase64: string): Promise<ReconhecimentoResponse> {
     try {
       // Envia para API DeepFace
-      const data = await this.request<ReconhecimentoResponse>('/reconhecer', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ foto_base64: fotoBase64 }),
+      const data = await this.cliente.requisitar<ReconhecimentoResponse>('/reconhecer', {
+        metodo: 'POST',
+        corpo: { foto_base64: fotoBase64 },
+        timeoutMs: TIMEOUTS_BIOMETRIA.processamento,
       })
 
       // Log se reconheceu
@@ -421,6 +458,30 @@ class DeepFaceService {
     }
   }
 
+  /**
+   * Reconhece várias fotos em uma única requisição
+   *
+   * A API extrai os embeddings e compara cada grupo de fotos com a galeria
+   * em uma única busca vetorizada, respondendo em NDJSON (uma linha por foto,
+   * na ordem do lote). Os resultados chegam à medida que ficam prontos.
+   *
+   * @param itens - Fotos a reconhecer (id opcional, devolvido no resultado)
+   * @returns Resultados na ordem do lote
+   *
+   * @example
+   * ```typescript
+   * for await (const r of deepfaceService.reconhecerLote(fotos)) {
+   *   if (r.success) console.log(`${r.id}: ${r.nome}`)
+   * }
+   * ```
+   */
+  reconhecerLote(itens: ItemLoteFace[]): AsyncGenerator<ResultadoLoteFace> {
+    return this.cliente.lote<ResultadoLoteFace>(
+      '/reconhecer/lote',
+      itens.map((item) => ({ id: item.id, foto_base64: item.fotoBase64 }))
+    )
+  }
+
   // ===========================================================================
   // GERENCIAMENTO DE FACES
   // ===========================================================================
@@ -445,8 +506,8 @@ class DeepFaceService {
    */
   async removerFace(funcionarioId: number): Promise<boolean> {
     try {
-      const data = await this.request<{ success: boolean }>(`/remover/${funcionarioId}`, {
-        method: 'DELETE',
+      const data = await this.cliente.requisitar<{ success: boolean }>(`/remover/${funcionarioId}`, {
+        metodo: 'DELETE',
       })
       return data.success === true
     } catch (err) {
@@ -475,7 +536,7 @@ class DeepFaceService {
    */
   async listarFaces(): Promise<ListaFaces> {
     try {
-      return await this.request<ListaFaces>('/listar')
+      return await this.cliente.requisitar<ListaFaces>('/listar')
     } catch (err: any) {
       console.error('[DeepFace] Erro ao listar:', err)
       return { success: false, total: 0, faces: [] }
@@ -488,7 +549,7 @@ class DeepFaceService {
    * Força a API a recarregar todos os embeddings do disco.
    * Útil após operações em lote ou sincronização manual.
    *
-   * O cache fica em: deepface-api/faces/embeddings_cache.json
+   * O cache fica em: deepface-api/faces/embeddings_cache.json/.bin
    *
    * @returns true se sincronizado com sucesso, false caso contrário
    *
@@ -503,8 +564,8 @@ class DeepFaceService {
    */
   async sincronizar(): Promise<boolean> {
     try {
-      const data = await this.request<{ success: boolean }>('/sincronizar', {
-        method: 'POST',
+      const data = await this.cliente.requisitar<{ success: boolean }>('/sincronizar', {
+        metodo: 'POST',
       })
       return data.success === true
     } catch (err) {
@@ -0,0 +1,239 @@
+/**
+ * Serviço da escala de plantão
+ *
+ * A escala de um funcionário em jornada PLANTAO é contada a partir do dia do
+ * último registro antes do mês. Em vez de procurar esse registro no
+ * histórico a cada cálculo:
+ *
+ * - a referência de cada funcionário e período fica gravada em
+ *   ciclos_plantao e é lida junto com os demais dados do lote; só as que
+ *   faltam são buscadas em registros_ponto (uma consulta para o lote)
+ * - o calendário de plantões (dias do mês) é calculado uma vez por ciclo,
+ *   referência e período e guardado em memória por município: funcionários
+ *   da mesma equipe compartilham o mesmo calendário
+ *
+ * Invalidação: alteração de marcação apaga as referências dos meses
+ * seguintes (ver espelho_incremental_service) e troca de jornada apaga as
+ * do funcionário. Referência gravada com outra jornada é buscada de novo.
+ * A referência não depende do ciclo da jornada e a chave do calendário
+ * inclui o ciclo: jornada com ciclo alterado chega aqui pelo retrato do
+ * configuracao_municipio_service, renovado em até VALIDADE_MS.
+ *
+ * Os calendários devolvidos são compartilhados: somente leitura.
+ */
+
+import app from '@adonisjs/core/services/app'
+import { readFile } from 'node:fs/promises'
+import { DateTime } from 'luxon'
+import { dbManager } from '#services/database_manager_service'
+import {
+  CalculoPontoNucleo,
+  ZONA,
+  type ContextoPeriodo,
+  type FuncionarioPonto,
+  type Jornada,
+} from '#services/calculo_ponto_nucleo'
+
+/** Calendários em memória por município (acima disso o cache é esvaziado) */
+const CALENDARIOS_POR_MUNICIPIO = 2000
+
+class EscalaPlantaoService {
+  private calendarios = new Map<number, Map<string, Map<string, boolean>>>()
+  private tabelasVerificadas = new Set<number>()
+
+  /**
+   * Calendário de plantões do período para os funcionários em jornada PLANTAO
+   * (os demais não aparecem no resultado)
+   */
+  async carregarEscalas(
+    municipioId: number,
+    contexto: ContextoPeriodo,
+    funcionarios: FuncionarioPonto[]
+  ): Promise<Map<number, Map<string, boolean>>> {
+    const plantonistas = funcionarios.filter((f) => {
+      const jornada = contexto.jornadas.get(f.jornada_id)
+      return jornada?.tipo === 'PLANTAO' && jornada.horas_plantao && jornada.horas_folga
+    })
+    const escalas = new Map<number, Map<string, boolean>>()
+    if (plantonistas.length === 0) return escalas
+
+    const referencias = await this.carregarReferencias(municipioId, contexto, plantonistas)
+    for (const funcionario of plantonistas) {
+      escalas.set(
+        funcionario.id,
+        this.calendario(
+          municipioId,
+          contexto,
+          contexto.jornadas.get(funcionario.jornada_id)!,
+          referencias.get(funcionario.id) ?? null
+        )
+      )
+    }
+    return escalas
+  }
+
+  /**
+   * Apaga as referências dos períodos posteriores a uma data (marcações
+   * alteradas nesse dia mudam o último registro antes dos meses seguintes)
+   */
+  async invalidarFuncionario(municipioId: number, funcionarioId: number, aPartirDe?: string): Promise<void> {
+    await this.garantirTabelas(municipioId)
+    await dbManager.queryMunicipio(
+      municipioId,
+      aPartirDe
+        ? `DELETE FROM ciclos_plantao WHERE funcionario_id = $1 AND make_date(ano, mes, 1) > $2::date`
+        : `DELETE FROM ciclos_plantao WHERE funcionario_id = $1`,
+      aPartirDe ? [funcionarioId, aPartirDe] : [funcionarioId]
+    )
+  }
+
+  /**
+   * Troca de jornada: apaga as referências dos funcionários e os calendários
+   * do município
+   */
+  async invalidarFuncionarios(municipioId: number, funcionarioIds: number[]): Promise<void> {
+    await this.garantirTabelas(municipioId)
+    await dbManager.queryMunicipio(
+      municipioId,
+      `DELETE FROM ciclos_plantao WHERE funcionario_id = ANY($1)`,
+      [funcionarioIds]
+    )
+    this.calendarios.delete(municipioId)
+  }
+
+  /**
+   * Dia de referência de cada funcionário no período (YYYY-MM-DD ou null):
+   * gravado em ciclos_plantao ou buscado e gravado
+   */
+  private async carregarReferencias(
+    municipioId: number,
+    contexto: ContextoPeriodo,
+    funcionarios: FuncionarioPonto[]
+  ): Promise<Map<number, string | null>> {
+    await this.garantirTabelas(municipioId)
+    const { mes, ano } = contexto
+    const jornadaPorFuncionario = new Map(funcionarios.map((f) => [f.id, f.jornada_id]))
+
+    const gravadas = await dbManager.queryMunicipio<{
+      funcionario_id: number
+      jornada_id: number | null
+      data_referencia: string | null
+    }>(
+      municipioId,
+      `SELECT funcionario_id, jornada_id, TO_CHAR(data_referencia, 'YYYY-MM-DD') as data_referencia
+       FROM ciclos_plantao
+       WHERE funcionario_id = ANY($1) AND ano = $2 AND mes = $3`,
+      [[...jornadaPorFuncionario.keys()], ano, mes]
+    )
+
+    const referencias = new Map<number, string | null>()
+    for (const gravada of gravadas) {
+      if (gravada.jornada_id === jornadaPorFuncionario.get(gravada.funcionario_id)) {
+        referencias.set(gravada.funcionario_id, gravada.data_referencia)
+      }
+    }
+
+    const faltantes = funcionarios.filter((f) => !referencias.has(f.id))
+    if (faltantes.length > 0) {
+      const ultimos = await this.buscarUltimosRegistros(
+        municipioId,
+        faltantes.map((f) => f.id),
+        contexto.inicioMes
+      )
+      for (const funcionario of faltantes) {
+        const ultimo = ultimos.get(funcionario.id)
+        referencias.set(funcionario.id, ultimo ? CalculoPontoNucleo.paraDateTime(ultimo).toISODate() : null)
+      }
+
+      await dbManager.queryMunicipio(
+        municipioId,
+        `INSERT INTO ciclos_plantao (funcionario_id, ano, mes, jornada_id, data_referencia)
+         SELECT f.funcionario_id, $1, $2, f.jornada_id, f.data_referencia
+         FROM unnest($3::int[], $4::int[], $5::date[]) AS f(funcionario_id, jornada_id, data_referencia)
+         ON CONFLICT (funcionario_id, ano, mes) DO UPDATE SET
+           jornada_id = EXCLUDED.jornada_id,
+           data_referencia = EXCLUDED.data_referencia,
+           atualizado_em = NOW()`,
+        [
+          ano,
+          mes,
+          faltantes.map((f) => f.id),
+          faltantes.map((f) => f.jornada_id),
+          faltantes.map((f) => referencias.get(f.id)),
+        ]
+      )
+    }
+
+    return referencias
+  }
+
+  /**
+   * Último registro de cada funcionário antes de uma data
+   */
+  private async buscarUltimosRegistros(
+    municipioId: number,
+    funcionarioIds: number[],
+    antes: DateTime
+  ): Promise<Map<number, Date | string>> {
+    const ultimos = await dbManager.queryMunicipio<{ funcionario_id: number; data_hora: Date | string }>(
+      municipioId,
+      `SELECT f.id as funcionario_id, r.data_hora
+       FROM unnest($1::int[]) AS f(id)
+       CROSS JOIN LATERAL (
+         SELECT data_hora FROM registros_ponto
+         WHERE funcionario_id = f.id AND data_hora < $2
+         ORDER BY data_hora DESC LIMIT 1
+       ) r`,
+      [funcionarioIds, antes.toISO()]
+    )
+    return new Map(ultimos.map((u) => [u.funcionario_id, u.data_hora]))
+  }
+
+  /**
+   * Calendário do ciclo da jornada a partir da referência, no período
+   * (calculado uma vez e reaproveitado)
+   */
+  private calendario(
+    municipioId: number,
+    contexto: ContextoPeriodo,
+    jornada: Jornada,
+    referencia: string | null
+  ): Map<string, boolean> {
+    const chave = [
+      `${jornada.horas_plantao}x${jornada.horas_folga}`,
+      referencia ?? '-',
+      contexto.inicioMes.toISODate(),
+      contexto.fimMes.toISODate(),
+    ].join(':')
+
+    let calendarios = this.calendarios.get(municipioId)
+    if (!calendarios) {
+      calendarios = new Map()
+      this.calendarios.set(municipioId, calendarios)
+    }
+
+    let escala = calendarios.get(chave)
+    if (!escala) {
+      if (calendarios.size >= CALENDARIOS_POR_MUNICIPIO) calendarios.clear()
+      escala = CalculoPontoNucleo.calendarioPlantao(
+        referencia ? DateTime.fromISO(referencia, { zone: ZONA }) : null,
+        jornada.horas_plantao!,
+        jornada.horas_folga!,
+        contexto.inicioMes,
+        contexto.fimMes
+      )
+      calendarios.set(chave, escala)
+    }
+    return escala
+  }
+
+  private async garantirTabelas(municipioId: number) {
+    if (this.tabelasVerificadas.has(municipioId)) return
+    const sql = await readFile(app.makePath('database/migrations/tenant/016_ciclos_plantao.sql'), 'utf-8')
+    await dbManager.queryMunicipio(municipioId, sql)
+    this.tabelasVerificadas.add(municipioId)
+  }
+}
+
+export const escalaPlantaoService = new EscalaPlantaoService()
+export default escalaPlantaoService
@@ -0,0 +1,299 @@
+/**
+ * Cache dos espelhos exibidos nas telas de ponto
+ *
+ * O espelho de um funcionário e período, como a tela o recebe (linha de
+ * espelhos_ponto com dados, funcionário e, quando o espelho salvo não serve,
+ * o cálculo em tempo real), fica em memória por município junto com a versão
+ * dos dados de que foi montado:
+ *
+ * - versão das marcações do período (espelhos_versoes), incrementada pelo
+ *   gatilho de registros_ponto a cada marcação incluída, editada ou excluída,
+ *   qualquer que seja o caminho da gravação, e por espelho_incremental_service
+ * - updated_at e status do espelho salvo, updated_at do funcionário e dias
+ *   ainda aguardando a atualização incremental
+ * - versão da configuração do município em memória
+ *
+ * Cada leitura confere a versão com uma consulta leve (sem o JSON de dados) e
+ * nunca serve um espelho de outra versão. Enquanto a atualização incremental
+ * não grava as marcações alteradas, o espelho aberto é calculado em tempo
+ * real. Marcação alterada recalcula em segundo plano os espelhos do
+ * funcionário que estão em memória; leituras durante o recálculo aguardam o
+ * mesmo cálculo. Entradas da versão atual mais antigas que VALIDADE_MS
+ * (folgas e afastamentos não entram na versão) são servidas e recarregadas
+ * em segundo plano.
+ *
+ * Os espelhos devolvidos são compartilhados: somente leitura.
+ */
+
+import app from '@adonisjs/core/services/app'
+import { readFile } from 'node:fs/promises'
+import { DateTime } from 'luxon'
+import { dbManager } from '#services/database_manager_service'
+import { calculoPontoService } from '#services/calculo_ponto_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
+
+/** Idade a partir da qual um espelho da versão atual é recarregado em segundo plano */
+const VALIDADE_MS = 5 * 60 * 1000
+/** Espelhos em memória por município (acima disso os mais antigos saem) */
+const ESPELHOS_POR_MUNICIPIO = 1000
+
+const ZONA = 'America/Sao_Paulo'
+
+/** Espelho como devolvido para a tela */
+export type EspelhoTela = Record<string, any> & { funcionario: any; calculado: boolean }
+
+interface VersaoEspelho {
+  chave: string
+  /** Espelho salvo ausente ou anterior às marcações: calcular em tempo real */
+  recalcular: boolean
+}
+
+interface EntradaEspelho {
+  versao: string
+  carregadaEm: number
+  espelho: EspelhoTela
+}
+
+class EspelhoCacheService {
+  private entradas = new Map<number, Map<string, EntradaEspelho>>()
+  private cargas = new Map<string, Promise<EspelhoTela>>()
+  private tabelasVerificadas = new Set<number>()
+
+  /**
+   * Espelho do funcionário no período, da versão atual dos dados
+   */
+  async obter(municipioId: number, funcionarioId: number, mes: number, ano: number): Promise<EspelhoTela> {
+    const versao = await this.versaoAtual(municipioId, funcionarioId, mes, ano)
+    const entrada = this.entradas.get(municipioId)?.get(`${funcionarioId}:${ano}-${mes}`)
+
+    if (entrada && entrada.versao === versao.chave) {
+      if (Date.now() - entrada.carregadaEm >= VALIDADE_MS) {
+        this.carregar(municipioId, funcionarioId, mes, ano, versao).catch((error) => {
+          console.error(`[Espelho Cache] Erro ao recarregar espelho do funcionário ${funcionarioId}:`, error.message)
+        })
+      }
+      return entrada.espelho
+    }
+    return this.carregar(municipioId, funcionarioId, mes, ano, versao)
+  }
+
+  /**
+   * Marcações alteradas: sobe a versão dos períodos afetados (mês de cada
+   * data, o anterior e o seguinte) e recalcula em segundo plano os espelhos
+   * do funcionário que estão em memória
+   */
+  async registrarAlteracao(municipioId: number, funcionarioId: number, datas: string[]): Promise<void> {
+    const periodos = new Map<string, { ano: number; mes: number }>()
+    for (const data of datas) {
+      const dia = DateTime.fromISO(data, { zone: ZONA })
+      for (const mes of [dia.minus({ months: 1 }), dia, dia.plus({ months: 1 })]) {
+        periodos.set(`${mes.year}-${mes.month}`, { ano: mes.year, mes: mes.month })
+      }
+    }
+    if (periodos.size === 0) return
+
+    await this.garantirTabelas(municipioId)
+    await dbManager.queryMunicipio(
+      municipioId,
+      `INSERT INTO espelhos_versoes (funcionario_id, ano, mes)
+       SELECT $1, p.ano, p.mes FROM unnest($2::int[], $3::int[]) AS p(ano, mes)
+       ON CONFLICT (funcionario_id, ano, mes) DO UPDATE SET
+         versao = espelhos_versoes.versao + 1,
+         alterado_em = NOW()`,
+      [funcionarioId, [...periodos.values()].map((p) => p.ano), [...periodos.values()].map((p) => p.mes)]
+    )
+
+    for (const { ano, mes } of periodos.values()) {
+      if (!this.entradas.get(municipioId)?.has(`${funcionarioId}:${ano}-${mes}`)) continue
+      this.obter(municipioId, funcionarioId, mes, ano).catch((error) => {
+        console.error(`[Espelho Cache] Erro ao recalcular espelho do funcionário ${funcionarioId}:`, error.message)
+      })
+    }
+  }
+
+  /**
+   * Versão atual dos dados do espelho (consulta sem o JSON de dados)
+   */
+  private async versaoAtual(
+    municipioId: number,
+    funcionarioId: number,
+    mes: number,
+    ano: number
+  ): Promise<VersaoEspelho> {
+    await this.garantirTabelas(municipioId)
+    const inicioMes = DateTime.fromObject({ year: ano, month: mes, day: 1 }, { zone: ZONA })
+    const [linha, configuracao] = await Promise.all([
+      dbManager.queryMunicipioOne<{
+        versao: string | null
+        marcacoes_posteriores: boolean | null
+        espelho_id: number | null
+        status: string | null
+        espelho_em: Date | null
+        funcionario_em: Date | null
+        pendente: boolean
+      }>(
+        municipioId,
+        `SELECT v.versao,
+                v.alterado_em > e.updated_at as marcacoes_posteriores,
+                e.id as espelho_id, e.status, e.updated_at as espelho_em,
+                f.updated_at as funcionario_em,
+                EXISTS (
+                  SELECT 1 FROM espelhos_dias_pendentes p
+                  WHERE p.funcionario_id = f.id AND p.data BETWEEN $4 AND $5
+                ) as pendente
+         FROM funcionarios f
+         LEFT JOIN espelhos_versoes v ON v.funcionario_id = f.id AND v.ano = $3 AND v.mes = $2
+         LEFT JOIN espelhos_ponto e ON e.funcionario_id = f.id AND e.mes = $2 AND e.ano = $3
+         WHERE f.id = $1`,
+        [
+          funcionarioId,
+          mes,
+          ano,
+          inicioMes.minus({ months: 1 }).toISODate(),
+          inicioMes.plus({ months: 1 }).endOf('month').toISODate(),
+        ]
+      ),
+      configuracaoMunicipioService.obter(municipioId),
+    ])
+
+    const instante = (data: Date | null) => (data ? new Date(data).getTime() : '-')
+    const aberto = (linha?.status ?? 'ABERTO') === 'ABERTO'
+    return {
+      chave: [
+        linha?.versao ?? 0,
+        linha?.espelho_id ?? '-',
+        instante(linha?.espelho_em ?? null),
+        linha?.status ?? '-',
+        instante(linha?.funcionario_em ?? null),
+        linha?.pendente ? 1 : 0,
+        configuracao.versao,
+      ].join(':'),
+      recalcular: !linha?.espelho_id || (aberto && (linha.pendente || linha.marcacoes_posteriores === true)),
+    }
+  }
+
+  /**
+   * Monta e guarda o espelho de uma versão (chamadas simultâneas da mesma
+   * versão compartilham a carga)
+   */
+  private carregar(
+    municipioId: number,
+    funcionarioId: number,
+    mes: number,
+    ano: number,
+    versao: VersaoEspelho
+  ): Promise<EspelhoTela> {
+    const chave = `${funcionarioId}:${ano}-${mes}`
+    const id = `${municipioId}:${chave}:${versao.chave}`
+    const emAndamento = this.cargas.get(id)
+    if (emAndamento) return emAndamento
+
+    const carga = this.montar(municipioId, funcionarioId, mes, ano, versao.recalcular)
+      .then((espelho) => {
+        this.guardar(municipioId, chave, { versao: versao.chave, carregadaEm: Date.now(), espelho })
+        return espelho
+      })
+      .finally(() => this.cargas.delete(id))
+    this.cargas.set(id, carga)
+    return carga
+  }
+
+  /**
+   * Espelho salvo ou, se ausente ou desatualizado, calculado em tempo real
+   */
+  private async montar(
+    municipioId: number,
+    funcionarioId: number,
+    mes: number,
+    ano: number,
+    recalcular: boolean
+  ): Promise<EspelhoTela> {
+    const [espelhoSalvo, funcionario] = await Promise.all([
+      dbManager.queryMunicipioOne<Record<string, any>>(
+        municipioId,
+        `SELECT * FROM espelhos_ponto WHERE funcionario_id = $1 AND mes = $2 AND ano = $3`,
+        [funcionarioId, mes, ano]
+      ),
+      dbManager.queryMunicipioOne(
+        municipioId,
+        `SELECT f.*, j.nome as jornada_nome, j.carga_horaria_diaria, j.carga_horaria_semanal,
+                l.nome as lotacao_nome, s.nome as secretaria_nome
+         FROM funcionarios f
+         LEFT JOIN jornadas j ON j.id = f.jornada_id
+         LEFT JOIN lotacoes l ON l.id = f.lotacao_id
+         LEFT JOIN secretarias s ON s.id = f.secretaria_id
+         WHERE f.id = $1`,
+        [funcionarioId]
+      ),
+    ])
+
+    if (espelhoSalvo && !recalcular) {
+      return { ...espelhoSalvo, funcionario, calculado: false }
+    }
+
+    // Espelho ainda não gerado ou com marcações que a atualização incremental não gravou
+    const calculado = await calculoPontoService.calcularEspelho(municipioId, funcionarioId, mes, ano)
+    const totais = {
+      dias_trabalhados: calculado.totais.diasTrabalhados,
+      horas_trabalhadas: calculado.totais.horasTrabalhadas,
+      horas_extras: calculado.totais.horasExtras,
+      horas_faltantes: calculado.totais.horasFaltantes,
+      atrasos: calculado.totais.atrasos,
+      faltas: calculado.totais.faltas,
+    }
+
+    if (espelhoSalvo) {
+      // Mantém justificativas e histórico gravados no espelho
+      const dados = typeof espelhoSalvo.dados === 'string' ? JSON.parse(espelhoSalvo.dados) : espelhoSalvo.dados
+      return {
+        ...espelhoSalvo,
+        ...totais,
+        dados: { ...dados, dias: calculado.dias, totais: calculado.totais },
+        funcionario,
+        calculado: true,
+      }
+    }
+
+    return {
+      funcionario_id: funcionarioId,
+      mes,
+      ano,
+      status: 'ABERTO',
+      ...totais,
+      dados: { dias: calculado.dias },
+      funcionario,
+      calculado: true,
+    }
+  }
+
+  private guardar(municipioId: number, chave: string, entrada: EntradaEspelho) {
+    let espelhos = this.entradas.get(municipioId)
+    if (!espelhos) {
+      espelhos = new Map()
+      this.entradas.set(municipioId, espelhos)
+    }
+    // Reinserido no fim: os mais antigos ficam no começo do Map
+    espelhos.delete(chave)
+    if (espelhos.size >= ESPELHOS_POR_MUNICIPIO) {
+      espelhos.delete(espelhos.keys().next().value!)
+    }
+    espelhos.set(chave, entrada)
+  }
+
+  private async garantirTabelas(municipioId: number) {
+    if (this.tabelasVerificadas.has(municipioId)) return
+    // Cada arquivo em um comando só (o 019 tem funções em plpgsql)
+    for (const arquivo of [
+      '015_espelhos_dias_pendentes.sql',
+      '018_espelhos_versoes.sql',
+      '019_espelhos_versoes_trigger.sql',
+    ]) {
+      const sql = await readFile(app.makePath(`database/migrations/tenant/${arquivo}`), 'utf-8')
+      await dbManager.queryMunicipio(municipioId, sql)
+    }
+    this.tabelasVerificadas.add(municipioId)
+  }
+}
+
+export const espelhoCacheService = new EspelhoCacheService()
+export default espelhoCacheService
@@ -0,0 +1,509 @@
+/**
+ * Serviço de atualização incremental dos espelhos de ponto
+ *
+ * Cada inclusão, edição ou exclusão de marcação registra o dia alterado em
+ * espelhos_dias_pendentes. Alguns segundos depois os dias pendentes do
+ * município são consumidos e os espelhos abertos afetados são atualizados
+ * recalculando só esses dias: os demais vêm do espelho salvo (dados.dias) e
+ * os totais são refeitos a partir da lista de dias.
+ *
+ * - dia do fechamento ou o seguinte alterado: os dois dias e o turno que
+ *   cruza o fechamento são recalculados
+ * - dias do mês ainda não calculados (espelho salvo no meio do mês) entram
+ *   no recálculo
+ * - jornada PLANTAO: a escala do mês depende do último registro antes dele,
+ *   então alteração no mês anterior invalida a referência gravada
+ *   (escala_plantao_service) e recalcula o espelho inteiro
+ * - espelho sem dados.dias: recálculo completo
+ *
+ * Só espelhos já gerados e com status ABERTO são atualizados. Cada marcação
+ * sobe também a versão dos espelhos do período (espelho_cache_service).
+ *
+ * Os dias pendentes são consumidos por funcionário (todos os dias dele de
+ * uma vez) e cada período é lido e gravado em uma transação, com os espelhos
+ * travados: outra atualização ou o fechamento do período (salvarEspelhos com
+ * a carga) esperam e não gravam por cima de um espelho mais novo.
+ */
+
+import app from '@adonisjs/core/services/app'
+import { readFile } from 'node:fs/promises'
+import { DateTime } from 'luxon'
+import { dbManager } from '#services/database_manager_service'
+import { escalaPlantaoService } from '#services/escala_plantao_service'
+import { espelhoCacheService } from '#services/espelho_cache_service'
+import {
+  CalculoPontoService,
+  calculoPontoService,
+  ESPELHOS_POR_GRAVACAO,
+  type ContextoPeriodo,
+  type DiaTrabalhado,
+  type EspelhoCalculado,
+  type FolgaProgramada,
+  type FuncionarioPonto,
+  type RegistroPonto,
+} from '#services/calculo_ponto_service'
+
+/** Espera depois da última marcação antes de atualizar os espelhos (ms) */
+const ATRASO_PROCESSAMENTO = 2000
+/** Dias pendentes consumidos por vez */
+const LOTE_PENDENTES = 2000
+
+const ZONA = 'America/Sao_Paulo'
+
+interface DiaPendente {
+  funcionario_id: number
+  data: string
+}
+
+interface EspelhoSalvo {
+  id: number
+  funcionario_id: number
+  mes: number
+  ano: number
+  dados: any
+  funcionario: FuncionarioPonto
+}
+
+/** Espelho atualizado recalculando só alguns dias */
+interface AtualizacaoParcial {
+  espelho: EspelhoSalvo
+  diasSalvos: Map<string, DiaTrabalhado>
+  totaisSalvos: Record<string, any>
+  recalcular: Set<string>
+  recalcularFechamento: boolean
+}
+
+class EspelhoIncrementalService {
+  private agendados = new Map<number, NodeJS.Timeout>()
+  private processando = new Set<number>()
+  /** Municípios que receberam marcações durante o processamento */
+  private repetir = new Set<number>()
+  private tabelasVerificadas = new Set<number>()
+
+  /**
+   * Registra os dias alterados de um funcionário e agenda a atualização dos espelhos
+   *
+   * Nunca lança erro: a marcação já foi gravada e o espelho pode ser
+   * reprocessado pelo fechamento do período.
+   */
+  async marcarDias(
+    municipioId: number,
+    funcionarioId: number,
+    datasHora: Array<Date | string | null | undefined>
+  ): Promise<void> {
+    try {
+      const datas = [
+        ...new Set(
+          datasHora
+            .filter((d): d is Date | string => !!d)
+            .map((d) => CalculoPontoService.paraDateTime(d).toISODate())
+            .filter((d): d is string => !!d)
+        ),
+      ]
+      if (!funcionarioId || datas.length === 0) return
+
+      await this.garantirTabelas(municipioId)
+      await dbManager.queryMunicipio(
+        municipioId,
+        `INSERT INTO espelhos_dias_pendentes (funcionario_id, data)
+         SELECT $1, unnest($2::date[])
+         ON CONFLICT (funcionario_id, data) DO UPDATE SET marcado_em = NOW()`,
+        [funcionarioId, datas]
+      )
+      // O último registro antes dos meses seguintes pode ter mudado: referências da escala de plantão
+      await escalaPlantaoService.invalidarFuncionario(municipioId, funcionarioId, [...datas].sort()[0])
+      // Nova versão dos espelhos dos períodos afetados (telas não recebem o espelho anterior)
+      await espelhoCacheService.registrarAlteracao(municipioId, funcionarioId, datas)
+      this.agendar(municipioId)
+    } catch (error: any) {
+      console.error(`[Espelho Incremental] Erro ao marcar dias do funcionário ${funcionarioId}:`, error.message)
+    }
+  }
+
+  /**
+   * Consome os dias pendentes do município e atualiza os espelhos afetados
+   */
+  async processarPendentes(municipioId: number): Promise<{ dias: number; espelhos: number }> {
+    const resultado = { dias: 0, espelhos: 0 }
+    if (this.processando.has(municipioId)) {
+      this.repetir.add(municipioId)
+      return resultado
+    }
+
+    this.processando.add(municipioId)
+    const inicio = Date.now()
+    // Dias de espelhos que falharam sozinhos: voltam para a fila só no fim,
+    // para este processamento não consumi-los de novo
+    const falhas: DiaPendente[] = []
+    try {
+      await this.garantirTabelas(municipioId)
+      while (true) {
+        // Todos os dias pendentes de cada funcionário escolhido (SKIP LOCKED: outro
+        // processo consumindo o mesmo município pega outros funcionários)
+        const pendentes = await dbManager.queryMunicipio<DiaPendente>(
+          municipioId,
+          `DELETE FROM espelhos_dias_pendentes
+           WHERE funcionario_id IN (
+             SELECT funcionario_id FROM espelhos_dias_pendentes
+             ORDER BY marcado_em
+             LIMIT $1
+             FOR UPDATE SKIP LOCKED
+           )
+           RETURNING funcionario_id, TO_CHAR(data, 'YYYY-MM-DD') as data`,
+          [LOTE_PENDENTES]
+        )
+        if (pendentes.length === 0) break
+
+        try {
+          resultado.espelhos += await this.atualizarEspelhos(municipioId, pendentes, falhas)
+          resultado.dias += pendentes.length
+        } catch (error) {
+          // Devolve os dias para a próxima marcação tentar de novo
+          await this.devolverPendentes(municipioId, pendentes)
+          throw error
+        }
+      }
+    } finally {
+      if (falhas.length > 0) {
+        await this.devolverPendentes(municipioId, falhas).catch((error) => {
+          console.error(`[Espelho Incremental] Erro ao devolver dias pendentes do município ${municipioId}:`, error.message)
+        })
+      }
+      this.processando.delete(municipioId)
+      if (this.repetir.delete(municipioId)) this.agendar(municipioId)
+    }
+
+    if (resultado.dias > 0) {
+      console.log(
+        `[Espelho Incremental] Município ${municipioId}: ${resultado.dias} dia(s), ` +
+          `${resultado.espelhos} espelho(s) atualizado(s) em ${Date.now() - inicio}ms`
+      )
+    }
+    return resultado
+  }
+
+  /**
+   * Devolve dias consumidos para a fila (a próxima marcação ou o fechamento
+   * do período tenta de novo)
+   */
+  private async devolverPendentes(municipioId: number, pendentes: DiaPendente[]) {
+    await dbManager.queryMunicipio(
+      municipioId,
+      `INSERT INTO espelhos_dias_pendentes (funcionario_id, data)
+       SELECT * FROM unnest($1::int[], $2::date[])
+       ON CONFLICT (funcionario_id, data) DO NOTHING`,
+      [pendentes.map((p) => p.funcionario_id), pendentes.map((p) => p.data)]
+    )
+  }
+
+  /**
+   * Agenda o processamento (várias marcações seguidas geram um processamento só)
+   */
+  private agendar(municipioId: number) {
+    if (this.agendados.has(municipioId)) return
+    const timer = setTimeout(() => {
+      this.agendados.delete(municipioId)
+      this.processarPendentes(municipioId).catch((error) => {
+        console.error(`[Espelho Incremental] Erro no município ${municipioId}:`, error.message)
+      })
+    }, ATRASO_PROCESSAMENTO)
+    timer.unref?.()
+    this.agendados.set(municipioId, timer)
+  }
+
+  /**
+   * Atualiza os espelhos abertos que contêm os dias alterados
+   *
+   * @param falhas Recebe os dias dos espelhos que não puderam ser atualizados
+   * @returns Quantidade de espelhos atualizados
+   */
+  private async atualizarEspelhos(
+    municipioId: number,
+    pendentes: DiaPendente[],
+    falhas: DiaPendente[]
+  ): Promise<number> {
+    const diasPorFuncionario = new Map<number, Set<string>>()
+    // Um dia pode afetar o espelho do próprio mês, o do mês anterior (dia
+    // seguinte ao fechamento no fim do mês) e o do seguinte (escala de plantão)
+    const periodos = new Set<number>()
+    for (const pendente of pendentes) {
+      if (!diasPorFuncionario.has(pendente.funcionario_id)) {
+        diasPorFuncionario.set(pendente.funcionario_id, new Set())
+      }
+      diasPorFuncionario.get(pendente.funcionario_id)!.add(pendente.data)
+
+      const data = DateTime.fromISO(pendente.data)
+      for (const mes of [data.minus({ months: 1 }), data, data.plus({ months: 1 })]) {
+        periodos.add(mes.year * 12 + mes.month - 1)
+      }
+    }
+
+    // Períodos com espelho aberto dos funcionários (o espelho é lido de novo, travado, na transação)
+    const encontrados = await dbManager.queryMunicipio<{ mes: number; ano: number }>(
+      municipioId,
+      `SELECT DISTINCT mes, ano FROM espelhos_ponto
+       WHERE funcionario_id = ANY($1)
+       AND (ano * 12 + mes - 1) = ANY($2::int[])
+       AND COALESCE(status, 'ABERTO') = 'ABERTO'
+       ORDER BY ano, mes`,
+      [[...diasPorFuncionario.keys()], [...periodos]]
+    )
+
+    let atualizados = 0
+    for (const { mes, ano } of encontrados) {
+      // Contexto (feriados, jornadas, fechamento) carregado uma vez por período
+      const contexto = await calculoPontoService.carregarContextoPeriodo(municipioId, mes, ano)
+      const bancoHorasAtivo = await calculoPontoService.prepararGravacao(municipioId)
+      atualizados += await dbManager.transactionMunicipio(municipioId, async (client) => {
+        const espelhos = await this.travarEspelhos(client, mes, ano, [...diasPorFuncionario.keys()])
+        const calculados = await this.atualizarPeriodo(municipioId, contexto, espelhos, diasPorFuncionario, falhas)
+        // Em caso de erro nada é gravado e os dias voltam para a fila (processarPendentes)
+        for (let inicio = 0; inicio < calculados.length; inicio += ESPELHOS_POR_GRAVACAO) {
+          const bloco = calculados.slice(inicio, inicio + ESPELHOS_POR_GRAVACAO)
+          await calculoPontoService.gravarEspelhos(client, mes, ano, bloco, bancoHorasAtivo)
+        }
+        return calculados.length
+      })
+    }
+    return atualizados
+  }
+
+  /**
+   * Lê os espelhos abertos do período travando as linhas até o fim da
+   * transação: outra atualização incremental ou o fechamento do período
+   * esperam esta gravar e partem do espelho já atualizado
+   */
+  private async travarEspelhos(client: any, mes: number, ano: number, funcionarioIds: number[]) {
+    const { rows } = await client.query(
+      `SELECT e.id, e.funcionario_id, e.mes, e.ano, e.dados,
+              f.nome, f.jornada_id, f.data_admissao, f.data_demissao
+       FROM espelhos_ponto e
+       JOIN funcionarios f ON f.id = e.funcionario_id
+       WHERE e.funcionario_id = ANY($1) AND e.mes = $2 AND e.ano = $3
+       AND COALESCE(e.status, 'ABERTO') = 'ABERTO'
+       ORDER BY e.funcionario_id
+       FOR UPDATE OF e`,
+      [funcionarioIds, mes, ano]
+    )
+    return rows.map(
+      (linha: Omit<EspelhoSalvo, 'funcionario'> & Omit<FuncionarioPonto, 'id'>): EspelhoSalvo => ({
+        id: linha.id,
+        funcionario_id: linha.funcionario_id,
+        mes: linha.mes,
+        ano: linha.ano,
+        dados: linha.dados,
+        funcionario: {
+          id: linha.funcionario_id,
+          nome: linha.nome,
+          jornada_id: linha.jornada_id,
+          data_admissao: linha.data_admissao,
+          data_demissao: linha.data_demissao,
+        },
+      })
+    )
+  }
+
+  /**
+   * Recalcula os espelhos de um período: parcialmente quando possível, por
+   * completo quando o espelho salvo não serve de base
+   *
+   * @returns Espelhos a gravar
+   */
+  private async atualizarPeriodo(
+    municipioId: number,
+    contexto: ContextoPeriodo,
+    espelhos: EspelhoSalvo[],
+    diasPorFuncionario: Map<number, Set<string>>,
+    falhas: DiaPendente[]
+  ): Promise<EspelhoCalculado[]> {
+    const { inicioMes, fimMes, dataFechamento } = contexto
+    const inicio = inicioMes.toISODate()!
+    const fim = fimMes.toISODate()!
+    const inicioMesAnterior = inicioMes.minus({ months: 1 }).toISODate()!
+    const diaFechamento = dataFechamento.toISODate()!
+    const diaApos = dataFechamento.plus({ days: 1 }).toISODate()!
+
+    const parciais: AtualizacaoParcial[] = []
+    const completos: FuncionarioPonto[] = []
+    const falhou = (funcionarioId: number) => {
+      for (const data of diasPorFuncionario.get(funcionarioId) ?? []) {
+        falhas.push({ funcionario_id: funcionarioId, data })
+      }
+    }
+
+    for (const espelho of espelhos) {
+      const alterados = diasPorFuncionario.get(espelho.funcionario_id)!
+      const jornada = contexto.jornadas.get(espelho.funcionario.jornada_id)
+      const noMes = [...alterados].filter((d) => d >= inicio && d <= fim)
+      const tocaFechamento = alterados.has(diaFechamento) || alterados.has(diaApos)
+      const mudaEscala =
+        jornada?.tipo === 'PLANTAO' && [...alterados].some((d) => d >= inicioMesAnterior && d < inicio)
+      if (noMes.length === 0 && !tocaFechamento && !mudaEscala) continue
+
+      const dados = typeof espelho.dados === 'string' ? JSON.parse(espelho.dados) : espelho.dados
+      if (mudaEscala || !Array.isArray(dados?.dias)) {
+        completos.push(espelho.funcionario)
+        continue
+      }
+
+      const diasSalvos = new Map<string, DiaTrabalhado>(dados.dias.map((d: DiaTrabalhado) => [d.data, d]))
+      const recalcular = new Set(noMes)
+      // Dias que ainda não existiam quando o espelho foi salvo
+      for (let dia = inicioMes; dia <= fimMes; dia = dia.plus({ days: 1 })) {
+        if (!diasSalvos.has(dia.toISODate()!)) recalcular.add(dia.toISODate()!)
+      }
+      if (tocaFechamento) {
+        for (const dia of [diaFechamento, diaApos]) {
+          if (dia >= inicio && dia <= fim) recalcular.add(dia)
+        }
+      }
+
+      parciais.push({
+        espelho,
+        diasSalvos,
+        totaisSalvos: dados.totais ?? {},
+        recalcular,
+        recalcularFechamento: tocaFechamento || recalcular.has(diaFechamento) || recalcular.has(diaApos),
+      })
+    }
+
+    const calculados: EspelhoCalculado[] = []
+
+    if (parciais.length > 0) {
+      const { registros, folgas, escalas } = await this.carregarDias(municipioId, contexto, parciais)
+
+      for (const parcial of parciais) {
+        const { espelho } = parcial
+        const funcionarioId = espelho.funcionario_id
+        try {
+          const registrosFuncionario = registros.get(funcionarioId) ?? []
+          const registrosPorDia = CalculoPontoService.agruparRegistrosPorDia(registrosFuncionario)
+          const parametros = CalculoPontoService.prepararJornada(contexto, {
+            funcionario: espelho.funcionario,
+            ultimoRegistroAnterior: null,
+            escalaPlantao: escalas.get(funcionarioId),
+          })
+
+          // Mesma sequência de dias do cálculo completo
+          const dias: DiaTrabalhado[] = []
+          for (let diaAtual = inicioMes; diaAtual <= fimMes; diaAtual = diaAtual.plus({ days: 1 })) {
+            const dataStr = diaAtual.toISODate()!
+            dias.push(
+              parcial.recalcular.has(dataStr)
+                ? CalculoPontoService.calcularDia(
+                    contexto,
+                    parametros,
+                    diaAtual,
+                    registrosPorDia[dataStr] || [],
+                    folgas.get(`${funcionarioId}:${dataStr}`)
+                  )
+                : parcial.diasSalvos.get(dataStr)!
+            )
+          }
+
+          const { totaisSalvos } = parcial
+          const fechamento = parcial.recalcularFechamento
+            ? CalculoPontoService.calcularFechamento(contexto, registrosFuncionario)
+            : {
+                horasParaProximoPeriodo: totaisSalvos.horasParaProximoPeriodo ?? 0,
+                registrosAfetados: totaisSalvos.observacoesFechamento ?? [],
+              }
+
+          calculados.push(CalculoPontoService.totalizar(contexto, funcionarioId, dias, fechamento))
+        } catch (error: any) {
+          console.error(`[Espelho Incremental] Erro ao atualizar espelho ${espelho.id}:`, error.message)
+          falhou(funcionarioId)
+        }
+      }
+    }
+
+    if (completos.length > 0) {
+      const dados = await calculoPontoService.carregarDadosFuncionarios(municipioId, contexto, completos)
+      for (const funcionario of completos) {
+        try {
+          calculados.push(CalculoPontoService.montarEspelho(contexto, dados.get(funcionario.id)!))
+        } catch (error: any) {
+          console.error(`[Espelho Incremental] Erro ao recalcular funcionário ${funcionario.id}:`, error.message)
+          falhou(funcionario.id)
+        }
+      }
+    }
+
+    return calculados
+  }
+
+  /**
+   * Registros e folgas só dos dias a recalcular (um intervalo por funcionário
+   * e dia) e o calendário de plantão
+   */
+  private async carregarDias(municipioId: number, contexto: ContextoPeriodo, parciais: AtualizacaoParcial[]) {
+    const diaFechamento = contexto.dataFechamento.toISODate()!
+    const diaApos = contexto.dataFechamento.plus({ days: 1 }).toISODate()!
+
+    const ids: number[] = []
+    const datas: string[] = []
+    const inicios: string[] = []
+    const fins: string[] = []
+    for (const parcial of parciais) {
+      const dias = new Set(parcial.recalcular)
+      // O turno que cruza o fechamento usa os dois dias, mesmo fora do mês
+      if (parcial.recalcularFechamento) {
+        dias.add(diaFechamento)
+        dias.add(diaApos)
+      }
+      for (const dia of dias) {
+        const inicioDia = DateTime.fromISO(dia, { zone: ZONA }).startOf('day')
+        ids.push(parcial.espelho.funcionario_id)
+        datas.push(dia)
+        inicios.push(inicioDia.toISO()!)
+        fins.push(inicioDia.plus({ days: 1 }).toISO()!)
+      }
+    }
+
+    const [linhasRegistros, linhasFolgas, escalas] = await Promise.all([
+      dbManager.queryMunicipio<RegistroPonto>(
+        municipioId,
+        `SELECT r.id, r.funcionario_id, r.data_hora, r.tipo, r.sentido, r.origem
+         FROM unnest($1::int[], $2::timestamptz[], $3::timestamptz[]) AS d(funcionario_id, inicio, fim)
+         JOIN registros_ponto r ON r.funcionario_id = d.funcionario_id
+           AND r.data_hora >= d.inicio AND r.data_hora < d.fim
+         ORDER BY r.funcionario_id, r.data_hora`,
+        [ids, inicios, fins]
+      ),
+      dbManager.queryMunicipio<FolgaProgramada & { funcionario_id: number }>(
+        municipioId,
+        `SELECT f.funcionario_id, TO_CHAR(f.data, 'YYYY-MM-DD') as data, f.tipo, f.motivo
+         FROM unnest($1::int[], $2::date[]) AS d(funcionario_id, data)
+         JOIN folgas_programadas f ON f.funcionario_id = d.funcionario_id AND f.data = d.data`,
+        [ids, datas]
+      ),
+      escalaPlantaoService.carregarEscalas(
+        municipioId,
+        contexto,
+        parciais.map((p) => p.espelho.funcionario)
+      ),
+    ])
+
+    const registros = new Map<number, RegistroPonto[]>()
+    for (const registro of linhasRegistros) {
+      if (!registros.has(registro.funcionario_id)) registros.set(registro.funcionario_id, [])
+      registros.get(registro.funcionario_id)!.push(registro)
+    }
+    const folgas = new Map<string, FolgaProgramada>(linhasFolgas.map((f) => [`${f.funcionario_id}:${f.data}`, f]))
+
+    return { registros, folgas, escalas }
+  }
+
+  private async garantirTabelas(municipioId: number) {
+    if (this.tabelasVerificadas.has(municipioId)) return
+    const sql = await readFile(
+      app.makePath('database/migrations/tenant/015_espelhos_dias_pendentes.sql'),
+      'utf-8'
+    )
+    await dbManager.queryMunicipio(municipioId, sql)
+    this.tabelasVerificadas.add(municipioId)
+  }
+}
+
+export const espelhoIncrementalService = new EspelhoIncrementalService()
+export default espelhoIncrementalService
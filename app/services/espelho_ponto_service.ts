@@ -1,5 +1,6 @@
 import DatabaseManagerService from '#services/database_manager_service'
 import { DateTime } from 'luxon'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
 import PDFDocument from 'pdfkit'
 import ExcelJS from 'exceljs'
 
@@ -550,17 +551,11 @@ export default class EspelhoPontoService {
     funcionario: DadosFuncionario
   ): Promise<RegistroDia[]> {
     const cargaHorariaDiaria = funcionario.carga_horaria_diaria
-    // Busca feriados do período
-    const feriadosQuery = `
-      SELECT data FROM feriados
-      WHERE data >= $1 AND data <= $2 AND ativo = true
-    `
-    const feriadosResult = await DatabaseManagerService.queryMunicipio(municipioId, feriadosQuery, [
-      dataInicio,
-      dataFim,
-    ])
-    const feriados = new Set(
-      feriadosResult.rows.map((r: any) => DateTime.fromJSDate(r.data).toISODate())
+    // Feriados do período (configuração em memória do município)
+    const feriados = configuracaoMunicipioService.feriadosNoPeriodo(
+      await configuracaoMunicipioService.obter(municipioId),
+      DateTime.fromJSDate(dataInicio).toISODate()!,
+      DateTime.fromJSDate(dataFim).toISODate()!
     )
 
     // Busca ocorrências do período
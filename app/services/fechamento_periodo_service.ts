@@ -0,0 +1,566 @@
+/**
+ * Serviço de fechamento do período em segundo plano
+ *
+ * Processa os espelhos do mês fora da requisição HTTP:
+ * - blocos de ESPELHOS_POR_GRAVACAO funcionários, calculados nas threads do
+ *   calculo_ponto_pool e gravados cada um em uma transação; vários blocos ao
+ *   mesmo tempo, com a concorrência configurada por município
+ *   (configuracoes.fechamento_concorrencia)
+ * - checkpoint dos funcionários concluídos (processamentos_periodo_itens)
+ *   depois de cada bloco: um novo pedido para o mesmo período retoma de onde
+ *   o anterior parou
+ * - cancelamento entre um bloco e outro
+ * - funcionários com marcações alteradas entre a carga e a gravação não são
+ *   gravados por cima da atualização incremental: entram na rodada seguinte
+ * - progresso e vazão no evento 'progresso-espelho' do WebSocket
+ *
+ * Um processamento por vez em cada município: pedidos simultâneos no mesmo
+ * processo aguardam o início já reservado e, entre servidores, o índice
+ * único das linhas PROCESSANDO (migração 020) decide quem processa. Uma
+ * linha PROCESSANDO sem checkpoint há PROCESSANDO_INATIVO_MINUTOS é de um
+ * processo interrompido e libera o município.
+ */
+
+import app from '@adonisjs/core/services/app'
+import { readFile } from 'node:fs/promises'
+import { dbManager } from '#services/database_manager_service'
+import {
+  calculoPontoService,
+  ESPELHOS_POR_GRAVACAO,
+  LOTE_FUNCIONARIOS,
+  RODADAS_ALTERADOS,
+  type EspelhoSerializado,
+  type FuncionarioPonto,
+} from '#services/calculo_ponto_service'
+import { calculoPontoPool } from '#services/calculo_ponto_pool'
+import websocketService from '#services/websocket_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
+
+/** Blocos gravados ao mesmo tempo, se o município não configurar */
+const CONCORRENCIA_PADRAO = 4
+/** O pool de cada município tem 10 conexões: sobra espaço para as requisições */
+const CONCORRENCIA_MAXIMA = 8
+/** Intervalo mínimo entre eventos de progresso (ms) */
+const INTERVALO_PROGRESSO = 500
+/** Processamentos interrompidos há mais tempo que isso começam do zero */
+const RETOMADA_MAXIMA_HORAS = 24
+/** Processamento sem checkpoint há mais tempo que isso foi interrompido (outro servidor caiu) */
+const PROCESSANDO_INATIVO_MINUTOS = 15
+
+type SituacaoInicio = 'NOVO' | 'RETOMADO' | 'EM_ANDAMENTO'
+
+export interface Processamento {
+  id: number
+  mes: number
+  ano: number
+  funcionario_ids: number[] | null
+  status: 'PROCESSANDO' | 'CONCLUIDO' | 'CANCELADO' | 'ERRO'
+  concorrencia: number
+  total: number
+  processados: number
+  erros: number
+  erro: string | null
+  iniciado_em: Date
+  concluido_em: Date | null
+}
+
+interface ItemCheckpoint {
+  funcionarioId: number
+  status: 'OK' | 'ERRO'
+  horasTrabalhadas: number | null
+  erro: string | null
+}
+
+/** Processamento em execução neste processo */
+interface Execucao {
+  processamento: Processamento
+  cancelado: boolean
+  inicio: number
+  /** Funcionários concluídos nesta execução (para a vazão) */
+  concluidos: number
+  ultimoProgresso: number
+  promessa?: Promise<void>
+}
+
+class FechamentoPeriodoService {
+  private execucoes = new Map<number, Execucao>()
+  /** Inícios em andamento (reservados antes do primeiro await) */
+  private iniciando = new Map<number, Promise<{ processamento: Processamento; situacao: SituacaoInicio }>>()
+  private tabelasVerificadas = new Set<number>()
+
+  /**
+   * Inicia o processamento do período em segundo plano
+   *
+   * Se o último processamento do mesmo período (e da mesma seleção de
+   * funcionários) foi interrompido, cancelado ou falhou, ele é retomado:
+   * os funcionários já processados com sucesso são pulados.
+   *
+   * @returns O processamento e a situação: NOVO, RETOMADO ou EM_ANDAMENTO
+   *   (já existe um processamento rodando no município; nada é iniciado)
+   */
+  async iniciar(
+    municipioId: number,
+    mes: number,
+    ano: number,
+    opcoes: { funcionarioIds?: number[] | null; usuarioId?: number; concorrencia?: number } = {}
+  ): Promise<{ processamento: Processamento; situacao: SituacaoInicio }> {
+    const emAndamento = this.execucoes.get(municipioId)
+    if (emAndamento) {
+      return { processamento: emAndamento.processamento, situacao: 'EM_ANDAMENTO' }
+    }
+
+    // Reservado antes de qualquer await: outro pedido que chegue agora aguarda este início
+    const iniciando = this.iniciando.get(municipioId)
+    if (iniciando) {
+      const { processamento } = await iniciando
+      return { processamento, situacao: 'EM_ANDAMENTO' }
+    }
+
+    const inicio = this.abrir(municipioId, mes, ano, opcoes).finally(() => this.iniciando.delete(municipioId))
+    this.iniciando.set(municipioId, inicio)
+    return inicio
+  }
+
+  /**
+   * Cria ou retoma a linha do processamento e inicia a execução
+   */
+  private async abrir(
+    municipioId: number,
+    mes: number,
+    ano: number,
+    opcoes: { funcionarioIds?: number[] | null; usuarioId?: number; concorrencia?: number }
+  ): Promise<{ processamento: Processamento; situacao: SituacaoInicio }> {
+    await this.garantirTabelas(municipioId)
+
+    const funcionarioIds = opcoes.funcionarioIds?.length
+      ? [...new Set(opcoes.funcionarioIds.map(Number))].sort((a, b) => a - b)
+      : null
+    const concorrencia = await this.obterConcorrencia(municipioId, opcoes.concorrencia)
+
+    // Último processamento do mesmo período e seleção
+    const anterior = await dbManager.queryMunicipioOne<Processamento & { recente: boolean }>(
+      municipioId,
+      `SELECT *, updated_at > NOW() - make_interval(hours => $4) as recente
+       FROM processamentos_periodo
+       WHERE mes = $1 AND ano = $2 AND funcionario_ids IS NOT DISTINCT FROM $3::int[]
+       ORDER BY id DESC LIMIT 1`,
+      [mes, ano, funcionarioIds, RETOMADA_MAXIMA_HORAS]
+    )
+    const retomar = !!anterior && anterior.status !== 'CONCLUIDO' && anterior.recente
+
+    // Processamento de servidor que caiu no meio (o que vai ser retomado fica como está)
+    await dbManager.queryMunicipio(
+      municipioId,
+      `UPDATE processamentos_periodo
+       SET status = 'ERRO', erro = 'Processamento interrompido', concluido_em = NOW(), updated_at = NOW()
+       WHERE status = 'PROCESSANDO' AND updated_at < NOW() - make_interval(mins => $1)
+       AND id IS DISTINCT FROM $2`,
+      [PROCESSANDO_INATIVO_MINUTOS, retomar ? anterior!.id : null]
+    )
+
+    const situacao = retomar ? 'RETOMADO' : 'NOVO'
+    let processamento: Processamento | null
+    try {
+      if (retomar) {
+        // Só retoma se ninguém está processando a linha (PROCESSANDO com checkpoint recente)
+        processamento = await dbManager.queryMunicipioOne<Processamento>(
+          municipioId,
+          `UPDATE processamentos_periodo
+           SET status = 'PROCESSANDO', concorrencia = $2, erro = NULL, concluido_em = NULL,
+               cancelamento_solicitado = false, updated_at = NOW()
+           WHERE id = $1
+           AND (status <> 'PROCESSANDO' OR updated_at < NOW() - make_interval(mins => $3))
+           RETURNING *`,
+          [anterior!.id, concorrencia, PROCESSANDO_INATIVO_MINUTOS]
+        )
+      } else {
+        processamento = await dbManager.queryMunicipioOne<Processamento>(
+          municipioId,
+          `INSERT INTO processamentos_periodo (mes, ano, funcionario_ids, status, concorrencia, usuario_id)
+           VALUES ($1, $2, $3::int[], 'PROCESSANDO', $4, $5)
+           RETURNING *`,
+          [mes, ano, funcionarioIds, concorrencia, opcoes.usuarioId ?? null]
+        )
+      }
+    } catch (error: any) {
+      // Índice único das linhas PROCESSANDO: outro servidor começou antes
+      if (error.code !== '23505') throw error
+      processamento = null
+    }
+
+    if (!processamento) {
+      const emOutroServidor = await dbManager.queryMunicipioOne<Processamento>(
+        municipioId,
+        `SELECT * FROM processamentos_periodo WHERE status = 'PROCESSANDO' ORDER BY id DESC LIMIT 1`
+      )
+      if (!emOutroServidor) {
+        throw new Error('Processamento do período encerrado por outro servidor durante o início; tente novamente')
+      }
+      return { processamento: emOutroServidor, situacao: 'EM_ANDAMENTO' }
+    }
+
+    const execucao: Execucao = {
+      processamento,
+      cancelado: false,
+      inicio: Date.now(),
+      concluidos: 0,
+      ultimoProgresso: 0,
+    }
+    this.execucoes.set(municipioId, execucao)
+    execucao.promessa = this.executar(municipioId, execucao)
+
+    console.log(
+      `[Fechamento] ${situacao} processamento ${processamento.id} (${mes}/${ano}) municipio=${municipioId} concorrencia=${concorrencia}`
+    )
+    return { processamento, situacao }
+  }
+
+  /**
+   * Pede o cancelamento do processamento (o funcionário em andamento termina)
+   *
+   * @returns false se o processamento não está em andamento
+   */
+  async cancelar(municipioId: number, processamentoId: number): Promise<boolean> {
+    const execucao = this.execucoes.get(municipioId)
+    if (execucao?.processamento.id === processamentoId) {
+      execucao.cancelado = true
+      return true
+    }
+
+    // Em outro servidor: o pedido é lido no próximo checkpoint. Interrompido
+    // (ex: reinício do servidor): só marca como cancelado
+    await this.garantirTabelas(municipioId)
+    const atualizados = await dbManager.queryMunicipio(
+      municipioId,
+      `UPDATE processamentos_periodo
+       SET cancelamento_solicitado = true,
+           status = CASE WHEN updated_at < NOW() - make_interval(mins => $2) THEN 'CANCELADO' ELSE status END,
+           concluido_em = CASE WHEN updated_at < NOW() - make_interval(mins => $2) THEN NOW() ELSE concluido_em END,
+           updated_at = CASE WHEN updated_at < NOW() - make_interval(mins => $2) THEN NOW() ELSE updated_at END
+       WHERE id = $1 AND status = 'PROCESSANDO'
+       RETURNING id`,
+      [processamentoId, PROCESSANDO_INATIVO_MINUTOS]
+    )
+    return atualizados.length > 0
+  }
+
+  /**
+   * Situação de um processamento, com os funcionários que deram erro
+   */
+  async buscar(municipioId: number, processamentoId: number) {
+    await this.garantirTabelas(municipioId)
+    const processamento = await dbManager.queryMunicipioOne<Processamento>(
+      municipioId,
+      `SELECT * FROM processamentos_periodo WHERE id = $1`,
+      [processamentoId]
+    )
+    if (!processamento) {
+      return null
+    }
+
+    const execucao = this.execucoes.get(municipioId)
+    const emExecucao = execucao?.processamento.id === processamentoId
+    const falhas = await dbManager.queryMunicipio(
+      municipioId,
+      `SELECT i.funcionario_id, f.nome, i.erro, i.processado_em
+       FROM processamentos_periodo_itens i
+       LEFT JOIN funcionarios f ON f.id = i.funcionario_id
+       WHERE i.processamento_id = $1 AND i.status = 'ERRO'
+       ORDER BY f.nome
+       LIMIT 100`,
+      [processamentoId]
+    )
+
+    return {
+      // Em execução, os contadores em memória estão à frente do último checkpoint
+      ...(emExecucao ? { ...processamento, ...execucao!.processamento } : processamento),
+      em_execucao: emExecucao,
+      falhas,
+    }
+  }
+
+  /**
+   * Aguarda o fim do processamento em execução no município (se houver)
+   */
+  async aguardar(municipioId: number): Promise<void> {
+    await this.execucoes.get(municipioId)?.promessa
+  }
+
+  /**
+   * Executa o processamento: funcionários pendentes em lotes, cada lote em
+   * blocos gravados por `concorrencia` trabalhadores ao mesmo tempo
+   */
+  private async executar(municipioId: number, execucao: Execucao): Promise<void> {
+    const { processamento } = execucao
+    const { mes, ano } = processamento
+    let funcionarioAtual = ''
+
+    try {
+      // Funcionários já processados com sucesso (retomada)
+      const concluidos = await dbManager.queryMunicipio<{ funcionario_id: number }>(
+        municipioId,
+        `SELECT funcionario_id FROM processamentos_periodo_itens
+         WHERE processamento_id = $1 AND status = 'OK'`,
+        [processamento.id]
+      )
+      const jaProcessados = new Set(concluidos.map((c) => c.funcionario_id))
+
+      // Busca funcionários ativos do município
+      let query = `
+        SELECT id, nome, jornada_id, data_admissao, data_demissao FROM funcionarios
+        WHERE ativo = true
+      `
+      const params: any[] = []
+
+      if (processamento.funcionario_ids) {
+        query += ` AND id = ANY($1)`
+        params.push(processamento.funcionario_ids)
+      }
+
+      query += ` ORDER BY nome`
+
+      const funcionarios = await dbManager.queryMunicipio<FuncionarioPonto>(municipioId, query, params)
+      const pendentes = funcionarios.filter((f) => !jaProcessados.has(f.id))
+
+      processamento.total = funcionarios.length
+      processamento.processados = funcionarios.length - pendentes.length
+      processamento.erros = 0
+      await dbManager.queryMunicipio(
+        municipioId,
+        `UPDATE processamentos_periodo SET total = $2, processados = $3, erros = 0, updated_at = NOW() WHERE id = $1`,
+        [processamento.id, processamento.total, processamento.processados]
+      )
+      this.emitirProgresso(municipioId, execucao, 'Iniciando...', 'processando', true)
+
+      // Configuração, feriados e jornadas: uma vez para todos
+      const contexto = await calculoPontoService.carregarContextoPeriodo(municipioId, mes, ano)
+
+      // Quem teve marcações alteradas entre a carga e a gravação (a atualização
+      // incremental já gravou o espelho) é recalculado na rodada seguinte
+      let fila = pendentes
+      for (let rodada = 1; fila.length > 0 && !execucao.cancelado; rodada++) {
+        if (rodada > RODADAS_ALTERADOS) {
+          const itens = fila.map((func): ItemCheckpoint => ({
+            funcionarioId: func.id,
+            status: 'ERRO',
+            horasTrabalhadas: null,
+            erro: 'Marcações alteradas durante o processamento',
+          }))
+          processamento.erros += itens.length
+          execucao.concluidos += itens.length
+          await this.gravarCheckpoint(municipioId, processamento, itens)
+          break
+        }
+
+        const alterados: FuncionarioPonto[] = []
+        for (let inicio = 0; inicio < fila.length && !execucao.cancelado; inicio += LOTE_FUNCIONARIOS) {
+          const lote = fila.slice(inicio, inicio + LOTE_FUNCIONARIOS)
+          const carga = await calculoPontoService.iniciarCarga(municipioId, mes, ano, lote.map((f) => f.id))
+          const dados = await calculoPontoService.carregarDadosFuncionarios(municipioId, contexto, lote)
+
+          let proximo = 0
+          const trabalhador = async () => {
+            while (!execucao.cancelado && proximo < lote.length) {
+              const bloco = lote.slice(proximo, proximo + ESPELHOS_POR_GRAVACAO)
+              proximo += bloco.length
+
+              // Cálculo nas threads do pool: o event loop fica livre para as requisições
+              const resultados = await calculoPontoPool.calcular(
+                contexto,
+                bloco.map((f) => dados.get(f.id)!)
+              )
+
+              const itens: ItemCheckpoint[] = []
+              const espelhos: EspelhoSerializado[] = []
+              bloco.forEach((func, i) => {
+                const { espelho, erro } = resultados[i]
+                if (espelho) {
+                  espelhos.push(espelho)
+                  itens.push({
+                    funcionarioId: func.id,
+                    status: 'OK',
+                    horasTrabalhadas: espelho.totais.horasTrabalhadas,
+                    erro: null,
+                  })
+                } else {
+                  console.error(`[Fechamento] Erro ao processar funcionário ${func.id} (${func.nome}):`, erro)
+                  itens.push({ funcionarioId: func.id, status: 'ERRO', horasTrabalhadas: null, erro: erro ?? null })
+                }
+              })
+
+              // Espelhos e banco de horas do bloco em uma transação
+              let naoGravados = new Set<number>()
+              try {
+                naoGravados = new Set(await calculoPontoService.salvarEspelhos(municipioId, mes, ano, espelhos, carga))
+              } catch (err: any) {
+                console.error(`[Fechamento] Erro ao salvar bloco de ${espelhos.length} espelho(s):`, err.message)
+                for (const item of itens) {
+                  if (item.status === 'OK') Object.assign(item, { status: 'ERRO', horasTrabalhadas: null, erro: err.message })
+                }
+              }
+
+              // Não gravados ficam fora do checkpoint até a próxima rodada
+              const concluidos = itens.filter((item) => !naoGravados.has(item.funcionarioId))
+              for (const func of bloco) {
+                if (naoGravados.has(func.id)) alterados.push(func)
+              }
+              for (const item of concluidos) {
+                if (item.status === 'OK') processamento.processados++
+                else processamento.erros++
+              }
+              execucao.concluidos += concluidos.length
+              funcionarioAtual = bloco[bloco.length - 1].nome
+
+              if (await this.gravarCheckpoint(municipioId, processamento, concluidos)) {
+                console.log(`[Fechamento] Cancelamento do processamento ${processamento.id} pedido por outro servidor`)
+                execucao.cancelado = true
+              }
+              this.emitirProgresso(municipioId, execucao, funcionarioAtual, 'processando')
+            }
+          }
+
+          const trabalhadores = Math.min(processamento.concorrencia, Math.ceil(lote.length / ESPELHOS_POR_GRAVACAO))
+          await Promise.all(Array.from({ length: trabalhadores }, trabalhador))
+        }
+        if (alterados.length > 0) {
+          console.log(`[Fechamento] ${alterados.length} funcionário(s) com marcações alteradas durante o processamento ${processamento.id}: recalculando`)
+        }
+        fila = alterados
+      }
+
+      processamento.status = execucao.cancelado ? 'CANCELADO' : 'CONCLUIDO'
+    } catch (error: any) {
+      console.error(`[Fechamento] Erro no processamento ${processamento.id}:`, error)
+      execucao.cancelado = true // Para os demais trabalhadores do lote
+      processamento.status = 'ERRO'
+      processamento.erro = error.message
+    }
+
+    try {
+      await dbManager.queryMunicipio(
+        municipioId,
+        `UPDATE processamentos_periodo
+         SET status = $2, erro = $3, processados = $4, erros = $5, concluido_em = NOW(), updated_at = NOW()
+         WHERE id = $1`,
+        [processamento.id, processamento.status, processamento.erro, processamento.processados, processamento.erros]
+      )
+    } catch (error: any) {
+      console.error(`[Fechamento] Erro ao finalizar processamento ${processamento.id}:`, error.message)
+    }
+    // Só depois do status final: um novo pedido não pode retomar este processamento
+    this.execucoes.delete(municipioId)
+
+    const segundos = ((Date.now() - execucao.inicio) / 1000).toFixed(1)
+    console.log(
+      `[Fechamento] Processamento ${processamento.id} ${processamento.status}: ${processamento.processados}/${processamento.total} ok, ${processamento.erros} erros, ${execucao.concluidos} nesta execução em ${segundos}s`
+    )
+    this.emitirProgresso(municipioId, execucao, funcionarioAtual, processamento.status.toLowerCase(), true)
+  }
+
+  /**
+   * Grava os funcionários concluídos e os contadores do processamento
+   *
+   * @returns true se outro servidor pediu o cancelamento
+   */
+  private async gravarCheckpoint(
+    municipioId: number,
+    processamento: Processamento,
+    itens: ItemCheckpoint[]
+  ): Promise<boolean> {
+    if (itens.length === 0) return false
+
+    // Checkpoints de trabalhadores diferentes podem chegar fora de ordem: contadores só crescem
+    const [linha] = await dbManager.queryMunicipio<{ cancelamento_solicitado: boolean }>(
+      municipioId,
+      `WITH gravados AS (
+         INSERT INTO processamentos_periodo_itens (processamento_id, funcionario_id, status, horas_trabalhadas, erro)
+         SELECT $1::int, * FROM unnest($2::int[], $3::varchar[], $4::int[], $5::text[])
+         ON CONFLICT (processamento_id, funcionario_id) DO UPDATE SET
+           status = EXCLUDED.status,
+           horas_trabalhadas = EXCLUDED.horas_trabalhadas,
+           erro = EXCLUDED.erro,
+           processado_em = NOW()
+       )
+       UPDATE processamentos_periodo
+       SET processados = GREATEST(processados, $6), erros = GREATEST(erros, $7), updated_at = NOW()
+       WHERE id = $1
+       RETURNING cancelamento_solicitado`,
+      [
+        processamento.id,
+        itens.map((i) => i.funcionarioId),
+        itens.map((i) => i.status),
+        itens.map((i) => i.horasTrabalhadas),
+        itens.map((i) => i.erro),
+        processamento.processados,
+        processamento.erros,
+      ]
+    )
+    return linha?.cancelamento_solicitado === true
+  }
+
+  /**
+   * Emite o progresso no WebSocket (no máximo a cada INTERVALO_PROGRESSO)
+   */
+  private emitirProgresso(
+    municipioId: number,
+    execucao: Execucao,
+    funcionarioNome: string,
+    status: string,
+    forcar = false
+  ) {
+    const agora = Date.now()
+    if (!forcar && agora - execucao.ultimoProgresso < INTERVALO_PROGRESSO) return
+    execucao.ultimoProgresso = agora
+
+    const { processamento } = execucao
+    const atual = processamento.processados + processamento.erros
+    const segundos = (agora - execucao.inicio) / 1000
+    const porSegundo = segundos > 0 ? execucao.concluidos / segundos : 0
+
+    websocketService.emitProgressoEspelho(municipioId, {
+      processamento_id: processamento.id,
+      funcionario_nome: funcionarioNome,
+      atual,
+      total: processamento.total,
+      percentual: processamento.total > 0 ? Math.floor((atual / processamento.total) * 100) : 100,
+      status,
+      processados: processamento.processados,
+      erros: processamento.erros,
+      por_segundo: Math.round(porSegundo * 10) / 10,
+      restante_segundos:
+        porSegundo > 0 ? Math.ceil((processamento.total - atual) / porSegundo) : null,
+    })
+  }
+
+  /**
+   * Concorrência do município: informada no pedido ou configurada
+   * (configuracoes.fechamento_concorrencia), limitada a CONCORRENCIA_MAXIMA
+   */
+  private async obterConcorrencia(municipioId: number, solicitada?: number): Promise<number> {
+    let concorrencia = Number(solicitada)
+    if (!concorrencia) {
+      const config = await configuracaoMunicipioService.obter(municipioId)
+      concorrencia = config.fechamentoConcorrencia ?? CONCORRENCIA_PADRAO
+    }
+    if (!Number.isFinite(concorrencia) || concorrencia < 1) {
+      concorrencia = CONCORRENCIA_PADRAO
+    }
+    return Math.min(concorrencia, CONCORRENCIA_MAXIMA)
+  }
+
+  /**
+   * Cria as tabelas do processamento e o índice de um processamento por vez
+   * em bases anteriores às migrações 014 e 020
+   */
+  private async garantirTabelas(municipioId: number) {
+    if (this.tabelasVerificadas.has(municipioId)) return
+    for (const arquivo of ['014_processamentos_periodo.sql', '020_processamentos_periodo_unico.sql']) {
+      const sql = await readFile(app.makePath(`database/migrations/tenant/${arquivo}`), 'utf-8')
+      await dbManager.queryMunicipio(municipioId, sql)
+    }
+    this.tabelasVerificadas.add(municipioId)
+  }
+}
+
+export const fechamentoPeriodoService = new FechamentoPeriodoService()
+export default fechamentoPeriodoService
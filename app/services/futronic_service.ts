@@ -13,6 +13,12 @@
  */
 
 import env from '#start/env'
+import {
+  ClienteBiometria,
+  TIMEOUTS_BIOMETRIA,
+  mediaMetrica,
+  somarMetrica,
+} from '#services/biometria_client'
 
 const FUTRONIC_URL = env.get('FUTRONIC_URL', 'http://localhost:5001')
 
@@ -27,6 +33,7 @@ interface CadastrarResponse {
   success: boolean
   funcionario_id?: number
   nome?: string
+  quality?: number
   message?: string
   error?: string
 }
@@ -40,9 +47,31 @@ interface VerificarResponse {
   error?: string
 }
 
+/**
+ * Formato do template retornado pela captura:
+ * - png: imagem sem perdas (padrão)
+ * - minucias: apenas o template de minúcias (~400 bytes)
+ * - raw: buffer cru do sensor (~150 KB, somente quando necessário)
+ */
+type FormatoTemplate = 'png' | 'minucias' | 'raw'
+
 interface CapturarResponse {
   success: boolean
   template_base64?: string
+  formato?: FormatoTemplate | 'wbf'
+  tamanho_bytes?: number
+  /** Qualidade medida da captura (0-100) */
+  quality?: number
+  qualidade_detalhes?: {
+    score: number
+    area: number
+    contraste: number
+    coerencia: number
+  }
+  /** Capturas feitas internamente até atingir a qualidade mínima */
+  tentativas?: number
+  /** Leitor que fez a captura (com vários leitores conectados) */
+  device_id?: string
   message?: string
   error?: string
   simulated?: boolean
@@ -55,15 +84,92 @@ interface ListarResponse {
     funcionario_id: number
     nome: string
     pis: string
+    formato?: string
+    qualidade?: number | null
+    /** Capturas consolidadas no template (1 = captura única) */
+    capturas?: number
     cadastrado_em?: string
   }>
 }
 
+interface SessaoCadastroResponse {
+  success: boolean
+  sessao_id?: string
+  /** Capturas já aceitas na sessão */
+  amostras?: number
+  /** Capturas exigidas pela sessão */
+  capturas?: number
+  faltam?: number
+  completa?: boolean
+  quality?: number
+  message?: string
+  error?: string
+}
+
+interface ConcluirCadastroResponse extends CadastrarResponse {
+  /** Capturas consolidadas no template */
+  capturas?: number
+  /** Índices das capturas descartadas por não baterem com as demais */
+  descartadas?: number[]
+  /** Scores entre todas as capturas da sessão */
+  scores?: number[][]
+  minucias?: number
+}
+
+interface ItemLote {
+  /** Identificador do cliente, devolvido na linha de resposta */
+  id?: string
+  templateBase64: string
+  /** Obrigatório em verificarLote (comparação 1:1) */
+  funcionarioId?: number
+}
+
+/** Uma linha da resposta NDJSON de identificarLote/verificarLote */
+interface ResultadoLote {
+  /** Posição do item no lote */
+  indice: number
+  id: string | null
+  success: boolean
+  funcionario_id?: number
+  nome?: string
+  pis?: string
+  /** Somente em verificarLote */
+  match?: boolean
+  confidence?: number
+  error?: string
+}
+
+/** Resumo do /metrics (Prometheus) da API para o painel de monitoramento */
+interface MetricasBiometria {
+  leitores: Array<{ deviceId: string; aberto: boolean; fila: number }>
+  capturas: { sucesso: number; qualidadeBaixa: number; erro: number }
+  /** Médias desde o início da API (null sem amostras) */
+  esperaDedoMs: number | null
+  leituraMs: number | null
+  qualidadeMedia: number | null
+  comparacaoMs: number | null
+  /** Digitais cadastradas por tenant */
+  galeria: Record<string, number>
+  reconexoes: number
+}
+
 class FutronicService {
-  private baseUrl: string
+  /** A API responde os erros no corpo JSON (exigirOk = false) */
+  private cliente: ClienteBiometria
 
-  constructor() {
-    this.baseUrl = FUTRONIC_URL
+  /**
+   * @param cliente Cliente HTTP; o tenant dele define a galeria de digitais
+   * usada pela API (sem tenant a API usa a galeria padrão)
+   */
+  constructor(cliente = new ClienteBiometria('Futronic', FUTRONIC_URL, undefined, false)) {
+    this.cliente = cliente
+  }
+
+  /**
+   * Serviço restrito à galeria de um tenant (ex: futronicService.doTenant(municipioId))
+   */
+  doTenant(tenant: string | number): FutronicService {
+    return new FutronicService(this.cliente.doTenant(tenant))
   }
 
   /**
@@ -71,11 +177,8 @@ class FutronicService {
    */
   async isAvailable(): Promise<boolean> {
     try {
-      const response = await fetch(`${this.baseUrl}/health`, {
-        method: 'GET',
-        signal: AbortSignal.timeout(3000),
-      })
-      return response.ok
+      await this.cliente.requisitar('/health', { timeoutMs: TIMEOUTS_BIOMETRIA.saude, exigirOk: true })
+      return true
     } catch {
       return false
     }
@@ -86,18 +189,55 @@ class FutronicService {
    */
   async getStatus(): Promise<StatusResponse | null> {
     try {
-      const response = await fetch(`${this.baseUrl}/`, {
-        method: 'GET',
-        signal: AbortSignal.timeout(5000),
-      })
+      return await this.cliente.requisitar<StatusResponse>('/', { exigirOk: true })
+    } catch (error) {
+      console.error('[FutronicService] Erro ao obter status:', error)
+      return null
+    }
+  }
 
-      if (!response.ok) {
+  /**
+   * Lê o /metrics da API e resume a saúde da biometria
+   */
+  async obterMetricas(): Promise<MetricasBiometria | null> {
+    try {
+      const amostras = await this.cliente.metricas()
+      if (!amostras) {
         return null
       }
+      const somar = (nome: string, filtro: Record<string, string> = {}) =>
+        somarMetrica(amostras, nome, filtro)
+      const media = (histograma: string, escala = 1) => mediaMetrica(amostras, histograma, escala)
+
+      const leitores = amostras
+        .filter((a) => a.nome === 'futronic_leitor_aberto')
+        .map((a) => ({
+          deviceId: a.rotulos.device,
+          aberto: a.valor === 1,
+          fila: somar('futronic_captura_fila', { device: a.rotulos.device }),
+        }))
+
+      const galeria: Record<string, number> = {}
+      for (const a of amostras.filter((a) => a.nome === 'futronic_galeria_tamanho')) {
+        galeria[a.rotulos.tenant] = a.valor
+      }
 
-      return await response.json()
+      return {
+        leitores,
+        capturas: {
+          sucesso: somar('futronic_capturas_total', { resultado: 'sucesso' }),
+          qualidadeBaixa: somar('futronic_capturas_total', { resultado: 'qualidade_baixa' }),
+          erro: somar('futronic_capturas_total', { resultado: 'erro' }),
+        },
+        esperaDedoMs: media('futronic_captura_espera_segundos', 1000),
+        leituraMs: media('futronic_captura_leitura_segundos', 1000),
+        qualidadeMedia: media('futronic_captura_qualidade'),
+        comparacaoMs: media('futronic_comparacao_segundos', 1000),
+        galeria,
+        reconexoes: somar('futronic_reconexoes_total'),
+      }
     } catch (error) {
-      console.error('[FutronicService] Erro ao obter status:', error)
+      console.error('[FutronicService] Erro ao obter métricas:', error)
       return null
     }
   }
@@ -112,16 +252,16 @@ class FutronicService {
 
   /**
    * Captura uma digital do leitor
+   * Sem deviceId a API usa o leitor menos ocupado
    */
-  async capturarDigital(): Promise<CapturarResponse> {
+  async capturarDigital(formato: FormatoTemplate = 'png', deviceId?: string): Promise<CapturarResponse> {
     try {
-      const response = await fetch(`${this.baseUrl}/capturar`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        signal: AbortSignal.timeout(15000), // 15s timeout para captura
+      const query = deviceId ? `?device=${encodeURIComponent(deviceId)}` : ''
+      return await this.cliente.requisitar(`/capturar${query}`, {
+        metodo: 'POST',
+        corpo: { formato },
+        timeoutMs: TIMEOUTS_BIOMETRIA.captura,
       })
-
-      return await response.json()
     } catch (error) {
       console.error('[FutronicService] Erro ao capturar:', error)
       return {
@@ -136,13 +276,7 @@ class FutronicService {
    */
   async simularCaptura(): Promise<CapturarResponse> {
     try {
-      const response = await fetch(`${this.baseUrl}/simular/captura`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        signal: AbortSignal.timeout(5000),
-      })
-
-      return await response.json()
+      return await this.cliente.requisitar('/simular/captura', { metodo: 'POST' })
     } catch (error) {
       console.error('[FutronicService] Erro ao simular captura:', error)
       return {
@@ -159,22 +293,21 @@ class FutronicService {
     funcionarioId: number,
     nome: string,
     pis: string,
-    templateBase64?: string
+    templateBase64?: string,
+    qualidade?: number
   ): Promise<CadastrarResponse> {
     try {
-      const response = await fetch(`${this.baseUrl}/cadastrar`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
+      return await this.cliente.requisitar('/cadastrar', {
+        metodo: 'POST',
+        corpo: {
           funcionario_id: funcionarioId,
           nome,
           pis,
           template_base64: templateBase64,
-        }),
-        signal: AbortSignal.timeout(10000),
+          qualidade,
+        },
+        timeoutMs: TIMEOUTS_BIOMETRIA.processamento,
       })
-
-      return await response.json()
     } catch (error) {
       console.error('[FutronicService] Erro ao cadastrar:', error)
       return {
@@ -184,21 +317,97 @@ class FutronicService {
     }
   }
 
+  /**
+   * Inicia um cadastro com várias capturas do mesmo dedo
+   * As capturas são comparadas entre si e fundidas em um único template
+   */
+  async iniciarSessaoCadastro(
+    funcionarioId: number,
+    nome: string,
+    pis: string,
+    capturas?: number
+  ): Promise<SessaoCadastroResponse> {
+    try {
+      return await this.cliente.requisitar('/cadastro/sessao', {
+        metodo: 'POST',
+        corpo: { funcionario_id: funcionarioId, nome, pis, capturas },
+      })
+    } catch (error) {
+      console.error('[FutronicService] Erro ao iniciar sessão de cadastro:', error)
+      return {
+        success: false,
+        error: 'Erro ao conectar com a API Futronic',
+      }
+    }
+  }
+
+  /**
+   * Adiciona uma captura à sessão de cadastro
+   * Sem templateBase64 a API captura do leitor (deviceId opcional)
+   */
+  async adicionarAmostraCadastro(
+    sessaoId: string,
+    templateBase64?: string,
+    deviceId?: string
+  ): Promise<SessaoCadastroResponse> {
+    try {
+      const query = deviceId ? `?device=${encodeURIComponent(deviceId)}` : ''
+      return await this.cliente.requisitar(`/cadastro/sessao/${sessaoId}/amostra${query}`, {
+        metodo: 'POST',
+        corpo: { template_base64: templateBase64 },
+        timeoutMs: templateBase64 ? TIMEOUTS_BIOMETRIA.processamento : TIMEOUTS_BIOMETRIA.capturaSessao,
+      })
+    } catch (error) {
+      console.error('[FutronicService] Erro ao adicionar captura:', error)
+      return {
+        success: false,
+        error: 'Erro ao conectar com a API Futronic',
+      }
+    }
+  }
+
+  /**
+   * Consolida as capturas da sessão e grava o cadastro
+   */
+  async concluirSessaoCadastro(sessaoId: string): Promise<ConcluirCadastroResponse> {
+    try {
+      return await this.cliente.requisitar(`/cadastro/sessao/${sessaoId}/concluir`, {
+        metodo: 'POST',
+        timeoutMs: TIMEOUTS_BIOMETRIA.processamento,
+      })
+    } catch (error) {
+      console.error('[FutronicService] Erro ao concluir cadastro:', error)
+      return {
+        success: false,
+        error: 'Erro ao conectar com a API Futronic',
+      }
+    }
+  }
+
+  /**
+   * Descarta uma sessão de cadastro
+   */
+  async cancelarSessaoCadastro(sessaoId: string): Promise<{ success: boolean }> {
+    try {
+      return await this.cliente.requisitar(`/cadastro/sessao/${sessaoId}`, { metodo: 'DELETE' })
+    } catch (error) {
+      console.error('[FutronicService] Erro ao cancelar sessão de cadastro:', error)
+      return {
+        success: false,
+      }
+    }
+  }
+
   /**
    * Verifica uma digital contra as cadastradas
    */
   async verificarDigital(templateBase64: string): Promise<VerificarResponse> {
     try {
-      const response = await fetch(`${this.baseUrl}/verificar`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          template_base64: templateBase64,
-        }),
-        signal: AbortSignal.timeout(10000),
+      return await this.cliente.requisitar('/verificar', {
+        metodo: 'POST',
+        corpo: { template_base64: templateBase64 },
+        timeoutMs: TIMEOUTS_BIOMETRIA.processamento,
       })
-
-      return await response.json()
     } catch (error) {
       console.error('[FutronicService] Erro ao verificar:', error)
       return {
@@ -208,17 +417,41 @@ class FutronicService {
     }
   }
 
+  /**
+   * Identifica várias digitais de uma vez (1:N)
+   * Os resultados chegam conforme a API processa o lote, na ordem dos itens
+   */
+  identificarLote(itens: ItemLote[]): AsyncGenerator<ResultadoLote> {
+    return this.processarLote('/identificar/lote', itens)
+  }
+
+  /**
+   * Verifica várias digitais de uma vez, cada uma contra o seu funcionarioId (1:1)
+   */
+  verificarLote(itens: ItemLote[]): AsyncGenerator<ResultadoLote> {
+    return this.processarLote('/verificar/lote', itens)
+  }
+
+  /**
+   * Envia o lote e lê a resposta NDJSON linha a linha
+   */
+  private processarLote(rota: string, itens: ItemLote[]): AsyncGenerator<ResultadoLote> {
+    return this.cliente.lote<ResultadoLote>(
+      rota,
+      itens.map((item) => ({
+        id: item.id,
+        template_base64: item.templateBase64,
+        funcionario_id: item.funcionarioId,
+      }))
+    )
+  }
+
   /**
    * Remove uma digital cadastrada
    */
   async removerDigital(funcionarioId: number): Promise<{ success: boolean; message?: string; error?: string }> {
     try {
-      const response = await fetch(`${this.baseUrl}/remover/${funcionarioId}`, {
-        method: 'DELETE',
-        signal: AbortSignal.timeout(5000),
-      })
-
-      return await response.json()
+      return await this.cliente.requisitar(`/remover/${funcionarioId}`, { metodo: 'DELETE' })
     } catch (error) {
       console.error('[FutronicService] Erro ao remover:', error)
       return {
@@ -233,12 +466,7 @@ class FutronicService {
    */
   async listarDigitais(): Promise<ListarResponse> {
     try {
-      const response = await fetch(`${this.baseUrl}/listar`, {
-        method: 'GET',
-        signal: AbortSignal.timeout(5000),
-      })
-
-      return await response.json()
+      return await this.cliente.requisitar('/listar')
     } catch (error) {
       console.error('[FutronicService] Erro ao listar:', error)
       return {
@@ -254,12 +482,7 @@ class FutronicService {
    */
   async sincronizar(): Promise<{ success: boolean; templates_carregados?: number }> {
     try {
-      const response = await fetch(`${this.baseUrl}/sincronizar`, {
-        method: 'POST',
-        signal: AbortSignal.timeout(5000),
-      })
-
-      return await response.json()
+      return await this.cliente.requisitar('/sincronizar', { metodo: 'POST' })
     } catch (error) {
       console.error('[FutronicService] Erro ao sincronizar:', error)
       return {
@@ -273,12 +496,7 @@ class FutronicService {
    */
   async reconectarDispositivo(): Promise<{ success: boolean; message?: string }> {
     try {
-      const response = await fetch(`${this.baseUrl}/device/reconnect`, {
-        method: 'POST',
-        signal: AbortSignal.timeout(5000),
-      })
-
-      return await response.json()
+      return await this.cliente.requisitar('/device/reconnect', { metodo: 'POST' })
     } catch (error) {
       console.error('[FutronicService] Erro ao reconectar:', error)
       return {
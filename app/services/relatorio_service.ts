@@ -1,5 +1,7 @@
 import DatabaseManagerService from '#services/database_manager_service'
 import { DateTime } from 'luxon'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
+import { bancoHorasSaldoService } from '#services/banco_horas_saldo_service'
 
 /**
  * Interface para registro de ponto no formato AFD
@@ -423,16 +425,12 @@ export default class RelatorioService {
 
     const funcionariosResult = await DatabaseManagerService.queryMunicipio(municipioId, queryFunc, params)
 
-    // Busca feriados do período
-    const feriadosQuery = `
-      SELECT data FROM feriados
-      WHERE data >= $1 AND data <= $2 AND ativo = true
-    `
-    const feriadosResult = await DatabaseManagerService.queryMunicipio(municipioId, feriadosQuery, [
-      dataInicio.toJSDate(),
-      dataFim.toJSDate(),
-    ])
-    const feriados = new Set(feriadosResult.rows.map((r: any) => DateTime.fromJSDate(r.data).toISODate()))
+    // Feriados do período (configuração em memória do município)
+    const feriados = configuracaoMunicipioService.feriadosNoPeriodo(
+      await configuracaoMunicipioService.obter(municipioId),
+      dataInicio.toISODate()!,
+      dataFim.toISODate()!
+    )
 
     // Calcula dias úteis do mês
     let diasUteisMes = 0
@@ -701,10 +699,12 @@ export default class RelatorioService {
 
     const funcionariosResult = await DatabaseManagerService.queryMunicipio(municipioId, queryFunc, params)
 
-    // Busca feriados
-    const feriadosQuery = `SELECT data FROM feriados WHERE data >= $1 AND data <= $2 AND ativo = true`
-    const feriadosResult = await DatabaseManagerService.queryMunicipio(municipioId, feriadosQuery, [dataInicio, dataFim])
-    const feriados = new Set(feriadosResult.rows.map((r: any) => DateTime.fromJSDate(r.data).toISODate()))
+    // Feriados do período (configuração em memória do município)
+    const feriados = configuracaoMunicipioService.feriadosNoPeriodo(
+      await configuracaoMunicipioService.obter(municipioId),
+      dtInicio.toISODate()!,
+      dtFim.toISODate()!
+    )
 
     const registros: HorasExtrasRegistro[] = []
     let totalHorasExtras50 = 0
@@ -954,13 +954,12 @@ export default class RelatorioService {
 
     const funcionariosResult = await DatabaseManagerService.queryMunicipio(municipioId, queryFunc, params)
 
-    // Busca feriados
-    const feriadosQuery = `SELECT data FROM feriados WHERE data >= $1 AND data <= $2 AND ativo = true`
-    const feriadosResult = await DatabaseManagerService.queryMunicipio(municipioId, feriadosQuery, [
-      dataInicio.toJSDate(),
-      dataFim.toJSDate(),
-    ])
-    const feriados = new Set(feriadosResult.rows.map((r: any) => DateTime.fromJSDate(r.data).toISODate()))
+    // Feriados do período (configuração em memória do município)
+    const feriados = configuracaoMunicipioService.feriadosNoPeriodo(
+      await configuracaoMunicipioService.obter(municipioId),
+      dataInicio.toISODate()!,
+      dataFim.toISODate()!
+    )
 
     // Calcula dias úteis
     let diasUteis = 0
@@ -1006,26 +1005,9 @@ export default class RelatorioService {
         }
       }
 
-      // Busca saldo anterior (acumulado até o mês anterior)
-      const mesAnterior = dataInicio.minus({ months: 1 })
-      const saldoAnteriorQuery = `
-        SELECT COALESCE(SUM(
-          CASE
-            WHEN tipo_operacao = 'CREDITO' THEN minutos
-            WHEN tipo_operacao IN ('DEBITO', 'COMPENSACAO', 'PAGAMENTO') THEN -ABS(minutos)
-            ELSE 0
-          END
-        ), 0) / 60.0 as saldo_horas
-        FROM banco_horas
-        WHERE funcionario_id = $1
-          AND data < $2
-      `
-      const [saldoAnteriorResult] = await DatabaseManagerService.queryMunicipio(
-        municipioId,
-        saldoAnteriorQuery,
-        [func.id, dataInicio.toJSDate()]
-      )
-      const saldoAnterior = saldoAnteriorResult?.saldo_horas || 0
+      // Saldo anterior (acumulado até o mês anterior, em horas)
+      const saldoAnterior =
+        (await bancoHorasSaldoService.saldoAntesDoMes(municipioId, func.id, ano, mes)) / 60
 
       const saldoMes = horasTrabalhadas - horasPrevistas
       const saldoAtual = saldoAnterior + saldoMes
@@ -358,8 +358,18 @@ class WebSocketService {
     total: number
     /** Percentual concluído (0-100) */
     percentual: number
-    /** Status: 'processando' ou 'concluido' */
+    /** Status: 'processando', 'concluido', 'cancelado' ou 'erro' */
     status: string
+    /** ID do processamento em segundo plano (fechamento_periodo_service) */
+    processamento_id?: number
+    /** Funcionários processados com sucesso */
+    processados?: number
+    /** Funcionários com erro */
+    erros?: number
+    /** Vazão da execução atual (funcionários por segundo) */
+    por_segundo?: number
+    /** Estimativa para terminar, em segundos */
+    restante_segundos?: number | null
   }): void {
     if (!this.io) return
 
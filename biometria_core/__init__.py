@@ -0,0 +1,19 @@
+"""
+Nucleo Biometrico Comum
+=======================
+
+Galerias, armazenamento, metricas e lotes compartilhados pelo deepface-api
+(faces) e pelo futronic-api (digitais):
+
+- armazenamento : galeria em disco (metadados JSON + dados binarios)
+- galerias      : tenants, galerias carregadas sob demanda e descarregadas quando ociosas
+- compartilhada : galeria mapeada em memoria por todos os processos, com contador de geracao
+- vetores       : busca vetorizada de embeddings (faces)
+- calibracao    : distancias de toda a galeria em blocos (threshold por FAR, duplicatas)
+- lote          : respostas NDJSON dos endpoints de lote
+- metricas      : registro de metricas Prometheus (/metrics)
+- benchmark     : harness de benchmark das duas modalidades
+
+Os servicos rodam a partir dos seus diretorios e adicionam a raiz do
+repositorio ao sys.path para importar este pacote.
+"""
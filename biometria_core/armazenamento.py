@@ -0,0 +1,106 @@
+"""
+Armazenamento Binario da Galeria
+================================
+
+Cada galeria fica em dois arquivos no diretorio do tenant:
+
+- {nome}.json : metadados dos cadastros (nome, pis, qualidade...), por id
+- {nome}.bin  : dado biometrico de cada id (minucias FTM1, embedding float32...)
+
+O JSON fica pequeno (sem base64 de vetores) e o binario e lido de uma vez, sem
+parse de texto. Os dois arquivos sao gravados em arquivos temporarios e
+trocados com os.replace, entao uma queda no meio da gravacao nao corrompe a
+galeria.
+
+Formato do .bin:
+    cabecalho: b"BGL1" + quantidade (uint32)
+    registro:  tamanho do id (uint16) + id (utf-8) + tamanho do dado (uint32) + dado
+"""
+
+import json
+import os
+import struct
+from pathlib import Path
+
+MAGIC = b"BGL1"
+_CABECALHO = struct.Struct("<4sI")
+_TAMANHO_ID = struct.Struct("<H")
+_TAMANHO_DADO = struct.Struct("<I")
+
+
+def serializar_dados(dados: dict) -> bytes:
+    """Serializa {id: bytes} no formato do .bin"""
+    partes = [_CABECALHO.pack(MAGIC, len(dados))]
+    for chave, dado in dados.items():
+        chave = str(chave).encode("utf-8")
+        partes.append(_TAMANHO_ID.pack(len(chave)))
+        partes.append(chave)
+        partes.append(_TAMANHO_DADO.pack(len(dado)))
+        partes.append(bytes(dado))
+    return b"".join(partes)
+
+
+def desserializar_dados(conteudo: bytes) -> dict:
+    """Le o conteudo de um .bin. Retorna: {id: bytes}"""
+    magic, quantidade = _CABECALHO.unpack_from(conteudo)
+    if magic != MAGIC:
+        raise ValueError("Arquivo de galeria invalido")
+
+    dados, posicao = {}, _CABECALHO.size
+    visao = memoryview(conteudo)
+    for _ in range(quantidade):
+        (tamanho,) = _TAMANHO_ID.unpack_from(conteudo, posicao)
+        posicao += _TAMANHO_ID.size
+        chave = bytes(visao[posicao:posicao + tamanho]).decode("utf-8")
+        posicao += tamanho
+        (tamanho,) = _TAMANHO_DADO.unpack_from(conteudo, posicao)
+        posicao += _TAMANHO_DADO.size
+        dados[chave] = bytes(visao[posicao:posicao + tamanho])
+        posicao += tamanho
+    return dados
+
+
+def _gravar_atomico(caminho: Path, conteudo: bytes):
+    temporario = caminho.with_name(caminho.name + ".tmp")
+    with open(temporario, "wb") as f:
+        f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+
+class ArmazemBinario:
+    """Par de arquivos (metadados JSON + dados binarios) de uma galeria"""
+
+    def __init__(self, diretorio: Path, nome: str):
+        self.diretorio = Path(diretorio)
+        self.arquivo_cadastros = self.diretorio / f"{nome}.json"
+        self.arquivo_dados = self.diretorio / f"{nome}.bin"
+
+    def carregar(self) -> tuple:
+        """
+        Le a galeria do disco (vazia se os arquivos nao existem).
+
+        Retorna: (cadastros {id: dict}, dados {id: bytes})
+        """
+        cadastros, dados = {}, {}
+        if self.arquivo_cadastros.exists():
+            with open(self.arquivo_cadastros, "r") as f:
+                cadastros = json.load(f)
+        if self.arquivo_dados.exists():
+            with open(self.arquivo_dados, "rb") as f:
+                dados = desserializar_dados(f.read())
+        return cadastros, dados
+
+    def carregar_cadastros(self) -> dict:
+        """Le so os metadados (sem o .bin)"""
+        if not self.arquivo_cadastros.exists():
+            return {}
+        with open(self.arquivo_cadastros, "r") as f:
+            return json.load(f)
+
+    def salvar(self, cadastros: dict, dados: dict):
+        """Grava a galeria inteira (dados primeiro: um cadastro nunca aponta para dado ausente)"""
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        _gravar_atomico(self.arquivo_dados, serializar_dados(dados))
+        _gravar_atomico(self.arquivo_cadastros, json.dumps(cadastros).encode("utf-8"))
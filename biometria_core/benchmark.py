@@ -0,0 +1,190 @@
+"""
+Harness de Benchmark das Galerias
+=================================
+
+Funcoes comuns aos benchmarks dos servicos biometricos (latencias, vazao,
+saida em JSON) e um benchmark das partes compartilhadas, para medir uma
+otimizacao do nucleo uma vez nas duas modalidades:
+
+- armazenamento: carga da galeria no formato antigo (JSON com base64/listas)
+  x armazenamento binario (armazenamento.py)
+- busca: identificacao 1:N de faces (vetores.py) e de digitais
+  (fingerprint.comparar_com_galeria, do futronic-api)
+
+Uso:
+    python -m biometria_core.benchmark --galeria 5000 --consultas 20
+    python -m biometria_core.benchmark --modalidade face --galeria 100000
+
+A saida e um JSON com as latencias (p50/p95/max) e a vazao de cada etapa.
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from .armazenamento import ArmazemBinario
+from . import vetores
+
+
+def resumir(latencias: list) -> dict:
+    """p50/p95/max (ms) de uma lista de latencias em ms"""
+    if not latencias:
+        return {}
+    ordenadas = sorted(latencias)
+    posicao = lambda p: ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+    return {
+        "n": len(ordenadas),
+        "p50_ms": round(posicao(0.50), 2),
+        "p95_ms": round(posicao(0.95), 2),
+        "max_ms": round(ordenadas[-1], 2),
+    }
+
+
+def cronometrar(funcao: Callable, repeticoes: int = 5, aquecimento: int = 1) -> list:
+    """Executa `funcao` (descartando o aquecimento) e devolve as latencias em ms"""
+    for _ in range(aquecimento):
+        funcao()
+    latencias = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias
+
+
+def medir(funcao: Callable, itens: int = 1, repeticoes: int = 5, aquecimento: int = 1) -> dict:
+    """Latencias de `funcao` e vazao em itens por segundo (`itens` processados por chamada)"""
+    latencias = cronometrar(funcao, repeticoes, aquecimento)
+    media = sum(latencias) / len(latencias)
+    return {**resumir(latencias), "itens_por_segundo": round(itens / (media / 1000)) if media else None}
+
+
+def contagens_processos(texto: str = None) -> list:
+    """Lista de processos a medir: a informada ("1,2,4") ou 1, 2, 4... ate os nucleos"""
+    if texto:
+        return [int(p) for p in texto.split(",")]
+    nucleos = os.cpu_count() or 1
+    contagens = [1]
+    while contagens[-1] * 2 <= nucleos:
+        contagens.append(contagens[-1] * 2)
+    if contagens[-1] != nucleos:
+        contagens.append(nucleos)
+    return contagens
+
+
+def imprimir(resultado: dict):
+    print(json.dumps(resultado, indent=2))
+
+
+# ============================================
+# BENCHMARK DO NUCLEO
+# ============================================
+
+def embeddings_sinteticos(quantidade: int, dimensao: int, semente: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(semente)
+    return rng.normal(0, 1, (quantidade, dimensao)).astype(np.float32)
+
+
+def medir_armazenamento(dados: dict, legado: Callable[[bytes], object], repeticoes: int) -> dict:
+    """Carga da galeria: JSON com o dado em texto (formato antigo) x armazem binario"""
+    cadastros = {chave: {"nome": f"Funcionario {chave}", "pis": "00000000000"} for chave in dados}
+    with tempfile.TemporaryDirectory() as diretorio:
+        antigo = Path(diretorio) / "legado.json"
+        with open(antigo, "w") as f:
+            json.dump({chave: {**cadastros[chave], "dado": legado(bruto)} for chave, bruto in dados.items()}, f)
+        armazem = ArmazemBinario(Path(diretorio), "galeria")
+        armazem.salvar(cadastros, dados)
+
+        def carregar_legado():
+            with open(antigo) as f:
+                return json.load(f)
+
+        return {
+            "carga_json": medir(carregar_legado, repeticoes=repeticoes),
+            "carga_binario": medir(armazem.carregar, repeticoes=repeticoes),
+            "json_bytes": antigo.stat().st_size,
+            "binario_bytes": armazem.arquivo_dados.stat().st_size + armazem.arquivo_cadastros.stat().st_size,
+        }
+
+
+def benchmark_face(galeria: int, consultas: int, dimensao: int, repeticoes: int) -> dict:
+    matriz = embeddings_sinteticos(galeria, dimensao)
+    sondas = matriz[:consultas] + embeddings_sinteticos(consultas, dimensao, 1) * 0.3
+    empacotada = vetores.empacotar_vetores(list(matriz))
+
+    def laco():
+        # Comparacao anterior: um cadastro por vez em Python
+        for sonda in sondas:
+            min(1 - np.dot(sonda, g) / (np.linalg.norm(sonda) * np.linalg.norm(g)) for g in matriz)
+
+    indices, _ = vetores.mais_proximos(sondas, empacotada)
+    return {
+        "galeria": galeria,
+        "dimensao": dimensao,
+        "consultas": consultas,
+        "armazenamento": medir_armazenamento(
+            {str(i): vetores.vetor_para_bytes(v) for i, v in enumerate(matriz)},
+            lambda bruto: vetores.vetor_de_bytes(bruto).tolist(), repeticoes,
+        ),
+        "busca_laco": medir(laco, consultas, repeticoes=1, aquecimento=0),
+        "busca_vetorizada": medir(lambda: vetores.mais_proximos(sondas, empacotada), consultas, repeticoes),
+        "acertos": float(np.mean(indices[:, 0] == np.arange(consultas))),
+    }
+
+
+def benchmark_digital(galeria: int, consultas: int, identidades: int, repeticoes: int) -> dict:
+    # fingerprint/scanners ficam no futronic-api (NumPy puro, sem o SDK)
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "futronic-api"))
+    import fingerprint
+    import scanners
+    from benchmark_paralelo import montar_galeria
+
+    conjuntos = montar_galeria(galeria, identidades)
+    minucias, quantidades = fingerprint.empacotar_minucias(conjuntos)
+    ponderar = np.zeros(len(conjuntos), dtype=bool)
+    sondas = fingerprint.empacotar_minucias([
+        fingerprint.extrair_minucias(scanners.gerar_digital_sintetica(n % identidades, 1 + n))
+        for n in range(consultas)
+    ])
+    return {
+        "galeria": galeria,
+        "consultas": consultas,
+        "armazenamento": medir_armazenamento(
+            {str(i): fingerprint.serializar_minucias(m, 320, 480) for i, m in enumerate(conjuntos)},
+            lambda bruto: base64.b64encode(bruto).decode("ascii"), repeticoes,
+        ),
+        "busca_vetorizada": medir(
+            lambda: fingerprint.comparar_com_galeria(*sondas, minucias, quantidades, ponderar),
+            consultas, repeticoes,
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modalidade", choices=["face", "digital", "todas"], default="todas")
+    parser.add_argument("--galeria", type=int, default=5000)
+    parser.add_argument("--consultas", type=int, default=20)
+    parser.add_argument("--dimensao", type=int, default=512, help="Dimensao dos embeddings (ArcFace: 512)")
+    parser.add_argument("--identidades", type=int, default=50, help="Digitais sinteticas distintas")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    resultado = {"nucleos": os.cpu_count() or 1}
+    if args.modalidade in ("face", "todas"):
+        resultado["face"] = benchmark_face(args.galeria, args.consultas, args.dimensao, args.repeticoes)
+    if args.modalidade in ("digital", "todas"):
+        resultado["digital"] = benchmark_digital(args.galeria, args.consultas, args.identidades, args.repeticoes)
+    imprimir(resultado)
+
+
+if __name__ == "__main__":
+    main()
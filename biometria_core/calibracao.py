@@ -0,0 +1,186 @@
+"""
+Calibracao do Threshold e Qualidade da Galeria
+==============================================
+
+Compara todos os cadastros de uma galeria de vetores entre si (N x N) em
+blocos de linhas, com a memoria limitada, sem guardar a matriz inteira:
+
+- distribuicao de impostores: cada cadastro e uma pessoa diferente, entao
+  todo par da galeria e um par impostor. As distancias vao para um histograma
+  de faixas finas, de onde saem os quantis.
+- limiares sugeridos: para cada FAR alvo (fracao de pares impostores aceitos),
+  o maior limiar com FAR <= alvo, e o FPIR estimado de uma face desconhecida
+  contra a galeria inteira (1 - (1 - FAR)^N).
+- cadastros proximos demais: o vizinho mais proximo de cada cadastro; os
+  que ficam abaixo do limiar atual podem ser confundidos com outra pessoa.
+- duplicatas provaveis: pares muito abaixo do limiar (mesma pessoa em dois ids).
+
+Sem pares genuinos (uma foto por pessoa) o FRR nao e estimado: reduzir o
+limiar abaixo do sugerido aumenta as novas tentativas no terminal.
+"""
+
+import heapq
+
+import numpy as np
+
+from . import vetores
+
+FARS_PADRAO = (1e-2, 1e-3, 1e-4, 1e-5)
+
+
+def linhas_por_bloco(cadastros: int, memoria_mb: float) -> int:
+    """Linhas da matriz de distancias calculadas de uma vez (bloco x N float32, ~3 temporarios)"""
+    return max(1, int(memoria_mb * 1024 * 1024 // (max(cadastros, 1) * 4 * 3)))
+
+
+def _limite_superior(grade: dict, metrica: str) -> float:
+    if metrica == "cosine":
+        return 2.0
+    return float(2 * grade["normas"].max()) if len(grade["normas"]) else 1.0
+
+
+def analisar_galeria(grade: dict, metrica: str = "cosine", limiar: float = None, fars: tuple = FARS_PADRAO,
+                     limiar_duplicata: float = None, memoria_mb: float = 64, faixas: int = 20000,
+                     limite: int = 50) -> dict:
+    """
+    Analisa a galeria empacotada ({"ids", "matriz", "normas"}, ver vetores.py).
+
+    `limiar` e o threshold em uso (cadastros com vizinho abaixo dele sao
+    sinalizados) e `limiar_duplicata` a distancia abaixo da qual um par e
+    considerado a mesma pessoa. As listas trazem no maximo `limite` itens,
+    dos mais proximos aos menos proximos.
+    """
+    ids, matriz = grade["ids"], grade["matriz"]
+    total = len(ids)
+    pares = total * (total - 1) // 2
+    resultado = {"cadastros": total, "pares": pares, "metrica": metrica}
+    if total < 2:
+        return {**resultado, "impostores": None, "limiares_sugeridos": [], "proximos": [], "duplicatas": []}
+
+    maximo = _limite_superior(grade, metrica)
+    histograma = np.zeros(faixas, dtype=np.int64)
+    vizinho = np.zeros(total, dtype=np.int64)
+    distancia_vizinho = np.full(total, np.inf)
+    soma = 0.0
+    duplicatas = []  # heap de (-distancia, i, j): os `limite` pares mais proximos
+    bloco = linhas_por_bloco(total, memoria_mb)
+
+    for inicio in range(0, total, bloco):
+        fim = min(total, inicio + bloco)
+        distancias = vetores.distancias(matriz[inicio:fim], grade, metrica)
+        linhas = np.arange(fim - inicio)
+        distancias[linhas, linhas + inicio] = np.inf  # Ignora o proprio cadastro
+
+        # Vizinho mais proximo (linha inteira)
+        proximos = np.argmin(distancias, axis=1)
+        vizinho[inicio:fim] = proximos
+        distancia_vizinho[inicio:fim] = distancias[linhas, proximos]
+
+        # Cada par uma vez so: colunas depois da linha
+        superior = np.arange(total)[None, :] > (linhas + inicio)[:, None]
+        valores = distancias[superior]
+        soma += float(valores.sum())
+        posicoes = np.clip((valores / maximo * faixas).astype(np.int64), 0, faixas - 1)
+        histograma += np.bincount(posicoes, minlength=faixas)
+
+        if limiar_duplicata is not None:
+            linhas_dup, colunas_dup = np.nonzero(superior & (distancias < limiar_duplicata))
+            for i, j in zip(linhas_dup, colunas_dup):
+                item = (-float(distancias[i, j]), int(i + inicio), int(j))
+                if len(duplicatas) < limite:
+                    heapq.heappush(duplicatas, item)
+                elif item > duplicatas[0]:
+                    heapq.heapreplace(duplicatas, item)
+
+    acumulado = np.cumsum(histograma)
+    borda = lambda faixa: round(float((faixa + 1) * maximo / faixas), 4)  # Limite superior da faixa
+
+    def quantil(q: float) -> float:
+        return borda(int(np.searchsorted(acumulado, q * pares)))
+
+    def far(valor: float) -> float:
+        """Fracao dos pares com distancia < valor (na resolucao do histograma)"""
+        faixa = int(np.floor(valor / maximo * faixas + 1e-9))
+        return float(acumulado[faixa - 1]) / pares if faixa > 0 else 0.0
+
+    def sugerido(alvo: float) -> dict:
+        # Maior borda de faixa com no maximo alvo * pares pares abaixo dela
+        faixa = int(np.searchsorted(acumulado, alvo * pares, side="right"))
+        valor = round(float(faixa * maximo / faixas), 4)
+        taxa = far(valor)
+        return {
+            "far": alvo,
+            "limiar": valor,
+            "far_observado": taxa,
+            "fpir_estimado": round(1 - (1 - taxa) ** total, 6),
+            # Abaixo de ~1/pares o FAR nao e medido, so extrapolado
+            "confiavel": alvo * pares >= 10,
+        }
+
+    resultado.update({
+        "impostores": {
+            "min": round(float(distancia_vizinho.min()), 4),
+            "p0_1": quantil(0.001),
+            "p1": quantil(0.01),
+            "p5": quantil(0.05),
+            "p50": quantil(0.5),
+            "media": round(soma / pares, 4),
+        },
+        "limiares_sugeridos": [sugerido(alvo) for alvo in fars],
+    })
+
+    if limiar is not None:
+        taxa = far(limiar)
+        ordem = np.argsort(distancia_vizinho, kind="stable")
+        sinalizados = [i for i in ordem if distancia_vizinho[i] < limiar]
+        resultado["limiar_atual"] = {
+            "limiar": limiar,
+            "far": taxa,
+            "fpir_estimado": round(1 - (1 - taxa) ** total, 6),
+            "cadastros_proximos": len(sinalizados),
+        }
+        resultado["proximos"] = [
+            {"id": ids[i], "vizinho": ids[int(vizinho[i])], "distancia": round(float(distancia_vizinho[i]), 4)}
+            for i in sinalizados[:limite]
+        ]
+    else:
+        resultado["proximos"] = []
+
+    resultado["duplicatas"] = [
+        {"ids": [ids[i], ids[j]], "distancia": round(-distancia, 4)}
+        for distancia, i, j in sorted(duplicatas, reverse=True)
+    ]
+    return resultado
+
+
+def taxas_erro(genuinos: np.ndarray, impostores: np.ndarray, limiar: float) -> dict:
+    """FAR (impostores aceitos) e FRR (genuinos rejeitados) de um limiar de similaridade (score >= limiar aceita)"""
+    genuinos, impostores = np.asarray(genuinos), np.asarray(impostores)
+    return {
+        "limiar": float(limiar),
+        "far": float(np.mean(impostores >= limiar)) if len(impostores) else 0.0,
+        "frr": float(np.mean(genuinos < limiar)) if len(genuinos) else 0.0,
+    }
+
+
+def ponto_operacao(genuinos: np.ndarray, impostores: np.ndarray, far_alvo: float) -> dict:
+    """
+    Menor limiar de similaridade com FAR <= far_alvo nos impostores dados
+    (o de menor FRR entre os que atendem o alvo), com FAR e FRR observados.
+
+    Para scores de similaridade (digitais); as faces usam distancias e
+    analisar_galeria. O limiar fica logo acima (4 casas, arredondado para
+    cima) do impostor que precisa ser rejeitado, entao o FAR medido so vale
+    para outro conjunto quando este tem pares suficientes (far_alvo * impostores >= 10).
+    """
+    impostores = np.sort(np.asarray(impostores, dtype=np.float64))[::-1]
+    aceitos = int(np.floor(far_alvo * len(impostores) + 1e-9))
+    if aceitos >= len(impostores):
+        limiar = float(impostores[-1]) if len(impostores) else 0.0
+    else:
+        limiar = float(np.ceil(np.nextafter(impostores[aceitos], np.inf) * 1e4) / 1e4)
+    return {
+        **taxas_erro(genuinos, impostores, limiar),
+        "far_alvo": far_alvo,
+        "confiavel": far_alvo * len(impostores) >= 10,
+    }
@@ -0,0 +1,146 @@
+"""
+Galeria Compartilhada entre Processos
+=====================================
+
+Com `uvicorn --workers N` cada worker e um processo independente. Para que
+todos busquem na mesma galeria, sem uma copia por processo, a forma de busca
+(matriz de vetores) e publicada em um arquivo e mapeada em memoria (mmap) por
+todos os workers: as paginas ficam no cache do sistema operacional, uma vez so.
+
+- {nome}.matriz  : ids + matriz float32 (G, D) + normas, regravado inteiro
+                   (temporario + os.replace) a cada alteracao. Quem ainda usa o
+                   mapeamento antigo continua lendo o arquivo anterior ate trocar.
+- {nome}.geracao : contador de geracao (uint64) mapeado em memoria e
+                   incrementado a cada alteracao. Conferir se a galeria mudou
+                   custa uma leitura de 8 bytes, sem chamada ao sistema.
+
+As alteracoes sao serializadas entre processos por flock no arquivo da geracao
+(POSIX). Sem fcntl (Windows) o lock vale so dentro do processo: rode um worker.
+
+Formato do .matriz:
+    cabecalho: b"GMT1" + geracao (uint64) + quantidade (uint32) + dimensao (uint32) + tamanho dos ids (uint32)
+    ids (JSON utf-8), alinhamento em 64 bytes, matriz float32 little-endian, normas float32
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: lock somente entre threads
+
+MAGIC = b"GMT1"
+_CABECALHO = struct.Struct("<4sQIII")
+_CONTADOR = struct.Struct("<Q")
+_ALINHAMENTO = 64
+
+
+class Geracao:
+    """Contador de geracao de uma galeria, compartilhado pelos processos"""
+
+    def __init__(self, arquivo: Path):
+        self.arquivo = Path(arquivo)
+        self.lock = threading.Lock()  # flock nao exclui threads do mesmo processo
+        self.fd = None
+        self.mapa = None
+
+    def abrir(self):
+        if self.mapa is not None:
+            return
+        self.arquivo.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.arquivo, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(fd).st_size < _CONTADOR.size:
+            os.write(fd, bytes(_CONTADOR.size))  # Primeiro processo: geracao 0
+        self.fd = fd
+        self.mapa = mmap.mmap(fd, _CONTADOR.size)
+
+    def atual(self) -> int:
+        self.abrir()
+        return _CONTADOR.unpack_from(self.mapa)[0]
+
+    @contextmanager
+    def escrita(self):
+        """
+        Exclusao mutua entre processos para alterar a galeria.
+
+        Devolve a proxima geracao; ao sair do bloco sem erro ela passa a ser a atual.
+        """
+        self.abrir()
+        with self.lock:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                proxima = self.atual() + 1
+                yield proxima
+                _CONTADOR.pack_into(self.mapa, 0, proxima)
+            finally:
+                if fcntl:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def fechar(self):
+        if self.mapa is not None:
+            self.mapa.close()
+            os.close(self.fd)
+        self.mapa, self.fd = None, None
+
+
+def gravar_matriz(arquivo: Path, geracao: int, ids: list, matriz: np.ndarray):
+    """Publica a matriz (G, D) e as normas (gravacao atomica)"""
+    matriz = np.ascontiguousarray(matriz, dtype="<f4")
+    if matriz.ndim != 2:
+        matriz = matriz.reshape(len(ids), -1)
+    normas = np.linalg.norm(matriz, axis=1).astype("<f4") if len(ids) else np.zeros(0, dtype="<f4")
+    ids_json = json.dumps(ids).encode("utf-8")
+
+    inicio = _CABECALHO.size + len(ids_json)
+    preenchimento = -inicio % _ALINHAMENTO
+    arquivo = Path(arquivo)
+    temporario = arquivo.with_name(arquivo.name + ".tmp")
+    with open(temporario, "wb") as f:
+        f.write(_CABECALHO.pack(MAGIC, geracao, matriz.shape[0], matriz.shape[1], len(ids_json)))
+        f.write(ids_json)
+        f.write(bytes(preenchimento))
+        f.write(matriz.tobytes())
+        f.write(normas.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, arquivo)
+
+
+def abrir_matriz(arquivo: Path) -> Optional[dict]:
+    """
+    Mapeia a matriz publicada (somente leitura, sem copia).
+
+    Retorna: dict com geracao, ids, matriz (G, D) e normas (G,), ou None se o arquivo nao existe
+    """
+    try:
+        with open(arquivo, "rb") as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+    magic, geracao, quantidade, dimensao, tamanho_ids = _CABECALHO.unpack_from(mapa)
+    if magic != MAGIC:
+        raise ValueError(f"Matriz compartilhada invalida: {arquivo}")
+    posicao = _CABECALHO.size
+    ids = json.loads(mapa[posicao:posicao + tamanho_ids].decode("utf-8"))
+    posicao += tamanho_ids
+    posicao += -posicao % _ALINHAMENTO
+
+    if quantidade == 0:
+        matriz, normas = np.zeros((0, dimensao), dtype=np.float32), np.zeros(0, dtype=np.float32)
+    else:
+        # Visoes sobre o mmap: o mapeamento vive enquanto os arrays forem usados
+        matriz = np.frombuffer(mapa, dtype="<f4", count=quantidade * dimensao, offset=posicao)
+        matriz = matriz.reshape(quantidade, dimensao)
+        normas = np.frombuffer(mapa, dtype="<f4", count=quantidade, offset=posicao + matriz.nbytes)
+    return {"geracao": geracao, "ids": ids, "matriz": matriz, "normas": normas}
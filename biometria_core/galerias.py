@@ -0,0 +1,441 @@
+"""
+Galerias por Tenant
+===================
+
+Cadastros biometricos particionados por tenant (municipio). Cada tenant tem a
+sua galeria, em um diretorio proprio, carregada do disco no primeiro uso e
+descarregada quando fica ociosa ou quando a memoria das galerias carregadas
+passa do limite. As buscas so tocam a galeria do tenant da requisicao.
+
+`Galeria` guarda os cadastros (metadados JSON), os dados biometricos brutos
+(bytes, ver armazenamento.py) e os dados desserializados; cada servico herda e
+implementa `desserializar` e `empacotar` (a forma pronta para a busca
+vetorizada). `Particoes` carrega, empresta e descarrega as galerias e exporta
+as metricas comuns (tamanho, memoria, descargas, duracao das buscas).
+
+Galerias com `COMPARTILHADA = True` sao as mesmas para todos os processos do
+servico (workers do uvicorn): a forma de busca e publicada em um arquivo
+mapeado em memoria e cada alteracao incrementa uma geracao (compartilhada.py).
+Os processos so guardam os metadados; `Particoes.usar` recarrega a galeria
+quando outro processo a alterou.
+
+Uso:
+    particoes = Particoes("futronic", GaleriaDigitais, ociosa=1800, memoria_maxima=512 * 2**20)
+    with particoes.usar(tenant) as galeria:
+        grade = galeria.obter_empacotada()
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+from fastapi import Header, HTTPException
+
+from . import metricas
+from .armazenamento import ArmazemBinario
+from .compartilhada import Geracao
+
+TENANT_PADRAO = "padrao"  # Requisicoes sem tenant (galeria na raiz do diretorio do servico)
+PADRAO_TENANT = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def validar_tenant(tenant: Optional[str]) -> str:
+    """Normaliza a chave do tenant (usada tambem como nome de diretorio)"""
+    tenant = (tenant or TENANT_PADRAO).strip()
+    if not PADRAO_TENANT.match(tenant):
+        raise HTTPException(status_code=400, detail="Tenant invalido (use letras, numeros, _ ou -)")
+    return tenant
+
+
+def obter_tenant(x_tenant: Optional[str] = Header(None), tenant: Optional[str] = None) -> str:
+    """Dependencia dos endpoints: tenant do header X-Tenant ou do parametro ?tenant="""
+    return validar_tenant(x_tenant or tenant)
+
+
+def diretorio_tenant(raiz: Path, tenant: str) -> Path:
+    """Diretorio da galeria: a raiz para o tenant padrao, raiz/tenants/{tenant} para os demais"""
+    return Path(raiz) if tenant == TENANT_PADRAO else Path(raiz) / "tenants" / tenant
+
+
+class Galeria:
+    """
+    Cadastros de um tenant.
+
+    `cadastros` guarda os metadados (id -> dict), `brutos` o dado biometrico
+    como gravado em disco e `dados` o dado desserializado, so para os ids que
+    tem dado. `empacotada` e a forma de busca, refeita quando os cadastros mudam.
+    """
+
+    NOME_ARQUIVO = "galeria"  # {NOME_ARQUIVO}.json + {NOME_ARQUIVO}.bin no diretorio do tenant
+    SERVICO = "Biometria"  # Prefixo dos logs
+    COMPARTILHADA = False  # Uma galeria para todos os processos (implementar publicar/mapear)
+
+    def __init__(self, tenant: str, diretorio: Path):
+        self.tenant = tenant
+        self.diretorio = Path(diretorio)
+        self.armazem = ArmazemBinario(self.diretorio, self.NOME_ARQUIVO)
+        self.cadastros = {}
+        self.brutos = {}
+        self.dados = {}
+        self.empacotada = None
+        self.lock = threading.RLock()  # Protege `cadastros`/`brutos`/`dados` e `empacotada`
+        self.carga = threading.Lock()  # Serializa a carga do disco (fora do lock das Particoes)
+        self.carregada = False
+        self.ultimo_uso = time.time()
+        self.em_uso = 0  # Requisicoes usando a galeria (protegido pelo lock das Particoes)
+        self.memoria = 0  # Bytes estimados (dados + metadados)
+        self.geracao = Geracao(self.diretorio / f"{self.NOME_ARQUIVO}.geracao") if self.COMPARTILHADA else None
+        self.geracao_carregada = None
+        self.alterando = False  # Compartilhada: dentro de uma alteracao, `dados` tem a galeria inteira do disco
+
+    # Pontos de extensao -------------------------------------------------
+
+    def desserializar(self, bruto: bytes):
+        """Converte o dado gravado para a forma usada na busca"""
+        raise NotImplementedError
+
+    def empacotar(self) -> dict:
+        """
+        Monta a galeria de busca a partir de `cadastros`/`dados` (chamado com o lock).
+        Na compartilhada, durante uma alteracao (`alterando`), monta dos dados e nao do mapeamento.
+        """
+        raise NotImplementedError
+
+    def migrar(self) -> bool:
+        """Converte formatos antigos apos carregar. Retorna True se algo mudou (a galeria e regravada)"""
+        return False
+
+    def ao_descarregar(self):
+        """Libera recursos externos da galeria (ex: memoria compartilhada)"""
+
+    def publicar(self, geracao: int):
+        """Grava a forma de busca de `cadastros`/`dados` para todos os processos (galeria compartilhada)"""
+        raise NotImplementedError
+
+    def mapear(self, geracao: int) -> bool:
+        """Mapeia a forma de busca publicada. Retorna False se nao existe ou e de outra geracao"""
+        raise NotImplementedError
+
+    # ----------------------------------------------------------------------
+
+    def carregar(self):
+        """Carrega a galeria do disco (vazia, sem criar o diretorio, se o tenant nunca gravou)"""
+        if not self.diretorio.exists():
+            with self.lock:
+                self.cadastros, self.brutos, self.dados = {}, {}, {}
+                self.geracao_carregada = None
+                self.invalidar()
+            return
+        if self.geracao is not None:
+            self._carregar_compartilhada()
+            return
+        self._carregar_dados()
+
+    def _carregar_dados(self, registrar: bool = True):
+        """Le cadastros e dados biometricos (convertendo formatos antigos)"""
+        try:
+            cadastros, brutos = self.armazem.carregar()
+            if registrar:
+                print(f"[{self.SERVICO}] Galeria carregada ({self.tenant}): {len(cadastros)} cadastros")
+        except Exception as e:
+            print(f"[{self.SERVICO}] Erro ao carregar galeria ({self.tenant}): {e}")
+            cadastros, brutos = {}, {}
+
+        with self.lock:
+            self.cadastros, self.brutos = cadastros, brutos
+            migrou = self.migrar()
+            self.dados = {}
+            for chave, bruto in list(self.brutos.items()):
+                if chave not in self.cadastros:
+                    del self.brutos[chave]  # Dado orfao (cadastro removido antes de uma queda)
+                    continue
+                try:
+                    self.dados[chave] = self.desserializar(bruto)
+                except Exception as e:
+                    print(f"[{self.SERVICO}] Dado invalido ignorado ({self.tenant}/{chave}): {e}")
+
+            self.invalidar()
+            if migrou:
+                self.salvar()
+
+    def _carregar_compartilhada(self):
+        """
+        Metadados do disco + forma de busca publicada. Se ela nao existe ou esta
+        desatualizada (primeiro uso, formato antigo), publica a partir dos dados.
+        """
+        geracao = self.geracao.atual()
+        cadastros = self.armazem.carregar_cadastros()
+        if not self.mapear(geracao):
+            with self.geracao.escrita() as geracao:
+                self._carregar_dados()
+                self.publicar(geracao)
+            cadastros = self.cadastros
+            self.mapear(geracao)
+        print(f"[{self.SERVICO}] Galeria compartilhada ({self.tenant}): {len(cadastros)} cadastros, geracao {geracao}")
+        with self.lock:
+            self.cadastros, self.brutos, self.dados = cadastros, {}, {}
+            self.geracao_carregada = geracao
+            self.invalidar()
+
+    def recarregar(self):
+        """Rele a galeria alterada fora do servico (compartilhada: republica para todos os processos)"""
+        if self.geracao is None:
+            self.carregar()
+            return
+        with self._alterando():
+            pass
+
+    def desatualizada(self) -> bool:
+        """Outro processo alterou a galeria compartilhada depois da carga"""
+        if self.geracao is None:
+            return False
+        if self.geracao_carregada is None:
+            return self.diretorio.exists()  # Carregada vazia: outro processo fez o primeiro cadastro?
+        return self.geracao.atual() != self.geracao_carregada
+
+    @contextmanager
+    def _alterando(self):
+        """
+        Envolve uma alteracao. Na galeria compartilhada, parte do estado mais
+        recente do disco (com o lock entre processos), grava, publica e
+        incrementa a geracao; depois mantem so os metadados e o mapeamento.
+        """
+        if self.geracao is None:
+            yield
+            self.invalidar()
+            self.salvar()
+            return
+        with self.geracao.escrita() as geracao:
+            self._carregar_dados(registrar=False)
+            self.alterando = True
+            try:
+                yield
+            except BaseException:
+                # Alteracao cancelada: nada gravado, geracao mantida
+                with self.lock:
+                    self.brutos, self.dados = {}, {}
+                    self.invalidar()
+                raise
+            finally:
+                self.alterando = False
+            self.salvar()
+            self.publicar(geracao)
+        with self.lock:
+            self.brutos, self.dados = {}, {}
+            self.mapear(geracao)
+            self.geracao_carregada = geracao
+            self.invalidar()
+
+    def salvar(self):
+        """Grava a galeria no disco"""
+        try:
+            with self.lock:
+                self.armazem.salvar(self.cadastros, self.brutos)
+        except Exception as e:
+            print(f"[{self.SERVICO}] Erro ao salvar galeria ({self.tenant}): {e}")
+
+    def gravar(self, chave: str, cadastro: dict, bruto: Optional[bytes] = None,
+               verificar: Optional[Callable[[], None]] = None):
+        """
+        Inclui/substitui um cadastro (sem dado, remove o dado anterior) e grava no disco.
+
+        `verificar` roda antes da gravacao, na mesma secao critica (lock da
+        galeria e, na compartilhada, lock entre processos, sobre a galeria
+        recem-lida do disco); uma excecao dele cancela a gravacao.
+        """
+        dado = self.desserializar(bruto) if bruto is not None else None
+        with self._alterando(), self.lock:
+            if verificar is not None:
+                verificar()
+            if bruto is not None:
+                self.brutos[chave] = bytes(bruto)
+                self.dados[chave] = dado
+            else:
+                self.brutos.pop(chave, None)
+                self.dados.pop(chave, None)
+            self.cadastros[chave] = cadastro
+
+    def remover(self, chave: str) -> bool:
+        """Remove um cadastro. Retorna False se nao existia"""
+        if chave not in self.cadastros and (self.geracao is None or not self.diretorio.exists()):
+            return False
+        with self._alterando(), self.lock:
+            existia = self.cadastros.pop(chave, None) is not None
+            self.brutos.pop(chave, None)
+            self.dados.pop(chave, None)
+        return existia
+
+    def invalidar(self):
+        """Descarta a galeria empacotada (chamar apos alterar cadastros/dados)"""
+        with self.lock:
+            self.empacotada = None
+            self.memoria = (
+                sum(len(bruto) * 2 for bruto in self.brutos.values())  # Bruto + desserializado (aproximado)
+                + sum(200 + sum(len(str(v)) for v in cadastro.values()) for cadastro in self.cadastros.values())
+            )
+
+    def obter_empacotada(self) -> dict:
+        """Galeria de busca (montada no primeiro uso apos cada alteracao)"""
+        with self.lock:
+            if self.empacotada is None:
+                self.empacotada = self.empacotar()
+            return self.empacotada
+
+    def descarregar(self):
+        """Libera a memoria da galeria (os cadastros continuam no disco)"""
+        self.ao_descarregar()
+        with self.lock:
+            self.empacotada = None
+            self.cadastros, self.brutos, self.dados, self.memoria = {}, {}, {}, 0
+            self.carregada = False
+        if self.geracao is not None:
+            self.geracao.fechar()
+            self.geracao_carregada = None
+
+
+class Particoes:
+    """
+    Galerias carregadas por tenant.
+
+    `usar(tenant)` carrega a galeria no primeiro uso e a empresta; galerias em
+    uso nunca sao descarregadas. A carga do disco usa o lock da galeria
+    (`carga`), fora do lock das Particoes: a carga de um tenant grande nao
+    bloqueia as requisicoes dos outros. A limpeza (thread iniciada com `iniciar`)
+    descarrega as ociosas ha `ociosa` segundos e, se a memoria estimada passar
+    de `memoria_maxima`, as menos usadas recentemente.
+    """
+
+    def __init__(self, servico: str, criar: Callable[[str], Galeria], ociosa: float, memoria_maxima: int,
+                 registro: Optional[metricas.Registro] = None):
+        self.servico = servico
+        self.criar = criar
+        self.ociosa = ociosa
+        self.memoria_maxima = memoria_maxima
+        self.galerias = {}
+        self.lock = threading.Lock()
+        self.parar_evento = threading.Event()
+        self.thread = None
+
+        registro = registro or metricas.registro
+        self.metrica_busca = registro.histograma(
+            f"{servico}_comparacao_segundos", "Duracao de cada comparacao contra a galeria", ["tenant", "operacao"]
+        )
+        self.metrica_consultas = registro.contador(
+            f"{servico}_comparacao_consultas_total", "Consultas comparadas contra a galeria", ["tenant", "operacao"]
+        )
+        self.metrica_recarregadas = registro.contador(
+            f"{servico}_galerias_recarregadas_total", "Galerias compartilhadas recarregadas apos alteracao em outro processo"
+        )
+        self.metrica_descarregadas = registro.contador(
+            f"{servico}_galerias_descarregadas_total", "Galerias descarregadas da memoria (ociosa ou memoria)",
+            ["motivo"]
+        )
+        registro.medidor(
+            f"{servico}_galeria_tamanho", "Cadastros na galeria (somente galerias carregadas)", ["tenant"],
+            coletor=lambda: {(g.tenant,): len(g.cadastros) for g in self.carregadas()}
+        )
+        registro.medidor(
+            f"{servico}_galerias_memoria_bytes", "Memoria estimada das galerias carregadas",
+            coletor=lambda: {(): sum(g.memoria for g in self.carregadas())}
+        )
+
+    def carregadas(self) -> list:
+        return list(self.galerias.values())
+
+    @contextmanager
+    def usar(self, tenant: str):
+        """
+        Galeria do tenant, carregada do disco no primeiro uso (e de novo se
+        outro processo alterou a galeria compartilhada).
+        Enquanto o bloco roda a galeria nao e descarregada.
+        """
+        with self.lock:
+            galeria = self.galerias.get(tenant)
+            if galeria is None:
+                galeria = self.criar(tenant)
+                self.galerias[tenant] = galeria
+            galeria.em_uso += 1  # Reservada: nao e descarregada durante a carga
+            galeria.ultimo_uso = time.time()
+
+        try:
+            with galeria.carga:
+                nova = not galeria.carregada
+                if nova:
+                    galeria.carregar()
+                    galeria.carregada = True
+                elif galeria.desatualizada():
+                    galeria.carregar()
+                    self.metrica_recarregadas.inc()
+        except BaseException:
+            with self.lock:
+                galeria.em_uso -= 1
+                if not galeria.carregada and galeria.em_uso == 0 and self.galerias.get(tenant) is galeria:
+                    del self.galerias[tenant]
+            raise
+
+        if nova:
+            with self.lock:
+                self.descarregar(manter=tenant)
+        try:
+            yield galeria
+        finally:
+            with self.lock:
+                galeria.em_uso -= 1
+                galeria.ultimo_uso = time.time()
+
+    @contextmanager
+    def medir(self, galeria: Galeria, operacao: str, consultas: int = 1):
+        """Registra a duracao e a quantidade de consultas de uma busca na galeria"""
+        with self.metrica_busca.medir(tenant=galeria.tenant, operacao=operacao):
+            yield
+        self.metrica_consultas.inc(consultas, tenant=galeria.tenant, operacao=operacao)
+
+    def descarregar(self, manter: Optional[str] = None):
+        """
+        Descarrega as galerias ociosas e, acima do limite de memoria, as menos
+        usadas recentemente. Galerias em uso e a do tenant `manter` ficam.
+        Chamado com o lock.
+        """
+        agora = time.time()
+        livres = sorted(
+            (g for g in self.galerias.values() if g.em_uso == 0 and g.tenant != manter),
+            key=lambda g: g.ultimo_uso,
+        )
+        total = sum(g.memoria for g in self.galerias.values())
+        for galeria in livres:
+            if agora - galeria.ultimo_uso >= self.ociosa:
+                motivo = "ociosa"
+            elif total > self.memoria_maxima:
+                motivo = "memoria"
+            else:
+                continue
+            del self.galerias[galeria.tenant]
+            total -= galeria.memoria
+            galeria.descarregar()
+            self.metrica_descarregadas.inc(motivo=motivo)
+            print(f"[{galeria.SERVICO}] Galeria {galeria.tenant} descarregada ({motivo})")
+
+    def descarregar_todas(self):
+        """Descarrega todas as galerias (shutdown)"""
+        with self.lock:
+            for galeria in self.galerias.values():
+                galeria.descarregar()
+            self.galerias.clear()
+
+    def iniciar(self):
+        """Inicia a thread de limpeza"""
+        self.parar_evento.clear()
+        self.thread = threading.Thread(target=self._limpar, name=f"limpeza-galerias-{self.servico}", daemon=True)
+        self.thread.start()
+
+    def parar(self):
+        self.parar_evento.set()
+
+    def _limpar(self):
+        intervalo = max(1.0, min(60.0, self.ociosa / 4))
+        while not self.parar_evento.wait(intervalo):
+            with self.lock:
+                self.descarregar()
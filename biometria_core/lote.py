@@ -0,0 +1,55 @@
+"""
+Respostas em Lote (NDJSON)
+==========================
+
+Os endpoints de lote recebem muitas consultas de uma vez, comparam cada grupo
+contra a galeria com uma unica busca vetorizada e respondem em NDJSON
+(`application/x-ndjson`), uma linha JSON por item na ordem do lote, enviada
+assim que o grupo termina.
+
+Uso:
+    return responder_lote(
+        request.itens, processar, maximo=5000, por_grupo=64,
+        contexto=lambda: particoes.usar(tenant),
+    )
+
+    def processar(galeria, grupo):  # grupo: [(indice, item), ...]
+        return [{"indice": indice, ...} for indice, item in grupo]
+"""
+
+import json
+from contextlib import nullcontext
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+TIPO_NDJSON = "application/x-ndjson"
+
+
+def linha_ndjson(resultado: dict) -> bytes:
+    return (json.dumps(resultado) + "\n").encode("utf-8")
+
+
+def responder_lote(itens: list, processar: Callable, maximo: int, por_grupo: int,
+                   contexto: Optional[Callable] = None) -> StreamingResponse:
+    """
+    Resposta NDJSON do lote.
+
+    `processar(recurso, grupo)` recebe o valor do `contexto` (ex: a galeria do
+    tenant, mantida em uso ate o fim do stream) e ate `por_grupo` pares
+    (indice, item) e devolve os resultados do grupo. Lotes com mais de `maximo`
+    itens sao recusados com 413.
+    """
+    if len(itens) > maximo:
+        raise HTTPException(status_code=413, detail=f"Lote com mais de {maximo} itens")
+
+    def gerar():
+        with (contexto() if contexto else nullcontext()) as recurso:
+            numerados = list(enumerate(itens))
+            for inicio in range(0, len(numerados), por_grupo):
+                for resultado in processar(recurso, numerados[inicio:inicio + por_grupo]):
+                    yield linha_ndjson(resultado)
+
+    # Gerador sincrono: o Starlette o consome em uma thread, sem bloquear o event loop
+    return StreamingResponse(gerar(), media_type=TIPO_NDJSON)
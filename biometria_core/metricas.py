@@ -0,0 +1,186 @@
+"""
+Metricas no formato Prometheus
+==============================
+
+Registro minimo de contadores, medidores e histogramas com rotulos, exportado
+no formato texto do Prometheus (0.0.4) em /metrics. Sem dependencias: o
+python32 embarcado no Windows nao tem prometheus_client.
+
+Uso:
+    capturas = registro.contador("futronic_capturas_total", "Capturas", ["device", "resultado"])
+    capturas.inc(device="SIM:0001", resultado="sucesso")
+
+    latencia = registro.histograma("futronic_comparacao_segundos", "Comparacao", ["operacao"])
+    with latencia.medir(operacao="verificar"):
+        ...
+
+    texto = registro.exportar()
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_numero(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _formatar_rotulos(nomes: tuple, valores: tuple, extra: Optional[tuple] = None) -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(f'{extra[0]}="{_escapar(extra[1])}"')
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Metrica:
+    """Base: nome, ajuda, rotulos e valores por combinacao de rotulos"""
+
+    tipo = "untyped"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Optional[list] = None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos or ())
+        self.lock = threading.Lock()
+        self.valores = {}
+
+    def _chave(self, rotulos: dict) -> tuple:
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"{self.nome}: rotulos esperados {self.rotulos}, recebidos {tuple(rotulos)}")
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def amostras(self) -> list:
+        """Linhas (sufixo, valores dos rotulos, rotulo extra, valor) para exportar"""
+        with self.lock:
+            return [("", chave, None, valor) for chave, valor in self.valores.items()]
+
+    def exportar(self) -> list:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        for sufixo, chave, extra, valor in self.amostras():
+            linhas.append(f"{self.nome}{sufixo}{_formatar_rotulos(self.rotulos, chave, extra)} {_formatar_numero(valor)}")
+        return linhas
+
+
+class Contador(Metrica):
+    """Valor que so cresce (reinicia com o processo)"""
+
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self.lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+
+class Medidor(Metrica):
+    """
+    Valor instantaneo. Com `coletor`, o valor e lido na hora da exportacao:
+    o coletor devolve {tupla de valores dos rotulos: valor}.
+    """
+
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Optional[list] = None,
+                 coletor: Optional[Callable[[], dict]] = None):
+        super().__init__(nome, ajuda, rotulos)
+        self.coletor = coletor
+
+    def set(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self.lock:
+            self.valores[chave] = valor
+
+    def amostras(self) -> list:
+        if self.coletor is None:
+            return super().amostras()
+        return [("", tuple(str(v) for v in chave), None, valor) for chave, valor in self.coletor().items()]
+
+
+class Histograma(Metrica):
+    """Distribuicao em buckets cumulativos, com _sum e _count"""
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Optional[list] = None,
+                 buckets: tuple = BUCKETS_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self.lock:
+            contagens, soma = self.valores.get(chave, ([0] * len(self.buckets), 0.0))
+            for indice, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[indice] += 1
+            self.valores[chave] = (contagens, soma + valor)
+
+    @contextmanager
+    def medir(self, **rotulos):
+        """Observa a duracao (segundos) do bloco"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def amostras(self) -> list:
+        with self.lock:
+            itens = [(chave, list(contagens), soma) for chave, (contagens, soma) in self.valores.items()]
+        linhas = []
+        for chave, contagens, soma in itens:
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append(("_bucket", chave, ("le", _formatar_numero(limite)), contagem))
+            linhas.append(("_sum", chave, None, soma))
+            linhas.append(("_count", chave, None, contagens[-1]))
+        return linhas
+
+
+class Registro:
+    """Conjunto de metricas exportadas juntas"""
+
+    def __init__(self):
+        self.metricas = []
+
+    def _registrar(self, metrica: Metrica) -> Metrica:
+        self.metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos: Optional[list] = None) -> Contador:
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome: str, ajuda: str, rotulos: Optional[list] = None,
+                coletor: Optional[Callable[[], dict]] = None) -> Medidor:
+        return self._registrar(Medidor(nome, ajuda, rotulos, coletor))
+
+    def histograma(self, nome: str, ajuda: str, rotulos: Optional[list] = None,
+                   buckets: tuple = BUCKETS_SEGUNDOS) -> Histograma:
+        return self._registrar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self.metricas:
+            try:
+                linhas.extend(metrica.exportar())
+            except Exception as e:
+                # Um coletor com erro nao derruba o /metrics inteiro
+                linhas.append(f"# {metrica.nome}: erro ao coletar ({e})")
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# biometria_core e importado a partir da raiz do repositorio (como nos servicos)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from biometria_core import calibracao
+
+
+def test_taxas_erro_aceita_score_igual_ao_limiar():
+    taxas = calibracao.taxas_erro(np.array([0.3, 0.5, 0.7]), np.array([0.1, 0.3, 0.4]), 0.3)
+    assert taxas["far"] == pytest.approx(2 / 3)
+    assert taxas["frr"] == 0.0
+
+
+def test_ponto_operacao_respeita_o_far_alvo():
+    rng = np.random.default_rng(0)
+    impostores = rng.uniform(0.0, 0.4, 10000)
+    genuinos = rng.uniform(0.25, 0.9, 1000)
+
+    ponto = calibracao.ponto_operacao(genuinos, impostores, 0.01)
+
+    assert ponto["far"] <= 0.01
+    assert ponto["confiavel"]
+    # Menor limiar que atende o alvo: um pouco abaixo dele o FAR passa do alvo
+    assert calibracao.taxas_erro(genuinos, impostores, ponto["limiar"] - 1e-3)["far"] > 0.01
+    assert ponto["frr"] == pytest.approx(np.mean(genuinos < ponto["limiar"]), abs=1e-3)
+
+
+def test_ponto_operacao_far_zero_rejeita_todos_os_impostores():
+    ponto = calibracao.ponto_operacao(np.array([0.6, 0.8]), np.array([0.2, 0.35, 0.5]), 0.0)
+    assert ponto["far"] == 0.0
+    assert ponto["limiar"] > 0.5
+    assert ponto["frr"] == 0.0
+    assert not ponto["confiavel"]
@@ -0,0 +1,191 @@
+import threading
+
+import pytest
+
+from biometria_core import metricas
+from biometria_core.galerias import Galeria, Particoes
+
+
+class GaleriaTeste(Galeria):
+    """Dado biometrico = texto; forma de busca = ids ordenados com o texto"""
+
+    NOME_ARQUIVO = "teste"
+    SERVICO = "Teste"
+
+    def desserializar(self, bruto: bytes):
+        return bruto.decode()
+
+    def empacotar(self) -> dict:
+        return {"ids": sorted(self.dados), "dados": [self.dados[i] for i in sorted(self.dados)]}
+
+
+def criar_particoes(tmp_path, criar=None, ociosa=3600):
+    criar = criar or (lambda tenant: GaleriaTeste(tenant, tmp_path / tenant))
+    return Particoes("teste", criar, ociosa, 2 ** 30, registro=metricas.Registro())
+
+
+def test_gravar_e_remover_persistem_no_disco(tmp_path):
+    galeria = GaleriaTeste("t1", tmp_path)
+    galeria.gravar("1", {"nome": "Ana"}, b"a")
+    galeria.gravar("2", {"nome": "Bia"}, b"b")
+    assert galeria.obter_empacotada()["ids"] == ["1", "2"]
+
+    assert galeria.remover("1")
+    assert not galeria.remover("1")
+    assert galeria.obter_empacotada()["ids"] == ["2"]
+
+    relida = GaleriaTeste("t1", tmp_path)
+    relida.carregar()
+    assert relida.cadastros == {"2": {"nome": "Bia"}}
+    assert relida.dados == {"2": "b"}
+
+
+def test_gravar_espera_o_lock_da_galeria(tmp_path):
+    """Alteracoes nao acontecem enquanto a forma de busca esta sendo montada (lock da galeria)"""
+    galeria = GaleriaTeste("t1", tmp_path)
+    galeria.carregar()
+    gravou = threading.Event()
+
+    with galeria.lock:
+        thread = threading.Thread(target=lambda: (galeria.gravar("1", {}, b"a"), gravou.set()))
+        thread.start()
+        assert not gravou.wait(0.2)
+        assert "1" not in galeria.cadastros
+    thread.join(5)
+
+    assert gravou.is_set()
+    assert galeria.obter_empacotada()["ids"] == ["1"]
+
+
+def test_usar_carrega_uma_vez_por_tenant(tmp_path):
+    cargas = []
+
+    class Contada(GaleriaTeste):
+        def carregar(self):
+            cargas.append(self.tenant)
+            super().carregar()
+
+    particoes = criar_particoes(tmp_path, lambda tenant: Contada(tenant, tmp_path / tenant))
+    emprestimos = [particoes.usar("t1") for _ in range(8)]
+    threads = [threading.Thread(target=emprestimo.__enter__) for emprestimo in emprestimos]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert cargas == ["t1"]
+    assert particoes.galerias["t1"].em_uso == 8
+    for emprestimo in emprestimos:
+        emprestimo.__exit__(None, None, None)
+    assert particoes.galerias["t1"].em_uso == 0
+
+
+def test_carga_de_um_tenant_nao_bloqueia_os_outros(tmp_path):
+    liberar, carregando = threading.Event(), threading.Event()
+
+    class Lenta(GaleriaTeste):
+        def carregar(self):
+            if self.tenant == "lento":
+                carregando.set()
+                assert liberar.wait(5)
+            super().carregar()
+
+    particoes = criar_particoes(tmp_path, lambda tenant: Lenta(tenant, tmp_path / tenant))
+
+    def usar_lento():
+        with particoes.usar("lento"):
+            pass
+
+    thread = threading.Thread(target=usar_lento)
+    thread.start()
+    assert carregando.wait(5)
+    try:
+        with particoes.usar("rapido") as galeria:
+            assert galeria.carregada
+    finally:
+        liberar.set()
+        thread.join(5)
+
+
+def test_erro_na_carga_nao_deixa_galeria_pela_metade(tmp_path):
+    falhar = [True]
+
+    class Instavel(GaleriaTeste):
+        def carregar(self):
+            if falhar[0]:
+                raise OSError("disco indisponivel")
+            super().carregar()
+
+    particoes = criar_particoes(tmp_path, lambda tenant: Instavel(tenant, tmp_path / tenant))
+    with pytest.raises(OSError):
+        with particoes.usar("t1"):
+            pass
+    assert "t1" not in particoes.galerias
+
+    falhar[0] = False
+    with particoes.usar("t1") as galeria:
+        assert galeria.carregada
+
+
+def test_descarrega_ociosas_mas_nao_as_em_uso(tmp_path):
+    particoes = criar_particoes(tmp_path, ociosa=0)
+
+    with particoes.usar("em_uso") as em_uso:
+        em_uso.gravar("1", {}, b"a")
+        with particoes.usar("ociosa"):
+            pass
+        with particoes.lock:
+            particoes.descarregar()
+        assert set(particoes.galerias) == {"em_uso"}
+        assert em_uso.cadastros
+
+    with particoes.lock:
+        particoes.descarregar()
+    assert particoes.galerias == {}
+
+    # Carregada de novo do disco no proximo uso
+    with particoes.usar("em_uso") as galeria:
+        assert galeria is not em_uso
+        assert galeria.dados == {"1": "a"}
+
+
+class GaleriaCompartilhadaTeste(GaleriaTeste):
+    """Galeria compartilhada; a forma publicada fica so neste objeto (cada objeto faz as vezes de um processo)"""
+
+    COMPARTILHADA = True
+
+    def publicar(self, geracao: int):
+        self.publicada = geracao
+
+    def mapear(self, geracao: int) -> bool:
+        return getattr(self, "publicada", None) == geracao
+
+
+@pytest.mark.parametrize("classe", [GaleriaTeste, GaleriaCompartilhadaTeste])
+def test_leitura_de_tenant_novo_nao_cria_diretorio(tmp_path, classe):
+    particoes = criar_particoes(tmp_path, lambda tenant: classe(tenant, tmp_path / tenant))
+
+    with particoes.usar("novo") as galeria:
+        assert galeria.cadastros == {}
+        assert galeria.obter_empacotada()["ids"] == []
+        assert not galeria.remover("1")
+    with particoes.usar("novo"):
+        pass
+
+    assert not (tmp_path / "novo").exists()
+
+
+def test_primeiro_cadastro_em_outro_processo_e_visto(tmp_path):
+    """Galeria carregada vazia (sem diretorio) recarrega quando outro processo grava o primeiro cadastro"""
+    criar = lambda tenant: GaleriaCompartilhadaTeste(tenant, tmp_path / tenant)
+    leitor, escritor = criar_particoes(tmp_path, criar), criar_particoes(tmp_path, criar)
+
+    with leitor.usar("novo") as galeria:
+        assert galeria.cadastros == {}
+
+    with escritor.usar("novo") as galeria:
+        galeria.gravar("1", {"nome": "Ana"}, b"a")
+    assert (tmp_path / "novo").exists()
+
+    with leitor.usar("novo") as galeria:
+        assert galeria.cadastros == {"1": {"nome": "Ana"}}
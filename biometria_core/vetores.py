@@ -0,0 +1,95 @@
+"""
+Busca Vetorizada de Embeddings
+==============================
+
+Galeria de vetores de tamanho fixo (embeddings faciais) empacotada em uma
+matriz float32 (G, D), com as normas pre-calculadas, para comparar K consultas
+com a galeria inteira em uma multiplicacao de matrizes em vez de um laco
+Python por cadastro.
+
+Metricas:
+- cosine    : 1 - similaridade do cosseno
+- euclidean : distancia euclidiana entre os vetores crus
+"""
+
+import numpy as np
+
+
+def vetor_de_bytes(bruto: bytes) -> np.ndarray:
+    """Embedding gravado como float32 little-endian"""
+    return np.frombuffer(bruto, dtype="<f4").astype(np.float32)
+
+
+def vetor_para_bytes(vetor) -> bytes:
+    return np.asarray(vetor, dtype="<f4").tobytes()
+
+
+def empacotar_vetores(vetores: list) -> dict:
+    """
+    Empacota a galeria.
+
+    Retorna: dict com matriz (G, D) float32 e normas (G,). Vetores com dimensao
+    diferente da maioria (outro modelo) nao podem ser empacotados juntos.
+    """
+    if not vetores:
+        return {"matriz": np.zeros((0, 0), dtype=np.float32), "normas": np.zeros(0, dtype=np.float32)}
+    matriz = np.vstack([np.asarray(v, dtype=np.float32) for v in vetores])
+    return {"matriz": matriz, "normas": np.linalg.norm(matriz, axis=1)}
+
+
+def empacotar_por_id(vetores_por_id: dict) -> tuple:
+    """
+    Empacota {id: vetor} usando so a dimensao mais comum (vetores de outro
+    modelo nao podem ser comparados com os demais).
+
+    Retorna: (galeria com "ids", matriz e normas, ids ignorados)
+    """
+    ids = list(vetores_por_id)
+    ignorados = []
+    if ids:
+        dimensoes = [len(vetores_por_id[chave]) for chave in ids]
+        dimensao = max(set(dimensoes), key=dimensoes.count)
+        ignorados = [chave for chave, d in zip(ids, dimensoes) if d != dimensao]
+        ids = [chave for chave, d in zip(ids, dimensoes) if d == dimensao]
+    return {"ids": ids, **empacotar_vetores([vetores_por_id[chave] for chave in ids])}, ignorados
+
+
+def distancias(consultas: np.ndarray, galeria: dict, metrica: str = "cosine") -> np.ndarray:
+    """
+    Distancias (K, G) entre as consultas (K, D) e a galeria empacotada.
+    """
+    consultas = np.atleast_2d(np.asarray(consultas, dtype=np.float32))
+    matriz, normas = galeria["matriz"], galeria["normas"]
+    if matriz.shape[0] == 0:
+        return np.zeros((len(consultas), 0), dtype=np.float32)
+
+    produto = consultas @ matriz.T
+    if metrica == "cosine":
+        normas_consultas = np.linalg.norm(consultas, axis=1)
+        divisor = np.maximum(normas_consultas[:, None] * normas[None, :], 1e-12)
+        return 1.0 - produto / divisor
+    if metrica == "euclidean":
+        # |q - g|^2 = |q|^2 + |g|^2 - 2 q.g (clip por arredondamento)
+        quadrados = (consultas ** 2).sum(axis=1)[:, None] + (normas ** 2)[None, :] - 2 * produto
+        return np.sqrt(np.maximum(quadrados, 0.0))
+    raise ValueError(f"Metrica desconhecida: {metrica}")
+
+
+def mais_proximos(consultas: np.ndarray, galeria: dict, metrica: str = "cosine", k: int = 1) -> tuple:
+    """
+    Os k cadastros mais proximos de cada consulta.
+
+    Retorna: (indices (K, k), distancias (K, k)), do mais proximo ao mais distante
+    """
+    todas = distancias(consultas, galeria, metrica)
+    k = min(k, todas.shape[1])
+    if k == 0:
+        vazio = np.zeros((len(todas), 0))
+        return vazio.astype(np.int64), vazio
+    if k < todas.shape[1]:
+        candidatos = np.argpartition(todas, k - 1, axis=1)[:, :k]
+    else:
+        candidatos = np.tile(np.arange(todas.shape[1]), (len(todas), 1))
+    valores = np.take_along_axis(todas, candidatos, axis=1)
+    ordem = np.argsort(valores, axis=1, kind="stable")
+    return np.take_along_axis(candidatos, ordem, axis=1), np.take_along_axis(valores, ordem, axis=1)
@@ -0,0 +1,608 @@
+import { BaseCommand, flags } from '@adonisjs/core/ace'
+import { CommandOptions } from '@adonisjs/core/types/ace'
+import { readFile, readdir, writeFile, mkdir } from 'node:fs/promises'
+import { dirname, join } from 'node:path'
+import { performance } from 'node:perf_hooks'
+import os from 'node:os'
+import pg from 'pg'
+import { DateTime } from 'luxon'
+
+/**
+ * Benchmark do motor de cálculo de ponto
+ *
+ * Cria (ou recria) um município sintético apontando para o banco central, com
+ * o schema de schema_municipio.sql + migrações numeradas, gera N funcionários
+ * x M meses de marcações (jornadas de 40h, 6h corridas, plantão 12x36 e 24x72,
+ * faltas, atrasos, esquecimentos, folgas programadas e feriados) e mede os
+ * caminhos quentes:
+ *
+ * - calculoPontoService.calcularEspelho (amostra de funcionários)
+ * - calculoPontoService.processarPeriodo (cada mês)
+ * - RelatorioService.gerarFrequencia (cada mês)
+ * - EspelhoPontoService.gerarPDF (amostra de funcionários)
+ *
+ * O resultado (tempos, consultas e pico de memória de cada etapa) é gravado
+ * em JSON para comparar execuções. A massa é determinística pela semente.
+ *
+ * O município sintético é cadastrado como inativo (SUSPENSO, ativo = false):
+ * não aparece nas listagens nem nas rotinas agendadas; o comando usa um pool
+ * próprio para ele. Com NODE_ENV=production só roda com --confirmar-producao
+ * (o schema sintético é criado e apagado no banco central).
+ *
+ * Uso: node ace benchmark:calculo_ponto --funcionarios=500 --meses=3
+ */
+
+const SCHEMA = 'benchmark_calculo'
+const SLUG = 'benchmark-calculo'
+const ZONA = 'America/Sao_Paulo'
+
+/** Linhas por INSERT na geração da massa */
+const LOTE_INSERCAO = 20000
+
+/**
+ * Colunas e tabelas que os municípios em produção têm e o schema_municipio.sql
+ * não cria (usadas pelo cálculo e pelas migrações numeradas)
+ */
+const SQL_COMPATIBILIDADE = `
+ALTER TABLE registros_ponto ADD COLUMN IF NOT EXISTS sentido VARCHAR(10);
+CREATE TABLE IF NOT EXISTS configuracoes (
+    chave VARCHAR(100) PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS folgas_programadas (
+    id SERIAL PRIMARY KEY,
+    funcionario_id INTEGER NOT NULL REFERENCES funcionarios(id),
+    data DATE NOT NULL,
+    tipo VARCHAR(20) DEFAULT 'FOLGA',
+    motivo VARCHAR(500),
+    created_by INTEGER,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_folgas_programadas_funcionario_data ON folgas_programadas(funcionario_id, data);
+CREATE TABLE IF NOT EXISTS plantoes (
+    id SERIAL PRIMARY KEY,
+    funcionario_id INTEGER NOT NULL REFERENCES funcionarios(id),
+    data DATE NOT NULL,
+    turno VARCHAR(20),
+    substituido_por INTEGER,
+    motivo_alteracao VARCHAR(500),
+    status VARCHAR(20),
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+`
+
+interface DefinicaoJornada {
+    codigo: string
+    nome: string
+    tipo: 'NORMAL' | 'PLANTAO'
+    carga: number
+    semanal: number
+    marcacoes: number
+    plantao: number | null
+    folga: number | null
+    /** [início, duração] em minutos desde a meia-noite */
+    turnos: Array<[number, number]>
+    /** Fração dos funcionários nesta jornada */
+    proporcao: number
+}
+
+/** Jornadas da massa sintética */
+const JORNADAS: DefinicaoJornada[] = [
+    { codigo: 'BENCH-40H', nome: 'Administrativo 40h', tipo: 'NORMAL', carga: 480, semanal: 2400, marcacoes: 4, plantao: null, folga: null, turnos: [[480, 240], [780, 240]], proporcao: 0.6 },
+    { codigo: 'BENCH-30H', nome: 'Corrido 6h', tipo: 'NORMAL', carga: 360, semanal: 1800, marcacoes: 2, plantao: null, folga: null, turnos: [[420, 360]], proporcao: 0.15 },
+    { codigo: 'BENCH-12X36', nome: 'Plantão 12x36', tipo: 'PLANTAO', carga: 720, semanal: 2520, marcacoes: 2, plantao: 12, folga: 36, turnos: [[420, 720]], proporcao: 0.15 },
+    { codigo: 'BENCH-24X72', nome: 'Plantão 24x72', tipo: 'PLANTAO', carga: 1440, semanal: 2520, marcacoes: 2, plantao: 24, folga: 72, turnos: [[420, 1440]], proporcao: 0.1 },
+]
+
+/** Feriados nacionais de data fixa (MM-DD) */
+const FERIADOS_NACIONAIS: Array<[string, string]> = [
+    ['01-01', 'Confraternização Universal'],
+    ['04-21', 'Tiradentes'],
+    ['05-01', 'Dia do Trabalho'],
+    ['09-07', 'Independência do Brasil'],
+    ['10-12', 'Nossa Senhora Aparecida'],
+    ['11-02', 'Finados'],
+    ['11-15', 'Proclamação da República'],
+    ['11-20', 'Dia da Consciência Negra'],
+    ['12-25', 'Natal'],
+]
+
+interface Medicao {
+    etapa: string
+    execucoes: number
+    total_ms: number
+    media_ms: number
+    min_ms: number
+    max_ms: number
+    p95_ms: number
+    consultas: number
+    consultas_por_execucao: number
+    comandos_controle: number
+    pico_heap_mb: number
+    pico_rss_mb: number
+    erro?: string
+}
+
+/** Gerador pseudoaleatório com semente (mulberry32) */
+function gerador(semente: number): () => number {
+    let a = semente >>> 0
+    return () => {
+        a = (a + 0x6d2b79f5) >>> 0
+        let t = a
+        t = Math.imul(t ^ (t >>> 15), t | 1)
+        t ^= t + Math.imul(t ^ (t >>> 7), t | 61)
+        return ((t ^ (t >>> 14)) >>> 0) / 4294967296
+    }
+}
+
+function arredondar(valor: number, casas = 2): number {
+    const fator = 10 ** casas
+    return Math.round(valor * fator) / fator
+}
+
+export default class BenchmarkCalculoPonto extends BaseCommand {
+    static commandName = 'benchmark:calculo_ponto'
+    static description = 'Gera um município sintético e mede o cálculo de espelhos, relatórios e PDF'
+
+    static options: CommandOptions = {
+        startApp: true,
+    }
+
+    @flags.number({ description: 'Quantidade de funcionários', default: 200 })
+    declare funcionarios: number
+
+    @flags.number({ description: 'Meses completos medidos (anteriores ao mês atual)', default: 3 })
+    declare meses: number
+
+    @flags.number({ description: 'Semente da massa sintética', default: 42 })
+    declare semente: number
+
+    @flags.number({ description: 'Funcionários medidos em calcularEspelho e gerarPDF', default: 50 })
+    declare amostra: number
+
+    @flags.string({ description: 'Arquivo JSON de saída (padrão: tmp/benchmarks/calculo_ponto_<data>.json)' })
+    declare saida?: string
+
+    @flags.boolean({ description: 'Mantém o município e o schema sintéticos ao final' })
+    declare manter?: boolean
+
+    @flags.boolean({ description: 'Permite rodar com NODE_ENV=production (usa o banco central)' })
+    declare confirmarProducao?: boolean
+
+    /** Contadores de consultas (todas as conexões pg do processo) */
+    private consultas = 0
+    private comandosControle = 0
+
+    async run() {
+        if (this.app.inProduction && !this.confirmarProducao) {
+            this.logger.error(
+                'NODE_ENV=production: o benchmark cria um município e um schema no banco central. ' +
+                    'Use --confirmar-producao para rodar mesmo assim'
+            )
+            this.exitCode = 1
+            return
+        }
+
+        const { dbManager, default: DatabaseManagerService } = await import('#services/database_manager_service')
+
+        this.instrumentarConsultas()
+
+        // Meses completos anteriores ao atual (o cálculo corta o mês corrente em "hoje")
+        const mesAtual = DateTime.now().setZone(ZONA).startOf('month')
+        const periodos = Array.from({ length: this.meses }, (_, i) => mesAtual.minus({ months: this.meses - i }))
+
+        this.logger.info(`Preparando município sintético (${this.funcionarios} funcionários, ${this.meses} meses)`)
+        const municipioId = await this.registrarMunicipio(dbManager)
+        await dbManager.removePoolMunicipio(municipioId)
+        // Município inativo: o cadastro não abre pool para ele
+        dbManager.registrarPoolMunicipio(municipioId, DatabaseManagerService.createCentralPool(), SCHEMA)
+
+        let resultado: Record<string, unknown>
+        try {
+            const avisos = await this.criarSchema(DatabaseManagerService)
+            const inicioGeracao = performance.now()
+            const massa = await this.gerarMassa(dbManager, municipioId, periodos)
+            const geracaoMs = arredondar(performance.now() - inicioGeracao)
+            this.logger.info(`Massa gerada: ${massa.registros} registros de ponto`)
+
+            const medicoes = await this.medirCaminhos(municipioId, periodos, massa.amostra)
+
+            resultado = {
+                versao: 1,
+                data: DateTime.now().toISO(),
+                ambiente: {
+                    node: process.version,
+                    plataforma: `${os.platform()} ${os.arch()}`,
+                    cpus: os.cpus().length,
+                    calculo_threads: process.env.CALCULO_THREADS ?? null,
+                },
+                parametros: {
+                    funcionarios: this.funcionarios,
+                    meses: this.meses,
+                    semente: this.semente,
+                    amostra: massa.amostra.length,
+                },
+                massa: {
+                    periodos: periodos.map((p) => p.toFormat('yyyy-MM')),
+                    funcionarios: massa.funcionarios,
+                    por_jornada: massa.porJornada,
+                    registros: massa.registros,
+                    faltas: massa.faltas,
+                    folgas_programadas: massa.folgas,
+                    feriados: massa.feriados,
+                    geracao_ms: geracaoMs,
+                },
+                avisos,
+                medicoes,
+            }
+        } finally {
+            await dbManager.removePoolMunicipio(municipioId)
+            if (!this.manter) {
+                await this.removerMunicipio(dbManager, DatabaseManagerService, municipioId)
+            }
+        }
+
+        const arquivo = this.saida
+            ?? join('tmp', 'benchmarks', `calculo_ponto_${DateTime.now().toFormat('yyyyMMdd_HHmmss')}.json`)
+        await mkdir(dirname(arquivo), { recursive: true })
+        await writeFile(arquivo, JSON.stringify(resultado, null, 2))
+
+        for (const medicao of resultado.medicoes as Medicao[]) {
+            const linha = `${medicao.etapa}: ${medicao.media_ms} ms/exec (${medicao.execucoes}x), `
+                + `${medicao.consultas_por_execucao} consultas/exec, pico ${medicao.pico_rss_mb} MB`
+            if (medicao.erro) this.logger.error(`${linha} - ${medicao.erro}`)
+            else this.logger.info(linha)
+        }
+        this.logger.success(`Resultado gravado em ${arquivo}`)
+    }
+
+    /**
+     * Conta as consultas de todos os clientes pg (pool do município e central).
+     * SET search_path / BEGIN / COMMIT / ROLLBACK são contados à parte.
+     */
+    private instrumentarConsultas() {
+        const prototipo = pg.Client.prototype as any
+        const original = prototipo.query
+        const comando = this
+        prototipo.query = function (this: unknown, ...args: any[]) {
+            const texto = typeof args[0] === 'string' ? args[0] : args[0]?.text ?? ''
+            if (/^\s*(SET search_path|BEGIN|COMMIT|ROLLBACK)\b/i.test(texto)) comando.comandosControle++
+            else comando.consultas++
+            return original.apply(this, args)
+        }
+    }
+
+    /**
+     * Cadastra (ou atualiza) o município sintético no banco central, inativo,
+     * com conexão para o próprio banco central
+     */
+    private async registrarMunicipio(dbManager: any): Promise<number> {
+        const [municipio] = await dbManager.queryCentral(
+            `INSERT INTO municipios
+               (codigo_ibge, nome, uf, slug, db_host, db_port, db_name, db_user, db_password, db_schema,
+                status, status_mensagem, ativo, created_at, updated_at)
+             VALUES ('9999999', 'Benchmark Cálculo de Ponto', 'SP', $1, $2, $3, $4, $5, $6, $7,
+                     'SUSPENSO', 'Município sintético do benchmark:calculo_ponto', false, NOW(), NOW())
+             ON CONFLICT (slug) DO UPDATE SET
+               db_host = EXCLUDED.db_host, db_port = EXCLUDED.db_port, db_name = EXCLUDED.db_name,
+               db_user = EXCLUDED.db_user, db_password = EXCLUDED.db_password, db_schema = EXCLUDED.db_schema,
+               status = 'SUSPENSO', status_mensagem = EXCLUDED.status_mensagem, ativo = false, updated_at = NOW()
+             RETURNING id`,
+            [
+                SLUG,
+                process.env.DB_HOST,
+                parseInt(process.env.DB_PORT || '5432'),
+                process.env.DB_DATABASE,
+                process.env.DB_USER,
+                process.env.DB_PASSWORD ?? null,
+                SCHEMA,
+            ]
+        )
+        return municipio.id
+    }
+
+    /**
+     * Recria o schema: schema_municipio.sql, compatibilidade e migrações numeradas.
+     * Migrações que falham viram avisos no resultado.
+     */
+    private async criarSchema(DatabaseManagerService: any): Promise<string[]> {
+        const pasta = join(process.cwd(), 'database', 'migrations', 'tenant')
+        const migracoes = (await readdir(pasta)).filter((arquivo) => /^\d{3}_.*\.sql$/.test(arquivo)).sort()
+        const avisos: string[] = []
+
+        const pool = DatabaseManagerService.createCentralPool()
+        const client = await pool.connect()
+        try {
+            await client.query(`DROP SCHEMA IF EXISTS ${SCHEMA} CASCADE`)
+            await client.query(`CREATE SCHEMA ${SCHEMA}`)
+            await client.query(`SET search_path TO ${SCHEMA}`)
+            await client.query(await readFile(join(pasta, 'schema_municipio.sql'), 'utf-8'))
+            await client.query(SQL_COMPATIBILIDADE)
+
+            for (const migracao of migracoes) {
+                try {
+                    await client.query(await readFile(join(pasta, migracao), 'utf-8'))
+                } catch (error: any) {
+                    avisos.push(`${migracao}: ${error.message}`)
+                    this.logger.warning(`Migração ${migracao} falhou: ${error.message}`)
+                }
+            }
+            await client.query('SET search_path TO public')
+        } finally {
+            client.release()
+            await pool.end()
+        }
+        return avisos
+    }
+
+    private async removerMunicipio(dbManager: any, DatabaseManagerService: any, municipioId: number) {
+        const pool = DatabaseManagerService.createCentralPool()
+        try {
+            await pool.query(`DROP SCHEMA IF EXISTS ${SCHEMA} CASCADE`)
+        } finally {
+            await pool.end()
+        }
+        await dbManager.queryCentral(`DELETE FROM municipios WHERE id = $1`, [municipioId])
+    }
+
+    /**
+     * Gera jornadas, funcionários, feriados, folgas e marcações do mês anterior
+     * ao primeiro período até o dia seguinte ao último (referência do plantão
+     * e turno que cruza o fechamento)
+     */
+    private async gerarMassa(dbManager: any, municipioId: number, periodos: DateTime[]) {
+        const sortear = gerador(this.semente)
+        const inicio = periodos[0].minus({ months: 1 })
+        const fim = periodos[periodos.length - 1].endOf('month').plus({ days: 1 }).startOf('day')
+
+        // Jornadas e horários
+        const jornadas: Array<{ id: number; definicao: DefinicaoJornada }> = []
+        for (const definicao of JORNADAS) {
+            const [jornada] = await dbManager.queryMunicipio(
+                municipioId,
+                `INSERT INTO jornadas (codigo, nome, tipo, carga_horaria_diaria, carga_horaria_semanal,
+                                       horas_plantao, horas_folga, tem_intervalo, duracao_intervalo, marcacoes_dia)
+                 VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10) RETURNING id`,
+                [
+                    definicao.codigo, definicao.nome, definicao.tipo, definicao.carga, definicao.semanal,
+                    definicao.plantao, definicao.folga, definicao.turnos.length > 1,
+                    definicao.turnos.length > 1 ? 60 : 0, definicao.marcacoes,
+                ]
+            )
+            const hora = (minutos: number) =>
+                `${String(Math.floor(minutos / 60) % 24).padStart(2, '0')}:${String(minutos % 60).padStart(2, '0')}`
+            const [turno1, turno2] = definicao.turnos
+            for (let diaSemana = 0; diaSemana <= 6; diaSemana++) {
+                const folga = definicao.tipo === 'NORMAL' && (diaSemana === 0 || diaSemana === 6)
+                await dbManager.queryMunicipio(
+                    municipioId,
+                    `INSERT INTO jornada_horarios (jornada_id, dia_semana, entrada_1, saida_1, entrada_2, saida_2, folga)
+                     VALUES ($1, $2, $3, $4, $5, $6, $7)`,
+                    [
+                        jornada.id, diaSemana,
+                        folga ? null : hora(turno1[0]), folga ? null : hora(turno1[0] + turno1[1]),
+                        folga || !turno2 ? null : hora(turno2[0]), folga || !turno2 ? null : hora(turno2[0] + turno2[1]),
+                        folga,
+                    ]
+                )
+            }
+            jornadas.push({ id: jornada.id, definicao })
+        }
+
+        // Feriados nacionais dos anos da massa
+        const feriados = new Set<string>()
+        for (let ano = inicio.year; ano <= fim.year; ano++) {
+            for (const [diaMes, nome] of FERIADOS_NACIONAIS) {
+                const data = `${ano}-${diaMes}`
+                if (data < inicio.toISODate()! || data > fim.toISODate()!) continue
+                feriados.add(data)
+                await dbManager.queryMunicipio(
+                    municipioId,
+                    `INSERT INTO feriados (data, nome, tipo, recorrente) VALUES ($1, $2, 'NACIONAL', false)`,
+                    [data, nome]
+                )
+            }
+        }
+
+        // Funcionários: jornada pela proporção, na ordem
+        const distribuicao: number[] = []
+        for (let i = 0; i < this.funcionarios; i++) {
+            const fracao = i / this.funcionarios
+            let acumulado = 0
+            distribuicao.push(JORNADAS.findIndex((j) => (acumulado += j.proporcao) > fracao))
+        }
+        const ids: number[] = []
+        for (let i = 0; i < this.funcionarios; i += LOTE_INSERCAO) {
+            const indices = Array.from({ length: Math.min(LOTE_INSERCAO, this.funcionarios - i) }, (_, k) => i + k)
+            const inseridos = await dbManager.queryMunicipio(
+                municipioId,
+                `INSERT INTO funcionarios (matricula, cpf, pis, nome, sexo, jornada_id, data_admissao, ativo)
+                 SELECT u.*, true
+                 FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::text[], $6::int[], $7::date[]) AS u
+                 RETURNING id`,
+                [
+                    indices.map((k) => `B${String(k + 1).padStart(6, '0')}`),
+                    indices.map((k) => String(90000000000 + k)),
+                    indices.map((k) => String(10000000000 + k)),
+                    indices.map((k) => `Funcionário Sintético ${k + 1}`),
+                    indices.map((k) => (k % 2 === 0 ? 'F' : 'M')),
+                    indices.map((k) => jornadas[distribuicao[k]].id),
+                    indices.map(() => inicio.minus({ years: 1 }).toISODate()),
+                ]
+            )
+            ids.push(...inseridos.map((f: { id: number }) => f.id))
+        }
+
+        // Marcações
+        let registros = 0
+        let faltas = 0
+        const folgas: Array<[number, string]> = []
+        const lote = { funcionarios: [] as number[], datas: [] as string[], sentidos: [] as string[] }
+        const gravarLote = async () => {
+            if (lote.funcionarios.length === 0) return
+            await dbManager.queryMunicipio(
+                municipioId,
+                `INSERT INTO registros_ponto (funcionario_id, data_hora, tipo, sentido, origem)
+                 SELECT f, d, s, s, 'EQUIPAMENTO' FROM unnest($1::int[], $2::timestamptz[], $3::text[]) AS r(f, d, s)`,
+                [lote.funcionarios, lote.datas, lote.sentidos]
+            )
+            registros += lote.funcionarios.length
+            lote.funcionarios = []
+            lote.datas = []
+            lote.sentidos = []
+        }
+
+        const variacao = () => Math.round((sortear() - 0.5) * 16) // ±8 minutos
+        const totalDias = Math.round(fim.diff(inicio, 'days').days)
+        for (let i = 0; i < ids.length; i++) {
+            const definicao = jornadas[distribuicao[i]].definicao
+            const ciclo = definicao.plantao && definicao.folga ? (definicao.plantao + definicao.folga) / 24 : 0
+            const deslocamento = ciclo ? i % ciclo : 0
+
+            for (let d = 0; d < totalDias; d++) {
+                const dia = inicio.plus({ days: d })
+                if (ciclo) {
+                    if ((d - deslocamento) % ciclo !== 0) continue
+                } else if (dia.weekday > 5 || feriados.has(dia.toISODate()!)) {
+                    continue
+                }
+
+                const sorteio = sortear()
+                if (sorteio < 0.03) {
+                    faltas++
+                    continue
+                }
+                if (!ciclo && sorteio < 0.04) {
+                    folgas.push([ids[i], dia.toISODate()!])
+                    continue
+                }
+                const atraso = sorteio > 0.9 ? 15 + Math.floor(sortear() * 30) : 0
+
+                const marcacoes: Array<[number, string]> = []
+                definicao.turnos.forEach(([entrada, duracao], turno) => {
+                    marcacoes.push([entrada + (turno === 0 ? atraso : 0) + variacao(), 'ENTRADA'])
+                    marcacoes.push([entrada + duracao + variacao(), 'SAIDA'])
+                })
+                // Esquecimento de marcação (saída do almoço)
+                if (marcacoes.length > 2 && sortear() < 0.02) marcacoes.splice(1, 1)
+
+                for (const [minutos, sentido] of marcacoes) {
+                    lote.funcionarios.push(ids[i])
+                    lote.datas.push(dia.plus({ minutes: minutos }).toISO()!)
+                    lote.sentidos.push(sentido)
+                }
+                if (lote.funcionarios.length >= LOTE_INSERCAO) await gravarLote()
+            }
+        }
+        await gravarLote()
+
+        for (let i = 0; i < folgas.length; i += LOTE_INSERCAO) {
+            const parte = folgas.slice(i, i + LOTE_INSERCAO)
+            await dbManager.queryMunicipio(
+                municipioId,
+                `INSERT INTO folgas_programadas (funcionario_id, data, tipo, motivo)
+                 SELECT f, d, 'FOLGA', 'Benchmark' FROM unnest($1::int[], $2::date[]) AS r(f, d)`,
+                [parte.map(([f]) => f), parte.map(([, d]) => d)]
+            )
+        }
+
+        await dbManager.queryMunicipio(municipioId, `ANALYZE`)
+
+        // Amostra espalhada pelas jornadas
+        const passo = Math.max(1, Math.floor(ids.length / Math.max(1, this.amostra)))
+        const amostra = ids.filter((_, i) => i % passo === 0).slice(0, this.amostra)
+
+        return {
+            funcionarios: ids.length,
+            porJornada: Object.fromEntries(
+                JORNADAS.map((j, k) => [j.codigo, distribuicao.filter((indice) => indice === k).length])
+            ),
+            registros,
+            faltas,
+            folgas: folgas.length,
+            feriados: feriados.size,
+            amostra,
+        }
+    }
+
+    private async medirCaminhos(municipioId: number, periodos: DateTime[], amostra: number[]): Promise<Medicao[]> {
+        const { calculoPontoService } = await import('#services/calculo_ponto_service')
+        const { default: RelatorioService } = await import('#services/relatorio_service')
+        const { default: EspelhoPontoService } = await import('#services/espelho_ponto_service')
+        const ultimo = periodos[periodos.length - 1]
+        const medicoes: Medicao[] = []
+
+        this.logger.info('Medindo calcularEspelho')
+        medicoes.push(await this.medir('calcularEspelho', amostra.length, (i) =>
+            calculoPontoService.calcularEspelho(municipioId, amostra[i], ultimo.month, ultimo.year)))
+
+        this.logger.info('Medindo processarPeriodo')
+        medicoes.push(await this.medir('processarPeriodo', periodos.length, (i) =>
+            calculoPontoService.processarPeriodo(municipioId, periodos[i].month, periodos[i].year)))
+
+        this.logger.info('Medindo gerarFrequencia')
+        medicoes.push(await this.medir('gerarFrequencia', periodos.length, (i) =>
+            RelatorioService.gerarFrequencia(municipioId, periodos[i].month, periodos[i].year)))
+
+        this.logger.info('Medindo gerarPDF')
+        medicoes.push(await this.medir('gerarPDF', amostra.length, (i) =>
+            EspelhoPontoService.gerarPDF(municipioId, amostra[i], ultimo.month, ultimo.year)))
+
+        return medicoes
+    }
+
+    /**
+     * Executa uma etapa N vezes em sequência medindo tempo de cada execução,
+     * consultas e pico de memória (amostrado a cada 5 ms). Um erro interrompe
+     * a etapa e fica registrado no resultado.
+     */
+    private async medir(etapa: string, execucoes: number, executar: (i: number) => Promise<unknown>): Promise<Medicao> {
+        ;(globalThis as any).gc?.()
+        const consultasAntes = this.consultas
+        const controleAntes = this.comandosControle
+        let picoHeap = 0
+        let picoRss = 0
+        const amostrarMemoria = () => {
+            const memoria = process.memoryUsage()
+            picoHeap = Math.max(picoHeap, memoria.heapUsed)
+            picoRss = Math.max(picoRss, memoria.rss)
+        }
+        amostrarMemoria()
+        const amostrador = setInterval(amostrarMemoria, 5)
+
+        const tempos: number[] = []
+        let erro: string | undefined
+        try {
+            for (let i = 0; i < execucoes; i++) {
+                const inicio = performance.now()
+                await executar(i)
+                tempos.push(performance.now() - inicio)
+            }
+        } catch (error: any) {
+            erro = error.message
+        } finally {
+            clearInterval(amostrador)
+            amostrarMemoria()
+        }
+
+        const ordenados = [...tempos].sort((a, b) => a - b)
+        const total = tempos.reduce((soma, tempo) => soma + tempo, 0)
+        const consultas = this.consultas - consultasAntes
+        const mb = (bytes: number) => arredondar(bytes / 1024 / 1024, 1)
+        return {
+            etapa,
+            execucoes: tempos.length,
+            total_ms: arredondar(total),
+            media_ms: tempos.length ? arredondar(total / tempos.length) : 0,
+            min_ms: arredondar(ordenados[0] ?? 0),
+            max_ms: arredondar(ordenados[ordenados.length - 1] ?? 0),
+            p95_ms: arredondar(ordenados[Math.min(ordenados.length - 1, Math.floor(ordenados.length * 0.95))] ?? 0),
+            consultas,
+            consultas_por_execucao: tempos.length ? arredondar(consultas / tempos.length, 1) : consultas,
+            comandos_controle: this.comandosControle - controleAntes,
+            pico_heap_mb: mb(picoHeap),
+            pico_rss_mb: mb(picoRss),
+            ...(erro ? { erro } : {}),
+        }
+    }
+}
@@ -0,0 +1,72 @@
+import { BaseCommand, flags } from '@adonisjs/core/ace'
+import { CommandOptions } from '@adonisjs/core/types/ace'
+
+/**
+ * Compara os saldos materializados do banco de horas (banco_horas_saldo_atual)
+ * com a soma do histórico em banco_horas e, com --corrigir, refaz os saldos
+ * dos funcionários divergentes.
+ */
+export default class ConciliarBancoHoras extends BaseCommand {
+    static commandName = 'banco_horas:conciliar'
+    static description = 'Confere os saldos materializados do banco de horas contra o histórico'
+
+    static options: CommandOptions = {
+        startApp: true,
+    }
+
+    @flags.number({ description: 'Somente este município (id)' })
+    declare municipio?: number
+
+    @flags.boolean({ description: 'Refaz os saldos dos funcionários divergentes' })
+    declare corrigir?: boolean
+
+    async run() {
+        const { dbManager } = await import('#services/database_manager_service')
+        const { bancoHorasSaldoService } = await import('#services/banco_horas_saldo_service')
+
+        const municipios = await dbManager.queryCentral<{ id: number; nome: string }>(
+            this.municipio
+                ? `SELECT id, nome FROM municipios WHERE id = $1`
+                : `SELECT id, nome FROM municipios WHERE ativo = true ORDER BY nome`,
+            this.municipio ? [this.municipio] : []
+        )
+
+        let totalDivergentes = 0
+        for (const municipio of municipios) {
+            try {
+                const divergencias = await bancoHorasSaldoService.divergencias(municipio.id)
+                if (divergencias.length === 0) {
+                    this.logger.success(`✓ ${municipio.nome}: saldos conferem com o histórico`)
+                    continue
+                }
+
+                totalDivergentes += divergencias.length
+                this.logger.warning(`${municipio.nome}: ${divergencias.length} funcionário(s) divergente(s)`)
+                for (const d of divergencias.slice(0, 20)) {
+                    this.logger.info(
+                        `  funcionário ${d.funcionario_id}: materializado ${d.saldo_materializado} min, ` +
+                            `histórico ${d.saldo_historico} min (diferença ${d.saldo_materializado - d.saldo_historico})`
+                    )
+                }
+                if (divergencias.length > 20) {
+                    this.logger.info(`  ... e mais ${divergencias.length - 20}`)
+                }
+
+                if (this.corrigir) {
+                    const refeitos = await bancoHorasSaldoService.reconstruir(
+                        municipio.id,
+                        divergencias.map((d) => d.funcionario_id)
+                    )
+                    this.logger.success(`✓ ${municipio.nome}: saldos de ${refeitos} funcionário(s) refeitos`)
+                }
+            } catch (error: any) {
+                this.logger.error(`✗ ${municipio.nome}: ${error.message}`)
+            }
+        }
+
+        if (totalDivergentes > 0 && !this.corrigir) {
+            this.logger.info('Use --corrigir para refazer os saldos divergentes')
+            this.exitCode = 1
+        }
+    }
+}
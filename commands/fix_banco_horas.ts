@@ -13,6 +13,7 @@ export default class FixBancoHoras extends BaseCommand {
 
     async run() {
         const { default: db } = await import('@adonisjs/lucid/services/db')
+        const { bancoHorasSaldoService } = await import('#services/banco_horas_saldo_service')
 
         this.logger.info('Recriando tabela banco_horas...')
 
@@ -33,7 +34,10 @@ export default class FixBancoHoras extends BaseCommand {
                 try {
                     await db.rawQuery(`SET search_path TO ${schema}, public`)
                     await db.rawQuery(sql)
-                    this.logger.success(`✓ ${municipio.nome}`)
+
+                    // Tabela recriada: saldos materializados refeitos a partir dela
+                    const total = await bancoHorasSaldoService.reconstruir(municipio.id)
+                    this.logger.success(`✓ ${municipio.nome} (saldos de ${total} funcionário(s) refeitos)`)
                 } catch (error: any) {
                     this.logger.error(`✗ ${municipio.nome}: ${error.message}`)
                 }
@@ -11,6 +11,7 @@ export default class FixBancoHorasFinal extends BaseCommand {
 
     async run() {
         const { default: db } = await import('@adonisjs/lucid/services/db')
+        const { bancoHorasSaldoService } = await import('#services/banco_horas_saldo_service')
 
         this.logger.info('=== FIX FINAL BANCO DE HORAS ===\n')
 
@@ -72,6 +73,10 @@ export default class FixBancoHorasFinal extends BaseCommand {
           `)
 
                     this.logger.success(`✓ ${municipio.nome} - Colunas: ${columns.rows.map((c: any) => c.column_name).join(', ')}`)
+
+                    // Tabela recriada: saldos materializados refeitos a partir dela
+                    const total = await bancoHorasSaldoService.reconstruir(municipio.id)
+                    this.logger.info(`Saldos materializados refeitos (${total} funcionário(s))`)
                 } catch (error: any) {
                     this.logger.error(`✗ ${municipio.nome}: ${error.message}`)
                 }
@@ -0,0 +1,37 @@
+-- Processamentos de período (fechamento do mês em segundo plano)
+CREATE TABLE IF NOT EXISTS processamentos_periodo (
+    id SERIAL PRIMARY KEY,
+    mes INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+    ano INTEGER NOT NULL,
+    funcionario_ids INTEGER[],  -- NULL = todos os funcionários ativos
+
+    -- Status
+    status VARCHAR(20) NOT NULL DEFAULT 'PROCESSANDO' CHECK (status IN ('PROCESSANDO', 'CONCLUIDO', 'CANCELADO', 'ERRO')),
+    concorrencia INTEGER NOT NULL DEFAULT 4,
+    erro TEXT,
+
+    -- Progresso
+    total INTEGER DEFAULT 0,
+    processados INTEGER DEFAULT 0,
+    erros INTEGER DEFAULT 0,
+
+    -- Controle
+    usuario_id INTEGER,
+    iniciado_em TIMESTAMPTZ DEFAULT NOW(),
+    concluido_em TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_processamentos_periodo_periodo ON processamentos_periodo(ano, mes);
+
+-- Checkpoint: funcionários já processados (a retomada pula os que estão OK)
+CREATE TABLE IF NOT EXISTS processamentos_periodo_itens (
+    processamento_id INTEGER NOT NULL REFERENCES processamentos_periodo(id) ON DELETE CASCADE,
+    funcionario_id INTEGER NOT NULL,
+    status VARCHAR(10) NOT NULL CHECK (status IN ('OK', 'ERRO')),
+    horas_trabalhadas INTEGER,  -- Em minutos
+    erro TEXT,
+    processado_em TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (processamento_id, funcionario_id)
+);
@@ -0,0 +1,9 @@
+-- Dias com marcações alteradas, aguardando a atualização incremental do espelho
+CREATE TABLE IF NOT EXISTS espelhos_dias_pendentes (
+    funcionario_id INTEGER NOT NULL,
+    data DATE NOT NULL,
+    marcado_em TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (funcionario_id, data)
+);
+
+CREATE INDEX IF NOT EXISTS idx_espelhos_dias_pendentes_marcado ON espelhos_dias_pendentes(marcado_em);
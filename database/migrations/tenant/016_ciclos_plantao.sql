@@ -0,0 +1,13 @@
+-- Referência da escala de plantão por funcionário e período: dia do último
+-- registro antes do mês, a partir do qual o ciclo (12x36, 24x72...) é contado
+CREATE TABLE IF NOT EXISTS ciclos_plantao (
+    funcionario_id INTEGER NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+    jornada_id INTEGER,  -- Jornada em vigor quando a referência foi gravada
+    data_referencia DATE,  -- NULL = sem registro anterior (ciclo começa no dia 1)
+    atualizado_em TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (funcionario_id, ano, mes)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ciclos_plantao_jornada ON ciclos_plantao(jornada_id);
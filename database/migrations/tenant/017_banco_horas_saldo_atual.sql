@@ -0,0 +1,33 @@
+-- Saldo materializado do banco de horas
+-- banco_horas_saldo passa a ser o fechamento mensal de cada funcionário
+-- (contadores do mês, variação líquida e saldo inicial/final acumulados) e
+-- banco_horas_saldo_atual o saldo corrente. Os dois são atualizados na mesma
+-- transação de cada movimentação em banco_horas (banco_horas_saldo_service).
+CREATE TABLE IF NOT EXISTS banco_horas_saldo (
+    id SERIAL PRIMARY KEY,
+    funcionario_id INTEGER NOT NULL REFERENCES funcionarios(id) ON DELETE CASCADE,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+    saldo_inicial INTEGER DEFAULT 0,
+    creditos INTEGER DEFAULT 0,
+    debitos INTEGER DEFAULT 0,
+    compensacoes INTEGER DEFAULT 0,
+    pagamentos INTEGER DEFAULT 0,
+    saldo_final INTEGER DEFAULT 0,
+    fechado BOOLEAN DEFAULT false,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE(funcionario_id, ano, mes)
+);
+
+-- Efeito líquido das movimentações do mês no saldo (saldo_final - saldo_inicial)
+ALTER TABLE banco_horas_saldo ADD COLUMN IF NOT EXISTS variacao INTEGER DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS banco_horas_saldo_atual (
+    funcionario_id INTEGER PRIMARY KEY REFERENCES funcionarios(id) ON DELETE CASCADE,
+    saldo INTEGER NOT NULL DEFAULT 0,  -- Minutos (soma das variações mensais)
+    atualizado_em TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_banco_horas_saldo_atual_saldo ON banco_horas_saldo_atual(saldo);
+CREATE INDEX IF NOT EXISTS idx_banco_horas_funcionario_data ON banco_horas(funcionario_id, data);
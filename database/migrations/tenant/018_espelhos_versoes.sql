@@ -0,0 +1,11 @@
+-- Versão dos dados do espelho por funcionário e período: incrementada a cada
+-- marcação incluída, editada ou excluída que afeta o período (cache das
+-- telas de espelho, espelho_cache_service)
+CREATE TABLE IF NOT EXISTS espelhos_versoes (
+    funcionario_id INTEGER NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+    versao BIGINT NOT NULL DEFAULT 1,
+    alterado_em TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (funcionario_id, ano, mes)
+);
@@ -0,0 +1,55 @@
+-- Versão dos espelhos mantida pelo banco: toda inclusão, edição ou exclusão em
+-- registros_ponto sobe a versão do mês da marcação, do anterior e do seguinte
+-- (mesmos períodos de espelho_cache_service.registrarAlteracao), inclusive
+-- gravações que não passam pela atualização incremental. O schema vem da
+-- tabela do gatilho: gravações pelo banco central usam outro search_path.
+-- Executado como um comando só (espelho_cache_service), fora do
+-- schema_municipio.sql, que é dividido em ';'.
+CREATE OR REPLACE FUNCTION espelhos_versoes_registro()
+RETURNS TRIGGER AS $$
+DECLARE
+    -- Funções chamadas daqui dependeriam do search_path: o comando é montado aqui mesmo
+    comando TEXT := format(
+        'INSERT INTO %I.espelhos_versoes (funcionario_id, ano, mes)
+         SELECT $1, EXTRACT(YEAR FROM p)::int, EXTRACT(MONTH FROM p)::int
+         FROM generate_series($2 - INTERVAL ''1 month'', $2 + INTERVAL ''1 month'', INTERVAL ''1 month'') AS p
+         ON CONFLICT (funcionario_id, ano, mes) DO UPDATE SET
+           versao = espelhos_versoes.versao + 1,
+           alterado_em = NOW()',
+        TG_TABLE_SCHEMA
+    );
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        EXECUTE comando USING OLD.funcionario_id,
+            date_trunc('month', OLD.data_hora AT TIME ZONE 'America/Sao_Paulo');
+        RETURN NULL;
+    END IF;
+
+    EXECUTE comando USING NEW.funcionario_id,
+        date_trunc('month', NEW.data_hora AT TIME ZONE 'America/Sao_Paulo');
+    -- Marcação movida para outro funcionário ou mês: o período de origem também muda
+    IF TG_OP = 'UPDATE' AND (
+        OLD.funcionario_id IS DISTINCT FROM NEW.funcionario_id
+        OR date_trunc('month', OLD.data_hora AT TIME ZONE 'America/Sao_Paulo')
+           IS DISTINCT FROM date_trunc('month', NEW.data_hora AT TIME ZONE 'America/Sao_Paulo')
+    ) THEN
+        EXECUTE comando USING OLD.funcionario_id,
+            date_trunc('month', OLD.data_hora AT TIME ZONE 'America/Sao_Paulo');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Criado só uma vez: DROP/CREATE a cada verificação bloquearia registros_ponto
+DO $gatilho$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'trg_espelhos_versoes_registro' AND tgrelid = 'registros_ponto'::regclass
+    ) THEN
+        CREATE TRIGGER trg_espelhos_versoes_registro
+            AFTER INSERT OR UPDATE OR DELETE ON registros_ponto
+            FOR EACH ROW EXECUTE PROCEDURE espelhos_versoes_registro();
+    END IF;
+END
+$gatilho$;
@@ -0,0 +1,13 @@
+-- Um processamento de período por município, mesmo com vários servidores:
+-- só uma linha PROCESSANDO por vez (fechamento_periodo_service.iniciar).
+-- Sobras de processos interrompidos antes do índice ficam como ERRO.
+UPDATE processamentos_periodo
+SET status = 'ERRO', erro = 'Processamento interrompido', concluido_em = NOW(), updated_at = NOW()
+WHERE status = 'PROCESSANDO'
+AND id < (SELECT MAX(id) FROM processamentos_periodo WHERE status = 'PROCESSANDO');
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_processamentos_periodo_processando
+    ON processamentos_periodo ((true)) WHERE status = 'PROCESSANDO';
+
+-- Cancelamento pedido a outro servidor: lido no checkpoint de cada bloco
+ALTER TABLE processamentos_periodo ADD COLUMN IF NOT EXISTS cancelamento_solicitado BOOLEAN DEFAULT false;
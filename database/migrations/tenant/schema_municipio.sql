@@ -279,6 +279,79 @@ CREATE INDEX IF NOT EXISTS idx_espelhos_ponto_funcionario ON espelhos_ponto(func
 CREATE INDEX IF NOT EXISTS idx_espelhos_ponto_periodo ON espelhos_ponto(ano, mes);
 CREATE INDEX IF NOT EXISTS idx_espelhos_ponto_status ON espelhos_ponto(status);
 
+-- Processamentos de período (fechamento do mês em segundo plano)
+CREATE TABLE IF NOT EXISTS processamentos_periodo (
+    id SERIAL PRIMARY KEY,
+    mes INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+    ano INTEGER NOT NULL,
+    funcionario_ids INTEGER[],  -- NULL = todos os funcionários ativos
+
+    -- Status
+    status VARCHAR(20) NOT NULL DEFAULT 'PROCESSANDO' CHECK (status IN ('PROCESSANDO', 'CONCLUIDO', 'CANCELADO', 'ERRO')),
+    concorrencia INTEGER NOT NULL DEFAULT 4,
+    erro TEXT,
+
+    -- Progresso
+    total INTEGER DEFAULT 0,
+    processados INTEGER DEFAULT 0,
+    erros INTEGER DEFAULT 0,
+
+    -- Controle
+    usuario_id INTEGER,
+    iniciado_em TIMESTAMPTZ DEFAULT NOW(),
+    concluido_em TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_processamentos_periodo_periodo ON processamentos_periodo(ano, mes);
+
+-- Checkpoint: funcionários já processados (a retomada pula os que estão OK)
+CREATE TABLE IF NOT EXISTS processamentos_periodo_itens (
+    processamento_id INTEGER NOT NULL REFERENCES processamentos_periodo(id) ON DELETE CASCADE,
+    funcionario_id INTEGER NOT NULL,
+    status VARCHAR(10) NOT NULL CHECK (status IN ('OK', 'ERRO')),
+    horas_trabalhadas INTEGER,  -- Em minutos
+    erro TEXT,
+    processado_em TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (processamento_id, funcionario_id)
+);
+
+-- Dias com marcações alteradas, aguardando a atualização incremental do espelho
+CREATE TABLE IF NOT EXISTS espelhos_dias_pendentes (
+    funcionario_id INTEGER NOT NULL,
+    data DATE NOT NULL,
+    marcado_em TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (funcionario_id, data)
+);
+
+CREATE INDEX IF NOT EXISTS idx_espelhos_dias_pendentes_marcado ON espelhos_dias_pendentes(marcado_em);
+
+-- Referência da escala de plantão por funcionário e período: dia do último
+-- registro antes do mês, a partir do qual o ciclo (12x36, 24x72...) é contado
+CREATE TABLE IF NOT EXISTS ciclos_plantao (
+    funcionario_id INTEGER NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+    jornada_id INTEGER,  -- Jornada em vigor quando a referência foi gravada
+    data_referencia DATE,  -- NULL = sem registro anterior (ciclo começa no dia 1)
+    atualizado_em TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (funcionario_id, ano, mes)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ciclos_plantao_jornada ON ciclos_plantao(jornada_id);
+
+-- Versão dos dados do espelho por funcionário e período: incrementada a cada
+-- marcação incluída, editada ou excluída que afeta o período
+CREATE TABLE IF NOT EXISTS espelhos_versoes (
+    funcionario_id INTEGER NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+    versao BIGINT NOT NULL DEFAULT 1,
+    alterado_em TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (funcionario_id, ano, mes)
+);
+
 -- Feriados
 CREATE TABLE IF NOT EXISTS feriados (
     id SERIAL PRIMARY KEY,
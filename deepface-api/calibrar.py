@@ -0,0 +1,65 @@
+"""
+Calibracao do Threshold pela Linha de Comando
+=============================================
+
+Mesma analise de GET /galeria/analise (biometria_core/calibracao.py), lendo a
+galeria direto do disco, sem carregar o modelo nem subir o servico. Serve para
+escolher o DEEPFACE_THRESHOLD e encontrar cadastros duplicados ou proximos demais.
+
+Uso:
+    python calibrar.py --tenant 12
+    python calibrar.py --tenant 12 --far 0.001 0.0001 --threshold 0.6 --memoria-mb 256
+
+A saida e um JSON com a distribuicao das distancias entre pessoas diferentes,
+os limiares sugeridos por FAR alvo, os cadastros com outra pessoa abaixo do
+threshold e as provaveis duplicatas.
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(1, str(Path(__file__).resolve().parent.parent))
+from biometria_core import calibracao, vetores
+from biometria_core.armazenamento import ArmazemBinario
+from biometria_core.benchmark import imprimir
+from biometria_core.galerias import TENANT_PADRAO, diretorio_tenant
+
+
+def carregar_galeria(faces_dir: Path, tenant: str) -> tuple:
+    """Cadastros e galeria empacotada do tenant (aceita o cache antigo, com embeddings no JSON)"""
+    cadastros, brutos = ArmazemBinario(diretorio_tenant(faces_dir, tenant), "embeddings_cache").carregar()
+    embeddings = {chave: vetores.vetor_de_bytes(bruto) for chave, bruto in brutos.items() if chave in cadastros}
+    for chave, cadastro in cadastros.items():
+        if "embedding" in cadastro:
+            embeddings[chave] = cadastro["embedding"]
+    grade, ignorados = vetores.empacotar_por_id(embeddings)
+    if ignorados:
+        print(f"{len(ignorados)} faces de outro modelo ignoradas", file=sys.stderr)
+    return cadastros, grade
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--faces-dir", default="./faces")
+    parser.add_argument("--tenant", default=TENANT_PADRAO)
+    parser.add_argument("--far", type=float, nargs="+", default=list(calibracao.FARS_PADRAO))
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("DEEPFACE_THRESHOLD", "0.68")))
+    parser.add_argument("--duplicata", type=float, default=float(os.environ.get("DEEPFACE_LIMIAR_DUPLICATA", "0.4")))
+    parser.add_argument("--metrica", default="cosine", choices=["cosine", "euclidean"])
+    parser.add_argument("--memoria-mb", type=float, default=256, help="Memoria maxima de cada bloco de distancias")
+    parser.add_argument("--limite", type=int, default=50, help="Itens por lista (proximos, duplicatas)")
+    args = parser.parse_args()
+
+    cadastros, grade = carregar_galeria(Path(args.faces_dir), args.tenant)
+    resultado = calibracao.analisar_galeria(
+        grade, args.metrica, args.threshold, tuple(args.far), args.duplicata, args.memoria_mb, limite=args.limite
+    )
+    for item in resultado["proximos"]:
+        item["nome"] = cadastros.get(item["id"], {}).get("nome")
+    imprimir({"tenant": args.tenant, **resultado})
+
+
+if __name__ == "__main__":
+    main()
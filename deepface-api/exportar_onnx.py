@@ -0,0 +1,188 @@
+"""
+Exportacao do ArcFace para ONNX e Verificacao de Paridade
+=========================================================
+
+Gera o modelo usado pelo backend onnx (inferencia.py) a partir do mesmo
+modelo Keras que o DeepFace carrega, e compara os embeddings dos dois
+backends nas mesmas fotos. Precisa do ambiente completo (requirements.txt +
+requirements-onnx.txt + tf2onnx); o servico em producao so precisa do .onnx.
+
+Uso:
+    python exportar_onnx.py                          # gera modelos/arcface.onnx
+    python exportar_onnx.py --verificar faces/       # paridade com o TensorFlow
+
+A verificacao mede, para cada foto:
+- modelo: o mesmo tensor de entrada no Keras e no ONNX (isola a conversao)
+- ponta_a_ponta: detector + modelo de cada backend a partir da foto
+- decisoes: pares de fotos cuja decisao de match (distancia < threshold) muda
+e as latencias, a vazao e a memoria (RSS) de cada backend. Sai com codigo 1
+se a distancia de cosseno entre os embeddings passar da tolerancia.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(1, str(Path(__file__).resolve().parent.parent))
+from biometria_core.benchmark import imprimir, resumir
+from biometria_core.vetores import distancias, empacotar_vetores
+
+import inferencia
+
+EXTENSOES = {".jpg", ".jpeg", ".png"}
+
+
+def exportar(saida: Path, modelo: str, opset: int):
+    import tensorflow as tf
+    import tf2onnx
+    from deepface import DeepFace
+
+    cliente = DeepFace.build_model(modelo)
+    keras = getattr(cliente, "model", cliente)  # DeepFace >= 0.0.86 devolve um cliente com .model
+    _, altura, largura, canais = keras.input_shape
+    assinatura = (tf.TensorSpec((None, altura, largura, canais), tf.float32, name="entrada"),)
+
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    tf2onnx.convert.from_keras(keras, input_signature=assinatura, opset=opset, output_path=str(saida))
+    print(f"[Exportacao] {modelo} -> {saida} ({saida.stat().st_size / 1024 / 1024:.1f} MB)")
+
+
+def rss_mb() -> float:
+    """Pico de memoria do processo (Linux: ru_maxrss em KB)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def carregar_fotos(caminhos: list) -> dict:
+    fotos = {}
+    for caminho in caminhos:
+        caminho = Path(caminho)
+        arquivos = sorted(caminho.rglob("*")) if caminho.is_dir() else [caminho]
+        for arquivo in arquivos:
+            if arquivo.suffix.lower() in EXTENSOES:
+                # Mesmo caminho do base64_to_image do main.py (RGB)
+                fotos[str(arquivo)] = np.array(Image.open(arquivo).convert("RGB"))
+    return fotos
+
+
+def extrair_todas(extrator, fotos: dict) -> tuple:
+    """Embeddings (None sem face) e latencias em ms de cada foto"""
+    embeddings, latencias = {}, []
+    extrator.aquecer()
+    for nome, foto in fotos.items():
+        inicio = time.perf_counter()
+        try:
+            embeddings[nome] = np.asarray(extrator.extrair(foto), dtype=np.float32)
+        except Exception:
+            embeddings[nome] = None
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return embeddings, latencias
+
+
+def desempenho(latencias: list, rss: float) -> dict:
+    media = sum(latencias) / len(latencias)
+    return {**resumir(latencias), "fotos_por_segundo": round(1000 / media, 2) if media else None, "rss_mb": rss}
+
+
+def cosseno(a: np.ndarray, b: np.ndarray) -> float:
+    return float(distancias(a[None, :], empacotar_vetores([b]))[0, 0])
+
+
+def verificar(args) -> int:
+    fotos = carregar_fotos(args.verificar)
+    if not fotos:
+        print("Nenhuma foto encontrada", file=sys.stderr)
+        return 1
+
+    # ONNX primeiro: o RSS medido ainda nao inclui o TensorFlow
+    onnx = inferencia.criar_extrator("onnx", arquivo_modelo=args.modelo_onnx, threads=args.threads, provider=args.provider)
+    embeddings_onnx, latencias_onnx = extrair_todas(onnx, fotos)
+    rss_onnx = rss_mb()
+
+    tensorflow = inferencia.criar_extrator("tensorflow", modelo=args.modelo)
+    embeddings_tf, latencias_tf = extrair_todas(tensorflow, fotos)
+    rss_total = rss_mb()
+
+    # Mesmo tensor de entrada nos dois grafos (faces preparadas pelo detector do onnx)
+    from deepface import DeepFace
+    cliente = DeepFace.build_model(args.modelo)
+    keras = getattr(cliente, "model", cliente)
+    entradas = []
+    for foto in fotos.values():
+        try:
+            entradas.append(onnx.preparar(foto))
+        except Exception:
+            pass
+    modelo = []
+    if entradas:
+        lote = np.stack(entradas)
+        saidas_keras = keras.predict(lote, verbose=0)
+        saidas_onnx = onnx.inferir(entradas)
+        modelo = [cosseno(a, b) for a, b in zip(saidas_keras, saidas_onnx)]
+
+    # Ponta a ponta: fotos com face nos dois backends
+    detectadas = [nome for nome in fotos if embeddings_tf[nome] is not None and embeddings_onnx[nome] is not None]
+    divergencias = [nome for nome in fotos if (embeddings_tf[nome] is None) != (embeddings_onnx[nome] is None)]
+    ponta = [cosseno(embeddings_tf[nome], embeddings_onnx[nome]) for nome in detectadas]
+
+    # Decisao de match entre pares de fotos (o que o /reconhecer decidiria)
+    decisoes = 0
+    pares = 0
+    if len(detectadas) > 1:
+        grade_tf = empacotar_vetores([embeddings_tf[nome] for nome in detectadas])
+        grade_onnx = empacotar_vetores([embeddings_onnx[nome] for nome in detectadas])
+        match_tf = distancias(grade_tf["matriz"], grade_tf) < args.threshold
+        match_onnx = distancias(grade_onnx["matriz"], grade_onnx) < args.threshold
+        superior = np.triu_indices(len(detectadas), k=1)
+        pares = len(superior[0])
+        decisoes = int((match_tf[superior] != match_onnx[superior]).sum())
+
+    resumo = lambda valores: {
+        "n": len(valores),
+        "max": round(max(valores), 6) if valores else None,
+        "media": round(float(np.mean(valores)), 6) if valores else None,
+    }
+    aprovado = all(d <= args.tolerancia for d in modelo + ponta) and not divergencias and not decisoes
+    imprimir({
+        "fotos": len(fotos),
+        "backend_onnx": onnx.descricao(),
+        "distancia_cosseno": {"modelo": resumo(modelo), "ponta_a_ponta": resumo(ponta)},
+        "deteccao_divergente": divergencias,
+        "decisoes": {"pares": pares, "divergentes": decisoes, "threshold": args.threshold},
+        "tolerancia": args.tolerancia,
+        "aprovado": aprovado,
+        "desempenho": {
+            "onnx": desempenho(latencias_onnx, rss_onnx),
+            # RSS acumulado: o processo ja tinha o ONNX carregado
+            "tensorflow": desempenho(latencias_tf, rss_total),
+        },
+    })
+    return 0 if aprovado else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modelo", default="ArcFace")
+    parser.add_argument("--modelo-onnx", default="modelos/arcface.onnx")
+    parser.add_argument("--opset", type=int, default=13)
+    parser.add_argument("--verificar", nargs="+", metavar="FOTOS", help="Fotos ou diretorios para a paridade")
+    parser.add_argument("--tolerancia", type=float, default=1e-3, help="Distancia de cosseno maxima entre os backends")
+    parser.add_argument("--threshold", type=float, default=0.68, help="THRESHOLD do main.py")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--provider", default="CPUExecutionProvider")
+    args = parser.parse_args()
+
+    if args.verificar:
+        sys.exit(verificar(args))
+    exportar(Path(args.modelo_onnx), args.modelo, args.opset)
+
+
+if __name__ == "__main__":
+    main()
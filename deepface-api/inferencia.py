@@ -0,0 +1,249 @@
+"""
+Backends de Inferencia do DeepFace API
+======================================
+
+Todo backend recebe a foto (numpy HxWx3 uint8, como chega do base64) e devolve
+o embedding da primeira face detectada, para o mesmo main.py. Assim a galeria
+nao sabe qual backend gerou o vetor: os dois produzem embeddings equivalentes
+(ver exportar_onnx.py --verificar) e podem ser trocados sem recadastrar.
+
+Backends (DEEPFACE_BACKEND):
+- tensorflow: DeepFace.represent (modelo Keras, detector opencv). Padrao.
+- onnx: o mesmo modelo ArcFace exportado para ONNX (exportar_onnx.py) rodando
+  no ONNX Runtime em CPU, com o detector opencv reimplementado sem o DeepFace.
+  Nao importa TensorFlow: sobe mais rapido e ocupa bem menos memoria por
+  worker. Com o pacote onnxruntime-openvino, DEEPFACE_ONNX_PROVIDER=
+  OpenVINOExecutionProvider executa o mesmo grafo pelo OpenVINO.
+"""
+
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+
+class Extrator:
+    """Interface comum dos backends de inferencia"""
+
+    nome = "base"
+
+    def descricao(self) -> str:
+        return self.nome
+
+    def aquecer(self):
+        """Carrega o modelo (a primeira inferencia e mais lenta)"""
+        dummy = np.zeros((100, 100, 3), dtype=np.uint8)
+        dummy[30:70, 30:70] = [255, 200, 150]  # Cor de pele aproximada
+        self.extrair(dummy, exigir_face=False)
+
+    def extrair(self, imagem: np.ndarray, exigir_face: bool = True) -> list:
+        """
+        Embedding da primeira face da imagem.
+
+        Levanta ValueError se nenhuma face for detectada e exigir_face for True
+        (sem exigir, a imagem inteira e tratada como a face).
+        """
+        raise NotImplementedError
+
+    def extrair_lote(self, imagens: List[np.ndarray]) -> List[Optional[list]]:
+        """Embeddings de varias imagens (None onde nao houver face)"""
+        embeddings = []
+        for imagem in imagens:
+            try:
+                embeddings.append(self.extrair(imagem))
+            except Exception:
+                embeddings.append(None)
+        return embeddings
+
+
+class ExtratorTensorFlow(Extrator):
+    """DeepFace.represent com o modelo Keras"""
+
+    nome = "tensorflow"
+
+    def __init__(self, modelo: str = "ArcFace", detector: str = "opencv", **_):
+        from deepface import DeepFace  # Importa o TensorFlow: so quando este backend e usado
+
+        self.deepface = DeepFace
+        self.modelo = modelo
+        self.detector = detector
+
+    def descricao(self) -> str:
+        return f"tensorflow ({self.modelo}, detector {self.detector})"
+
+    def extrair(self, imagem: np.ndarray, exigir_face: bool = True) -> list:
+        result = self.deepface.represent(
+            img_path=imagem,
+            model_name=self.modelo,
+            detector_backend=self.detector,
+            enforce_detection=exigir_face
+        )
+        return result[0]["embedding"]
+
+
+# ============================================
+# ONNX RUNTIME
+# ============================================
+
+class DetectorOpenCV:
+    """
+    Mesmo pre-processamento do DeepFace com detector_backend="opencv":
+    cascata Haar da face, olhos pela cascata de olhos dentro da face, rotacao
+    da imagem inteira para nivelar os olhos e recorte da area rotacionada.
+
+    Como no DeepFace, a matriz recebida e tratada como BGR (a foto do base64
+    chega em RGB e e repassada assim, nos dois backends).
+    """
+
+    def __init__(self):
+        import cv2
+
+        self.cv2 = cv2
+        self.faces = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+        self.olhos = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_eye.xml"))
+
+    def encontrar_olhos(self, face: np.ndarray) -> tuple:
+        """Centros (olho esquerdo, olho direito) na face, ou (None, None)"""
+        cinza = self.cv2.cvtColor(face, self.cv2.COLOR_BGR2GRAY)
+        olhos = self.olhos.detectMultiScale(cinza, 1.1, 10)
+        if len(olhos) < 2:
+            return None, None
+        olhos = sorted(olhos, key=lambda v: abs(v[2] * v[3]), reverse=True)
+        primeiro, segundo = olhos[0], olhos[1]
+        # O olho direito da pessoa aparece a esquerda na imagem
+        direito, esquerdo = (primeiro, segundo) if primeiro[0] < segundo[0] else (segundo, primeiro)
+        centro = lambda olho: (int(olho[0] + olho[2] / 2), int(olho[1] + olho[3] / 2))
+        return centro(esquerdo), centro(direito)
+
+    @staticmethod
+    def rotacionar_area(area: tuple, angulo: float, tamanho: tuple) -> tuple:
+        """Caixa (x1, y1, x2, y2) depois de rotacionar a imagem em `angulo` graus"""
+        direcao = 1 if angulo >= 0 else -1
+        angulo = abs(angulo) % 360
+        if angulo == 0:
+            return area
+        angulo = angulo * np.pi / 180
+        altura, largura = tamanho
+        x = (area[0] + area[2]) / 2 - largura / 2
+        y = (area[1] + area[3]) / 2 - altura / 2
+        x_novo = x * np.cos(angulo) + y * direcao * np.sin(angulo) + largura / 2
+        y_novo = -x * direcao * np.sin(angulo) + y * np.cos(angulo) + altura / 2
+        meia_largura, meia_altura = (area[2] - area[0]) / 2, (area[3] - area[1]) / 2
+        return (
+            int(x_novo - meia_largura), int(y_novo - meia_altura),
+            int(x_novo + meia_largura), int(y_novo + meia_altura),
+        )
+
+    def detectar(self, imagem: np.ndarray) -> Optional[np.ndarray]:
+        """Primeira face da imagem, alinhada pelos olhos (None se nao houver)"""
+        from PIL import Image
+
+        faces = self.faces.detectMultiScale(imagem, 1.1, 10)
+        if len(faces) == 0:
+            return None
+        x, y, w, h = (int(v) for v in faces[0])
+        esquerdo, direito = self.encontrar_olhos(imagem[y:y + h, x:x + w])
+        if esquerdo is None:
+            return imagem[y:y + h, x:x + w]
+
+        esquerdo, direito = (x + esquerdo[0], y + esquerdo[1]), (x + direito[0], y + direito[1])
+        angulo = float(np.degrees(np.arctan2(esquerdo[1] - direito[1], esquerdo[0] - direito[0])))
+        alinhada = np.array(Image.fromarray(imagem).rotate(angulo))
+        x1, y1, x2, y2 = self.rotacionar_area((x, y, x + w, y + h), angulo, imagem.shape[:2])
+        face = alinhada[max(y1, 0):y2, max(x1, 0):x2]
+        return face if face.size else imagem[y:y + h, x:x + w]
+
+    def redimensionar(self, face: np.ndarray, tamanho: tuple) -> np.ndarray:
+        """Normaliza para [0, 1], reduz mantendo a proporcao e completa com preto (como o DeepFace)"""
+        altura, largura = tamanho
+        face = face / 255.0  # Antes do resize, em float64, para interpolar igual ao DeepFace
+        fator = min(altura / face.shape[0], largura / face.shape[1])
+        face = self.cv2.resize(face, (int(face.shape[1] * fator), int(face.shape[0] * fator)))
+        falta_altura, falta_largura = altura - face.shape[0], largura - face.shape[1]
+        face = np.pad(face, (
+            (falta_altura // 2, falta_altura - falta_altura // 2),
+            (falta_largura // 2, falta_largura - falta_largura // 2),
+            (0, 0),
+        ), "constant")
+        if face.shape[:2] != (altura, largura):
+            face = self.cv2.resize(face, (largura, altura))
+        return face.astype(np.float32)
+
+
+class ExtratorOnnx(Extrator):
+    """ArcFace exportado para ONNX, executado pelo ONNX Runtime"""
+
+    nome = "onnx"
+
+    def __init__(self, arquivo_modelo: str = "modelos/arcface.onnx", threads: int = 0,
+                 provider: str = "CPUExecutionProvider", **_):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("onnxruntime nao instalado - execute: pip install -r requirements-onnx.txt")
+
+        arquivo_modelo = Path(arquivo_modelo)
+        if not arquivo_modelo.exists():
+            raise RuntimeError(f"Modelo ONNX nao encontrado em {arquivo_modelo} - gere com exportar_onnx.py")
+        if provider not in ort.get_available_providers():
+            raise RuntimeError(f"Provider {provider} indisponivel (instalados: {', '.join(ort.get_available_providers())})")
+
+        opcoes = ort.SessionOptions()
+        opcoes.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opcoes.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opcoes.intra_op_num_threads = threads  # 0 = um por nucleo fisico
+        opcoes.inter_op_num_threads = 1  # Grafo sequencial: paralelismo so dentro dos operadores
+
+        self.sessao = ort.InferenceSession(str(arquivo_modelo), opcoes, providers=[provider])
+        self.provider = provider
+        self.threads = threads
+        self.arquivo_modelo = arquivo_modelo
+        entrada = self.sessao.get_inputs()[0]
+        self.entrada = entrada.name
+        # Entrada NHWC exportada do Keras: (lote, altura, largura, 3)
+        self.tamanho = (int(entrada.shape[1]), int(entrada.shape[2]))
+        self.detector = DetectorOpenCV()
+
+    def descricao(self) -> str:
+        return f"onnx ({self.arquivo_modelo.name}, {self.provider}, threads {self.threads or 'auto'})"
+
+    def preparar(self, imagem: np.ndarray, exigir_face: bool = True) -> np.ndarray:
+        """Face detectada, alinhada e redimensionada para a entrada do modelo"""
+        face = self.detector.detectar(imagem)
+        if face is None:
+            if exigir_face:
+                raise ValueError("Face could not be detected")
+            face = imagem
+        return self.detector.redimensionar(face, self.tamanho)
+
+    def inferir(self, faces: List[np.ndarray]) -> np.ndarray:
+        return self.sessao.run(None, {self.entrada: np.stack(faces).astype(np.float32, copy=False)})[0]
+
+    def extrair(self, imagem: np.ndarray, exigir_face: bool = True) -> list:
+        return self.inferir([self.preparar(imagem, exigir_face)])[0].tolist()
+
+    def extrair_lote(self, imagens: List[np.ndarray]) -> List[Optional[list]]:
+        """Detecta as faces de todas as imagens e infere todas em uma unica chamada ao modelo"""
+        faces = {}
+        for posicao, imagem in enumerate(imagens):
+            try:
+                faces[posicao] = self.preparar(imagem)
+            except Exception:
+                pass
+        embeddings = dict(zip(faces, self.inferir(list(faces.values())))) if faces else {}
+        return [embeddings[posicao].tolist() if posicao in embeddings else None for posicao in range(len(imagens))]
+
+
+BACKENDS = {
+    "tensorflow": ExtratorTensorFlow,
+    "onnx": ExtratorOnnx,
+}
+
+
+def criar_extrator(nome: str, **opcoes) -> Extrator:
+    """Instancia o backend pelo nome (DEEPFACE_BACKEND)"""
+    backend = BACKENDS.get(nome.lower())
+    if not backend:
+        raise ValueError(f"Backend de inferencia desconhecido: {nome} (opcoes: {', '.join(BACKENDS)})")
+    return backend(**opcoes)
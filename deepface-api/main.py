@@ -10,6 +10,12 @@ Modelos disponiveis (em ordem de precisao):
 - Facenet512: 99.65% (mais preciso, mais lento)
 - VGG-Face: 98.78% (mais rapido, menos preciso)
 
+Galerias, armazenamento, métricas e lotes vêm do núcleo comum com o
+futronic-api (biometria_core/, na raiz do repositório).
+
+A extração dos embeddings roda no TensorFlow (DeepFace) ou no ONNX Runtime,
+conforme DEEPFACE_BACKEND (ver inferencia.py).
+
 Uso:
     python main.py
     ou
@@ -19,8 +25,7 @@ Uso:
 import os
 import sys
 import base64
-import json
-import shutil
+import time
 
 # Corrige encoding para Windows (evita erros com emojis do DeepFace)
 if sys.platform == "win32":
@@ -29,21 +34,43 @@ if sys.platform == "win32":
     os.environ['PYTHONIOENCODING'] = 'utf-8'
 from io import BytesIO
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 import numpy as np
 from PIL import Image
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from deepface import DeepFace
+
+# Núcleo comum com o futronic-api (na raiz do repositório; no Docker, ao lado do main.py)
+sys.path.insert(1, str(Path(__file__).resolve().parent.parent))
+from biometria_core import calibracao, compartilhada, metricas, vetores
+from biometria_core.galerias import Galeria, Particoes, diretorio_tenant, obter_tenant
+from biometria_core.lote import responder_lote
+
+import inferencia
 
 # Configurações
 FACES_DIR = Path("./faces")  # Diretório para armazenar faces cadastradas
 MODEL_NAME = "ArcFace"  # Modelo de reconhecimento (ArcFace = 99.5% precisão)
 DETECTOR_BACKEND = "opencv"  # Detector de faces (opencv é mais rápido)
 DISTANCE_METRIC = "cosine"  # Métrica de distância
-THRESHOLD = 0.68  # Threshold para match (menor = mais restritivo)
+BACKEND = os.environ.get("DEEPFACE_BACKEND", "tensorflow")  # tensorflow ou onnx (inferencia.py)
+ONNX_MODELO = os.environ.get("DEEPFACE_ONNX_MODELO", "./modelos/arcface.onnx")  # Gerado por exportar_onnx.py
+ONNX_THREADS = int(os.environ.get("DEEPFACE_ONNX_THREADS", "0"))  # Threads por inferência (0 = núcleos físicos)
+ONNX_PROVIDER = os.environ.get("DEEPFACE_ONNX_PROVIDER", "CPUExecutionProvider")  # ou OpenVINOExecutionProvider
+THRESHOLD = float(os.environ.get("DEEPFACE_THRESHOLD", "0.68"))  # Threshold para match (menor = mais restritivo; calibre com calibrar.py)
+LIMIAR_DUPLICATA = float(os.environ.get("DEEPFACE_LIMIAR_DUPLICATA", "0.4"))  # Abaixo disso, dois cadastros são provavelmente a mesma pessoa
+CANDIDATOS_DUPLICATA = 3  # Cadastros parecidos devolvidos no conflito do /cadastrar
+LOTE_MAXIMO = int(os.environ.get("DEEPFACE_LOTE_MAXIMO", "500"))  # Fotos por /reconhecer/lote
+FOTOS_POR_GRUPO = 16  # Fotos extraídas e comparadas (e respondidas) de uma vez no lote
+GALERIA_OCIOSA = float(os.environ.get("DEEPFACE_GALERIA_OCIOSA", "1800"))  # Segundos sem uso até descarregar
+MEMORIA_GALERIAS = int(os.environ.get("DEEPFACE_MEMORIA_GALERIAS_MB", "512")) * 1024 * 1024  # Limite das galerias
+# Galeria única para todos os workers do uvicorn (mmap + geração); no Windows, um worker só
+GALERIA_COMPARTILHADA = os.environ.get(
+    "DEEPFACE_GALERIA_COMPARTILHADA", "0" if sys.platform == "win32" else "1"
+) == "1"
 
 # Cria diretório de faces se não existir
 FACES_DIR.mkdir(parents=True, exist_ok=True)
@@ -64,8 +91,102 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Cache de embeddings para performance
-embeddings_cache = {}
+
+
+class GaleriaFaces(Galeria):
+    """
+    Faces cadastradas de um tenant.
+
+    Metadados em embeddings_cache.json e embeddings (float32) em
+    embeddings_cache.bin, no diretório do tenant; as fotos ficam ao lado, em {id}.jpg.
+
+    Compartilhada (padrão): a matriz de busca fica em embeddings_cache.matriz,
+    mapeada por todos os workers, que guardam só os metadados.
+    """
+
+    NOME_ARQUIVO = "embeddings_cache"
+    SERVICO = "DeepFace"
+    COMPARTILHADA = GALERIA_COMPARTILHADA
+
+    def __init__(self, tenant: str):
+        super().__init__(tenant, diretorio_tenant(FACES_DIR, tenant))
+        self.arquivo_matriz = self.diretorio / f"{self.NOME_ARQUIVO}.matriz"
+        self.mapeada = None  # Matriz publicada (mmap), na galeria compartilhada
+
+    def desserializar(self, bruto: bytes) -> np.ndarray:
+        return vetores.vetor_de_bytes(bruto)
+
+    def migrar(self) -> bool:
+        """Move os embeddings gravados como lista no JSON (formato antigo) para o .bin"""
+        movidos = 0
+        for func_id, data in self.cadastros.items():
+            if "embedding" in data:
+                self.brutos[func_id] = vetores.vetor_para_bytes(data.pop("embedding"))
+                movidos += 1
+        if movidos:
+            print(f"[DeepFace] {movidos} embeddings movidos para o armazenamento binário ({self.tenant})")
+        return movidos > 0
+
+    def empacotar(self) -> dict:
+        """Matriz de embeddings para a busca vetorizada (somente a dimensão do modelo mais usado)"""
+        if self.mapeada is not None and not self.alterando:
+            return self.mapeada
+        grade, ignorados = vetores.empacotar_por_id(
+            {func_id: self.dados[func_id] for func_id in self.cadastros if func_id in self.dados}
+        )
+        if ignorados:
+            print(f"[DeepFace] {len(ignorados)} faces de outro modelo ignoradas ({self.tenant}): recadastre")
+        return grade
+
+    def publicar(self, geracao: int):
+        self.mapeada = None  # Monta a partir dos dados recém-lidos do disco
+        grade = self.empacotar()
+        compartilhada.gravar_matriz(self.arquivo_matriz, geracao, grade["ids"], grade["matriz"])
+
+    def mapear(self, geracao: int) -> bool:
+        mapeada = compartilhada.abrir_matriz(self.arquivo_matriz)
+        if mapeada is None or mapeada["geracao"] != geracao:
+            return False
+        self.mapeada = mapeada
+        return True
+
+    def invalidar(self):
+        super().invalidar()
+        if self.mapeada is not None:
+            # Páginas no cache do sistema, as mesmas para todos os workers
+            self.memoria += self.mapeada["matriz"].nbytes
+
+    def ao_descarregar(self):
+        self.mapeada = None
+
+
+# Backend de inferência (o TensorFlow só é importado se for o escolhido)
+EXTRATOR = inferencia.criar_extrator(
+    BACKEND,
+    modelo=MODEL_NAME,
+    detector=DETECTOR_BACKEND,
+    arquivo_modelo=ONNX_MODELO,
+    threads=ONNX_THREADS,
+    provider=ONNX_PROVIDER,
+)
+
+# Galerias por tenant, carregadas no primeiro uso (tenant padrão na raiz de FACES_DIR)
+GALERIAS = Particoes("deepface", GaleriaFaces, GALERIA_OCIOSA, MEMORIA_GALERIAS)
+
+METRICA_EXTRACAO = metricas.registro.histograma(
+    "deepface_extracao_segundos", "Detecção + extração do embedding de cada foto", ["resultado"]
+)
+METRICA_DUPLICATAS = metricas.registro.contador(
+    "deepface_cadastros_duplicados_total", "Cadastros parecidos demais com outro funcionário", ["resultado"]
+)
+
+
+class CadastroDuplicado(Exception):
+    """Face parecida demais com a de outro funcionário (cancela a gravação do /cadastrar)"""
+
+    def __init__(self, candidatos: list):
+        super().__init__("Face já cadastrada para outro funcionário")
+        self.candidatos = candidatos
 
 
 class RegisterRequest(BaseModel):
@@ -74,6 +195,7 @@ class RegisterRequest(BaseModel):
     nome: str
     pis: str
     foto_base64: str
+    permitir_duplicata: bool = False  # Grava mesmo parecida com outro funcionário (ex: gêmeos, após conferência)
 
 
 class RecognizeRequest(BaseModel):
@@ -81,6 +203,17 @@ class RecognizeRequest(BaseModel):
     foto_base64: str
 
 
+class ItemLote(BaseModel):
+    """Uma foto de /reconhecer/lote"""
+    id: Optional[str] = None  # Identificador do cliente, devolvido na linha de resposta
+    foto_base64: str
+
+
+class LoteRequest(BaseModel):
+    """Request de reconhecimento em lote"""
+    itens: List[ItemLote]
+
+
 class StatusResponse(BaseModel):
     """Response de status"""
     status: str
@@ -105,77 +238,115 @@ def base64_to_image(base64_string: str) -> np.ndarray:
     return np.array(image)
 
 
-def save_face_image(funcionario_id: int, image_array: np.ndarray) -> str:
-    """Salva imagem da face no diretório"""
-    face_path = FACES_DIR / f"{funcionario_id}.jpg"
+def save_face_image(galeria: GaleriaFaces, funcionario_id: int, image_array: np.ndarray) -> str:
+    """Salva imagem da face no diretório do tenant"""
+    galeria.diretorio.mkdir(parents=True, exist_ok=True)
+    face_path = galeria.diretorio / f"{funcionario_id}.jpg"
     image = Image.fromarray(image_array)
     image.save(face_path, "JPEG", quality=95)
     return str(face_path)
 
 
-def load_embeddings_cache():
-    """Carrega cache de embeddings do disco"""
-    global embeddings_cache
-    cache_file = FACES_DIR / "embeddings_cache.json"
-
-    if cache_file.exists():
-        try:
-            with open(cache_file, "r") as f:
-                embeddings_cache = json.load(f)
-            print(f"[DeepFace] Cache carregado: {len(embeddings_cache)} faces")
-        except Exception as e:
-            print(f"[DeepFace] Erro ao carregar cache: {e}")
-            embeddings_cache = {}
-
-
-def save_embeddings_cache():
-    """Salva cache de embeddings no disco"""
-    cache_file = FACES_DIR / "embeddings_cache.json"
-    try:
-        with open(cache_file, "w") as f:
-            json.dump(embeddings_cache, f)
-    except Exception as e:
-        print(f"[DeepFace] Erro ao salvar cache: {e}")
-
-
 def get_embedding(image_array: np.ndarray) -> list:
     """Extrai embedding (vetor facial) de uma imagem"""
+    inicio = time.perf_counter()
     try:
-        result = DeepFace.represent(
-            img_path=image_array,
-            model_name=MODEL_NAME,
-            detector_backend=DETECTOR_BACKEND,
-            enforce_detection=True
-        )
-        return result[0]["embedding"]
+        embedding = EXTRATOR.extrair(image_array)
+        METRICA_EXTRACAO.observar(time.perf_counter() - inicio, resultado="sucesso")
+        return embedding
     except Exception as e:
+        METRICA_EXTRACAO.observar(time.perf_counter() - inicio, resultado="erro")
         print(f"[DeepFace] Erro ao extrair embedding: {e}")
         raise
 
 
+def get_embeddings(images: List[np.ndarray]) -> List[Optional[list]]:
+    """Extrai os embeddings de várias imagens (None onde não houver face; o onnx infere todas de uma vez)"""
+    inicio = time.perf_counter()
+    embeddings = EXTRATOR.extrair_lote(images)
+    por_imagem = (time.perf_counter() - inicio) / max(len(images), 1)
+    for embedding in embeddings:
+        METRICA_EXTRACAO.observar(por_imagem, resultado="sucesso" if embedding is not None else "erro")
+    return embeddings
+
+
+def buscar_faces(galeria: GaleriaFaces, embeddings: list, operacao: str = "reconhecer") -> list:
+    """
+    Compara os embeddings com todas as faces do tenant (uma multiplicação de matrizes).
+
+    Retorna: lista de (func_id ou None, distância) da face mais próxima de cada embedding
+    """
+    grade = galeria.obter_empacotada()
+    if not grade["ids"] or not embeddings:
+        return [(None, float("inf"))] * len(embeddings)
+    with GALERIAS.medir(galeria, operacao, len(embeddings)):
+        indices, distancias = vetores.mais_proximos(np.array(embeddings), grade, DISTANCE_METRIC)
+    return [(grade["ids"][int(i[0])], float(d[0])) for i, d in zip(indices, distancias)]
+
+
+def buscar_duplicatas(galeria: GaleriaFaces, embedding: list, funcionario_id: int) -> list:
+    """
+    Cadastros de outros funcionários a menos de LIMIAR_DUPLICATA do embedding
+    (busca vetorizada dos k mais próximos). O próprio funcionário é ignorado (recadastro).
+    """
+    grade = galeria.obter_empacotada()
+    if not grade["ids"]:
+        return []
+    with GALERIAS.medir(galeria, "duplicatas"):
+        indices, distancias = vetores.mais_proximos(
+            np.array([embedding]), grade, DISTANCE_METRIC, CANDIDATOS_DUPLICATA + 1
+        )
+    candidatos = []
+    for indice, distancia in zip(indices[0], distancias[0]):
+        func_id = grade["ids"][int(indice)]
+        if func_id == str(funcionario_id) or distancia >= LIMIAR_DUPLICATA:
+            continue
+        candidatos.append({
+            "funcionario_id": int(func_id),
+            "nome": galeria.cadastros.get(func_id, {}).get("nome"),
+            "distance": float(distancia),
+        })
+    return candidatos[:CANDIDATOS_DUPLICATA]
+
+
+def resultado_reconhecimento(galeria: GaleriaFaces, func_id: Optional[str], distancia: float) -> dict:
+    """Resposta de /reconhecer para a face mais próxima (aplica o threshold)"""
+    if func_id is not None and distancia < THRESHOLD:
+        data = galeria.cadastros.get(func_id, {})
+        confidence = 1 - (distancia / THRESHOLD)  # Normaliza para 0-1
+        confidence = max(0, min(1, confidence))  # Garante entre 0 e 1
+        return {
+            "success": True,
+            "funcionario_id": int(func_id),
+            "nome": data.get("nome"),
+            "pis": data.get("pis"),
+            "confidence": confidence,
+            "distance": distancia
+        }
+    return {
+        "success": False,
+        "error": "Face não reconhecida",
+        "best_distance": distancia if func_id is not None else None
+    }
+
+
 @app.on_event("startup")
 async def startup_event():
     """Inicializacao do servidor"""
     print("[DeepFace] Iniciando servidor...")
     print(f"[DeepFace] Modelo: {MODEL_NAME}")
     print(f"[DeepFace] Detector: {DETECTOR_BACKEND}")
+    print(f"[DeepFace] Backend: {EXTRATOR.descricao()}")
     print(f"[DeepFace] Threshold: {THRESHOLD}")
 
-    # Carrega cache
-    load_embeddings_cache()
+    # Galerias carregam no primeiro uso de cada tenant; a limpeza descarrega as ociosas
+    GALERIAS.iniciar()
 
     # Pre-carrega o modelo (primeira execucao e mais lenta)
     print("[DeepFace] Carregando modelo (pode demorar na primeira vez)...")
     try:
-        # Cria uma imagem dummy para forcar carregamento do modelo
-        dummy = np.zeros((100, 100, 3), dtype=np.uint8)
-        dummy[30:70, 30:70] = [255, 200, 150]  # Cor de pele aproximada
-        DeepFace.represent(
-            img_path=dummy,
-            model_name=MODEL_NAME,
-            detector_backend=DETECTOR_BACKEND,
-            enforce_detection=False
-        )
+        # Infere uma imagem dummy para forcar carregamento do modelo
+        EXTRATOR.aquecer()
         print("[DeepFace] Modelo carregado com sucesso!")
     except Exception as e:
         # Trata erro de forma segura (evita problemas de encoding)
@@ -186,10 +357,18 @@ async def startup_event():
     print("[DeepFace] Servidor pronto!")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Encerramento do servidor"""
+    GALERIAS.parar()
+    GALERIAS.descarregar_todas()
+
+
 @app.get("/", response_model=StatusResponse)
-async def status():
-    """Status do serviço"""
-    faces_count = len(list(FACES_DIR.glob("*.jpg")))
+async def status(tenant: str = Depends(obter_tenant)):
+    """Status do serviço (faces_cadastradas do tenant)"""
+    with GALERIAS.usar(tenant) as galeria:
+        faces_count = len(galeria.cadastros)
     return StatusResponse(
         status="online",
         model=MODEL_NAME,
@@ -204,13 +383,20 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas no formato Prometheus (galerias, buscas e extração de embeddings)"""
+    return Response(content=metricas.registro.exportar(), media_type=metricas.TIPO_CONTEUDO)
+
+
 @app.post("/cadastrar")
-async def cadastrar_face(request: RegisterRequest):
+async def cadastrar_face(request: RegisterRequest, tenant: str = Depends(obter_tenant)):
     """
     Cadastra uma nova face no sistema.
 
     - Recebe foto em base64
     - Extrai embedding facial
+    - Recusa (409) se a face já pertence a outro funcionário, salvo permitir_duplicata
     - Salva imagem e embedding
     """
     try:
@@ -222,26 +408,51 @@ async def cadastrar_face(request: RegisterRequest):
         # Extrai embedding
         embedding = get_embedding(image_array)
 
-        # Salva imagem
-        face_path = save_face_image(request.funcionario_id, image_array)
-
-        # Salva no cache
-        embeddings_cache[str(request.funcionario_id)] = {
-            "nome": request.nome,
-            "pis": request.pis,
-            "embedding": embedding,
-            "face_path": face_path
-        }
-        save_embeddings_cache()
+        with GALERIAS.usar(tenant) as galeria:
+            candidatos = []
+
+            def verificar():
+                # Mesma pessoa cadastrada com outro id? Roda na seção crítica da gravação:
+                # dois cadastros simultâneos da mesma face não passam os dois
+                candidatos[:] = buscar_duplicatas(galeria, embedding, request.funcionario_id)
+                if candidatos and not request.permitir_duplicata:
+                    raise CadastroDuplicado(list(candidatos))
+
+            # Salva na galeria (embedding no armazenamento binário)
+            try:
+                galeria.gravar(str(request.funcionario_id), {
+                    "nome": request.nome,
+                    "pis": request.pis,
+                    "face_path": str(galeria.diretorio / f"{request.funcionario_id}.jpg")
+                }, vetores.vetor_para_bytes(embedding), verificar=verificar)
+            except CadastroDuplicado as e:
+                nomes = ", ".join(f"{c['nome']} (ID {c['funcionario_id']})" for c in e.candidatos)
+                METRICA_DUPLICATAS.inc(resultado="recusado")
+                print(f"[DeepFace] Cadastro recusado: {request.nome} parece com {nomes}")
+                return JSONResponse(status_code=409, content={
+                    "success": False,
+                    "error": f"Face já cadastrada para outro funcionário: {nomes}",
+                    "candidatos": e.candidatos,
+                })
+            if candidatos:
+                nomes = ", ".join(f"{c['nome']} (ID {c['funcionario_id']})" for c in candidatos)
+                METRICA_DUPLICATAS.inc(resultado="permitido")
+                print(f"[DeepFace] Cadastro permitido apesar da semelhança com {nomes}")
+
+            # Salva imagem (depois da gravação: um cadastro recusado não troca a foto de ninguém)
+            save_face_image(galeria, request.funcionario_id, image_array)
 
         print(f"[DeepFace] Cadastrado com sucesso: {request.nome}")
 
-        return {
+        resposta = {
             "success": True,
             "funcionario_id": request.funcionario_id,
             "nome": request.nome,
             "message": "Face cadastrada com sucesso"
         }
+        if candidatos:
+            resposta["candidatos"] = candidatos  # Gravado com permitir_duplicata
+        return resposta
 
     except Exception as e:
         print(f"[DeepFace] Erro ao cadastrar: {e}")
@@ -249,106 +460,100 @@ async def cadastrar_face(request: RegisterRequest):
 
 
 @app.post("/reconhecer")
-async def reconhecer_face(request: RecognizeRequest):
+async def reconhecer_face(request: RecognizeRequest, tenant: str = Depends(obter_tenant)):
     """
-    Reconhece uma face contra as cadastradas.
+    Reconhece uma face contra as cadastradas do tenant.
 
     - Recebe foto em base64
     - Extrai embedding
-    - Compara com faces cadastradas
+    - Compara com faces cadastradas (busca vetorizada)
     - Retorna match com maior confiança
     """
     try:
-        if not embeddings_cache:
-            return {
-                "success": False,
-                "error": "Nenhuma face cadastrada"
-            }
+        with GALERIAS.usar(tenant) as galeria:
+            if not galeria.cadastros:
+                return {
+                    "success": False,
+                    "error": "Nenhuma face cadastrada"
+                }
 
-        # Converte base64 para imagem
-        image_array = base64_to_image(request.foto_base64)
+            # Converte base64 para imagem
+            image_array = base64_to_image(request.foto_base64)
 
-        # Extrai embedding da face a reconhecer
-        try:
-            query_embedding = get_embedding(image_array)
-        except Exception as e:
-            return {
-                "success": False,
-                "error": "Nenhuma face detectada na imagem"
-            }
-
-        # Compara com todas as faces cadastradas
-        best_match = None
-        best_distance = float("inf")
-
-        query_embedding = np.array(query_embedding)
-
-        for func_id, data in embeddings_cache.items():
-            cached_embedding = np.array(data["embedding"])
-
-            # Calcula distância coseno
-            if DISTANCE_METRIC == "cosine":
-                # Distância coseno: 1 - similaridade
-                similarity = np.dot(query_embedding, cached_embedding) / (
-                    np.linalg.norm(query_embedding) * np.linalg.norm(cached_embedding)
-                )
-                distance = 1 - similarity
-            else:
-                # Distância euclidiana
-                distance = np.linalg.norm(query_embedding - cached_embedding)
-
-            if distance < best_distance:
-                best_distance = distance
-                best_match = {
-                    "funcionario_id": int(func_id),
-                    "nome": data["nome"],
-                    "pis": data["pis"],
-                    "distance": float(distance)
+            # Extrai embedding da face a reconhecer
+            try:
+                query_embedding = get_embedding(image_array)
+            except Exception as e:
+                return {
+                    "success": False,
+                    "error": "Nenhuma face detectada na imagem"
                 }
 
-        # Verifica se passou no threshold
-        if best_match and best_distance < THRESHOLD:
-            confidence = 1 - (best_distance / THRESHOLD)  # Normaliza para 0-1
-            confidence = max(0, min(1, confidence))  # Garante entre 0 e 1
-
-            print(f"[DeepFace] Reconhecido: {best_match['nome']} (distância: {best_distance:.4f}, confiança: {confidence:.2%})")
-
-            return {
-                "success": True,
-                "funcionario_id": best_match["funcionario_id"],
-                "nome": best_match["nome"],
-                "pis": best_match["pis"],
-                "confidence": confidence,
-                "distance": best_distance
-            }
+            # Compara com todas as faces cadastradas
+            func_id, best_distance = buscar_faces(galeria, [query_embedding])[0]
+            resultado = resultado_reconhecimento(galeria, func_id, best_distance)
+
+        if resultado["success"]:
+            print(f"[DeepFace] Reconhecido: {resultado['nome']} (distância: {best_distance:.4f}, confiança: {resultado['confidence']:.2%})")
         else:
             print(f"[DeepFace] Não reconhecido (melhor distância: {best_distance:.4f}, threshold: {THRESHOLD})")
-            return {
-                "success": False,
-                "error": "Face não reconhecida",
-                "best_distance": float(best_distance) if best_match else None
-            }
+        return resultado
 
     except Exception as e:
         print(f"[DeepFace] Erro ao reconhecer: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.post("/reconhecer/lote")
+async def reconhecer_lote(request: LoteRequest, tenant: str = Depends(obter_tenant)):
+    """
+    Reconhece várias fotos contra as faces cadastradas do tenant.
+
+    Os embeddings de cada grupo são comparados com a galeria de uma vez e a
+    resposta é enviada em NDJSON, uma linha por foto na ordem do lote:
+    {"indice", "id", "success", "funcionario_id", "nome", "pis", "confidence", "distance"} ou {"indice", "id", "success": false, "error"}
+    """
+    def processar(galeria, grupo):
+        resultados, imagens = {}, {}
+        for indice, item in grupo:
+            try:
+                imagens[indice] = base64_to_image(item.foto_base64)
+            except Exception:
+                resultados[indice] = {"success": False, "error": "Nenhuma face detectada na imagem"}
+
+        consultas = []
+        for indice, embedding in zip(imagens, get_embeddings(list(imagens.values()))):
+            if embedding is None:
+                resultados[indice] = {"success": False, "error": "Nenhuma face detectada na imagem"}
+            else:
+                consultas.append((indice, embedding))
+
+        encontrados = buscar_faces(galeria, [embedding for _, embedding in consultas], "reconhecer_lote")
+        for (indice, _), (func_id, distancia) in zip(consultas, encontrados):
+            resultados[indice] = resultado_reconhecimento(galeria, func_id, distancia)
+
+        return [{"indice": indice, "id": item.id, **resultados[indice]} for indice, item in grupo]
+
+    with GALERIAS.usar(tenant) as galeria:
+        if not galeria.cadastros:
+            return {"success": False, "error": "Nenhuma face cadastrada"}
+    return responder_lote(
+        request.itens, processar, LOTE_MAXIMO, FOTOS_POR_GRUPO, contexto=lambda: GALERIAS.usar(tenant)
+    )
+
+
 @app.delete("/remover/{funcionario_id}")
-async def remover_face(funcionario_id: int):
+async def remover_face(funcionario_id: int, tenant: str = Depends(obter_tenant)):
     """Remove uma face cadastrada"""
     try:
-        func_id_str = str(funcionario_id)
-
-        # Remove do cache
-        if func_id_str in embeddings_cache:
-            del embeddings_cache[func_id_str]
-            save_embeddings_cache()
+        with GALERIAS.usar(tenant) as galeria:
+            # Remove da galeria
+            galeria.remover(str(funcionario_id))
 
-        # Remove arquivo de imagem
-        face_path = FACES_DIR / f"{funcionario_id}.jpg"
-        if face_path.exists():
-            face_path.unlink()
+            # Remove arquivo de imagem
+            face_path = galeria.diretorio / f"{funcionario_id}.jpg"
+            if face_path.exists():
+                face_path.unlink()
 
         print(f"[DeepFace] Removido: ID {funcionario_id}")
 
@@ -362,11 +567,41 @@ async def remover_face(funcionario_id: int):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.get("/galeria/analise")
+def analisar_galeria(
+    far: Optional[str] = None,
+    limite: int = 50,
+    tenant: str = Depends(obter_tenant),
+):
+    """
+    Calibração do threshold e qualidade da galeria do tenant.
+
+    Compara todos os cadastros entre si (em blocos, memória limitada) e retorna a
+    distribuição das distâncias entre pessoas diferentes, os limiares sugeridos
+    para cada FAR alvo (?far=0.001,0.0001), os cadastros com outra pessoa abaixo
+    do threshold atual e as prováveis duplicatas. Síncrono: roda fora do event loop.
+    """
+    try:
+        fars = tuple(float(valor) for valor in far.split(",")) if far else calibracao.FARS_PADRAO
+    except ValueError:
+        raise HTTPException(status_code=400, detail="far deve ser uma lista de números (ex: 0.001,0.0001)")
+    with GALERIAS.usar(tenant) as galeria:
+        grade = galeria.obter_empacotada()
+        resultado = calibracao.analisar_galeria(
+            grade, DISTANCE_METRIC, THRESHOLD, fars, LIMIAR_DUPLICATA, limite=limite
+        )
+        for item in resultado["proximos"]:
+            item["nome"] = galeria.cadastros.get(item["id"], {}).get("nome")
+    return {"success": True, "tenant": tenant, **resultado}
+
+
 @app.get("/listar")
-async def listar_faces():
-    """Lista todas as faces cadastradas"""
+async def listar_faces(tenant: str = Depends(obter_tenant)):
+    """Lista todas as faces cadastradas do tenant"""
     faces = []
-    for func_id, data in embeddings_cache.items():
+    with GALERIAS.usar(tenant) as galeria:
+        cadastros = list(galeria.cadastros.items())
+    for func_id, data in cadastros:
         faces.append({
             "funcionario_id": int(func_id),
             "nome": data["nome"],
@@ -381,15 +616,17 @@ async def listar_faces():
 
 
 @app.post("/sincronizar")
-async def sincronizar():
+async def sincronizar(tenant: str = Depends(obter_tenant)):
     """
-    Recarrega o cache de embeddings do disco.
-    Útil se as imagens foram adicionadas manualmente.
+    Recarrega do disco a galeria de embeddings do tenant.
+    Útil se a galeria foi alterada manualmente.
     """
-    load_embeddings_cache()
+    with GALERIAS.usar(tenant) as galeria:
+        galeria.recarregar()
+        total = len(galeria.cadastros)
     return {
         "success": True,
-        "faces_carregadas": len(embeddings_cache)
+        "faces_carregadas": total
     }
 
 
@@ -0,0 +1,48 @@
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Modulos do servico importados a partir do diretorio dele (como no main.py). No fim do
+# sys.path e o main.py com outro nome: o futronic-api tambem tem um main.py
+SERVICO = Path(__file__).resolve().parent.parent
+sys.path.append(str(SERVICO))
+sys.path.insert(1, str(SERVICO.parent))
+
+import inferencia
+
+
+class ExtratorCor(inferencia.Extrator):
+    """
+    Backend de teste, sem modelo: o embedding e a cor media da foto.
+    Fotos da mesma cor sao a mesma pessoa (distancia 0); vermelho x verde, distancia 1.
+    """
+
+    nome = "cor"
+
+    def __init__(self, **_):
+        pass
+
+    def extrair(self, imagem: np.ndarray, exigir_face: bool = True) -> list:
+        return imagem.reshape(-1, 3).mean(axis=0).astype(float).tolist()
+
+
+inferencia.BACKENDS["cor"] = ExtratorCor
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """main.py com o backend de teste; ./faces criado em um diretorio temporario"""
+    anterior = os.getcwd()
+    os.environ["DEEPFACE_BACKEND"] = "cor"
+    os.chdir(tmp_path_factory.mktemp("deepface"))
+    try:
+        spec = importlib.util.spec_from_file_location("deepface_main", SERVICO / "main.py")
+        modulo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modulo)
+    finally:
+        os.chdir(anterior)
+    return modulo
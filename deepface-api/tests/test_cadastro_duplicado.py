@@ -0,0 +1,91 @@
+import base64
+from io import BytesIO
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from biometria_core import metricas
+from biometria_core.galerias import Particoes
+
+VERMELHO, VERDE = (200, 30, 30), (30, 200, 30)
+
+
+def foto(cor) -> str:
+    buffer = BytesIO()
+    Image.fromarray(np.full((32, 32, 3), cor, dtype=np.uint8)).save(buffer, "PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.fixture(params=[False, True], ids=["processo_unico", "compartilhada"])
+def servico(main, tmp_path, monkeypatch, request):
+    """Galerias em um diretorio temporario, com e sem a galeria compartilhada entre processos"""
+    monkeypatch.setattr(main, "FACES_DIR", tmp_path)
+    monkeypatch.setattr(main.GaleriaFaces, "COMPARTILHADA", request.param)
+    monkeypatch.setattr(main, "GALERIAS", Particoes(
+        "deepface", main.GaleriaFaces, 3600, 2 ** 30, registro=metricas.Registro()
+    ))
+    return main
+
+
+def cadastrar(cliente, funcionario_id, cor, **extra):
+    return cliente.post("/cadastrar", json={
+        "funcionario_id": funcionario_id, "nome": f"Func {funcionario_id}", "pis": str(funcionario_id),
+        "foto_base64": foto(cor), **extra
+    })
+
+
+def test_face_de_outro_funcionario_e_recusada(servico, tmp_path):
+    cliente = TestClient(servico.app)
+    assert cadastrar(cliente, 1, VERMELHO).status_code == 200
+    assert cadastrar(cliente, 2, VERDE).status_code == 200
+
+    resposta = cadastrar(cliente, 3, VERMELHO)
+
+    assert resposta.status_code == 409
+    assert [c["funcionario_id"] for c in resposta.json()["candidatos"]] == [1]
+    with servico.GALERIAS.usar("padrao") as galeria:
+        assert set(galeria.cadastros) == {"1", "2"}
+    assert not (tmp_path / "3.jpg").exists()
+
+
+def test_recadastro_e_duplicata_permitida(servico):
+    cliente = TestClient(servico.app)
+    assert cadastrar(cliente, 1, VERMELHO).status_code == 200
+
+    assert cadastrar(cliente, 1, VERMELHO).status_code == 200  # O proprio funcionario e ignorado
+    resposta = cadastrar(cliente, 2, VERMELHO, permitir_duplicata=True)
+
+    assert resposta.status_code == 200
+    assert [c["funcionario_id"] for c in resposta.json()["candidatos"]] == [1]
+    with servico.GALERIAS.usar("padrao") as galeria:
+        assert set(galeria.cadastros) == {"1", "2"}
+
+
+def test_duplicata_gravada_durante_o_cadastro_e_recusada(servico, monkeypatch):
+    """
+    Outro cadastro da mesma face (outra requisicao ou outro worker) grava entre a
+    carga da galeria e a gravacao desta: a verificacao roda na secao critica da
+    gravacao e ve o cadastro concorrente.
+    """
+    cliente = TestClient(servico.app)
+    gravar = servico.GaleriaFaces.gravar
+    concorrente = []
+
+    def gravar_com_concorrente(galeria, chave, *args, **kwargs):
+        if not concorrente:
+            concorrente.append(chave)
+            # Outro worker tem a propria galeria; outra requisicao usa a mesma
+            outra = servico.GaleriaFaces(galeria.tenant) if galeria.COMPARTILHADA else galeria
+            embedding = servico.EXTRATOR.extrair(np.full((4, 4, 3), VERMELHO, dtype=np.uint8))
+            gravar(outra, "1", {"nome": "Func 1", "pis": "1"}, servico.vetores.vetor_para_bytes(embedding))
+        return gravar(galeria, chave, *args, **kwargs)
+
+    monkeypatch.setattr(servico.GaleriaFaces, "gravar", gravar_com_concorrente)
+
+    resposta = cadastrar(cliente, 2, VERMELHO)
+
+    assert resposta.status_code == 409
+    with servico.GALERIAS.usar("padrao") as galeria:
+        assert set(galeria.cadastros) == {"1"}
@@ -0,0 +1,164 @@
+"""
+Benchmark do Biometric API com o scanner simulado
+=================================================
+
+Cadastra N identidades sinteticas e verifica M capturas novas passando pelos
+endpoints reais (/capturar, /cadastrar, /verificar). Mede latencias e acertos.
+
+Uso (Linux/CI, sem leitor):
+    FUTRONIC_SCANNER=simulado FUTRONIC_SIMULADOR_LEITORES=4 python main.py &
+    python benchmark.py --identidades 20 --verificacoes 100 --concorrencia 4
+
+As capturas rodam em paralelo, uma thread por leitor simulado (?device=).
+As mesmas sondas sao enviadas tambem de uma vez para /identificar/lote.
+A saida e um JSON com p50/p95/max de cada etapa, vazao de captura, de
+/verificar e do lote e a taxa de identificacao correta.
+"""
+
+import argparse
+import json
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from biometria_core.benchmark import imprimir, resumir
+
+ID_BASE = 900000  # Faixa de funcionario_id usada pelo benchmark (removida ao final)
+
+
+def chamar(url: str, metodo: str = "GET", corpo: dict = None, timeout: float = 60):
+    dados = json.dumps(corpo).encode() if corpo is not None else None
+    requisicao = urllib.request.Request(
+        url, data=dados, method=metodo, headers={"Content-Type": "application/json"}
+    )
+    inicio = time.perf_counter()
+    with urllib.request.urlopen(requisicao, timeout=timeout) as resposta:
+        resultado = json.loads(resposta.read())
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def capturar(url: str, device_id: str, identidade: int, formato: str) -> tuple:
+    resultado, _ = chamar(f"{url}/simular/dedo", "POST", {"identidade": identidade, "device_id": device_id})
+    if not resultado.get("success"):
+        raise RuntimeError(resultado.get("error"))
+    resultado, latencia = chamar(
+        f"{url}/capturar?device={device_id}", "POST", {"timeout": 10, "formato": formato}
+    )
+    if not resultado.get("success"):
+        raise RuntimeError(f"Captura da identidade {identidade} falhou: {resultado.get('error')}")
+    return resultado, latencia
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--identidades", type=int, default=20)
+    parser.add_argument("--verificacoes", type=int, default=100)
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--formato", default="minucias", choices=["png", "minucias", "raw"])
+    parser.add_argument("--manter", action="store_true", help="Nao remove os cadastros ao final")
+    args = parser.parse_args()
+    url = args.url.rstrip("/")
+
+    status, _ = chamar(f"{url}/device/status")
+    if status.get("sdk", {}).get("driver") != "simulado":
+        print("O servico precisa rodar com FUTRONIC_SCANNER=simulado", file=sys.stderr)
+        sys.exit(1)
+    leitores = [leitor["device_id"] for leitor in status.get("leitores", [])]
+    if not leitores:
+        print("Nenhum leitor simulado conectado", file=sys.stderr)
+        sys.exit(1)
+
+    latencias = {"capturar": [], "cadastrar": [], "verificar": []}
+    duracao_capturas = 0.0
+
+    def capturar_em_paralelo(identidades: list) -> list:
+        """Distribui as capturas entre os leitores (uma thread por leitor)"""
+        nonlocal duracao_capturas
+        def capturar_no_leitor(posicao):
+            return [
+                (n, capturar(url, leitores[posicao], identidades[n], args.formato))
+                for n in range(posicao, len(identidades), len(leitores))
+            ]
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(leitores)) as executor:
+            lotes = list(executor.map(capturar_no_leitor, range(len(leitores))))
+        duracao_capturas += time.perf_counter() - inicio
+        capturas = sorted((item for lote in lotes for item in lote), key=lambda item: item[0])
+        latencias["capturar"].extend(latencia for _, (_, latencia) in capturas)
+        return [captura for _, (captura, _) in capturas]
+
+    # Cadastro
+    capturas = capturar_em_paralelo(list(range(args.identidades)))
+    for identidade, captura in enumerate(capturas):
+        resultado, latencia = chamar(f"{url}/cadastrar", "POST", {
+            "funcionario_id": ID_BASE + identidade,
+            "nome": f"Benchmark {identidade}",
+            "pis": f"{ID_BASE + identidade:011d}",
+            "template_base64": captura["template_base64"],
+            "qualidade": captura.get("quality"),
+        })
+        if not resultado.get("success"):
+            raise RuntimeError(f"Cadastro da identidade {identidade} falhou: {resultado.get('error')}")
+        latencias["cadastrar"].append(latencia)
+
+    # Capturas de verificacao (cada leitor atende uma captura por vez)
+    identidades = [n % args.identidades for n in range(args.verificacoes)]
+    capturas = capturar_em_paralelo(identidades)
+    sondas = [(identidade, captura["template_base64"]) for identidade, captura in zip(identidades, capturas)]
+
+    # Verificacoes concorrentes
+    def verificar(sonda):
+        identidade, template = sonda
+        resultado, latencia = chamar(f"{url}/verificar", "POST", {"template_base64": template})
+        return resultado.get("funcionario_id") == ID_BASE + identidade, latencia
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        resultados = list(executor.map(verificar, sondas))
+    duracao = time.perf_counter() - inicio
+
+    latencias["verificar"] = [latencia for _, latencia in resultados]
+    acertos = sum(1 for acerto, _ in resultados if acerto)
+
+    # Mesmas sondas em um unico /identificar/lote (resposta NDJSON)
+    corpo = {"itens": [{"id": str(n), "template_base64": template} for n, (_, template) in enumerate(sondas)]}
+    requisicao = urllib.request.Request(
+        f"{url}/identificar/lote", data=json.dumps(corpo).encode(), method="POST",
+        headers={"Content-Type": "application/json"}
+    )
+    inicio = time.perf_counter()
+    with urllib.request.urlopen(requisicao, timeout=600) as resposta:
+        linhas = [json.loads(linha) for linha in resposta if linha.strip()]
+    duracao_lote = time.perf_counter() - inicio
+    acertos_lote = sum(
+        1 for linha in linhas if linha.get("funcionario_id") == ID_BASE + sondas[linha["indice"]][0]
+    )
+
+    if not args.manter:
+        for identidade in range(args.identidades):
+            chamar(f"{url}/remover/{ID_BASE + identidade}", "DELETE")
+
+    imprimir({
+        "identidades": args.identidades,
+        "verificacoes": args.verificacoes,
+        "concorrencia": args.concorrencia,
+        "leitores": len(leitores),
+        "formato": args.formato,
+        "latencias": {etapa: resumir(valores) for etapa, valores in latencias.items()},
+        "capturas_por_segundo": round(len(latencias["capturar"]) / duracao_capturas, 2),
+        "verificacoes_por_segundo": round(len(resultados) / duracao, 2) if duracao else None,
+        "taxa_identificacao": round(acertos / len(resultados), 4) if resultados else None,
+        "lote": {
+            "duracao_ms": round(duracao_lote * 1000, 2),
+            "identificacoes_por_segundo": round(len(linhas) / duracao_lote, 2) if duracao_lote else None,
+            "taxa_identificacao": round(acertos_lote / len(linhas), 4) if linhas else None,
+        },
+    })
+
+
+if __name__ == "__main__":
+    main()
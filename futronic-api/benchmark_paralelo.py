@@ -0,0 +1,113 @@
+"""
+Benchmark da comparacao paralela (speedup x processos)
+======================================================
+
+Monta uma galeria sintetica grande, publica em memoria compartilhada e mede a
+identificacao (1:N) com 1, 2, 4... processos. Roda direto sobre os modulos,
+sem o servidor e sem leitor.
+
+Uso:
+    python benchmark_paralelo.py --galeria 5000 --consultas 20 --processos 1,2,4,8
+
+A galeria parte de `--identidades` digitais sinteticas (scanners.py); as demais
+entradas sao copias rotacionadas/deslocadas com ruido, para ter a mesma
+distribuicao de minucias sem extrair milhares de imagens. A saida e um JSON com
+a latencia media por consulta, vazao e speedup/eficiencia em relacao a 1 processo.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import fingerprint
+import scanners
+from biometria_core.benchmark import contagens_processos, imprimir
+from comparacao_paralela import PoolComparacao
+
+
+def montar_galeria(tamanho: int, identidades: int, semente: int = 0) -> list:
+    """Digitais sinteticas + variacoes delas ate `tamanho` entradas"""
+    rng = np.random.default_rng(semente)
+    base = [
+        fingerprint.extrair_minucias(scanners.gerar_digital_sintetica(identidade, 0))
+        for identidade in range(identidades)
+    ]
+    galeria = list(base)
+    while len(galeria) < tamanho:
+        origem = base[len(galeria) % identidades]
+        variacao = fingerprint.transformar_minucias(
+            origem, rng.uniform(-np.pi, np.pi), rng.uniform(-40, 40), rng.uniform(-40, 40)
+        )
+        variacao[:, fingerprint.COL_X:fingerprint.COL_Y + 1] += rng.normal(0, 3, (len(variacao), 2))
+        manter = rng.random(len(variacao)) > 0.2
+        galeria.append(variacao[manter].astype(np.float32))
+    return galeria
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--galeria", type=int, default=5000)
+    parser.add_argument("--identidades", type=int, default=50)
+    parser.add_argument("--consultas", type=int, default=20)
+    parser.add_argument("--processos", default=None, help="Lista separada por virgula (padrao: 1, 2, 4... ate os nucleos)")
+    args = parser.parse_args()
+
+    nucleos = os.cpu_count() or 1
+    contagens = contagens_processos(args.processos)
+
+    galeria = montar_galeria(args.galeria, args.identidades)
+    minucias, quantidades = fingerprint.empacotar_minucias(galeria)
+    ponderar = np.zeros(len(galeria), dtype=bool)
+    sondas = [
+        fingerprint.extrair_minucias(scanners.gerar_digital_sintetica(n % args.identidades, 1 + n))
+        for n in range(args.consultas)
+    ]
+    sondas = [fingerprint.empacotar_minucias([sonda]) for sonda in sondas]
+
+    resultados, referencia, base = [], None, None
+    for processos in contagens:
+        pool = None
+        if processos > 1:
+            pool = PoolComparacao(processos)
+            pool.aquecer()
+            compartilhada = pool.publicar(minucias, quantidades, ponderar)
+            comparar = lambda consulta, n: pool.comparar(compartilhada, consulta, n)
+        else:
+            comparar = lambda consulta, n: fingerprint.comparar_com_galeria(consulta, n, minucias, quantidades, ponderar)
+
+        comparar(*sondas[0])  # Aquece (anexa a memoria compartilhada nos workers)
+        inicio = time.perf_counter()
+        scores = np.vstack([comparar(consulta, n) for consulta, n in sondas])
+        duracao = time.perf_counter() - inicio
+        if pool:
+            pool.encerrar()
+
+        if referencia is None:
+            referencia = scores
+        por_consulta = duracao / len(sondas)
+        base = base or por_consulta
+        resultados.append({
+            "processos": processos,
+            "ms_por_consulta": round(por_consulta * 1000, 2),
+            "comparacoes_por_segundo": round(len(galeria) / por_consulta),
+            "speedup": round(base / por_consulta, 2),
+            "eficiencia": round(base / por_consulta / processos, 2),
+            "scores_iguais": bool(np.array_equal(scores, referencia)),
+        })
+
+    imprimir({
+        "nucleos": nucleos,
+        "galeria": len(galeria),
+        "consultas": len(sondas),
+        "minucias_por_digital": round(float(quantidades.mean()), 1),
+        "resultados": resultados,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Calibracao do LIMIAR_MATCH (FAR/FRR) com Digitais Sinteticas
+============================================================
+
+Gera `--identidades` dedos sinteticos (scanners.gerar_digital_sintetica) com
+`--impressoes` colocacoes cada, extrai as minucias e compara todas as
+digitais entre si (fingerprint.comparar_com_galeria):
+
+- pares genuinos: impressoes diferentes do mesmo dedo
+- pares impostores: dedos diferentes
+
+As identidades sao divididas em duas metades disjuntas. O limiar de cada FAR
+alvo e escolhido na metade de calibracao (biometria_core.calibracao.ponto_operacao)
+e o FAR/FRR informado e o medido na metade reservada, que nao participou da
+escolha. Digitais sinteticas nao substituem capturas reais: confira o limiar
+com capturas do leitor antes de trocar o FUTRONIC_LIMIAR_MATCH em producao.
+
+Uso:
+    python calibrar.py
+    python calibrar.py --identidades 120 --impressoes 4 --far 0.01 0.001 --limiar 0.34
+
+A saida e um JSON com a distribuicao dos scores de cada metade, o ponto de
+operacao por FAR alvo e as taxas do limiar atual na metade reservada.
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import fingerprint
+import scanners
+from biometria_core import calibracao
+from biometria_core.benchmark import imprimir
+
+
+def scores_conjunto(identidades: range, impressoes: int, semente: int = 0) -> tuple:
+    """Scores (genuinos, impostores) de todas as digitais das identidades, cada par uma vez"""
+    minucias, donos = [], []
+    for identidade in identidades:
+        for impressao in range(impressoes):
+            imagem = scanners.gerar_digital_sintetica(identidade, impressao, semente=semente)
+            minucias.append(fingerprint.extrair_minucias(imagem))
+            donos.append(identidade)
+
+    empacotadas, quantidades = fingerprint.empacotar_minucias(minucias)
+    scores = fingerprint.comparar_com_galeria(empacotadas, quantidades, empacotadas, quantidades)
+    donos = np.array(donos)
+    superior = np.triu(np.ones(scores.shape, dtype=bool), k=1)
+    mesmo_dedo = donos[:, None] == donos[None, :]
+    return scores[superior & mesmo_dedo], scores[superior & ~mesmo_dedo]
+
+
+def resumir_scores(valores: np.ndarray) -> dict:
+    return {
+        "n": int(len(valores)),
+        "min": round(float(valores.min()), 4),
+        "p1": round(float(np.quantile(valores, 0.01)), 4),
+        "p50": round(float(np.quantile(valores, 0.5)), 4),
+        "p99": round(float(np.quantile(valores, 0.99)), 4),
+        "max": round(float(valores.max()), 4),
+    }
+
+
+def calibrar(identidades: int, impressoes: int, fars: tuple, limiar: float, semente: int = 0) -> dict:
+    metade = identidades // 2
+    genuinos_cal, impostores_cal = scores_conjunto(range(metade), impressoes, semente)
+    genuinos_res, impostores_res = scores_conjunto(range(metade, identidades), impressoes, semente)
+
+    pontos = []
+    for alvo in fars:
+        ponto = calibracao.ponto_operacao(genuinos_cal, impostores_cal, alvo)
+        pontos.append({
+            "far_alvo": alvo,
+            "limiar": ponto["limiar"],
+            "calibracao": {"far": ponto["far"], "frr": ponto["frr"], "confiavel": ponto["confiavel"]},
+            "reservado": calibracao.taxas_erro(genuinos_res, impostores_res, ponto["limiar"]),
+        })
+
+    return {
+        "identidades": identidades,
+        "impressoes": impressoes,
+        "calibracao": {
+            "genuinos": resumir_scores(genuinos_cal),
+            "impostores": resumir_scores(impostores_cal),
+        },
+        "reservado": {
+            "genuinos": resumir_scores(genuinos_res),
+            "impostores": resumir_scores(impostores_res),
+        },
+        "pontos_operacao": pontos,
+        "limiar_atual": calibracao.taxas_erro(genuinos_res, impostores_res, limiar),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--identidades", type=int, default=120, help="Dedos sinteticos (metade para calibrar)")
+    parser.add_argument("--impressoes", type=int, default=4, help="Colocacoes de cada dedo")
+    parser.add_argument("--far", type=float, nargs="+", default=[1e-2, 1e-3])
+    parser.add_argument("--limiar", type=float, default=float(os.environ.get("FUTRONIC_LIMIAR_MATCH", "0.34")))
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args()
+
+    imprimir(calibrar(args.identidades, args.impressoes, tuple(args.far), args.limiar, args.semente))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Comparacao Paralela da Galeria
+==============================
+
+Divide a galeria de minucias entre processos para que a identificacao (1:N)
+use todos os nucleos - a comparacao e NumPy, mas cada chamada roda inteira sob
+o GIL de um unico processo.
+
+Os arrays empacotados da galeria (ver fingerprint.empacotar_minucias) ficam em
+multiprocessing.shared_memory: cada worker anexa os blocos uma vez por versao da
+galeria e compara as consultas com a sua faixa, sem copiar a galeria. A
+identificacao espalha as faixas entre os workers e junta os scores.
+
+Cada tenant publica a sua galeria sob uma chave; publicar de novo na mesma
+chave substitui a versao anterior.
+
+Uso:
+    pool = PoolComparacao(processos=4)
+    galeria = pool.publicar(minucias, quantidades, ponderar, chave="12")
+    scores = pool.comparar(galeria, consultas, quantidades_consultas)  # (K, G)
+    pool.retirar("12")
+    pool.encerrar()
+"""
+
+import multiprocessing
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import fingerprint
+
+FAIXAS_POR_PROCESSO = 2  # Faixas da galeria por worker (equilibra workers mais lentos)
+GALERIAS_ANEXADAS = 8  # Galerias (versoes/tenants) mantidas anexadas em cada worker
+
+
+class GaleriaCompartilhada:
+    """
+    Galeria empacotada copiada para blocos de memoria compartilhada.
+
+    O processo principal cria e libera os blocos; os workers recebem apenas
+    o descritor (nomes, formatos e tipos) e anexam os blocos.
+    """
+
+    CAMPOS = ("minucias", "quantidades", "ponderar")
+
+    def __init__(self, minucias: np.ndarray, quantidades: np.ndarray, ponderar: np.ndarray):
+        self.versao = uuid.uuid4().hex[:12]
+        self.tamanho = len(minucias)
+        self.blocos = {}
+        self.descritor = {"versao": self.versao, "campos": {}}
+        self.em_uso = 0  # Comparacoes em andamento (protegido pelo lock do pool)
+        self.obsoleta = False
+
+        for campo, array in zip(self.CAMPOS, (minucias, quantidades, ponderar)):
+            array = np.ascontiguousarray(array)
+            bloco = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=bloco.buf)[...] = array
+            self.blocos[campo] = bloco
+            self.descritor["campos"][campo] = (bloco.name, array.shape, array.dtype.str)
+
+    def liberar(self):
+        """Fecha e remove os blocos (somente no processo que os criou)"""
+        for bloco in self.blocos.values():
+            bloco.close()
+            try:
+                bloco.unlink()
+            except FileNotFoundError:
+                pass
+        self.blocos.clear()
+
+
+# ============================================
+# LADO DO WORKER
+# ============================================
+
+_anexadas = {}  # versao -> (blocos, arrays), na ordem em que foram anexadas
+
+
+def _anexar(descritor: dict) -> dict:
+    """Anexa os blocos da galeria (uma vez por versao) e devolve os arrays"""
+    versao = descritor["versao"]
+    if versao not in _anexadas:
+        blocos, arrays = [], {}
+        for campo, (nome, formato, tipo) in descritor["campos"].items():
+            bloco = shared_memory.SharedMemory(name=nome)
+            blocos.append(bloco)
+            arrays[campo] = np.ndarray(tuple(formato), dtype=np.dtype(tipo), buffer=bloco.buf)
+        _anexadas[versao] = (blocos, arrays)
+
+        # Solta as anexadas ha mais tempo (reanexa se voltarem a ser usadas)
+        while len(_anexadas) > GALERIAS_ANEXADAS:
+            antiga = next(iter(_anexadas))
+            blocos_antigos, arrays_antigos = _anexadas.pop(antiga)
+            arrays_antigos.clear()
+            for bloco in blocos_antigos:
+                bloco.close()
+    return _anexadas[versao][1]
+
+
+def _comparar_faixa(descritor: dict, inicio: int, fim: int,
+                    consultas: np.ndarray, quantidades: np.ndarray) -> np.ndarray:
+    """Compara as consultas com a faixa [inicio, fim) da galeria (roda no worker)"""
+    galeria = _anexar(descritor)
+    return fingerprint.comparar_com_galeria(
+        consultas, quantidades,
+        galeria["minucias"][inicio:fim], galeria["quantidades"][inicio:fim], galeria["ponderar"][inicio:fim],
+    )
+
+
+# ============================================
+# LADO DO PROCESSO PRINCIPAL
+# ============================================
+
+class PoolComparacao:
+    """
+    Pool de processos que compara consultas contra uma galeria compartilhada.
+
+    `publicar` copia uma nova versao da galeria da `chave` para memoria
+    compartilhada; a versao anterior e liberada assim que nenhuma comparacao a
+    estiver usando.
+    """
+
+    def __init__(self, processos: int):
+        self.processos = processos
+        self.lock = threading.Lock()
+        self.publicadas = {}  # chave -> GaleriaCompartilhada
+        # spawn em todas as plataformas: o servico tem threads (monitor, captura) e fork as copiaria
+        self.executor = ProcessPoolExecutor(
+            max_workers=processos,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def aquecer(self):
+        """Sobe os workers antes da primeira identificacao (spawn leva alguns segundos)"""
+        list(self.executor.map(abs, range(self.processos)))
+
+    def publicar(self, minucias: np.ndarray, quantidades: np.ndarray, ponderar: np.ndarray,
+                 chave: str = "") -> GaleriaCompartilhada:
+        """Publica uma nova versao da galeria da `chave` e descarta a anterior"""
+        galeria = GaleriaCompartilhada(minucias, quantidades, ponderar)
+        self._substituir(chave, galeria)
+        return galeria
+
+    def retirar(self, chave: str = ""):
+        """Descarta a galeria publicada na `chave` (ex: ficou pequena ou ociosa)"""
+        self._substituir(chave, None)
+
+    def _substituir(self, chave: str, galeria):
+        with self.lock:
+            anterior = self.publicadas.pop(chave, None)
+            if galeria is not None:
+                self.publicadas[chave] = galeria
+            if anterior is not None:
+                anterior.obsoleta = True
+                if anterior.em_uso == 0:
+                    anterior.liberar()
+
+    def faixas(self, tamanho: int) -> list:
+        """Divide [0, tamanho) em faixas contiguas de tamanho parecido"""
+        quantidade = max(1, min(tamanho, self.processos * FAIXAS_POR_PROCESSO))
+        limites = np.linspace(0, tamanho, quantidade + 1).astype(int)
+        return [(int(inicio), int(fim)) for inicio, fim in zip(limites[:-1], limites[1:]) if fim > inicio]
+
+    def comparar(self, galeria: GaleriaCompartilhada, consultas: np.ndarray, quantidades: np.ndarray) -> np.ndarray:
+        """
+        Compara K consultas com a galeria inteira, em paralelo.
+
+        Retorna: scores (K, G) - os mesmos de fingerprint.comparar_com_galeria
+        """
+        with self.lock:
+            if galeria.obsoleta and not galeria.blocos:
+                raise RuntimeError("Galeria compartilhada ja liberada")
+            galeria.em_uso += 1
+
+        try:
+            futuros = [
+                self.executor.submit(_comparar_faixa, galeria.descritor, inicio, fim, consultas, quantidades)
+                for inicio, fim in self.faixas(galeria.tamanho)
+            ]
+            partes = [futuro.result() for futuro in futuros]
+            if not partes:
+                return np.zeros((len(consultas), 0), dtype=np.float64)
+            return np.concatenate(partes, axis=1)
+        finally:
+            with self.lock:
+                galeria.em_uso -= 1
+                if galeria.obsoleta and galeria.em_uso == 0:
+                    galeria.liberar()
+
+    def encerrar(self):
+        """Para os workers e libera a memoria compartilhada"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            for galeria in self.publicadas.values():
+                galeria.liberar()
+            self.publicadas.clear()
@@ -0,0 +1,737 @@
+"""
+Processamento de Digitais
+=========================
+
+Codificacao, extracao de minucias e comparacao de digitais usadas pela Biometric API.
+Implementado apenas com NumPy + Pillow (sem OpenCV/SciPy) para rodar tambem
+no Python 32-bit embarcado (python32/) exigido pelo SDK Futronic.
+
+Formatos de template aceitos (identificados pelos primeiros bytes):
+- PNG  : imagem 8-bit em escala de cinza, sem perdas      -> b"\\x89PNG"
+- FTM1 : template de minucias (poucas centenas de bytes)  -> b"FTM1"
+- RAW  : buffer cru do sensor (legado, ~150 KB no FS80H)  -> qualquer outro conteudo
+"""
+
+import struct
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+# Formatos de template
+FORMATO_PNG = "png"
+FORMATO_MINUCIAS = "minucias"
+FORMATO_RAW = "raw"
+FORMATO_DESCONHECIDO = "desconhecido"
+
+PNG_MAGIC = b"\x89PNG"
+MINUCIAS_MAGIC = b"FTM1"
+
+# Dimensoes (altura, largura) dos sensores conhecidos, pelo tamanho do buffer raw
+# FS80/FS80H/FS88 entregam 320x480 pixels a 500 DPI
+SENSOR_DIMENSOES = {
+    320 * 480: (480, 320),
+}
+
+# Parametros de extracao
+BLOCO = 16  # Tamanho do bloco para segmentacao
+RAIO_ORIENTACAO = 8  # Raio da janela de suavizacao do campo de orientacao
+MAX_MINUCIAS = 100  # Limite de minucias por template
+DISTANCIA_MINIMA_MINUCIAS = 8  # Minucias mais proximas que isso sao ruido (espinhos/quebras)
+COERENCIA_MINIMA = 0.2  # Minucias em regioes sem orientacao definida sao descartadas
+
+# Parametros de qualidade
+DESVIO_MINIMO_DIGITAL = 12.0  # Desvio padrao (niveis de cinza) de um bloco com digital
+DESVIO_CONTRASTE_IDEAL = 50.0  # Desvio padrao de um bloco com cristas bem definidas
+AREA_IDEAL = 0.6  # Fracao do sensor coberta por um dedo bem posicionado
+COERENCIA_IDEAL = 0.7  # Coerencia media de cristas nitidas
+
+# Parametros de comparacao
+TOLERANCIA_DISTANCIA = 12.0  # pixels
+TOLERANCIA_ANGULO = np.pi / 9  # 20 graus
+ROTACAO_MAXIMA = np.pi / 4  # 45 graus
+CELULA_ROTACAO = np.pi / 36  # Celulas de votacao do alinhamento: 5 graus x 8 px
+CELULA_TRANSLACAO = 8.0
+CANDIDATOS_ALINHAMENTO = 5  # Celulas mais votadas avaliadas por completo
+MIN_MINUCIAS_COMPARACAO = 5
+ELEMENTOS_POR_BLOCO = 200_000  # Pares de minucias por bloco da comparacao em lote (limita a memoria)
+
+# Parametros da consolidacao (cadastro com varias capturas)
+PRESENCA_MINIMA = 0.5  # Fracao das capturas em que a minucia precisa aparecer para ficar no template
+
+# Colunas do array de minucias: x, y, angulo (radianos, [0, pi)), tipo (1=terminacao, 3=bifurcacao), peso (0-1)
+COL_X, COL_Y, COL_ANGULO, COL_TIPO, COL_PESO = range(5)
+TIPO_TERMINACAO, TIPO_BIFURCACAO = 1, 3
+
+_REGISTRO_MINUCIA = np.dtype([
+    ("x", "<u2"),
+    ("y", "<u2"),
+    ("angulo", "u1"),
+    ("tipo", "u1"),
+    ("peso", "u1"),
+])
+_CABECALHO = struct.Struct("<4sHHH")  # magic, largura, altura, quantidade
+
+
+class TemplateInvalido(ValueError):
+    """Template recebido corrompido ou truncado (PNG ilegivel, FTM1 incompleto)"""
+
+
+# ============================================
+# CODIFICACAO
+# ============================================
+
+def identificar_formato(data: bytes) -> str:
+    """Identifica o formato de um template pelos primeiros bytes"""
+    if not data:
+        return FORMATO_DESCONHECIDO
+    if data.startswith(PNG_MAGIC):
+        return FORMATO_PNG
+    if data.startswith(MINUCIAS_MAGIC):
+        return FORMATO_MINUCIAS
+    if len(data) in SENSOR_DIMENSOES:
+        return FORMATO_RAW
+    return FORMATO_DESCONHECIDO
+
+
+def raw_para_imagem(data: bytes, largura: int = None, altura: int = None) -> Optional[np.ndarray]:
+    """Converte o buffer cru do sensor em imagem (altura x largura, uint8)"""
+    if largura and altura:
+        if len(data) < largura * altura:
+            return None
+        return np.frombuffer(data, dtype=np.uint8, count=largura * altura).reshape(altura, largura)
+
+    dimensoes = SENSOR_DIMENSOES.get(len(data))
+    if not dimensoes:
+        return None
+    return np.frombuffer(data, dtype=np.uint8).reshape(dimensoes)
+
+
+def codificar_png(imagem: np.ndarray) -> bytes:
+    """Codifica a imagem em PNG 8-bit (sem perdas)"""
+    buffer = BytesIO()
+    Image.fromarray(np.ascontiguousarray(imagem, dtype=np.uint8), mode="L").save(
+        buffer, "PNG", optimize=True
+    )
+    return buffer.getvalue()
+
+
+def decodificar_png(data: bytes) -> np.ndarray:
+    """Decodifica PNG para imagem em escala de cinza (uint8)"""
+    try:
+        image = Image.open(BytesIO(data))
+        if image.mode != "L":
+            image = image.convert("L")
+        return np.array(image)
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise TemplateInvalido(f"PNG invalido: {e}") from e
+
+
+def decodificar_imagem(data: bytes) -> Optional[np.ndarray]:
+    """Retorna a imagem contida no template (PNG ou raw), ou None se for apenas minucias"""
+    formato = identificar_formato(data)
+    if formato == FORMATO_PNG:
+        return decodificar_png(data)
+    if formato == FORMATO_RAW:
+        return raw_para_imagem(data)
+    return None
+
+
+def serializar_minucias(minucias: np.ndarray, largura: int, altura: int) -> bytes:
+    """Serializa minucias no formato FTM1 (7 bytes por minucia)"""
+    registros = np.zeros(len(minucias), dtype=_REGISTRO_MINUCIA)
+    if len(minucias):
+        registros["x"] = np.clip(np.round(minucias[:, COL_X]), 0, 65535)
+        registros["y"] = np.clip(np.round(minucias[:, COL_Y]), 0, 65535)
+        registros["angulo"] = np.round(minucias[:, COL_ANGULO] / np.pi * 256).astype(np.int64) % 256
+        registros["tipo"] = minucias[:, COL_TIPO]
+        registros["peso"] = np.clip(np.round(minucias[:, COL_PESO] * 255), 0, 255)
+    return _CABECALHO.pack(MINUCIAS_MAGIC, largura, altura, len(registros)) + registros.tobytes()
+
+
+def desserializar_minucias(data: bytes) -> tuple:
+    """
+    Le um template FTM1.
+
+    Retorna: (minucias, largura, altura)
+    """
+    if len(data) < _CABECALHO.size:
+        raise TemplateInvalido("Template de minucias truncado")
+    magic, largura, altura, quantidade = _CABECALHO.unpack_from(data)
+    if magic != MINUCIAS_MAGIC:
+        raise TemplateInvalido("Template de minucias invalido")
+    if len(data) < _CABECALHO.size + quantidade * _REGISTRO_MINUCIA.itemsize:
+        raise TemplateInvalido(f"Template de minucias truncado ({quantidade} minucias declaradas)")
+    registros = np.frombuffer(data, dtype=_REGISTRO_MINUCIA, count=quantidade, offset=_CABECALHO.size)
+
+    minucias = np.empty((quantidade, 5), dtype=np.float32)
+    minucias[:, COL_X] = registros["x"]
+    minucias[:, COL_Y] = registros["y"]
+    minucias[:, COL_ANGULO] = registros["angulo"] * (np.pi / 256)
+    minucias[:, COL_TIPO] = registros["tipo"]
+    minucias[:, COL_PESO] = registros["peso"] / 255.0
+    return minucias, largura, altura
+
+
+# ============================================
+# EXTRACAO DE MINUCIAS
+# ============================================
+
+def _media_local(imagem: np.ndarray, raio: int) -> np.ndarray:
+    """Media em janela (2*raio+1)^2 usando imagem integral"""
+    k = 2 * raio + 1
+    p = np.pad(imagem.astype(np.float64), ((raio + 1, raio), (raio + 1, raio)), mode="edge")
+    c = p.cumsum(axis=0).cumsum(axis=1)
+    soma = c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]
+    return soma / (k * k)
+
+
+def _vizinhos(img: np.ndarray) -> list:
+    """Retorna os 8 vizinhos (P2..P9, sentido horario a partir do norte) de uma imagem com borda de 1 pixel"""
+    return [
+        img[:-2, 1:-1], img[:-2, 2:], img[1:-1, 2:], img[2:, 2:],
+        img[2:, 1:-1], img[2:, :-2], img[1:-1, :-2], img[:-2, :-2],
+    ]
+
+
+def _afinar(binaria: np.ndarray) -> np.ndarray:
+    """Afinamento Zhang-Suen vetorizado (cada iteracao processa a imagem inteira)"""
+    img = np.pad(binaria.astype(np.uint8), 1)
+    while True:
+        alterado = False
+        for passo in (0, 1):
+            p2, p3, p4, p5, p6, p7, p8, p9 = _vizinhos(img)
+            centro = img[1:-1, 1:-1]
+            b = p2 + p3 + p4 + p5 + p6 + p7 + p8 + p9
+            sequencia = (p2, p3, p4, p5, p6, p7, p8, p9, p2)
+            a = sum((sequencia[i] == 0) & (sequencia[i + 1] == 1) for i in range(8))
+            if passo == 0:
+                c1 = (p2 * p4 * p6) == 0
+                c2 = (p4 * p6 * p8) == 0
+            else:
+                c1 = (p2 * p4 * p8) == 0
+                c2 = (p2 * p6 * p8) == 0
+            remover = (centro == 1) & (b >= 2) & (b <= 6) & (a == 1) & c1 & c2
+            if remover.any():
+                centro[remover] = 0
+                alterado = True
+        if not alterado:
+            return img[1:-1, 1:-1].astype(bool)
+
+
+def _blocos(imagem: np.ndarray) -> np.ndarray:
+    """Visao (hb, BLOCO, wb, BLOCO) da imagem, descartando a sobra das bordas"""
+    altura, largura = imagem.shape
+    hb, wb = altura // BLOCO, largura // BLOCO
+    return imagem[:hb * BLOCO, :wb * BLOCO].reshape(hb, BLOCO, wb, BLOCO)
+
+
+def _segmentar(imagem: np.ndarray) -> np.ndarray:
+    """Mascara da regiao com digital (blocos com variancia suficiente), ja erodida em 1 bloco"""
+    altura, largura = imagem.shape
+    hb, wb = altura // BLOCO, largura // BLOCO
+    desvio = _blocos(imagem).std(axis=(1, 3))
+    mascara = desvio > max(desvio.max() * 0.3, 1e-6)
+
+    # Erosao: descarta blocos na borda da digital (minucias falsas no contorno)
+    p = np.pad(mascara, 1)
+    mascara = mascara & p[:-2, 1:-1] & p[2:, 1:-1] & p[1:-1, :-2] & p[1:-1, 2:]
+
+    completa = np.zeros((altura, largura), dtype=bool)
+    completa[:hb * BLOCO, :wb * BLOCO] = np.repeat(np.repeat(mascara, BLOCO, axis=0), BLOCO, axis=1)
+    return completa
+
+
+def campo_orientacao(imagem: np.ndarray) -> tuple:
+    """
+    Campo de orientacao das cristas por gradientes suavizados.
+
+    Retorna: (angulo, coerencia) por pixel. Angulo em [0, pi), coerencia em [0, 1].
+    """
+    gy, gx = np.gradient(imagem.astype(np.float64))
+    gxx = _media_local(gx * gx, RAIO_ORIENTACAO)
+    gyy = _media_local(gy * gy, RAIO_ORIENTACAO)
+    gxy = _media_local(gx * gy, RAIO_ORIENTACAO)
+
+    angulo = (0.5 * np.arctan2(2 * gxy, gxx - gyy) + np.pi / 2) % np.pi
+    coerencia = np.sqrt((gxx - gyy) ** 2 + 4 * gxy ** 2) / (gxx + gyy + 1e-9)
+    return angulo, coerencia
+
+
+def extrair_minucias(imagem: np.ndarray) -> np.ndarray:
+    """
+    Extrai minucias (terminacoes e bifurcacoes) de uma imagem de digital.
+
+    Pipeline: normalizacao -> segmentacao -> orientacao -> binarizacao local
+    -> afinamento -> crossing number -> filtragem.
+
+    Retorna: array (N, 5) com colunas x, y, angulo, tipo, peso
+    """
+    img = imagem.astype(np.float64)
+    img = (img - img.mean()) / (img.std() + 1e-9)
+
+    mascara = _segmentar(img)
+    angulo, coerencia = campo_orientacao(img)
+
+    # Binarizacao: cristas sao mais escuras que a media local
+    suavizada = _media_local(img, 1)
+    cristas = (suavizada < _media_local(img, 6)) & mascara
+
+    esqueleto = _afinar(cristas).astype(np.uint8)
+
+    # Crossing number: 1 = terminacao, 3 = bifurcacao
+    viz = _vizinhos(np.pad(esqueleto, 1))
+    cn = sum(np.abs(viz[i].astype(np.int8) - viz[(i + 1) % 8]) for i in range(8)) // 2
+    candidatos = (esqueleto == 1) & ((cn == 1) | (cn == 3)) & mascara
+
+    ys, xs = np.nonzero(candidatos)
+    if len(xs) == 0:
+        return np.zeros((0, 5), dtype=np.float32)
+
+    pesos = coerencia[ys, xs]
+    validos = pesos >= COERENCIA_MINIMA
+    ys, xs, pesos = ys[validos], xs[validos], pesos[validos]
+
+    # Remove aglomerados (espinhos e quebras geram pares de minucias falsas muito proximas)
+    if len(xs) > 1:
+        dx = xs[:, None] - xs[None, :]
+        dy = ys[:, None] - ys[None, :]
+        proximas = (dx * dx + dy * dy) < DISTANCIA_MINIMA_MINUCIAS ** 2
+        np.fill_diagonal(proximas, False)
+        isoladas = ~proximas.any(axis=1)
+        ys, xs, pesos = ys[isoladas], xs[isoladas], pesos[isoladas]
+
+    # Mantem as minucias mais confiaveis
+    ordem = np.argsort(-pesos, kind="stable")[:MAX_MINUCIAS]
+    ys, xs, pesos = ys[ordem], xs[ordem], pesos[ordem]
+
+    minucias = np.empty((len(xs), 5), dtype=np.float32)
+    minucias[:, COL_X] = xs
+    minucias[:, COL_Y] = ys
+    minucias[:, COL_ANGULO] = angulo[ys, xs]
+    minucias[:, COL_TIPO] = cn[ys, xs]
+    minucias[:, COL_PESO] = np.clip(pesos, 0, 1)
+    return minucias
+
+
+# ============================================
+# QUALIDADE
+# ============================================
+
+def avaliar_qualidade(imagem: np.ndarray) -> dict:
+    """
+    Avalia a qualidade de uma captura por blocos (poucos milissegundos).
+
+    - area: fracao do sensor coberta pela digital (relativa a AREA_IDEAL)
+    - contraste: desvio padrao medio dos blocos com digital
+    - coerencia: definicao da orientacao das cristas (0 = ruido, 1 = cristas paralelas)
+
+    Retorna: dict com score (0-100) e os componentes (0-1)
+    """
+    img = imagem.astype(np.float64)
+    desvio = _blocos(img).std(axis=(1, 3))
+    digital = desvio >= DESVIO_MINIMO_DIGITAL
+
+    if not digital.any():
+        return {"score": 0, "area": 0.0, "contraste": 0.0, "coerencia": 0.0}
+
+    area = min(1.0, float(digital.mean()) / AREA_IDEAL)
+    contraste = min(1.0, float(desvio[digital].mean()) / DESVIO_CONTRASTE_IDEAL)
+
+    # Coerencia do tensor de gradientes somado por bloco
+    gy, gx = np.gradient(img)
+    gxx = _blocos(gx * gx).sum(axis=(1, 3))
+    gyy = _blocos(gy * gy).sum(axis=(1, 3))
+    gxy = _blocos(gx * gy).sum(axis=(1, 3))
+    coerencia_blocos = np.sqrt((gxx - gyy) ** 2 + 4 * gxy ** 2) / (gxx + gyy + 1e-9)
+    coerencia = float(coerencia_blocos[digital].mean())
+
+    # Sem orientacao definida nao ha digital utilizavel, independente de area/contraste
+    score = 100 * min(1.0, coerencia / COERENCIA_IDEAL) * (0.5 * area + 0.5 * contraste)
+    return {
+        "score": int(round(score)),
+        "area": round(area, 3),
+        "contraste": round(contraste, 3),
+        "coerencia": round(coerencia, 3),
+    }
+
+
+def carregar_minucias(data: bytes) -> Optional[np.ndarray]:
+    """
+    Obtem as minucias de qualquer formato de template suportado.
+    Retorna None se o formato nao for reconhecido (template legado opaco).
+    """
+    formato = identificar_formato(data)
+    if formato == FORMATO_MINUCIAS:
+        return desserializar_minucias(data)[0]
+    imagem = decodificar_imagem(data)
+    if imagem is None:
+        return None
+    return extrair_minucias(imagem)
+
+
+# ============================================
+# COMPARACAO
+# ============================================
+
+def _diferenca_angular(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Diferenca entre orientacoes (modulo pi), no intervalo [-pi/2, pi/2)"""
+    return (b - a + np.pi / 2) % np.pi - np.pi / 2
+
+
+def alinhar_minucias(a: np.ndarray, b: np.ndarray, ponderar: bool = False) -> Optional[dict]:
+    """
+    Alinha dois conjuntos de minucias.
+
+    Alinhamento por votacao (transformada de Hough sobre rotacao/translacao de
+    todos os pares) seguido de pareamento mutuo por vizinho mais proximo.
+
+    Com `ponderar`, os pares de `b` contam pelo peso (confiabilidade) das suas
+    minucias - usado para templates consolidados, em que o peso indica em
+    quantas capturas a minucia apareceu.
+
+    Retorna: dict com score (0 a 1), rotacao/dx/dy (levam `a` ao referencial de
+    `b`) e pares (indices em `a` e em `b`), ou None se nao houver alinhamento
+    """
+    n, m = len(a), len(b)
+    if n < MIN_MINUCIAS_COMPARACAO or m < MIN_MINUCIAS_COMPARACAO:
+        return None
+
+    # Rotacao candidata para cada par (i, j)
+    rot = _diferenca_angular(a[:, None, COL_ANGULO], b[None, :, COL_ANGULO])
+    cos, sin = np.cos(rot), np.sin(rot)
+    ax, ay = a[:, None, COL_X], a[:, None, COL_Y]
+    tx = b[None, :, COL_X] - (cos * ax - sin * ay)
+    ty = b[None, :, COL_Y] - (sin * ax + cos * ay)
+
+    plausivel = np.abs(rot) <= ROTACAO_MAXIMA
+    if not plausivel.any():
+        return None
+
+    # Votacao em celulas de rotacao/translacao
+    rot_v, tx_v, ty_v = rot[plausivel], tx[plausivel], ty[plausivel]
+    chaves = np.stack([
+        np.floor(rot_v / CELULA_ROTACAO),
+        np.floor(tx_v / CELULA_TRANSLACAO),
+        np.floor(ty_v / CELULA_TRANSLACAO),
+    ], axis=1).astype(np.int64)
+    celulas, inverso, votos = np.unique(chaves, axis=0, return_inverse=True, return_counts=True)
+    inverso = inverso.ravel()
+
+    pesos_b = b[:, COL_PESO] if ponderar and b[:, COL_PESO].sum() > 0 else None
+
+    melhor = None
+    for celula in np.argsort(-votos, kind="stable")[:CANDIDATOS_ALINHAMENTO]:
+        selecionados = inverso == celula
+        r = float(np.mean(rot_v[selecionados]))
+        dx = float(np.mean(tx_v[selecionados]))
+        dy = float(np.mean(ty_v[selecionados]))
+
+        alinhadas = transformar_minucias(a, r, dx, dy)
+        pares_a, pares_b = _parear(alinhadas, b)
+
+        if pesos_b is None:
+            score = len(pares_a) * len(pares_a) / (n * m)
+        else:
+            score = len(pares_a) * float(pesos_b[pares_b].sum()) / (n * float(pesos_b.sum()))
+        if melhor is None or score > melhor["score"]:
+            melhor = {"score": min(1.0, score), "rotacao": r, "dx": dx, "dy": dy, "pares": (pares_a, pares_b)}
+
+    return melhor
+
+
+def comparar_minucias(a: np.ndarray, b: np.ndarray, ponderar: bool = False) -> float:
+    """
+    Compara dois conjuntos de minucias (ver alinhar_minucias).
+
+    Retorna: score entre 0 e 1
+    """
+    alinhamento = alinhar_minucias(a, b, ponderar)
+    return alinhamento["score"] if alinhamento else 0.0
+
+
+def empacotar_minucias(conjuntos: list) -> tuple:
+    """
+    Empilha conjuntos de minucias de tamanhos diferentes para comparacao em lote.
+
+    Retorna: (array (K, maximo, 5) float32 preenchido com zeros, quantidades (K,) int32)
+    """
+    quantidades = np.array([len(m) for m in conjuntos], dtype=np.int32)
+    maximo = int(quantidades.max()) if len(conjuntos) else 0
+    empacotadas = np.zeros((len(conjuntos), maximo, 5), dtype=np.float32)
+    for i, minucias in enumerate(conjuntos):
+        empacotadas[i, :len(minucias)] = minucias
+    return empacotadas, quantidades
+
+
+def comparar_pares(a: np.ndarray, na: np.ndarray, b: np.ndarray, nb: np.ndarray,
+                   ponderar: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Compara P pares (a[p], b[p]) de uma vez, com o mesmo algoritmo de
+    comparar_minucias (votacao de Hough + pareamento mutuo), vetorizado sobre os
+    pares. Usado para identificar contra a galeria inteira e em lotes.
+
+    a: (P, N, 5) e b: (P, M, 5) empacotados (ver empacotar_minucias); na/nb:
+    minucias validas de cada lado; ponderar: (P,) bool, pares de b contam pelo peso.
+    `a` pode ser um np.broadcast_to de uma unica consulta.
+
+    Retorna: scores (P,) entre 0 e 1
+    """
+    total = len(a)
+    scores = np.zeros(total, dtype=np.float64)
+    if total == 0 or a.shape[1] == 0 or b.shape[1] == 0:
+        return scores
+
+    na = np.asarray(na)
+    nb = np.asarray(nb)
+    ponderar = np.zeros(total, dtype=bool) if ponderar is None else np.asarray(ponderar, dtype=bool)
+
+    bloco = max(1, ELEMENTOS_POR_BLOCO // (a.shape[1] * b.shape[1]))
+    for inicio in range(0, total, bloco):
+        fim = min(total, inicio + bloco)
+        scores[inicio:fim] = _comparar_bloco(
+            a[inicio:fim], na[inicio:fim], b[inicio:fim], nb[inicio:fim], ponderar[inicio:fim]
+        )
+    return scores
+
+
+def comparar_com_galeria(consultas: np.ndarray, nc: np.ndarray, galeria: np.ndarray, ng: np.ndarray,
+                         ponderar: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Compara K consultas com G digitais da galeria (todos contra todos).
+
+    consultas/galeria empacotadas com empacotar_minucias; ponderar: (G,) bool.
+    As consultas sao processadas em grupos para limitar a memoria dos pares.
+
+    Retorna: scores (K, G)
+    """
+    k, g = len(consultas), len(galeria)
+    scores = np.zeros((k, g), dtype=np.float64)
+    if k == 0 or g == 0:
+        return scores
+    ponderar = np.zeros(g, dtype=bool) if ponderar is None else np.asarray(ponderar, dtype=bool)
+
+    pares_por_grupo = max(1, ELEMENTOS_POR_BLOCO // max(1, consultas.shape[1] * galeria.shape[1]))
+    por_grupo = max(1, pares_por_grupo // g)
+    for inicio in range(0, k, por_grupo):
+        fim = min(k, inicio + por_grupo)
+        indice_c = np.repeat(np.arange(inicio, fim), g)
+        indice_g = np.tile(np.arange(g), fim - inicio)
+        scores[inicio:fim] = comparar_pares(
+            consultas[indice_c], nc[indice_c], galeria[indice_g], ng[indice_g], ponderar[indice_g]
+        ).reshape(fim - inicio, g)
+    return scores
+
+
+# Deslocamentos para codificar (par, rotacao, tx, ty) das celulas de votacao em um int64,
+# preservando a ordem lexicografica usada em alinhar_minucias
+_BITS_CELULA = 12
+_DESLOCAMENTO_CELULA = 1 << (_BITS_CELULA - 1)
+
+
+def _comparar_bloco(a, na, b, nb, ponderar) -> np.ndarray:
+    """Um bloco de comparar_pares"""
+    pares, n, m = len(a), a.shape[1], b.shape[1]
+    scores = np.zeros(pares, dtype=np.float64)
+
+    validas_a = np.arange(n)[None, :] < na[:, None]
+    validas_b = np.arange(m)[None, :] < nb[:, None]
+    aptos = (na >= MIN_MINUCIAS_COMPARACAO) & (nb >= MIN_MINUCIAS_COMPARACAO)
+
+    # Rotacao candidata para cada (par, i, j); translacao so dos pares plausiveis
+    rot = _diferenca_angular(a[:, :, None, COL_ANGULO], b[:, None, :, COL_ANGULO])
+    plausivel = (np.abs(rot) <= ROTACAO_MAXIMA) & validas_a[:, :, None] & validas_b[:, None, :]
+    plausivel &= aptos[:, None, None]
+    par_v, i_v, j_v = np.nonzero(plausivel)
+    if len(par_v) == 0:
+        return scores
+
+    rot_v = rot[par_v, i_v, j_v]
+    cos, sin = np.cos(rot_v), np.sin(rot_v)
+    ax, ay = a[par_v, i_v, COL_X], a[par_v, i_v, COL_Y]
+    tx_v = b[par_v, j_v, COL_X] - (cos * ax - sin * ay)
+    ty_v = b[par_v, j_v, COL_Y] - (sin * ax + cos * ay)
+
+    # Votacao: uma chave int64 por (par, celula)
+    chaves = par_v.astype(np.int64)
+    for valor, celula in ((rot_v, CELULA_ROTACAO), (tx_v, CELULA_TRANSLACAO), (ty_v, CELULA_TRANSLACAO)):
+        componente = np.clip(np.floor(valor / celula).astype(np.int64) + _DESLOCAMENTO_CELULA,
+                             0, (1 << _BITS_CELULA) - 1)
+        chaves = (chaves << _BITS_CELULA) | componente
+    celulas, inverso, votos = np.unique(chaves, return_inverse=True, return_counts=True)
+    inverso = inverso.ravel()
+    par_celula = celulas >> (3 * _BITS_CELULA)
+
+    # CANDIDATOS_ALINHAMENTO celulas mais votadas de cada par (empates na ordem das celulas)
+    ordem = np.lexsort((-votos, par_celula))
+    par_ordenado = par_celula[ordem]
+    posicao = np.arange(len(ordem)) - np.searchsorted(par_ordenado, par_ordenado, side="left")
+    escolhidas = ordem[posicao < CANDIDATOS_ALINHAMENTO]
+
+    r = (np.bincount(inverso, weights=rot_v, minlength=len(celulas))[escolhidas] / votos[escolhidas])
+    dx = (np.bincount(inverso, weights=tx_v, minlength=len(celulas))[escolhidas] / votos[escolhidas])
+    dy = (np.bincount(inverso, weights=ty_v, minlength=len(celulas))[escolhidas] / votos[escolhidas])
+    par_c = par_celula[escolhidas]
+    r, dx, dy = r.astype(np.float32), dx.astype(np.float32), dy.astype(np.float32)
+
+    # Avalia cada candidato: alinha a, pareia com b
+    ac, bc = a[par_c], b[par_c]
+    c, s = np.cos(r)[:, None], np.sin(r)[:, None]
+    xa = c * ac[:, :, COL_X] - s * ac[:, :, COL_Y] + dx[:, None]
+    ya = s * ac[:, :, COL_X] + c * ac[:, :, COL_Y] + dy[:, None]
+
+    # Diferenca angular apos a rotacao = rot[i, j] - r, ja no intervalo (-pi, pi)
+    dist2 = (xa[:, :, None] - bc[:, None, :, COL_X]) ** 2 + (ya[:, :, None] - bc[:, None, :, COL_Y]) ** 2
+    diferenca = np.abs(rot[par_c] - r[:, None, None])
+    compativel = (dist2 <= TOLERANCIA_DISTANCIA ** 2) & (
+        (diferenca <= TOLERANCIA_ANGULO) | (diferenca >= np.pi - TOLERANCIA_ANGULO)
+    )
+    compativel &= validas_a[par_c][:, :, None] & validas_b[par_c][:, None, :]
+    dist2 = np.where(compativel, dist2, np.inf)
+
+    mais_proximo_a = dist2.argmin(axis=2)
+    mais_proximo_b = dist2.argmin(axis=1)
+    mutuos = np.take_along_axis(mais_proximo_b, mais_proximo_a, axis=1) == np.arange(n)[None, :]
+    mutuos &= np.isfinite(np.take_along_axis(dist2, mais_proximo_a[:, :, None], axis=2)[:, :, 0])
+    pareados = mutuos.sum(axis=1)
+
+    n_c = na[par_c].astype(np.float64)
+    score = pareados * pareados / (n_c * nb[par_c])
+
+    pesos = np.where(validas_b[par_c], bc[:, :, COL_PESO], 0)
+    soma_pesos = pesos.sum(axis=1)
+    ponderado = ponderar[par_c] & (soma_pesos > 0)
+    if ponderado.any():
+        pesos_pareados = (np.take_along_axis(pesos, mais_proximo_a, axis=1) * mutuos).sum(axis=1)
+        score = np.where(ponderado, pareados * pesos_pareados / (n_c * np.where(ponderado, soma_pesos, 1)), score)
+
+    np.maximum.at(scores, par_c, score)
+    return np.minimum(scores, 1.0)
+
+
+def transformar_minucias(minucias: np.ndarray, rotacao: float, dx: float, dy: float) -> np.ndarray:
+    """Aplica rotacao e translacao as minucias (posicao e orientacao)"""
+    c, s = np.cos(rotacao), np.sin(rotacao)
+    resultado = minucias.copy()
+    resultado[:, COL_X] = c * minucias[:, COL_X] - s * minucias[:, COL_Y] + dx
+    resultado[:, COL_Y] = s * minucias[:, COL_X] + c * minucias[:, COL_Y] + dy
+    resultado[:, COL_ANGULO] = (minucias[:, COL_ANGULO] + rotacao) % np.pi
+    return resultado
+
+
+def _parear(a: np.ndarray, b: np.ndarray) -> tuple:
+    """
+    Pareamento mutuo por vizinho mais proximo entre minucias ja alinhadas
+    (dentro das tolerancias de distancia e angulo).
+
+    Retorna: (indices em a, indices em b)
+    """
+    dist2 = (a[:, None, COL_X] - b[None, :, COL_X]) ** 2 + (a[:, None, COL_Y] - b[None, :, COL_Y]) ** 2
+    compativel = (dist2 <= TOLERANCIA_DISTANCIA ** 2) & (
+        np.abs(_diferenca_angular(a[:, None, COL_ANGULO], b[None, :, COL_ANGULO])) <= TOLERANCIA_ANGULO
+    )
+    dist2 = np.where(compativel, dist2, np.inf)
+
+    # Pareamento mutuo: i -> j mais proximo e j -> i mais proximo
+    mais_proximo_a = dist2.argmin(axis=1)
+    mais_proximo_b = dist2.argmin(axis=0)
+    indices = np.arange(len(a))
+    mutuos = (mais_proximo_b[mais_proximo_a] == indices) & np.isfinite(dist2[indices, mais_proximo_a])
+    return indices[mutuos], mais_proximo_a[mutuos]
+
+
+# ============================================
+# CONSOLIDACAO (CADASTRO COM VARIAS CAPTURAS)
+# ============================================
+
+def consolidar_minucias(capturas: list, limiar: float) -> dict:
+    """
+    Funde varias capturas do mesmo dedo em um unico template.
+
+    1. Compara todas as capturas entre si; a referencia e a de maior score medio
+    2. Descarta as capturas que nao batem com a referencia (score < limiar)
+    3. Alinha as demais ao referencial da referencia e agrupa as minucias que
+       coincidem. Cada minucia consolidada recebe peso = presenca (fracao das
+       capturas em que apareceu) x peso medio; as presentes em menos de
+       PRESENCA_MINIMA das capturas sao descartadas
+
+    Retorna: dict com minucias (N x 5), referencia, aceitas, descartadas e
+    scores (matriz capturas x capturas)
+    """
+    quantidade = len(capturas)
+    scores = np.eye(quantidade)
+    for i in range(quantidade):
+        for j in range(i + 1, quantidade):
+            scores[i, j] = scores[j, i] = comparar_minucias(capturas[i], capturas[j])
+
+    medias = (scores.sum(axis=1) - 1) / max(1, quantidade - 1)
+    referencia = int(np.argmax(medias))
+    base = capturas[referencia]
+
+    aceitas, alinhadas = [referencia], [base]
+    for i in range(quantidade):
+        if i == referencia or scores[referencia, i] < limiar:
+            continue
+        alinhamento = alinhar_minucias(capturas[i], base)
+        if alinhamento:
+            aceitas.append(i)
+            alinhadas.append(transformar_minucias(
+                capturas[i], alinhamento["rotacao"], alinhamento["dx"], alinhamento["dy"]
+            ))
+
+    # Acumuladores por grupo: posicao, orientacao (angulo dobrado, pois e modulo pi),
+    # votos de bifurcacao, soma dos pesos e numero de capturas
+    posicoes = base[:, [COL_X, COL_Y]].astype(np.float64)
+    orientacoes = _vetor_orientacao(base)
+    bifurcacoes = (base[:, COL_TIPO] == TIPO_BIFURCACAO).astype(np.float64)
+    pesos = base[:, COL_PESO].astype(np.float64)
+    contagem = np.ones(len(base))
+
+    for minucias in alinhadas[1:]:
+        grupos = _media_grupos(posicoes, orientacoes, bifurcacoes, contagem)
+        pares, alvos = _parear(minucias, grupos)
+
+        posicoes[alvos] += minucias[pares][:, [COL_X, COL_Y]]
+        orientacoes[alvos] += _vetor_orientacao(minucias[pares])
+        bifurcacoes[alvos] += minucias[pares, COL_TIPO] == TIPO_BIFURCACAO
+        pesos[alvos] += minucias[pares, COL_PESO]
+        contagem[alvos] += 1
+
+        # Minucias sem par abrem grupos novos
+        novas = minucias[np.setdiff1d(np.arange(len(minucias)), pares)]
+        posicoes = np.vstack([posicoes, novas[:, [COL_X, COL_Y]]])
+        orientacoes = np.vstack([orientacoes, _vetor_orientacao(novas)])
+        bifurcacoes = np.concatenate([bifurcacoes, novas[:, COL_TIPO] == TIPO_BIFURCACAO])
+        pesos = np.concatenate([pesos, novas[:, COL_PESO]])
+        contagem = np.concatenate([contagem, np.ones(len(novas))])
+
+    consolidadas = _media_grupos(posicoes, orientacoes, bifurcacoes, contagem)
+    presenca = contagem / len(alinhadas)
+    consolidadas[:, COL_PESO] = presenca * pesos / contagem
+
+    consolidadas = consolidadas[presenca >= PRESENCA_MINIMA]
+    consolidadas = consolidadas[np.argsort(-consolidadas[:, COL_PESO], kind="stable")[:MAX_MINUCIAS]]
+
+    return {
+        "minucias": consolidadas.astype(np.float32),
+        "referencia": referencia,
+        "aceitas": sorted(aceitas),
+        "descartadas": [i for i in range(quantidade) if i not in aceitas],
+        "scores": np.round(scores, 4).tolist(),
+    }
+
+
+def _vetor_orientacao(minucias: np.ndarray) -> np.ndarray:
+    """Orientacao como vetor de angulo dobrado (media correta para angulos modulo pi)"""
+    return np.stack([np.cos(2 * minucias[:, COL_ANGULO]), np.sin(2 * minucias[:, COL_ANGULO])], axis=1)
+
+
+def _media_grupos(posicoes: np.ndarray, orientacoes: np.ndarray,
+                  bifurcacoes: np.ndarray, contagem: np.ndarray) -> np.ndarray:
+    """Minucia media de cada grupo da consolidacao (peso ainda nao calculado)"""
+    grupos = np.zeros((len(contagem), 5), dtype=np.float64)
+    grupos[:, [COL_X, COL_Y]] = posicoes / contagem[:, None]
+    grupos[:, COL_ANGULO] = (np.arctan2(orientacoes[:, 1], orientacoes[:, 0]) / 2) % np.pi
+    grupos[:, COL_TIPO] = np.where(bifurcacoes * 2 > contagem, TIPO_BIFURCACAO, TIPO_TERMINACAO)
+    return grupos
@@ -8,7 +8,7 @@ Roda na porta 5001 e e chamado pelo AdonisJS.
 Hardware suportado:
 1. SDK Futronic nativo (ftrScanAPI.dll) - PRIORIDADE
 2. Windows Biometric Framework (WBF) - fallback
-3. Simulacao para testes
+3. Scanner simulado (FUTRONIC_SCANNER=simulado) - testes e benchmarks no Linux
 
 Leitores Futronic suportados:
 - FS80, FS80H, FS88, FS90
@@ -27,11 +27,15 @@ Uso:
 import os
 import sys
 import base64
-import json
+import binascii
 import hashlib
+import time
+import uuid
+import threading
+import concurrent.futures
 from io import BytesIO
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # Corrige encoding para Windows
@@ -40,22 +44,57 @@ if sys.platform == "win32":
     sys.stderr.reconfigure(encoding='utf-8', errors='replace')
     os.environ['PYTHONIOENCODING'] = 'utf-8'
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from PIL import Image
 import numpy as np
 
+# Modulos locais (o python32 embarcado nao adiciona o diretorio do script ao sys.path)
+# e o nucleo comum com o deepface-api (biometria_core/, na raiz do repositorio)
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(1, str(Path(__file__).resolve().parent.parent))
+import fingerprint
+import scanners
+from biometria_core import metricas
+from biometria_core.galerias import Galeria, Particoes, diretorio_tenant, obter_tenant
+from biometria_core.lote import responder_lote as responder_ndjson
+from comparacao_paralela import PoolComparacao
+
 # Configuracoes
 TEMPLATES_DIR = Path("./templates")  # Diretorio para armazenar templates
 PORT = 5001
+# Score minimo de minucias para match. 0.34 = FAR 0,11% / FRR 9,4% medidos em digitais sinteticas
+# reservadas (calibrar.py, 120 dedos x 4 impressoes; tabela no README); recalibrar com capturas reais do leitor
+LIMIAR_MATCH = float(os.environ.get("FUTRONIC_LIMIAR_MATCH", "0.34"))
+QUALIDADE_MINIMA = int(os.environ.get("FUTRONIC_QUALIDADE_MINIMA", "40"))  # Capturas abaixo disso sao refeitas (0-100)
+TENTATIVAS_CAPTURA = int(os.environ.get("FUTRONIC_TENTATIVAS_CAPTURA", "3"))  # Tentativas internas por /capturar
+CAPTURAS_CADASTRO = int(os.environ.get("FUTRONIC_CAPTURAS_CADASTRO", "3"))  # Capturas por sessao de cadastro
+MIN_CAPTURAS_CONSISTENTES = 2  # Capturas que precisam bater entre si para consolidar o cadastro
+VALIDADE_SESSAO_CADASTRO = 600  # Segundos ate uma sessao de cadastro abandonada ser descartada
+LOTE_MAXIMO = int(os.environ.get("FUTRONIC_LOTE_MAXIMO", "5000"))  # Digitais por /verificar/lote e /identificar/lote
+CONSULTAS_POR_GRUPO = 64  # Consultas comparadas (e respondidas) de uma vez nos endpoints de lote
+PROCESSOS_COMPARACAO = int(os.environ.get("FUTRONIC_PROCESSOS_COMPARACAO", str(os.cpu_count() or 1)))  # 1 = sem pool
+GALERIA_MINIMA_PARALELA = int(os.environ.get("FUTRONIC_GALERIA_PARALELA", "500"))  # Cadastros para usar o pool
+GALERIA_OCIOSA = float(os.environ.get("FUTRONIC_GALERIA_OCIOSA", "1800"))  # Segundos sem uso ate descarregar
+MEMORIA_GALERIAS = int(os.environ.get("FUTRONIC_MEMORIA_GALERIAS_MB", "512")) * 1024 * 1024  # Limite das galerias carregadas
 DEVICE_CONNECTED = False  # Status do dispositivo
 DEVICE_INFO = {}  # Informacoes do dispositivo
-
-# SDK Futronic
-FUTRONIC_SDK_AVAILABLE = False
-FUTRONIC_HANDLE = None
-ftrScanAPI = None  # Handle para a DLL
+DEVICE_ATUALIZADO_EM = None  # Ultima varredura do monitor de dispositivos
+DEVICE_LOCK = threading.Lock()  # Protege a troca de DEVICE_CONNECTED/DEVICE_INFO
+INTERVALO_MONITOR = float(os.environ.get("FUTRONIC_INTERVALO_MONITOR", "5"))  # Segundos entre varreduras USB
+TIMEOUT_RECONEXAO = 4.0  # Espera maxima de /device/reconnect pela varredura (cliente usa 5s)
+
+# Driver de captura (scanners.py): "futronic" (ftrScanAPI.dll) ou "simulado"
+SCANNER_DRIVER = os.environ.get("FUTRONIC_SCANNER", "futronic").lower()
+DRIVER = scanners.obter_driver(SCANNER_DRIVER)
+SIMULADOR_LEITORES = int(os.environ.get("FUTRONIC_SIMULADOR_LEITORES", "1"))  # Leitores simulados conectados
+OPCOES_SIMULADOR = {
+    "diretorio": os.environ.get("FUTRONIC_SIMULADOR_IMAGENS") or None,  # Capturas gravadas (PNG/raw); vazio = sinteticas
+    "identidades": int(os.environ.get("FUTRONIC_SIMULADOR_IDENTIDADES", "10")),
+    "atraso": float(os.environ.get("FUTRONIC_SIMULADOR_ATRASO", "0")),  # Segundos ate o "dedo" ser colocado
+}
+LEITORES = {}  # device_id -> Leitor (driver + worker de captura), protegido por DEVICE_LOCK
 
 # =============================================================
 # FABRICANTES DE LEITORES BIOMETRICOS SUPORTADOS
@@ -119,7 +158,7 @@ app.add_middleware(
 
 # Handler global de exceções para evitar que o servidor caia
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -137,8 +176,59 @@ async def global_exception_handler(request: Request, exc: Exception):
         }
     )
 
-# Cache de templates em memoria
-templates_cache = {}
+
+@app.exception_handler(fingerprint.TemplateInvalido)
+async def template_invalido_handler(request: Request, exc: fingerprint.TemplateInvalido):
+    """Template enviado corrompido (base64, PNG ou FTM1): erro do cliente, nao do servidor"""
+    print(f"[Futronic] Template invalido: {exc}")
+    return JSONResponse(status_code=400, content={"success": False, "error": f"Template invalido: {exc}"})
+
+# Galerias por tenant, carregadas no primeiro uso (tenant padrao na raiz de TEMPLATES_DIR)
+GALERIAS = Particoes(
+    "futronic", lambda tenant: GaleriaTenant(tenant), GALERIA_OCIOSA, MEMORIA_GALERIAS
+)
+
+# Processos que dividem a galeria entre si (criado no startup, se PROCESSOS_COMPARACAO > 1)
+pool_comparacao = None
+
+# Sessoes de cadastro com varias capturas (sessao_id -> SessaoCadastro)
+sessoes_cadastro = {}
+SESSOES_LOCK = threading.Lock()
+
+
+# ============================================
+# METRICAS (/metrics)
+# ============================================
+
+METRICA_ESPERA_DEDO = metricas.registro.histograma(
+    "futronic_captura_espera_segundos", "Tempo ate o dedo ser detectado no leitor",
+    ["device"], buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30)
+)
+METRICA_LEITURA = metricas.registro.histograma(
+    "futronic_captura_leitura_segundos", "Leitura da imagem depois do dedo detectado",
+    ["device"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+METRICA_QUALIDADE = metricas.registro.histograma(
+    "futronic_captura_qualidade", "Score de qualidade (0-100) de cada tentativa de captura",
+    ["device"], buckets=(10, 20, 30, 40, 50, 60, 70, 80, 90, 100)
+)
+METRICA_CAPTURAS = metricas.registro.contador(
+    "futronic_capturas_total", "Capturas pelo driver por resultado (sucesso, qualidade_baixa, erro)",
+    ["device", "resultado"]
+)
+METRICA_RECONEXOES = metricas.registro.contador(
+    "futronic_reconexoes_total", "Reaberturas do leitor (captura, monitor ou sdk)", ["device", "origem"]
+)
+# Galerias (futronic_galeria_tamanho, _galerias_memoria_bytes, _galerias_descarregadas_total,
+# _comparacao_segundos e _comparacao_consultas_total) sao registradas pelas Particoes
+metricas.registro.medidor(
+    "futronic_captura_fila", "Capturas na fila ou em andamento no worker de cada leitor", ["device"],
+    coletor=lambda: {(leitor.device_id,): leitor.pendentes for leitor in list(LEITORES.values())}
+)
+metricas.registro.medidor(
+    "futronic_leitor_aberto", "1 se o driver do leitor esta aberto", ["device"],
+    coletor=lambda: {(leitor.device_id,): int(leitor.scanner.aberto) for leitor in list(LEITORES.values())}
+)
 
 
 # ============================================
@@ -151,6 +241,13 @@ class CadastrarRequest(BaseModel):
     nome: str
     pis: str
     template_base64: Optional[str] = None  # Template ja extraido (opcional)
+    qualidade: Optional[int] = None  # Qualidade informada pela captura (para templates so de minucias)
+
+
+class CapturarRequest(BaseModel):
+    """Request para capturar digital"""
+    timeout: int = 30
+    formato: str = fingerprint.FORMATO_PNG  # png | minucias | raw
 
 
 class VerificarRequest(BaseModel):
@@ -158,6 +255,39 @@ class VerificarRequest(BaseModel):
     template_base64: str  # Template da digital capturada
 
 
+class ItemLote(BaseModel):
+    """Digital de um lote de verificacao/identificacao"""
+    id: Optional[str] = None  # Identificador do cliente, devolvido na resposta
+    template_base64: str
+    funcionario_id: Optional[int] = None  # Obrigatorio em /verificar/lote (comparacao 1:1)
+
+
+class LoteRequest(BaseModel):
+    """Request para verificar/identificar varias digitais de uma vez"""
+    itens: List[ItemLote]
+
+
+class SessaoCadastroRequest(BaseModel):
+    """Request para iniciar uma sessao de cadastro com varias capturas"""
+    funcionario_id: int
+    nome: str
+    pis: str
+    capturas: Optional[int] = None  # Padrao: FUTRONIC_CAPTURAS_CADASTRO
+
+
+class AmostraCadastroRequest(BaseModel):
+    """Request para adicionar uma captura a sessao de cadastro"""
+    template_base64: Optional[str] = None  # Captura ja feita; sem ela captura do leitor
+    timeout: int = 30
+
+
+class DedoSimuladoRequest(BaseModel):
+    """Request para definir a proxima captura do scanner simulado"""
+    identidade: Optional[int] = None  # Digital sintetica (mesma identidade = mesmo dedo)
+    template_base64: Optional[str] = None  # Ou uma captura gravada (PNG/raw)
+    device_id: Optional[str] = None  # Leitor simulado (padrao: o primeiro)
+
+
 class StatusResponse(BaseModel):
     """Response de status"""
     status: str
@@ -170,29 +300,261 @@ class StatusResponse(BaseModel):
 # FUNCOES AUXILIARES
 # ============================================
 
-def load_templates_cache():
-    """Carrega cache de templates do disco"""
-    global templates_cache
-    cache_file = TEMPLATES_DIR / "templates_cache.json"
+class GaleriaTenant(Galeria):
+    """
+    Digitais cadastradas de um tenant (municipio).
+
+    Os metadados ficam em templates_cache.json e as minucias (FTM1) em
+    templates_cache.bin, no diretorio do tenant (ver biometria_core.armazenamento);
+    as imagens ficam ao lado, em {id}.png. Cadastros opacos (ex: WBF) guardam o
+    template em base64 no JSON e usam a comparacao legada.
+    """
+
+    NOME_ARQUIVO = "templates_cache"
+    SERVICO = "Futronic"
+
+    def __init__(self, tenant: str):
+        super().__init__(tenant, diretorio_tenant(TEMPLATES_DIR, tenant))
+
+    def desserializar(self, bruto: bytes) -> np.ndarray:
+        return fingerprint.desserializar_minucias(bruto)[0]
+
+    def migrar(self) -> bool:
+        """Move as minucias em base64 do JSON para o .bin e extrai minucias de imagens legadas"""
+        migrados, movidos = 0, 0
+        for func_id, data in self.cadastros.items():
+            if data.get("minucias"):
+                self.brutos[func_id] = base64.b64decode(data.pop("minucias"))
+                movidos += 1
+            elif data.get("template") and func_id not in self.brutos:
+                if migrar_template_legado(self, func_id, data):
+                    migrados += 1
+        if migrados:
+            print(f"[Futronic] {migrados} templates legados convertidos para minucias ({self.tenant})")
+        if movidos:
+            print(f"[Futronic] {movidos} templates movidos para o armazenamento binario ({self.tenant})")
+        return bool(migrados or movidos)
+
+    def empacotar(self) -> dict:
+        """
+        Galeria de minucias empacotada para comparacao vetorizada.
+
+        Retorna: dict com ids (ordem do cadastro), posicao (id -> indice), minucias
+        (G, maximo, 5), quantidades (G,), ponderar (G,) - templates consolidados -,
+        opacos (lista de (id, template bytes) ja decodificados, para a comparacao
+        legada) e compartilhada (copia em memoria compartilhada para o pool, em galerias grandes)
+        """
+        ids = [func_id for func_id in self.cadastros if func_id in self.dados]
+        minucias, quantidades = fingerprint.empacotar_minucias([self.dados[i] for i in ids])
+        opacos = []
+        for func_id, data in self.cadastros.items():
+            if "template" in data:
+                armazenado = template_armazenado(func_id, data)
+                if armazenado is not None:
+                    opacos.append((func_id, armazenado))
+        empacotada = {
+            "ids": ids,
+            "posicao": {func_id: indice for indice, func_id in enumerate(ids)},
+            "minucias": minucias,
+            "quantidades": quantidades,
+            "ponderar": np.array([self.cadastros[i].get("capturas", 1) > 1 for i in ids], dtype=bool),
+            "opacos": opacos,
+            "compartilhada": None,
+        }
+        if pool_comparacao is not None and len(ids) >= GALERIA_MINIMA_PARALELA:
+            empacotada["compartilhada"] = pool_comparacao.publicar(
+                minucias, quantidades, empacotada["ponderar"], chave=self.tenant
+            )
+        elif pool_comparacao is not None:
+            pool_comparacao.retirar(self.tenant)
+        return empacotada
 
-    if cache_file.exists():
+    def ao_descarregar(self):
+        if pool_comparacao is not None:
+            pool_comparacao.retirar(self.tenant)
+
+
+def decodificar_base64(texto: str) -> bytes:
+    """Decodifica um template recebido em base64 (TemplateInvalido se corrompido)"""
+    try:
+        return base64.b64decode(texto)
+    except (binascii.Error, ValueError) as e:
+        raise fingerprint.TemplateInvalido(f"base64 invalido: {e}") from e
+
+
+def template_armazenado(func_id: str, data: dict) -> Optional[bytes]:
+    """Template opaco de um cadastro (None, com aviso, se o cache estiver corrompido)"""
+    try:
+        return base64.b64decode(data["template"])
+    except (binascii.Error, ValueError) as e:
+        print(f"[Futronic] Template armazenado de {func_id} corrompido, ignorado: {e}")
+        return None
+
+
+def preparar_template(template_data: bytes) -> dict:
+    """
+    Converte um template recebido (PNG, raw ou minucias) para a forma armazenada.
+
+    O cache guarda apenas as minucias (algumas centenas de bytes); a imagem,
+    quando existir, e gravada em PNG no diretorio de templates.
+
+    Retorna: dict com formato, minucias (bytes FTM1 ou None), imagem (ndarray ou None)
+    e qualidade (dict de avaliar_qualidade, quando houver imagem)
+    """
+    formato = fingerprint.identificar_formato(template_data)
+    imagem = fingerprint.decodificar_imagem(template_data)
+    qualidade = fingerprint.avaliar_qualidade(imagem) if imagem is not None else None
+
+    if formato == fingerprint.FORMATO_MINUCIAS:
+        minucias = template_data
+    elif imagem is not None:
+        altura, largura = imagem.shape
+        minucias = fingerprint.serializar_minucias(
+            fingerprint.extrair_minucias(imagem), largura, altura
+        )
+    else:
+        minucias = None
+
+    return {"formato": formato, "minucias": minucias, "imagem": imagem, "qualidade": qualidade}
+
+
+def salvar_cadastro(galeria: GaleriaTenant, func_id: str, nome: str, pis: str, formato: str,
+                    qualidade: Optional[int], minucias: Optional[bytes] = None, imagem: Optional[np.ndarray] = None,
+                    template_data: Optional[bytes] = None, capturas: int = 1) -> dict:
+    """
+    Grava o cadastro na galeria do tenant e no diretorio dela.
+
+    O cache guarda as minucias (ou o template opaco, se nao houver minucias);
+    a imagem vai para {id}.png e o template opaco para {id}.bin.
+    `capturas` > 1 indica um template consolidado de varias capturas.
+    """
+    entrada = {
+        "nome": nome,
+        "pis": pis,
+        "formato": formato,
+        "qualidade": qualidade,
+        "cadastrado_em": datetime.now().isoformat()
+    }
+    if capturas > 1:
+        entrada["capturas"] = capturas
+
+    if minucias is None:
+        entrada["template"] = base64.b64encode(template_data).decode("utf-8")
+    galeria.gravar(func_id, entrada, minucias)
+
+    # Salva imagem (PNG) ou template em arquivo separado (backup)
+    if imagem is not None:
+        with open(galeria.diretorio / f"{func_id}.png", "wb") as f:
+            f.write(fingerprint.codificar_png(imagem))
+    elif template_data is not None:
+        with open(galeria.diretorio / f"{func_id}.bin", "wb") as f:
+            f.write(template_data)
+
+    return entrada
+
+
+def comparar_galeria(grade: dict, consultas: np.ndarray, quantidades: np.ndarray) -> np.ndarray:
+    """Scores (K, G) das consultas contra a galeria; em paralelo quando ela esta no pool"""
+    if grade["compartilhada"] is not None:
         try:
-            with open(cache_file, "r") as f:
-                templates_cache = json.load(f)
-            print(f"[Futronic] Cache carregado: {len(templates_cache)} templates")
-        except Exception as e:
-            print(f"[Futronic] Erro ao carregar cache: {e}")
-            templates_cache = {}
+            return pool_comparacao.comparar(grade["compartilhada"], consultas, quantidades)
+        except RuntimeError as e:
+            # Galeria trocada durante a comparacao ou pool quebrado: compara neste processo
+            print(f"[Futronic] Comparacao paralela indisponivel ({e}), comparando localmente")
+    return fingerprint.comparar_com_galeria(
+        consultas, quantidades, grade["minucias"], grade["quantidades"], grade["ponderar"]
+    )
+
+
+def identificar_digitais(galeria: GaleriaTenant, consultas: list, operacao: str = "verificar") -> list:
+    """
+    Identifica cada digital contra todas as cadastradas no tenant da galeria.
 
+    consultas: lista de (template bytes, minucias ou None). As minucias sao
+    comparadas com a galeria inteira de uma vez; templates opacos (WBF) usam a
+    comparacao legada byte a byte.
+
+    Retorna: lista de (func_id ou None, score) na ordem das consultas
+    """
+    with GALERIAS.medir(galeria, operacao, len(consultas)):
+        return _identificar_digitais(galeria, consultas)
+
+
+def _identificar_digitais(galeria: GaleriaTenant, consultas: list) -> list:
+    resultados = [(None, 0.0)] * len(consultas)
+    grade = galeria.obter_empacotada()
+
+    com_minucias = [n for n, (_, minucias) in enumerate(consultas) if minucias is not None]
+    if com_minucias and grade["ids"]:
+        empacotadas, quantidades = fingerprint.empacotar_minucias([consultas[n][1] for n in com_minucias])
+        scores = comparar_galeria(grade, empacotadas, quantidades)
+        for linha, n in enumerate(com_minucias):
+            melhor = int(np.argmax(scores[linha]))
+            if scores[linha, melhor] >= LIMIAR_MATCH:
+                resultados[n] = (grade["ids"][melhor], float(scores[linha, melhor]))
+
+    # Cadastros opacos: comparacao legada (tambem para consultas sem minucias), so quando
+    # a galeria tem algum; os templates vem decodificados da galeria empacotada
+    if grade["opacos"]:
+        for n, (template, minucias) in enumerate(consultas):
+            for func_id, armazenado in grade["opacos"]:
+                if minucias is not None and func_id in grade["posicao"]:
+                    continue
+                is_match, score = compare_templates(template, armazenado)
+                if is_match and score > resultados[n][1]:
+                    resultados[n] = (func_id, score)
 
-def save_templates_cache():
-    """Salva cache de templates no disco"""
-    cache_file = TEMPLATES_DIR / "templates_cache.json"
+    return resultados
+
+
+def migrar_template_legado(galeria: GaleriaTenant, func_id: str, data: dict) -> bool:
+    """Extrai minucias de uma entrada legada do cache, removendo a imagem base64 do JSON"""
     try:
-        with open(cache_file, "w") as f:
-            json.dump(templates_cache, f)
+        preparado = preparar_template(base64.b64decode(data["template"]))
     except Exception as e:
-        print(f"[Futronic] Erro ao salvar cache: {e}")
+        print(f"[Futronic] Erro ao migrar template {func_id}: {e}")
+        return False
+
+    if preparado["minucias"] is None:
+        return False  # Formato opaco (ex: WBF) - continua usando comparacao legada
+
+    if preparado["imagem"] is not None:
+        with open(galeria.diretorio / f"{func_id}.png", "wb") as f:
+            f.write(fingerprint.codificar_png(preparado["imagem"]))
+
+    data["formato"] = preparado["formato"]
+    galeria.brutos[func_id] = preparado["minucias"]
+    if preparado["qualidade"]:
+        data["qualidade"] = preparado["qualidade"]["score"]
+    del data["template"]
+    return True
+
+
+def codificar_captura(imagem: np.ndarray, formato: str) -> dict:
+    """
+    Codifica a imagem capturada no formato pedido.
+
+    - png: imagem sem perdas (padrao)
+    - minucias: apenas o template de minucias extraido
+    - raw: buffer cru do sensor (somente sob demanda)
+    """
+    altura, largura = imagem.shape
+
+    if formato == fingerprint.FORMATO_MINUCIAS:
+        data = fingerprint.serializar_minucias(fingerprint.extrair_minucias(imagem), largura, altura)
+    elif formato == fingerprint.FORMATO_RAW:
+        data = imagem.tobytes()
+    else:
+        formato = fingerprint.FORMATO_PNG
+        data = fingerprint.codificar_png(imagem)
+
+    return {
+        "template_base64": base64.b64encode(data).decode("utf-8"),
+        "formato": formato,
+        "tamanho_bytes": len(data),
+        "largura": largura,
+        "altura": altura,
+    }
 
 
 def compare_templates(template1: bytes, template2: bytes, threshold: float = 0.7) -> tuple:
@@ -216,7 +578,10 @@ def compare_templates(template1: bytes, template2: bytes, threshold: float = 0.7
 
     # Calcula similaridade baseada em bytes comuns
     # Isso e apenas um placeholder - o SDK real faz matching biometrico
-    common = sum(1 for a, b in zip(template1, template2) if a == b)
+    tamanho = min(len(template1), len(template2))
+    bytes1 = np.frombuffer(template1, dtype=np.uint8, count=tamanho)
+    bytes2 = np.frombuffer(template2, dtype=np.uint8, count=tamanho)
+    common = int(np.count_nonzero(bytes1 == bytes2))
     total = max(len(template1), len(template2))
     score = common / total if total > 0 else 0
 
@@ -267,61 +632,59 @@ def get_vendor_info(vid: str, pid: str) -> dict:
     return None
 
 
-def detect_usb_device_linux():
+def detect_usb_device_linux() -> list:
     """
     Detecta leitores biometricos no Linux usando lsusb/pyusb.
-    """
-    global DEVICE_CONNECTED, DEVICE_INFO
 
+    Retorna: lista de dispositivos encontrados
+    """
     devices_found = []
 
-    # Metodo 1: Tenta usar pyusb
+    # Metodo 1: Tenta usar pyusb (uma unica varredura do barramento para todos os fabricantes)
     try:
         import usb.core
         import usb.util
 
-        for vendor_vid, vendor_data in BIOMETRIC_VENDORS.items():
-            vid_int = int(vendor_vid, 16)
-            devices = usb.core.find(find_all=True, idVendor=vid_int)
-
-            for device in devices:
-                pid_hex = f"{device.idProduct:04X}"
-                model = vendor_data["models"].get(pid_hex.upper(), "Scanner")
-
-                device_data = {
-                    "device_id": f"USB:{vendor_vid}:{pid_hex}",
-                    "description": f"{vendor_data['name']} {model}",
-                    "name": model,
-                    "manufacturer": vendor_data["name"],
-                    "model": model,
-                    "vid": vendor_vid,
-                    "pid": pid_hex,
-                    "method": "pyusb",
-                    "status": "OK"
-                }
-                devices_found.append(device_data)
-                print(f"[Biometric] Encontrado (pyusb): {vendor_data['name']} {model}")
+        devices = usb.core.find(
+            find_all=True,
+            custom_match=lambda d: f"{d.idVendor:04X}" in BIOMETRIC_VENDORS
+        )
+
+        for device in devices:
+            vendor_vid = f"{device.idVendor:04X}"
+            vendor_data = BIOMETRIC_VENDORS[vendor_vid]
+            pid_hex = f"{device.idProduct:04X}"
+            model = vendor_data["models"].get(pid_hex.upper(), "Scanner")
+
+            devices_found.append({
+                "device_id": f"USB:{vendor_vid}:{pid_hex}:{device.bus}:{device.address}",
+                "description": f"{vendor_data['name']} {model}",
+                "name": model,
+                "manufacturer": vendor_data["name"],
+                "model": model,
+                "vid": vendor_vid,
+                "pid": pid_hex,
+                "method": "pyusb",
+                "status": "OK"
+            })
 
         if devices_found:
-            DEVICE_CONNECTED = True
-            DEVICE_INFO = devices_found[0]
-            DEVICE_INFO["all_devices"] = devices_found
-            return True
+            return devices_found
 
     except ImportError:
-        print("[Biometric] pyusb nao instalado - tentando lsusb")
+        pass  # pyusb nao instalado - tenta lsusb
     except Exception as e:
         print(f"[Biometric] Erro pyusb: {e}")
 
     # Metodo 2: Tenta usar lsusb (comando do sistema)
     try:
         import subprocess
-        result = subprocess.run(["lsusb"], capture_output=True, text=True)
+        result = subprocess.run(["lsusb"], capture_output=True, text=True, timeout=10)
 
         for line in result.stdout.split("\n"):
             for vendor_vid, vendor_data in BIOMETRIC_VENDORS.items():
                 if f":{vendor_vid.lower()}:" in line.lower() or f" {vendor_vid.lower()}:" in line.lower():
-                    device_data = {
+                    devices_found.append({
                         "device_id": line.strip(),
                         "description": f"{vendor_data['name']} Scanner",
                         "name": "Fingerprint Scanner",
@@ -331,28 +694,22 @@ def detect_usb_device_linux():
                         "pid": "Unknown",
                         "method": "lsusb",
                         "status": "OK"
-                    }
-                    devices_found.append(device_data)
-                    print(f"[Biometric] Encontrado (lsusb): {line.strip()}")
-
-        if devices_found:
-            DEVICE_CONNECTED = True
-            DEVICE_INFO = devices_found[0]
-            DEVICE_INFO["all_devices"] = devices_found
-            return True
+                    })
 
+    except FileNotFoundError:
+        pass  # lsusb nao disponivel
     except Exception as e:
         print(f"[Biometric] Erro lsusb: {e}")
 
-    return False
+    return devices_found
 
 
-def detect_usb_device_macos():
+def detect_usb_device_macos() -> list:
     """
     Detecta leitores biometricos no macOS usando system_profiler.
-    """
-    global DEVICE_CONNECTED, DEVICE_INFO
 
+    Retorna: lista de dispositivos encontrados
+    """
     devices_found = []
 
     try:
@@ -363,7 +720,8 @@ def detect_usb_device_macos():
         result = subprocess.run(
             ["system_profiler", "SPUSBDataType"],
             capture_output=True,
-            text=True
+            text=True,
+            timeout=30
         )
 
         current_device = {}
@@ -384,7 +742,7 @@ def detect_usb_device_macos():
                 if match:
                     pid = match.group(1).upper()
                     vendor_info = get_vendor_info(current_device["vid"], pid)
-                    device_data = {
+                    devices_found.append({
                         "device_id": f"USB:{current_device['vid']}:{pid}",
                         "description": f"{current_device['vendor']} Scanner",
                         "name": vendor_info["model"] if vendor_info else "Scanner",
@@ -394,37 +752,36 @@ def detect_usb_device_macos():
                         "pid": pid,
                         "method": "system_profiler",
                         "status": "OK"
-                    }
-                    devices_found.append(device_data)
-                    print(f"[Biometric] Encontrado (macOS): {current_device['vendor']}")
+                    })
                     current_device = {}
 
-        if devices_found:
-            DEVICE_CONNECTED = True
-            DEVICE_INFO = devices_found[0]
-            DEVICE_INFO["all_devices"] = devices_found
-            return True
-
     except Exception as e:
         print(f"[Biometric] Erro macOS: {e}")
 
-    return False
+    return devices_found
 
 
-def detect_usb_device_windows():
+def detect_usb_device_windows() -> list:
     """
     Detecta leitores biometricos no Windows usando WMI.
-    """
-    global DEVICE_CONNECTED, DEVICE_INFO
 
+    Retorna: lista de dispositivos encontrados
+    """
     try:
         import wmi
         c = wmi.WMI()
+    except ImportError:
+        print("[Biometric] wmi nao instalado - execute: pip install WMI pywin32")
+        return []
+    except Exception as e:
+        print(f"[Biometric] Erro WMI: {e}")
+        return []
 
-        devices_found = []
+    devices_found = []
 
-        # Busca em todos os dispositivos PnP
-        for device in c.Win32_PnPEntity():
+    try:
+        # Busca apenas dispositivos USB (varrer todo Win32_PnPEntity leva segundos)
+        for device in c.query("SELECT * FROM Win32_PnPEntity WHERE DeviceID LIKE 'USB%'"):
             device_id = (device.DeviceID or "").upper()
 
             if "VID_" not in device_id:
@@ -434,7 +791,7 @@ def detect_usb_device_windows():
             vendor_info = get_vendor_info(vid, pid)
 
             if vendor_info:
-                device_data = {
+                devices_found.append({
                     "device_id": device.DeviceID,
                     "description": device.Description or f"{vendor_info['vendor']} Scanner",
                     "name": device.Name or "Fingerprint Scanner",
@@ -444,256 +801,252 @@ def detect_usb_device_windows():
                     "pid": pid,
                     "method": "wmi-pnp",
                     "status": device.Status
-                }
-                devices_found.append(device_data)
-                print(f"[Biometric] Encontrado: {vendor_info['vendor']} {vendor_info['model']}")
-                print(f"[Biometric] Device ID: {device.DeviceID}")
-
-        # Busca adicional em dispositivos biometricos
-        try:
-            for device in c.query("SELECT * FROM Win32_PnPEntity WHERE PNPClass = 'Biometric'"):
-                device_id = (device.DeviceID or "").upper()
-
-                if any(d["device_id"].upper() == device_id for d in devices_found):
-                    continue
+                })
+    except Exception as e:
+        print(f"[Biometric] Erro WMI: {e}")
 
-                vid, pid = extract_vid_pid(device_id)
-                vendor_info = get_vendor_info(vid, pid)
+    # Busca adicional em dispositivos biometricos
+    try:
+        for device in c.query("SELECT * FROM Win32_PnPEntity WHERE PNPClass = 'Biometric'"):
+            device_id = (device.DeviceID or "").upper()
 
-                device_data = {
-                    "device_id": device.DeviceID,
-                    "description": device.Description or "Biometric Scanner",
-                    "name": device.Name or "Fingerprint Scanner",
-                    "manufacturer": vendor_info["vendor"] if vendor_info else "Desconhecido",
-                    "model": vendor_info["model"] if vendor_info else device.Description or "Scanner",
-                    "vid": vid,
-                    "pid": pid,
-                    "method": "wmi-biometric",
-                    "status": device.Status
-                }
-                devices_found.append(device_data)
-                print(f"[Biometric] Encontrado (biometric class): {device.Description}")
-        except Exception:
-            pass
+            if any(d["device_id"].upper() == device_id for d in devices_found):
+                continue
 
-        if devices_found:
-            DEVICE_CONNECTED = True
-            DEVICE_INFO = devices_found[0]
-            DEVICE_INFO["all_devices"] = devices_found
-            print(f"[Biometric] Usando: {DEVICE_INFO['manufacturer']} {DEVICE_INFO['model']}")
-            return True
+            vid, pid = extract_vid_pid(device_id)
+            vendor_info = get_vendor_info(vid, pid)
 
-        return False
+            devices_found.append({
+                "device_id": device.DeviceID,
+                "description": device.Description or "Biometric Scanner",
+                "name": device.Name or "Fingerprint Scanner",
+                "manufacturer": vendor_info["vendor"] if vendor_info else "Desconhecido",
+                "model": vendor_info["model"] if vendor_info else device.Description or "Scanner",
+                "vid": vid,
+                "pid": pid,
+                "method": "wmi-biometric",
+                "status": device.Status
+            })
+    except Exception:
+        pass
 
-    except ImportError:
-        print("[Biometric] wmi nao instalado - execute: pip install WMI pywin32")
-        return False
-    except Exception as e:
-        print(f"[Biometric] Erro WMI: {e}")
-        return False
+    return devices_found
 
 
-def detect_usb_device():
+def listar_dispositivos_usb() -> list:
     """
     Detecta QUALQUER leitor biometrico USB.
     Suporta Windows, Linux e macOS.
-    """
-    global DEVICE_CONNECTED, DEVICE_INFO
 
-    print(f"[Biometric] Sistema operacional: {sys.platform}")
+    Retorna: lista de dispositivos encontrados (sem alterar o estado global)
+    """
+    if SCANNER_DRIVER == "simulado":
+        return scanners.dispositivos_simulados(SIMULADOR_LEITORES)  # Nao depende do hardware da maquina
 
-    # Detecta baseado no sistema operacional
     if sys.platform == "win32":
-        result = detect_usb_device_windows()
+        return detect_usb_device_windows()
     elif sys.platform == "darwin":
-        result = detect_usb_device_macos()
+        return detect_usb_device_macos()
     elif sys.platform.startswith("linux"):
-        result = detect_usb_device_linux()
-    else:
-        print(f"[Biometric] Sistema {sys.platform} nao suportado")
-        result = False
+        return detect_usb_device_linux()
 
-    if not result:
-        print("[Biometric] Nenhum leitor biometrico detectado")
-        DEVICE_CONNECTED = False
-        DEVICE_INFO = {}
-
-    return result
+    print(f"[Biometric] Sistema {sys.platform} nao suportado")
+    return []
 
 
-def init_futronic_sdk():
+def aplicar_inventario(devices_found: list) -> bool:
     """
-    Inicializa o SDK Futronic nativo (ftrScanAPI.dll).
-    Retorna True se o SDK foi carregado e o dispositivo aberto com sucesso.
+    Substitui DEVICE_CONNECTED/DEVICE_INFO de uma so vez a partir do inventario detectado.
+    Leitores de /device/status nunca veem um estado pela metade.
     """
-    global FUTRONIC_SDK_AVAILABLE, FUTRONIC_HANDLE, ftrScanAPI
+    global DEVICE_CONNECTED, DEVICE_INFO, DEVICE_ATUALIZADO_EM
+
+    if devices_found:
+        info = dict(devices_found[0])
+        info["all_devices"] = devices_found
+        # Mantem o SDK em uso se o leitor principal continua o mesmo
+        if DEVICE_INFO.get("device_id") == info["device_id"] and "sdk" in DEVICE_INFO:
+            info["sdk"] = DEVICE_INFO["sdk"]
+    else:
+        info = {}
 
-    if sys.platform != "win32":
-        print("[Futronic SDK] Disponivel apenas no Windows")
-        return False
+    with DEVICE_LOCK:
+        DEVICE_INFO = info
+        DEVICE_CONNECTED = bool(devices_found)
+        DEVICE_ATUALIZADO_EM = datetime.now().isoformat()
 
-    try:
-        import ctypes
-        from ctypes import c_void_p, c_int, c_bool, byref, create_string_buffer, Structure, POINTER
+    return DEVICE_CONNECTED
 
-        # Tenta carregar a DLL do diretorio atual
-        dll_path = Path(__file__).parent / "ftrScanAPI.dll"
-        if not dll_path.exists():
-            # Tenta no System32
-            dll_path = Path("C:/Windows/System32/ftrScanAPI.dll")
 
-        if not dll_path.exists():
-            print(f"[Futronic SDK] DLL nao encontrada: {dll_path}")
-            return False
+def detect_usb_device():
+    """Detecta leitores e atualiza o estado global"""
+    print(f"[Biometric] Sistema operacional: {sys.platform}")
 
-        print(f"[Futronic SDK] Carregando DLL: {dll_path}")
-        ftrScanAPI = ctypes.WinDLL(str(dll_path))
-
-        # Define tipos de retorno das funcoes
-        ftrScanAPI.ftrScanOpenDevice.restype = c_void_p
-        ftrScanAPI.ftrScanCloseDevice.argtypes = [c_void_p]
-        ftrScanAPI.ftrScanGetImageSize.argtypes = [c_void_p, c_void_p]
-        ftrScanAPI.ftrScanGetImageSize.restype = c_bool
-        ftrScanAPI.ftrScanGetImage.argtypes = [c_void_p, c_int, c_void_p]
-        ftrScanAPI.ftrScanGetImage.restype = c_bool
-        ftrScanAPI.ftrScanIsFingerPresent.argtypes = [c_void_p, c_void_p]
-        ftrScanAPI.ftrScanIsFingerPresent.restype = c_bool
-
-        # Abre o dispositivo
-        print("[Futronic SDK] Abrindo dispositivo...")
-        handle = ftrScanAPI.ftrScanOpenDevice()
-
-        if not handle:
-            print("[Futronic SDK] Falha ao abrir dispositivo (handle nulo)")
-            return False
+    devices_found = listar_dispositivos_usb()
+    for device in devices_found:
+        print(f"[Biometric] Encontrado ({device['method']}): {device['manufacturer']} {device['model']}")
 
-        FUTRONIC_HANDLE = handle
-        FUTRONIC_SDK_AVAILABLE = True
-        print(f"[Futronic SDK] Dispositivo aberto com sucesso! Handle: {handle}")
-        return True
+    if not devices_found:
+        print("[Biometric] Nenhum leitor biometrico detectado")
+
+    return aplicar_inventario(devices_found)
 
-    except OSError as e:
-        print(f"[Futronic SDK] Erro ao carregar DLL: {e}")
-        return False
-    except Exception as e:
-        print(f"[Futronic SDK] Erro: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
 
+class Leitor:
+    """
+    Um leitor do inventario com o seu driver e o seu worker de captura.
 
-def close_futronic_sdk():
-    """Fecha o dispositivo Futronic."""
-    global FUTRONIC_SDK_AVAILABLE, FUTRONIC_HANDLE, ftrScanAPI
+    Cada leitor tem uma thread de captura propria (executor com 1 worker), entao
+    leitores diferentes capturam em paralelo e as capturas de um mesmo leitor
+    ficam em fila. `pendentes` conta capturas na fila ou em andamento e e usado
+    para escolher o leitor menos ocupado.
+    """
 
-    if FUTRONIC_HANDLE and ftrScanAPI:
+    def __init__(self, device: dict, scanner: scanners.Scanner):
+        self.device_id = device["device_id"]
+        self.device = device
+        self.scanner = scanner
+        self.lock = threading.Lock()  # Protege o handle (captura x abertura pelo monitor)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"captura-{self.device_id}"
+        )
+        self.pendentes = 0  # Protegido por DEVICE_LOCK
+        self.capturas = 0
+        self.aberturas = 0  # Aberturas bem-sucedidas (a partir da segunda, conta como reconexao)
+
+    def abrir(self) -> bool:
+        """Abre o driver se estiver livre. Retorna False se ha captura em andamento"""
+        if not self.lock.acquire(blocking=False):
+            return False
         try:
-            ftrScanAPI.ftrScanCloseDevice(FUTRONIC_HANDLE)
-            print("[Futronic SDK] Dispositivo fechado")
-        except Exception as e:
-            print(f"[Futronic SDK] Erro ao fechar: {e}")
+            if not self.scanner.aberto:
+                print(f"[Biometric] Abrindo {self.scanner.nome} para {self.device_id}...")
+                if self.scanner.abrir():
+                    print(f"[Biometric] {self.scanner.nome} inicializado com sucesso! ({self.device_id})")
+                    self.aberturas += 1
+                    if self.aberturas > 1:
+                        METRICA_RECONEXOES.inc(device=self.device_id, origem="monitor")
+                else:
+                    print(f"[Biometric] {self.scanner.nome} nao disponivel para {self.device_id} - usando WBF/simulacao")
+            return True
+        finally:
+            self.lock.release()
 
-    FUTRONIC_HANDLE = None
-    FUTRONIC_SDK_AVAILABLE = False
+    def encerrar(self):
+        """Fecha o driver depois das capturas ja enfileiradas e encerra o worker"""
+        try:
+            self.executor.submit(self.scanner.fechar)
+        except RuntimeError:
+            pass  # Worker ja encerrado
+        self.executor.shutdown(wait=False)
+
+    def estado(self) -> dict:
+        return {
+            "device_id": self.device_id,
+            "manufacturer": self.device.get("manufacturer", ""),
+            "model": self.device.get("model", ""),
+            "driver": self.scanner.nome,
+            "aberto": self.scanner.aberto,
+            "pendentes": self.pendentes,
+            "capturas": self.capturas
+        }
 
 
-def capturar_com_futronic_sdk(timeout_seconds: int = 30):
+def criar_leitor(device: dict, indice: int) -> Leitor:
+    """Cria o driver para o `indice`-esimo leitor compativel do inventario"""
+    if SCANNER_DRIVER == "simulado":
+        scanner = scanners.criar_scanner(SCANNER_DRIVER, device_id=device["device_id"], **OPCOES_SIMULADOR)
+    else:
+        scanner = scanners.criar_scanner(SCANNER_DRIVER, interface=indice)
+    return Leitor(device, scanner)
+
+
+def capturar_imagem(leitor: Leitor, timeout_seconds: int = 30):
     """
-    Captura digital usando o SDK Futronic nativo.
-    Aguarda o usuario colocar o dedo no leitor.
+    Captura uma imagem com o driver do leitor (chamado com leitor.lock).
     Reconecta automaticamente se necessario.
 
-    Retorna: (image_data, error_message)
+    Retorna: (imagem, error_message) - imagem em escala de cinza (altura x largura, uint8)
     """
-    global FUTRONIC_HANDLE, ftrScanAPI, FUTRONIC_SDK_AVAILABLE
-
-    if not FUTRONIC_SDK_AVAILABLE or not FUTRONIC_HANDLE:
+    scanner = leitor.scanner
+    if not scanner.aberto:
         # Tenta reconectar
-        print("[Futronic SDK] Tentando reconectar...")
-        if init_futronic_sdk():
-            print("[Futronic SDK] Reconectado com sucesso!")
+        print(f"[{scanner.nome}] Tentando reconectar {leitor.device_id}...")
+        if scanner.abrir():
+            print(f"[{scanner.nome}] Reconectado com sucesso!")
+            leitor.aberturas += 1
+            METRICA_RECONEXOES.inc(device=leitor.device_id, origem="captura")
         else:
-            return None, "SDK Futronic nao inicializado"
+            return None, f"{scanner.nome} nao inicializado"
 
-    try:
-        import ctypes
-        from ctypes import c_int, c_bool, byref, create_string_buffer, Structure
-
-        # Estrutura para tamanho da imagem
-        class FTRSCAN_IMAGE_SIZE(Structure):
-            _fields_ = [
-                ("nWidth", c_int),
-                ("nHeight", c_int),
-                ("nImageSize", c_int)
-            ]
-
-        # Estrutura para parametros de frame
-        class FTRSCAN_FRAME_PARAMETERS(Structure):
-            _fields_ = [
-                ("nContrastOnDose2", c_int),
-                ("nContrastOnDose4", c_int),
-                ("nDose", c_int),
-                ("nBrightnessOnDose2", c_int),
-                ("nBrightnessOnDose4", c_int),
-                ("bFingerPresent", c_bool)
-            ]
-
-        # Obtem tamanho da imagem
-        img_size = FTRSCAN_IMAGE_SIZE()
-        if not ftrScanAPI.ftrScanGetImageSize(FUTRONIC_HANDLE, byref(img_size)):
-            # Tenta reconectar e tentar novamente
-            print("[Futronic SDK] Falha ao obter tamanho - tentando reconectar...")
-            close_futronic_sdk()
-            if init_futronic_sdk():
-                if not ftrScanAPI.ftrScanGetImageSize(FUTRONIC_HANDLE, byref(img_size)):
-                    return None, "Falha ao obter tamanho da imagem"
-            else:
-                return None, "Falha ao reconectar com o leitor"
+    reconexoes = scanner.reconexoes
+    inicio = time.perf_counter()
+    imagem, error = scanner.capturar(timeout_seconds)
+    duracao = time.perf_counter() - inicio
 
-        print(f"[Futronic SDK] Tamanho: {img_size.nWidth}x{img_size.nHeight} ({img_size.nImageSize} bytes)")
+    if scanner.reconexoes > reconexoes:
+        METRICA_RECONEXOES.inc(scanner.reconexoes - reconexoes, device=leitor.device_id, origem="sdk")
+    if scanner.espera_dedo is not None:
+        METRICA_ESPERA_DEDO.observar(scanner.espera_dedo, device=leitor.device_id)
+        if imagem is not None:
+            METRICA_LEITURA.observar(max(0.0, duracao - scanner.espera_dedo), device=leitor.device_id)
+    return imagem, error
 
-        # Aguarda o dedo no leitor
-        print(f"[Futronic SDK] Aguardando dedo no leitor (timeout: {timeout_seconds}s)...")
-        print("[Futronic SDK] COLOQUE O DEDO NO LEITOR...")
 
-        import time
-        start_time = time.time()
-        frame_params = FTRSCAN_FRAME_PARAMETERS()
+def sincronizar_leitores():
+    """
+    Cria um Leitor (driver + worker de captura) para cada dispositivo compativel do
+    inventario e encerra os que foram removidos. Nao mexe no handle de um leitor
+    com captura em andamento.
 
-        while (time.time() - start_time) < timeout_seconds:
-            try:
-                # Verifica se tem dedo no leitor
-                if ftrScanAPI.ftrScanIsFingerPresent(FUTRONIC_HANDLE, byref(frame_params)):
-                    if frame_params.bFingerPresent:
-                        print("[Futronic SDK] Dedo detectado! Capturando...")
-                        break
-            except Exception as e:
-                print(f"[Futronic SDK] Erro ao verificar dedo: {e}")
-                # Tenta continuar
-            time.sleep(0.1)  # Verifica a cada 100ms
-        else:
-            return None, "Timeout - nenhum dedo detectado"
+    Retorna: True se o estado ficou sincronizado, False se precisa tentar de novo
+    """
+    global LEITORES
 
-        # Captura a imagem
-        buffer = create_string_buffer(img_size.nImageSize)
-        if not ftrScanAPI.ftrScanGetImage(FUTRONIC_HANDLE, 4, buffer):  # Dose 4 = alta qualidade
-            return None, "Falha ao capturar imagem"
+    with DEVICE_LOCK:
+        devices = DEVICE_INFO.get("all_devices", [])
+        anteriores = dict(LEITORES)
 
-        print(f"[Futronic SDK] Imagem capturada! {len(buffer.raw)} bytes")
+    compativeis = [device for device in devices if DRIVER.atende(device)]
+    leitores = {}
+    for indice, device in enumerate(compativeis):
+        leitor = anteriores.pop(device["device_id"], None) or criar_leitor(device, indice)
+        leitores[leitor.device_id] = leitor
 
-        # Converte para formato de template (a imagem raw pode ser usada como template)
-        return buffer.raw, None
+    with DEVICE_LOCK:
+        LEITORES = leitores
 
-    except OSError as e:
-        # Erro de acesso ao dispositivo - tenta reconectar na proxima vez
-        print(f"[Futronic SDK] Erro de dispositivo: {e}")
-        close_futronic_sdk()
-        return None, f"Erro de dispositivo: {e}. Tente novamente."
-    except Exception as e:
-        print(f"[Futronic SDK] Erro na captura: {e}")
-        import traceback
-        traceback.print_exc()
-        return None, str(e)
+    for leitor in anteriores.values():
+        print(f"[Biometric] Leitor removido - fechando {leitor.scanner.nome} ({leitor.device_id})")
+        leitor.encerrar()
+
+    sincronizado = all([leitor.abrir() for leitor in leitores.values()])
+
+    principal = leitores.get(DEVICE_INFO.get("device_id"))
+    if principal:
+        DEVICE_INFO['sdk'] = principal.scanner.sdk if principal.scanner.aberto else 'wbf_or_simulation'
+
+    return sincronizado
+
+
+def reservar_leitor(device_id: Optional[str] = None):
+    """
+    Escolhe o leitor da captura: o pedido em `device_id` ou o menos ocupado.
+    A reserva (pendentes + 1) e desfeita pelo worker ao terminar a captura.
+
+    Retorna: (leitor, error_message) - (None, None) se nenhum leitor usa o driver
+    """
+    with DEVICE_LOCK:
+        if device_id:
+            leitor = LEITORES.get(device_id)
+            if not leitor:
+                return None, f"Leitor {device_id} nao encontrado"
+        elif LEITORES:
+            leitor = min(LEITORES.values(), key=lambda item: item.pendentes)
+        else:
+            return None, None
+        leitor.pendentes += 1
+    return leitor, None
 
 
 def init_device():
@@ -701,8 +1054,6 @@ def init_device():
     Inicializa qualquer leitor biometrico conectado.
     Prioridade: 1) SDK Futronic, 2) WBF, 3) Deteccao USB
     """
-    global DEVICE_CONNECTED, DEVICE_INFO
-
     print("[Biometric] =================================================")
     print("[Biometric] Buscando leitor biometrico USB...")
     print("[Biometric] Fabricantes suportados:")
@@ -713,24 +1064,141 @@ def init_device():
 
     # Primeiro, tenta detectar dispositivo USB
     if detect_usb_device():
-        print(f"[Biometric] Leitor conectado: {DEVICE_INFO.get('manufacturer', '')} {DEVICE_INFO.get('model', '')}")
-
-        # Se for Futronic, tenta inicializar o SDK nativo
-        if DEVICE_INFO.get('manufacturer', '').lower() == 'futronic':
-            print("[Biometric] Detectado leitor Futronic - tentando SDK nativo...")
-            if init_futronic_sdk():
-                print("[Biometric] SDK Futronic inicializado com sucesso!")
-                DEVICE_INFO['sdk'] = 'futronic_native'
-            else:
-                print("[Biometric] SDK Futronic nao disponivel - usando WBF/simulacao")
-                DEVICE_INFO['sdk'] = 'wbf_or_simulation'
-
+        sincronizar_leitores()
+        print(f"[Biometric] PRONTO! Leitor {DEVICE_INFO.get('manufacturer', '')} {DEVICE_INFO.get('model', '')} conectado")
         return True
-    else:
-        DEVICE_CONNECTED = False
-        DEVICE_INFO = {}
-        print("[Biometric] Nenhum leitor biometrico detectado")
-        return False
+
+    print("[Biometric] AVISO: Nenhum leitor conectado")
+    print("[Biometric] Conecte um leitor USB e use /device/reconnect")
+    return False
+
+
+class MonitorDispositivos:
+    """
+    Mantem o inventario de leitores atualizado em segundo plano.
+
+    A deteccao (WMI/pyusb/lsusb/system_profiler) roda apenas nesta thread, a cada
+    `intervalo` segundos ou quando um evento de hotplug (udev, se pyudev estiver
+    instalado) ou /device/reconnect pede uma nova varredura. Os endpoints apenas
+    leem o estado ja detectado.
+    """
+
+    def __init__(self, intervalo: float):
+        self.intervalo = intervalo
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._atualizado = threading.Condition()
+        self._geracao = 0
+        self._leitores_pendentes = False
+        self._thread = None
+        self._observer = None
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._executar, name="monitor-dispositivos", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+        if self._observer:
+            try:
+                self._observer.stop()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def solicitar_atualizacao(self, reabrir_sdk: bool = False) -> int:
+        """Pede uma varredura imediata. Retorna a geracao atual para usar em aguardar_atualizacao"""
+        with self._atualizado:
+            geracao = self._geracao
+        if reabrir_sdk:
+            self._leitores_pendentes = True
+        self._acordar.set()
+        return geracao
+
+    def aguardar_atualizacao(self, geracao: int, timeout: float) -> bool:
+        """Bloqueia ate uma varredura posterior a `geracao` terminar (ou timeout)"""
+        with self._atualizado:
+            return self._atualizado.wait_for(lambda: self._geracao > geracao, timeout=timeout)
+
+    def _executar(self):
+        if sys.platform == "win32":
+            # WMI usa COM, que precisa ser inicializado em cada thread
+            try:
+                import pythoncom
+                pythoncom.CoInitialize()
+            except ImportError:
+                pass
+
+        self._iniciar_hotplug()
+
+        primeira = True
+        while not self._parar.is_set():
+            try:
+                if primeira:
+                    init_device()
+                    primeira = False
+                else:
+                    self._atualizar()
+            except Exception as e:
+                print(f"[Biometric] Erro no monitor de dispositivos: {e}")
+
+            with self._atualizado:
+                self._geracao += 1
+                self._atualizado.notify_all()
+
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+
+    def _atualizar(self):
+        global DEVICE_ATUALIZADO_EM
+
+        anteriores = {d["device_id"] for d in DEVICE_INFO.get("all_devices", [])}
+        devices_found = listar_dispositivos_usb()
+        atuais = {d["device_id"] for d in devices_found}
+
+        if atuais != anteriores:
+            for device in devices_found:
+                if device["device_id"] not in anteriores:
+                    print(f"[Biometric] Leitor conectado: {device['manufacturer']} {device['model']}")
+            if anteriores - atuais:
+                print(f"[Biometric] {len(anteriores - atuais)} leitor(es) desconectado(s)")
+            aplicar_inventario(devices_found)
+            self._leitores_pendentes = True
+        else:
+            with DEVICE_LOCK:
+                DEVICE_ATUALIZADO_EM = datetime.now().isoformat()
+
+        if self._leitores_pendentes:
+            self._leitores_pendentes = not sincronizar_leitores()
+
+    def _iniciar_hotplug(self):
+        """Usa eventos udev para reagir a conexao/remocao sem esperar o intervalo (Linux, opcional)"""
+        if not sys.platform.startswith("linux"):
+            return
+        try:
+            import pyudev
+        except ImportError:
+            return
+
+        try:
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.filter_by(subsystem="usb")
+            self._observer = pyudev.MonitorObserver(
+                monitor, callback=lambda device: self._acordar.set(), name="monitor-udev"
+            )
+            self._observer.start()
+            print("[Biometric] Monitorando hotplug USB via udev")
+        except Exception as e:
+            print(f"[Biometric] udev indisponivel ({e}) - usando apenas varredura periodica")
+
+
+monitor_dispositivos = MonitorDispositivos(INTERVALO_MONITOR)
 
 
 # ============================================
@@ -749,19 +1217,32 @@ async def startup_event():
     print("=" * 60)
     print("")
 
-    # Carrega cache de templates
-    load_templates_cache()
+    # Pool de comparacao (antes do cache, para a galeria ja ir para a memoria compartilhada)
+    global pool_comparacao
+    if PROCESSOS_COMPARACAO > 1:
+        pool_comparacao = PoolComparacao(PROCESSOS_COMPARACAO)
+        threading.Thread(target=pool_comparacao.aquecer, daemon=True).start()
+        print(f"[Futronic] Comparacao em {PROCESSOS_COMPARACAO} processos (galerias >= {GALERIA_MINIMA_PARALELA})")
 
-    # Inicializa dispositivo
-    init_device()
+    # Galerias carregam no primeiro uso de cada tenant; a limpeza descarrega as ociosas
+    GALERIAS.iniciar()
 
-    print("")
-    if DEVICE_CONNECTED:
-        print(f"[Biometric] PRONTO! Leitor {DEVICE_INFO.get('manufacturer', '')} {DEVICE_INFO.get('model', '')} conectado")
-    else:
-        print("[Biometric] AVISO: Nenhum leitor conectado")
-        print("[Biometric] Conecte um leitor USB e use /device/reconnect")
-    print("")
+    # Deteccao do leitor roda em segundo plano (nao atrasa o inicio da API)
+    monitor_dispositivos.iniciar()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Encerramento do servidor"""
+    monitor_dispositivos.parar()
+    with DEVICE_LOCK:
+        leitores = list(LEITORES.values())
+    for leitor in leitores:
+        leitor.encerrar()
+    GALERIAS.parar()
+    GALERIAS.descarregar_todas()
+    if pool_comparacao is not None:
+        pool_comparacao.encerrar()
 
 
 # ============================================
@@ -769,12 +1250,14 @@ async def startup_event():
 # ============================================
 
 @app.get("/", response_model=StatusResponse)
-async def status():
-    """Status do servico"""
+async def status(tenant: str = Depends(obter_tenant)):
+    """Status do servico (templates_cadastrados do tenant)"""
+    with GALERIAS.usar(tenant) as galeria:
+        cadastrados = len(galeria.cadastros)
     return StatusResponse(
         status="online",
         device_connected=DEVICE_CONNECTED,
-        templates_cadastrados=len(templates_cache),
+        templates_cadastrados=cadastrados,
         version="1.0.0"
     )
 
@@ -808,27 +1291,43 @@ async def health():
     return {"status": "healthy", "device": DEVICE_CONNECTED}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Metricas no formato texto do Prometheus"""
+    return Response(content=metricas.registro.exportar(), media_type=metricas.TIPO_CONTEUDO)
+
+
 @app.get("/device/status")
 async def device_status():
-    """Status detalhado do dispositivo"""
+    """Status detalhado do dispositivo (inventario mantido pelo monitor, sem varrer o USB)"""
     try:
-        safe_info = get_safe_device_info(DEVICE_INFO) if DEVICE_INFO else {}
+        with DEVICE_LOCK:
+            connected, device_info, atualizado_em = DEVICE_CONNECTED, DEVICE_INFO, DEVICE_ATUALIZADO_EM
+            leitores = [leitor.estado() for leitor in LEITORES.values()]
+            principal = LEITORES.get(device_info.get("device_id"))
+
+        safe_info = get_safe_device_info(device_info) if device_info else {}
 
         # Informacoes do SDK
         sdk_info = {
-            "futronic_sdk_available": FUTRONIC_SDK_AVAILABLE,
-            "futronic_handle": str(FUTRONIC_HANDLE) if FUTRONIC_HANDLE else None,
-            "sdk_used": DEVICE_INFO.get('sdk', 'none')
+            "futronic_sdk_available": any(
+                leitor["aberto"] for leitor in leitores if SCANNER_DRIVER == "futronic"
+            ),
+            "futronic_handle": principal.scanner.identificador() if principal else None,
+            "driver": SCANNER_DRIVER,
+            "sdk_used": device_info.get('sdk', 'none')
         }
 
         return {
-            "connected": DEVICE_CONNECTED,
+            "connected": connected,
             "manufacturer": safe_info.get("manufacturer", ""),
             "model": safe_info.get("model", ""),
             "info": safe_info,
             "sdk": sdk_info,
-            "driver_installed": DEVICE_CONNECTED,
-            "message": "Pronto para uso" if DEVICE_CONNECTED else "Conecte o leitor USB"
+            "driver_installed": connected,
+            "atualizado_em": atualizado_em,
+            "leitores": leitores,
+            "message": "Pronto para uso" if connected else "Conecte o leitor USB"
         }
     except Exception as e:
         print(f"[Biometric] Erro em /device/status: {e}")
@@ -887,8 +1386,8 @@ async def listar_dispositivos():
     """
     try:
         if not DEVICE_CONNECTED:
-            # Tenta detectar novamente
-            detect_usb_device()
+            # Pede uma nova varredura ao monitor (resultado aparece na proxima consulta)
+            monitor_dispositivos.solicitar_atualizacao()
 
         if DEVICE_CONNECTED and "all_devices" in DEVICE_INFO:
             safe_devices = [get_safe_device_info(d) for d in DEVICE_INFO["all_devices"]]
@@ -925,13 +1424,27 @@ async def listar_dispositivos():
 
 @app.post("/device/reconnect")
 async def device_reconnect():
-    """Tenta reconectar ao dispositivo"""
+    """
+    Tenta reconectar ao dispositivo.
+
+    Pede uma varredura imediata ao monitor e aguarda o resultado fora do event loop,
+    sem bloquear as demais requisicoes.
+    """
+    import asyncio
+
     try:
-        init_device()
+        geracao = monitor_dispositivos.solicitar_atualizacao(reabrir_sdk=True)
+        concluido = await asyncio.to_thread(
+            monitor_dispositivos.aguardar_atualizacao, geracao, TIMEOUT_RECONEXAO
+        )
         return {
             "success": DEVICE_CONNECTED,
             "device_info": get_safe_device_info(DEVICE_INFO),
-            "message": "Dispositivo conectado" if DEVICE_CONNECTED else "Dispositivo nao encontrado"
+            "atualizado_em": DEVICE_ATUALIZADO_EM,
+            "message": (
+                ("Dispositivo conectado" if DEVICE_CONNECTED else "Dispositivo nao encontrado")
+                if concluido else "Varredura em andamento - consulte /device/status"
+            )
         }
     except Exception as e:
         print(f"[Biometric] Erro em /device/reconnect: {e}")
@@ -1062,21 +1575,121 @@ def capturar_com_wbf(timeout_seconds: int = 30):
         return None, f"WBF_EXCEPTION: {str(e)}"
 
 
+def capturar_e_codificar(leitor: Leitor, timeout_seconds: int, formato: str):
+    """
+    Captura com o driver do leitor e codifica no formato pedido (roda no worker do leitor).
+
+    Capturas com qualidade abaixo de QUALIDADE_MINIMA sao refeitas aqui mesmo
+    (ate TENTATIVAS_CAPTURA vezes, dentro do timeout), evitando que uma digital
+    ruim so seja descoberta na verificacao. Fica a melhor captura obtida.
+
+    Retorna: (payload, error_message). Em rejeicao por qualidade o payload traz
+    apenas a qualidade medida.
+    """
+    resultado = "erro"
+    try:
+        with leitor.lock:
+            payload, error = _capturar_com_qualidade(leitor, timeout_seconds, formato)
+        resultado = "sucesso" if not error else ("qualidade_baixa" if payload else "erro")
+        return payload, error
+    finally:
+        METRICA_CAPTURAS.inc(device=leitor.device_id, resultado=resultado)
+        with DEVICE_LOCK:
+            leitor.pendentes -= 1
+            leitor.capturas += 1
+
+
+def _capturar_com_qualidade(leitor: Leitor, timeout_seconds: int, formato: str):
+    """Laco de tentativas de capturar_e_codificar (chamado com leitor.lock)"""
+    import time
+
+    inicio = time.time()
+    melhor_imagem, melhor_qualidade = None, None
+    tentativas = 0
+
+    while tentativas < TENTATIVAS_CAPTURA:
+        restante = timeout_seconds - (time.time() - inicio)
+        if restante <= 0:
+            break
+
+        imagem, error = capturar_imagem(leitor, max(1, int(restante)))
+        if error or imagem is None:
+            if melhor_imagem is not None:
+                break  # Ja existe uma captura (de baixa qualidade) para avaliar
+            return None, error or "Falha ao capturar imagem"
+
+        tentativas += 1
+        qualidade = fingerprint.avaliar_qualidade(imagem)
+        METRICA_QUALIDADE.observar(qualidade["score"], device=leitor.device_id)
+        print(f"[{leitor.scanner.nome}] {leitor.device_id} - qualidade da captura {tentativas}/{TENTATIVAS_CAPTURA}: {qualidade['score']}")
+
+        if melhor_qualidade is None or qualidade["score"] > melhor_qualidade["score"]:
+            melhor_imagem, melhor_qualidade = imagem, qualidade
+
+        if qualidade["score"] >= QUALIDADE_MINIMA:
+            break
+
+    if melhor_qualidade["score"] < QUALIDADE_MINIMA:
+        return {
+            "quality": melhor_qualidade["score"],
+            "qualidade_detalhes": melhor_qualidade,
+            "tentativas": tentativas
+        }, f"Qualidade insuficiente ({melhor_qualidade['score']} < {QUALIDADE_MINIMA})"
+
+    payload = codificar_captura(melhor_imagem, formato)
+    payload["quality"] = melhor_qualidade["score"]
+    payload["qualidade_detalhes"] = melhor_qualidade
+    payload["tentativas"] = tentativas
+    return payload, None
+
+
+async def executar_captura(leitor: Leitor, timeout_seconds: int, formato: str):
+    """
+    Envia a captura ao worker do leitor ja reservado e aguarda (timeout + 5s).
+
+    Retorna: (payload, error_message) de capturar_e_codificar
+    """
+    import asyncio
+
+    loop = asyncio.get_event_loop()
+    try:
+        future = loop.run_in_executor(
+            leitor.executor, capturar_e_codificar, leitor, timeout_seconds, formato
+        )
+    except RuntimeError:
+        # Leitor removido entre a reserva e o envio ao worker
+        with DEVICE_LOCK:
+            leitor.pendentes -= 1
+        raise
+    return await asyncio.wait_for(future, timeout=timeout_seconds + 5)
+
+
 @app.post("/capturar")
-async def capturar_digital():
+async def capturar_digital(request: Optional[CapturarRequest] = None, device: Optional[str] = None):
     """
     Captura uma digital do leitor.
     Aguarda o usuario colocar o dedo no leitor (funcao bloqueante).
 
+    Com varios leitores conectados, `?device=<device_id>` escolhe o leitor; sem o
+    parametro a captura vai para o leitor com menos capturas pendentes. Cada
+    leitor tem o seu worker, entao leitores diferentes capturam em paralelo.
+
+    Formato do template retornado (campo "formato" do body):
+    - png: imagem sem perdas (padrao)
+    - minucias: somente o template de minucias (~400 bytes)
+    - raw: buffer cru do sensor (somente sob demanda)
+
     Prioridade de captura:
-    1. SDK Futronic nativo (ftrScanAPI.dll) - para leitores Futronic
+    1. Driver de captura (scanners.py): SDK Futronic nativo ou scanner simulado
     2. Windows Biometric Framework (WBF) - para outros leitores
-    3. Simulacao - se nenhum SDK disponivel
 
     Suporta:
     - Futronic (FS80, FS80H, FS88, FS90) via SDK nativo
     - DigitalPersona, ZKTeco, Suprema via WBF
     """
+    request = request or CapturarRequest()
+    timeout = request.timeout
+
     try:
         if not DEVICE_CONNECTED:
             return {
@@ -1085,66 +1698,70 @@ async def capturar_digital():
                 "message": "Conecte o leitor biometrico USB e use /device/reconnect"
             }
 
+        leitor, error = reservar_leitor(device)
+        if error:
+            return {
+                "success": False,
+                "error": error,
+                "message": "Use /device/status para ver os leitores disponiveis"
+            }
+
         print("[Biometric] Iniciando captura de digital...")
-        print(f"[Biometric] Leitor: {DEVICE_INFO.get('manufacturer', '')} {DEVICE_INFO.get('model', '')}")
+        if leitor:
+            print(f"[Biometric] Leitor: {leitor.device.get('manufacturer', '')} {leitor.device.get('model', '')} ({leitor.device_id})")
+        else:
+            print(f"[Biometric] Leitor: {DEVICE_INFO.get('manufacturer', '')} {DEVICE_INFO.get('model', '')}")
         print(f"[Biometric] SDK disponivel: {DEVICE_INFO.get('sdk', 'nenhum')}")
 
         # =====================================================
-        # Se for Futronic mas SDK não está disponível, tenta reconectar
+        # PRIORIDADE 1: Driver de captura (SDK Futronic nativo ou simulado)
+        # (se o driver nao estiver aberto, o worker tenta reconectar antes de capturar)
         # =====================================================
-        if DEVICE_INFO.get('manufacturer', '').lower() == 'futronic' and not FUTRONIC_SDK_AVAILABLE:
-            print("[Biometric] SDK Futronic não disponível - tentando reconectar...")
-            if init_futronic_sdk():
-                print("[Biometric] SDK Futronic reconectado com sucesso!")
-                DEVICE_INFO['sdk'] = 'futronic_native'
-            else:
-                print("[Biometric] Falha ao reconectar SDK Futronic")
-
-        # =====================================================
-        # PRIORIDADE 1: SDK Futronic nativo
-        # =====================================================
-        if FUTRONIC_SDK_AVAILABLE:
-            print("[Biometric] Usando SDK Futronic nativo...")
+        if leitor:
+            scanner = leitor.scanner
+            print(f"[Biometric] Usando {scanner.nome}...")
             import asyncio
-            import concurrent.futures
 
             try:
-                loop = asyncio.get_event_loop()
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = loop.run_in_executor(executor, capturar_com_futronic_sdk, 30)
-                    sample_data, error = await asyncio.wait_for(future, timeout=35)
+                payload, error = await executar_captura(leitor, timeout, request.formato)
 
-                if sample_data and not error:
-                    template_b64 = base64.b64encode(sample_data).decode('utf-8')
-                    print(f"[Biometric] Sucesso! Template capturado: {len(sample_data)} bytes")
+                if payload and not error:
+                    print(f"[Biometric] Sucesso! Template capturado: {payload['tamanho_bytes']} bytes ({payload['formato']})")
 
                     return {
                         "success": True,
-                        "template_base64": template_b64,
-                        "quality": 85,
-                        "message": "Digital capturada com sucesso (SDK Futronic)!",
-                        "device_info": get_safe_device_info(DEVICE_INFO),
-                        "simulated": False,
-                        "sdk_used": "futronic_native"
+                        **payload,
+                        "message": f"Digital capturada com sucesso ({scanner.nome})!",
+                        "device_id": leitor.device_id,
+                        "device_info": get_safe_device_info(leitor.device),
+                        "simulated": scanner.simulado,
+                        "sdk_used": scanner.sdk
                     }
                 elif error:
-                    print(f"[Biometric] Erro SDK Futronic: {error}")
+                    print(f"[Biometric] Erro {scanner.nome}: {error}")
                     if "Timeout" in str(error):
                         return {
                             "success": False,
                             "error": error,
                             "message": "Coloque o dedo no leitor e tente novamente"
                         }
+                    if payload and "quality" in payload:
+                        return {
+                            "success": False,
+                            "error": error,
+                            **payload,
+                            "message": "Digital com baixa qualidade. Limpe o dedo e o leitor e tente novamente."
+                        }
                     # Continua para tentar WBF
 
             except asyncio.TimeoutError:
                 return {
                     "success": False,
-                    "error": "Timeout - nenhuma digital detectada em 30 segundos",
+                    "error": f"Timeout - nenhuma digital detectada em {timeout} segundos",
                     "message": "Coloque o dedo no leitor e tente novamente"
                 }
             except Exception as e:
-                print(f"[Biometric] Erro SDK Futronic: {e}")
+                print(f"[Biometric] Erro {scanner.nome}: {e}")
                 # Continua para tentar WBF
 
         # =====================================================
@@ -1158,8 +1775,8 @@ async def capturar_digital():
                 print("[Biometric] Tentando Windows Biometric Framework...")
                 loop = asyncio.get_event_loop()
                 with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = loop.run_in_executor(executor, capturar_com_wbf, 30)
-                    sample_data, error = await asyncio.wait_for(future, timeout=35)
+                    future = loop.run_in_executor(executor, capturar_com_wbf, timeout)
+                    sample_data, error = await asyncio.wait_for(future, timeout=timeout + 5)
 
                 if sample_data and not error:
                     template_b64 = base64.b64encode(sample_data).decode('utf-8')
@@ -1168,7 +1785,9 @@ async def capturar_digital():
                     return {
                         "success": True,
                         "template_base64": template_b64,
-                        "quality": 80,
+                        "formato": "wbf",  # Amostra WINBIO opaca - nao e convertida
+                        "tamanho_bytes": len(sample_data),
+                        "quality": 80,  # Amostra opaca; o proprio WBF ja rejeita capturas ruins (0x80098005)
                         "message": "Digital capturada com sucesso!",
                         "device_info": get_safe_device_info(DEVICE_INFO),
                         "simulated": False
@@ -1201,7 +1820,7 @@ async def capturar_digital():
             except asyncio.TimeoutError:
                 return {
                     "success": False,
-                    "error": "Timeout - nenhuma digital detectada em 30 segundos",
+                    "error": f"Timeout - nenhuma digital detectada em {timeout} segundos",
                     "message": "Coloque o dedo no leitor e tente novamente"
                 }
             except Exception as e:
@@ -1232,7 +1851,7 @@ async def capturar_digital():
 
 
 @app.post("/cadastrar")
-async def cadastrar_digital(request: CadastrarRequest):
+async def cadastrar_digital(request: CadastrarRequest, tenant: str = Depends(obter_tenant)):
     """
     Cadastra uma digital no sistema.
 
@@ -1246,7 +1865,7 @@ async def cadastrar_digital(request: CadastrarRequest):
 
         if request.template_base64:
             # Template ja fornecido
-            template_data = base64.b64decode(request.template_base64)
+            template_data = decodificar_base64(request.template_base64)
         elif DEVICE_CONNECTED:
             # Captura do leitor
             # TODO: Implementar captura real
@@ -1260,19 +1879,29 @@ async def cadastrar_digital(request: CadastrarRequest):
                 "error": "Leitor nao conectado e template nao fornecido"
             }
 
-        # Salva template no cache
-        templates_cache[str(request.funcionario_id)] = {
-            "nome": request.nome,
-            "pis": request.pis,
-            "template": request.template_base64,
-            "cadastrado_em": datetime.now().isoformat()
-        }
-        save_templates_cache()
+        func_id = str(request.funcionario_id)
+        # Extracao das minucias fora do event loop
+        import asyncio
+        preparado = await asyncio.to_thread(preparar_template, template_data)
 
-        # Salva template em arquivo separado (backup)
-        template_file = TEMPLATES_DIR / f"{request.funcionario_id}.bin"
-        with open(template_file, "wb") as f:
-            f.write(template_data)
+        qualidade = preparado["qualidade"]["score"] if preparado["qualidade"] else request.qualidade
+        if qualidade is not None and qualidade < QUALIDADE_MINIMA:
+            return {
+                "success": False,
+                "error": f"Qualidade insuficiente ({qualidade} < {QUALIDADE_MINIMA})",
+                "quality": qualidade,
+                "message": "Capture a digital novamente"
+            }
+
+        # Salva template no cache (apenas minucias; formatos opacos ficam como estao)
+        with GALERIAS.usar(tenant) as galeria:
+            salvar_cadastro(
+                galeria, func_id, request.nome, request.pis, preparado["formato"], qualidade,
+                minucias=preparado["minucias"],
+                imagem=preparado["imagem"],
+                template_data=template_data
+            )
+            quantidade_minucias = len(galeria.dados[func_id]) if func_id in galeria.dados else None
 
         print(f"[Futronic] Cadastrado com sucesso: {request.nome}")
 
@@ -1280,6 +1909,9 @@ async def cadastrar_digital(request: CadastrarRequest):
             "success": True,
             "funcionario_id": request.funcionario_id,
             "nome": request.nome,
+            "formato": preparado["formato"],
+            "quality": qualidade,
+            "minucias": quantidade_minucias,
             "message": "Digital cadastrada com sucesso"
         }
 
@@ -1288,42 +1920,251 @@ async def cadastrar_digital(request: CadastrarRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@app.post("/verificar")
-async def verificar_digital(request: VerificarRequest):
+# ============================================
+# CADASTRO COM VARIAS CAPTURAS
+# ============================================
+
+class SessaoCadastro:
+    """Capturas de um cadastro em andamento, consolidadas ao concluir"""
+
+    def __init__(self, tenant: str, funcionario_id: int, nome: str, pis: str, capturas: int):
+        self.id = uuid.uuid4().hex
+        self.tenant = tenant
+        self.funcionario_id = funcionario_id
+        self.nome = nome
+        self.pis = pis
+        self.capturas = capturas
+        self.amostras = []  # dicts com minucias, largura, altura, qualidade e imagem
+        self.criada_em = time.time()
+
+    def estado(self) -> dict:
+        return {
+            "sessao_id": self.id,
+            "amostras": len(self.amostras),
+            "capturas": self.capturas,
+            "faltam": max(0, self.capturas - len(self.amostras)),
+            "completa": len(self.amostras) >= self.capturas
+        }
+
+
+def descartar_sessoes_expiradas():
+    """Remove sessoes de cadastro abandonadas (chamado com SESSOES_LOCK)"""
+    limite = time.time() - VALIDADE_SESSAO_CADASTRO
+    for sessao_id in [s for s, sessao in sessoes_cadastro.items() if sessao.criada_em < limite]:
+        del sessoes_cadastro[sessao_id]
+
+
+def obter_sessao_cadastro(sessao_id: str, tenant: str) -> Optional[SessaoCadastro]:
+    """Sessao do tenant (sessoes de outro tenant nao sao encontradas)"""
+    with SESSOES_LOCK:
+        descartar_sessoes_expiradas()
+        sessao = sessoes_cadastro.get(sessao_id)
+    return sessao if sessao and sessao.tenant == tenant else None
+
+
+@app.post("/cadastro/sessao")
+async def iniciar_sessao_cadastro(request: SessaoCadastroRequest, tenant: str = Depends(obter_tenant)):
     """
-    Verifica uma digital contra as cadastradas.
+    Inicia um cadastro com varias capturas do mesmo dedo.
 
-    Retorna o funcionario correspondente se encontrar match.
+    Fluxo: POST /cadastro/sessao -> N x POST /cadastro/sessao/{id}/amostra ->
+    POST /cadastro/sessao/{id}/concluir. As capturas sao comparadas entre si, as
+    inconsistentes descartadas e as demais fundidas em um template com peso
+    (confiabilidade) por minucia.
     """
-    try:
-        if not templates_cache:
-            return {
-                "success": False,
-                "error": "Nenhuma digital cadastrada"
-            }
+    sessao = SessaoCadastro(
+        tenant, request.funcionario_id, request.nome, request.pis, max(1, request.capturas or CAPTURAS_CADASTRO)
+    )
+    with SESSOES_LOCK:
+        descartar_sessoes_expiradas()
+        sessoes_cadastro[sessao.id] = sessao
 
-        # Decodifica template da requisicao
-        query_template = base64.b64decode(request.template_base64)
+    print(f"[Futronic] Sessao de cadastro {sessao.id}: {request.nome} ({sessao.capturas} capturas)")
+    return {"success": True, **sessao.estado(), "validade_segundos": VALIDADE_SESSAO_CADASTRO}
 
-        # Compara com todas as digitais cadastradas
-        best_match = None
-        best_score = 0.0
 
-        for func_id, data in templates_cache.items():
-            cached_template = base64.b64decode(data["template"])
+@app.post("/cadastro/sessao/{sessao_id}/amostra")
+async def adicionar_amostra_cadastro(sessao_id: str, request: Optional[AmostraCadastroRequest] = None,
+                                     device: Optional[str] = None, tenant: str = Depends(obter_tenant)):
+    """
+    Adiciona uma captura a sessao de cadastro.
+
+    Recebe a captura em template_base64 (PNG, raw ou minucias) ou, sem ela,
+    captura do leitor (`?device=` opcional, como em /capturar).
+    """
+    import asyncio
 
-            # Compara templates
-            is_match, score = compare_templates(query_template, cached_template)
+    request = request or AmostraCadastroRequest()
+    sessao = obter_sessao_cadastro(sessao_id, tenant)
+    if not sessao:
+        return {"success": False, "error": "Sessao de cadastro nao encontrada ou expirada"}
+    if sessao.estado()["completa"]:
+        return {"success": False, "error": "Sessao ja tem todas as capturas", **sessao.estado()}
 
-            if is_match and score > best_score:
-                best_score = score
-                best_match = {
-                    "funcionario_id": int(func_id),
-                    "nome": data["nome"],
-                    "pis": data["pis"],
-                    "score": score
+    if request.template_base64:
+        template_data = decodificar_base64(request.template_base64)
+    else:
+        if not DEVICE_CONNECTED:
+            return {"success": False, "error": "Leitor nao conectado"}
+        leitor, error = reservar_leitor(device)
+        if not leitor:
+            return {"success": False, "error": error or "Nenhum leitor disponivel para captura direta"}
+        try:
+            payload, error = await executar_captura(leitor, request.timeout, fingerprint.FORMATO_PNG)
+        except asyncio.TimeoutError:
+            return {"success": False, "error": f"Timeout - nenhuma digital detectada em {request.timeout} segundos"}
+        if error:
+            return {"success": False, "error": error, **(payload or {}), **sessao.estado()}
+        template_data = decodificar_base64(payload["template_base64"])
+
+    # Extracao das minucias fora do event loop
+    preparado = await asyncio.to_thread(preparar_template, template_data)
+    if preparado["minucias"] is None:
+        return {"success": False, "error": "Formato sem minucias (ex: WBF) nao pode ser consolidado"}
+
+    qualidade = preparado["qualidade"]["score"] if preparado["qualidade"] else None
+    if qualidade is not None and qualidade < QUALIDADE_MINIMA:
+        return {
+            "success": False,
+            "error": f"Qualidade insuficiente ({qualidade} < {QUALIDADE_MINIMA})",
+            "quality": qualidade,
+            **sessao.estado()
+        }
+
+    minucias, largura, altura = fingerprint.desserializar_minucias(preparado["minucias"])
+
+    # Outra amostra pode ter completado (ou a sessao ter sido concluida/cancelada) durante a captura
+    with SESSOES_LOCK:
+        if sessoes_cadastro.get(sessao.id) is not sessao:
+            return {"success": False, "error": "Sessao de cadastro nao encontrada ou expirada"}
+        if len(sessao.amostras) >= sessao.capturas:
+            return {"success": False, "error": "Sessao ja tem todas as capturas", **sessao.estado()}
+        sessao.amostras.append({
+            "minucias": minucias,
+            "largura": largura,
+            "altura": altura,
+            "qualidade": qualidade,
+            "imagem": preparado["imagem"]
+        })
+        estado = sessao.estado()
+
+    return {"success": True, **estado, "quality": qualidade, "minucias": len(minucias)}
+
+
+@app.post("/cadastro/sessao/{sessao_id}/concluir")
+async def concluir_sessao_cadastro(sessao_id: str, tenant: str = Depends(obter_tenant)):
+    """
+    Consolida as capturas da sessao e grava o cadastro.
+
+    Se menos de MIN_CAPTURAS_CONSISTENTES capturas baterem entre si, as
+    inconsistentes saem da sessao e e preciso adicionar novas capturas.
+    """
+    sessao = obter_sessao_cadastro(sessao_id, tenant)
+    if not sessao:
+        return {"success": False, "error": "Sessao de cadastro nao encontrada ou expirada"}
+    with SESSOES_LOCK:
+        amostras = list(sessao.amostras)
+    if len(amostras) < sessao.capturas:
+        return {"success": False, "error": f"Faltam {sessao.capturas - len(amostras)} captura(s)", **sessao.estado()}
+
+    # Comparacao e fusao das capturas fora do event loop
+    import asyncio
+    resultado = await asyncio.to_thread(
+        fingerprint.consolidar_minucias, [a["minucias"] for a in amostras], LIMIAR_MATCH
+    )
+    aceitas = [amostras[i] for i in resultado["aceitas"]]
+
+    if len(aceitas) < min(MIN_CAPTURAS_CONSISTENTES, len(amostras)):
+        with SESSOES_LOCK:
+            sessao.amostras = aceitas
+        return {
+            "success": False,
+            "error": "Capturas inconsistentes entre si",
+            "descartadas": resultado["descartadas"],
+            "scores": resultado["scores"],
+            **sessao.estado(),
+            "message": "Capture o mesmo dedo novamente"
+        }
+
+    if len(resultado["minucias"]) < fingerprint.MIN_MINUCIAS_COMPARACAO:
+        return {"success": False, "error": "Poucas minucias em comum entre as capturas", **sessao.estado()}
+
+    referencia = amostras[resultado["referencia"]]
+    minucias = fingerprint.serializar_minucias(resultado["minucias"], referencia["largura"], referencia["altura"])
+    qualidades = [a["qualidade"] for a in aceitas if a["qualidade"] is not None]
+    qualidade = round(sum(qualidades) / len(qualidades)) if qualidades else None
+
+    with GALERIAS.usar(tenant) as galeria:
+        salvar_cadastro(
+            galeria, str(sessao.funcionario_id), sessao.nome, sessao.pis, fingerprint.FORMATO_MINUCIAS, qualidade,
+            minucias=minucias,
+            imagem=referencia["imagem"],
+            template_data=minucias,
+            capturas=len(aceitas)
+        )
+    with SESSOES_LOCK:
+        sessoes_cadastro.pop(sessao.id, None)
+
+    print(f"[Futronic] Cadastrado com sucesso: {sessao.nome} ({len(aceitas)} capturas consolidadas)")
+
+    return {
+        "success": True,
+        "funcionario_id": sessao.funcionario_id,
+        "nome": sessao.nome,
+        "formato": fingerprint.FORMATO_MINUCIAS,
+        "quality": qualidade,
+        "capturas": len(aceitas),
+        "descartadas": resultado["descartadas"],
+        "scores": resultado["scores"],
+        "minucias": len(resultado["minucias"]),
+        "message": "Digital cadastrada com sucesso"
+    }
+
+
+@app.delete("/cadastro/sessao/{sessao_id}")
+async def cancelar_sessao_cadastro(sessao_id: str, tenant: str = Depends(obter_tenant)):
+    """Descarta uma sessao de cadastro"""
+    with SESSOES_LOCK:
+        sessao = sessoes_cadastro.get(sessao_id)
+        if sessao and sessao.tenant == tenant:
+            del sessoes_cadastro[sessao_id]
+        else:
+            sessao = None
+    return {"success": sessao is not None}
+
+
+@app.post("/verificar")
+async def verificar_digital(request: VerificarRequest, tenant: str = Depends(obter_tenant)):
+    """
+    Verifica uma digital contra as cadastradas do tenant.
+
+    Retorna o funcionario correspondente se encontrar match.
+    """
+    try:
+        with GALERIAS.usar(tenant) as galeria:
+            if not galeria.cadastros:
+                return {
+                    "success": False,
+                    "error": "Nenhuma digital cadastrada"
                 }
 
+            # Decodifica template da requisicao
+            query_template = decodificar_base64(request.template_base64)
+
+            # Extrai as minucias e compara com todas as digitais cadastradas (fora do event loop:
+            # requisicoes simultaneas se sobrepoem e, com o pool, cada uma usa todos os nucleos)
+            import asyncio
+            func_id, best_score = await asyncio.to_thread(identificar_template, galeria, query_template)
+            data = galeria.cadastros.get(func_id, {}) if func_id is not None else None
+        best_match = None
+        if data is not None:
+            best_match = {
+                "funcionario_id": int(func_id),
+                "nome": data["nome"],
+                "pis": data["pis"],
+                "score": best_score
+            }
+
         if best_match:
             print(f"[Futronic] Identificado: {best_match['nome']} (score: {best_score:.2%})")
             return {
@@ -1345,21 +2186,152 @@ async def verificar_digital(request: VerificarRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+def identificar_template(galeria: GaleriaTenant, template: bytes) -> tuple:
+    """Extrai as minucias de uma digital e identifica na galeria. Retorna: (func_id ou None, score)"""
+    return identificar_digitais(galeria, [(template, fingerprint.carregar_minucias(template))])[0]
+
+
+def decodificar_item_lote(item: ItemLote) -> tuple:
+    """Decodifica a digital de um item de lote. Retorna: (template bytes, minucias ou None)"""
+    template = decodificar_base64(item.template_base64)
+    return template, fingerprint.carregar_minucias(template)
+
+
+def responder_lote(itens: List[ItemLote], tenant: str, processar):
+    """
+    Resposta NDJSON (uma linha JSON por item, na ordem do lote).
+
+    `processar(galeria, grupo)` recebe a galeria do tenant (em uso ate o fim do
+    stream) e ate CONSULTAS_POR_GRUPO pares (indice, item) e devolve os resultados.
+    """
+    return responder_ndjson(
+        itens, processar, LOTE_MAXIMO, CONSULTAS_POR_GRUPO, contexto=lambda: GALERIAS.usar(tenant)
+    )
+
+
+@app.post("/identificar/lote")
+async def identificar_lote(request: LoteRequest, tenant: str = Depends(obter_tenant)):
+    """
+    Identifica varias digitais contra as cadastradas (1:N), como /verificar.
+
+    As consultas sao comparadas com a galeria inteira de uma vez e a resposta
+    e enviada em NDJSON, uma linha por digital:
+    {"indice", "id", "success", "funcionario_id", "nome", "pis", "confidence"} ou {"indice", "id", "success": false, "error"}
+    """
+    def processar(galeria, grupo):
+        resultados, consultas = {}, []
+        for indice, item in grupo:
+            try:
+                consultas.append((indice, decodificar_item_lote(item)))
+            except Exception as e:
+                resultados[indice] = {"success": False, "error": f"Template invalido: {e}"}
+
+        identificados = (
+            identificar_digitais(galeria, [consulta for _, consulta in consultas], "identificar_lote")
+            if consultas else []
+        )
+        for (indice, _), (func_id, score) in zip(consultas, identificados):
+            if func_id is None:
+                resultados[indice] = {"success": False, "error": "Digital nao reconhecida"}
+            else:
+                data = galeria.cadastros.get(func_id, {})
+                resultados[indice] = {
+                    "success": True,
+                    "funcionario_id": int(func_id),
+                    "nome": data.get("nome"),
+                    "pis": data.get("pis"),
+                    "confidence": score,
+                }
+
+        return [{"indice": indice, "id": item.id, **resultados[indice]} for indice, item in grupo]
+
+    with GALERIAS.usar(tenant) as galeria:
+        if not galeria.cadastros:
+            return {"success": False, "error": "Nenhuma digital cadastrada"}
+    return responder_lote(request.itens, tenant, processar)
+
+
+@app.post("/verificar/lote")
+async def verificar_lote(request: LoteRequest, tenant: str = Depends(obter_tenant)):
+    """
+    Verifica varias digitais, cada uma contra o funcionario informado (1:1).
+
+    Resposta em NDJSON, uma linha por digital:
+    {"indice", "id", "success", "funcionario_id", "match", "confidence"} ou {"indice", "id", "success": false, "error"}
+    """
+    def processar(galeria, grupo):
+        grade = galeria.obter_empacotada()
+        templates = galeria.cadastros
+        resultados, pares = {}, []
+        for indice, item in grupo:
+            func_id = str(item.funcionario_id) if item.funcionario_id is not None else None
+            if func_id is None:
+                resultados[indice] = {"success": False, "error": "funcionario_id obrigatorio"}
+                continue
+            if func_id not in templates:
+                resultados[indice] = {"success": False, "error": "Funcionario sem digital cadastrada"}
+                continue
+            try:
+                template, minucias = decodificar_item_lote(item)
+            except Exception as e:
+                resultados[indice] = {"success": False, "error": f"Template invalido: {e}"}
+                continue
+
+            if minucias is not None and func_id in grade["posicao"]:
+                pares.append((indice, minucias, grade["posicao"][func_id]))
+            elif "template" in templates[func_id]:
+                armazenado = template_armazenado(func_id, templates[func_id])
+                if armazenado is None:
+                    resultados[indice] = {"success": False, "error": "Template cadastrado corrompido"}
+                    continue
+                is_match, score = compare_templates(template, armazenado)
+                resultados[indice] = {"match": bool(is_match), "score": score}
+            else:
+                resultados[indice] = {"success": False, "error": "Template sem minucias para comparar"}
+
+        # Pares com minucias: uma unica comparacao vetorizada
+        if pares:
+            consultas, quantidades = fingerprint.empacotar_minucias([minucias for _, minucias, _ in pares])
+            posicoes = np.array([posicao for _, _, posicao in pares])
+            with GALERIAS.medir(galeria, "verificar_lote", len(pares)):
+                scores = fingerprint.comparar_pares(
+                    consultas, quantidades, grade["minucias"][posicoes],
+                    grade["quantidades"][posicoes], grade["ponderar"][posicoes]
+                )
+            for (indice, _, _), score in zip(pares, scores):
+                resultados[indice] = {"match": bool(score >= LIMIAR_MATCH), "score": float(score)}
+
+        linhas = []
+        for indice, item in grupo:
+            resultado = resultados[indice]
+            if "match" in resultado:
+                resultado = {
+                    "success": True,
+                    "funcionario_id": item.funcionario_id,
+                    "match": resultado["match"],
+                    "confidence": resultado["score"],
+                }
+            linhas.append({"indice": indice, "id": item.id, **resultado})
+        return linhas
+
+    return responder_lote(request.itens, tenant, processar)
+
+
 @app.delete("/remover/{funcionario_id}")
-async def remover_digital(funcionario_id: int):
+async def remover_digital(funcionario_id: int, tenant: str = Depends(obter_tenant)):
     """Remove uma digital cadastrada"""
     try:
         func_id_str = str(funcionario_id)
 
-        # Remove do cache
-        if func_id_str in templates_cache:
-            del templates_cache[func_id_str]
-            save_templates_cache()
+        with GALERIAS.usar(tenant) as galeria:
+            # Remove do cache
+            galeria.remover(func_id_str)
 
-        # Remove arquivo de template
-        template_file = TEMPLATES_DIR / f"{funcionario_id}.bin"
-        if template_file.exists():
-            template_file.unlink()
+            # Remove arquivos de template/imagem
+            for extensao in ("bin", "png"):
+                template_file = galeria.diretorio / f"{funcionario_id}.{extensao}"
+                if template_file.exists():
+                    template_file.unlink()
 
         print(f"[Futronic] Removido: ID {funcionario_id}")
 
@@ -1374,14 +2346,19 @@ async def remover_digital(funcionario_id: int):
 
 
 @app.get("/listar")
-async def listar_digitais():
-    """Lista todas as digitais cadastradas"""
+async def listar_digitais(tenant: str = Depends(obter_tenant)):
+    """Lista todas as digitais cadastradas do tenant"""
     digitais = []
-    for func_id, data in templates_cache.items():
+    with GALERIAS.usar(tenant) as galeria:
+        cadastros = list(galeria.cadastros.items())
+    for func_id, data in cadastros:
         digitais.append({
             "funcionario_id": int(func_id),
             "nome": data["nome"],
             "pis": data["pis"],
+            "formato": data.get("formato"),
+            "qualidade": data.get("qualidade"),
+            "capturas": data.get("capturas", 1),
             "cadastrado_em": data.get("cadastrado_em")
         })
 
@@ -1393,12 +2370,14 @@ async def listar_digitais():
 
 
 @app.post("/sincronizar")
-async def sincronizar():
-    """Recarrega o cache de templates do disco"""
-    load_templates_cache()
+async def sincronizar(tenant: str = Depends(obter_tenant)):
+    """Recarrega do disco o cache de templates do tenant"""
+    with GALERIAS.usar(tenant) as galeria:
+        galeria.carregar()
+        total = len(galeria.cadastros)
     return {
         "success": True,
-        "templates_carregados": len(templates_cache)
+        "templates_carregados": total
     }
 
 
@@ -1427,16 +2406,17 @@ async def simular_captura():
 
 
 @app.post("/simular/verificacao")
-async def simular_verificacao(funcionario_id: int = 1):
+async def simular_verificacao(funcionario_id: int = 1, tenant: str = Depends(obter_tenant)):
     """
     Simula uma verificacao bem-sucedida.
 
     Retorna o funcionario especificado se estiver cadastrado.
     """
     func_id_str = str(funcionario_id)
+    with GALERIAS.usar(tenant) as galeria:
+        data = galeria.cadastros.get(func_id_str)
 
-    if func_id_str in templates_cache:
-        data = templates_cache[func_id_str]
+    if data is not None:
         return {
             "success": True,
             "funcionario_id": funcionario_id,
@@ -1453,6 +2433,41 @@ async def simular_verificacao(funcionario_id: int = 1):
         }
 
 
+@app.post("/simular/dedo")
+async def simular_dedo(request: DedoSimuladoRequest):
+    """
+    Define a proxima imagem do scanner simulado (FUTRONIC_SCANNER=simulado).
+
+    A captura seguinte em /capturar passa pelo mesmo fluxo de um leitor real
+    (qualidade, codificacao e minucias), permitindo testes deterministicos.
+    """
+    if SCANNER_DRIVER != "simulado":
+        return {"success": False, "error": "Scanner simulado nao esta ativo (FUTRONIC_SCANNER=simulado)"}
+
+    with DEVICE_LOCK:
+        if request.device_id:
+            leitor = LEITORES.get(request.device_id)
+        else:
+            leitor = next(iter(LEITORES.values()), None)
+    if not leitor:
+        return {"success": False, "error": f"Leitor simulado nao encontrado: {request.device_id or 'nenhum conectado'}"}
+
+    if request.template_base64:
+        try:
+            imagem = fingerprint.decodificar_imagem(decodificar_base64(request.template_base64))
+        except Exception:
+            imagem = None
+        if imagem is None:
+            return {"success": False, "error": "Imagem invalida (esperado PNG ou raw do sensor)"}
+        leitor.scanner.enfileirar(imagem)
+    elif request.identidade is not None:
+        leitor.scanner.enfileirar(request.identidade)
+    else:
+        return {"success": False, "error": "Informe identidade ou template_base64"}
+
+    return {"success": True, "device_id": leitor.device_id, "simulated": True}
+
+
 # ============================================
 # MAIN
 # ============================================
@@ -0,0 +1,451 @@
+"""
+Drivers de captura do Biometric API
+===================================
+
+Todo driver entrega a imagem do sensor (escala de cinza, altura x largura, uint8)
+para o mesmo worker de captura de main.py, que avalia a qualidade, codifica o
+template e extrai as minucias. Assim o restante do servico nao sabe de onde a
+imagem veio.
+
+Drivers:
+- futronic: SDK nativo ftrScanAPI.dll (Windows)
+- simulado: reproduz imagens gravadas (PNG ou raw de um diretorio) ou gera
+  digitais sinteticas deterministicas. Permite rodar o servico completo
+  (captura, qualidade, extracao e comparacao) no Linux, em testes e benchmarks.
+"""
+
+import sys
+import time
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+import fingerprint
+
+
+class Scanner:
+    """Interface comum dos drivers de captura"""
+
+    nome = "base"
+    sdk = "none"
+    simulado = False
+
+    espera_dedo = None  # Segundos ate o dedo ser detectado na ultima captura (None se nao chegou a detectar)
+    reconexoes = 0  # Reaberturas feitas pelo proprio driver durante capturas
+
+    @property
+    def aberto(self) -> bool:
+        return False
+
+    def abrir(self) -> bool:
+        """Abre o dispositivo. Retorna True se ficou pronto para capturar"""
+        raise NotImplementedError
+
+    def fechar(self):
+        """Libera o dispositivo (pode ser chamado mesmo se ja estiver fechado)"""
+
+    def capturar(self, timeout_seconds: int):
+        """
+        Aguarda o dedo e captura uma imagem. Atualiza `espera_dedo`.
+
+        Retorna: (imagem, error_message)
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def atende(cls, device_info: dict) -> bool:
+        """Indica se o driver deve ser usado para o leitor do inventario"""
+        return False
+
+    def identificador(self) -> Optional[str]:
+        """Identificador do dispositivo aberto (para /device/status)"""
+        return None
+
+
+# ============================================
+# FUTRONIC (ftrScanAPI.dll)
+# ============================================
+
+class FutronicScanner(Scanner):
+    """Leitores Futronic (FS80, FS80H, FS88, FS90) via ftrScanAPI.dll"""
+
+    nome = "Futronic SDK"
+    sdk = "futronic_native"
+
+    DOSE_CAPTURA = 4  # Dose 4 = alta qualidade
+
+    def __init__(self, interface: int = 0):
+        self.interface = interface  # Posicao do leitor entre os Futronic conectados
+        self._dll = None
+        self._handle = None
+
+    @property
+    def aberto(self) -> bool:
+        return bool(self._handle)
+
+    def identificador(self) -> Optional[str]:
+        return str(self._handle) if self._handle else None
+
+    @classmethod
+    def atende(cls, device_info: dict) -> bool:
+        return device_info.get('manufacturer', '').lower() == 'futronic'
+
+    def abrir(self) -> bool:
+        """
+        Carrega a DLL e abre o dispositivo.
+        Retorna True se o SDK foi carregado e o dispositivo aberto com sucesso.
+        """
+        if sys.platform != "win32":
+            print("[Futronic SDK] Disponivel apenas no Windows")
+            return False
+
+        try:
+            import ctypes
+            from ctypes import c_void_p, c_int, c_bool
+
+            # Tenta carregar a DLL do diretorio atual
+            dll_path = Path(__file__).parent / "ftrScanAPI.dll"
+            if not dll_path.exists():
+                # Tenta no System32
+                dll_path = Path("C:/Windows/System32/ftrScanAPI.dll")
+
+            if not dll_path.exists():
+                print(f"[Futronic SDK] DLL nao encontrada: {dll_path}")
+                return False
+
+            print(f"[Futronic SDK] Carregando DLL: {dll_path}")
+            dll = ctypes.WinDLL(str(dll_path))
+
+            # Define tipos de retorno das funcoes
+            dll.ftrScanOpenDevice.restype = c_void_p
+            dll.ftrScanOpenDeviceOnInterface.argtypes = [c_int]
+            dll.ftrScanOpenDeviceOnInterface.restype = c_void_p
+            dll.ftrScanCloseDevice.argtypes = [c_void_p]
+            dll.ftrScanGetImageSize.argtypes = [c_void_p, c_void_p]
+            dll.ftrScanGetImageSize.restype = c_bool
+            dll.ftrScanGetImage.argtypes = [c_void_p, c_int, c_void_p]
+            dll.ftrScanGetImage.restype = c_bool
+            dll.ftrScanIsFingerPresent.argtypes = [c_void_p, c_void_p]
+            dll.ftrScanIsFingerPresent.restype = c_bool
+
+            # Abre o dispositivo (com varios leitores, cada um fica em uma interface)
+            print(f"[Futronic SDK] Abrindo dispositivo (interface {self.interface})...")
+            if self.interface:
+                handle = dll.ftrScanOpenDeviceOnInterface(self.interface)
+            else:
+                handle = dll.ftrScanOpenDevice()
+
+            if not handle:
+                print("[Futronic SDK] Falha ao abrir dispositivo (handle nulo)")
+                return False
+
+            self._dll = dll
+            self._handle = handle
+            print(f"[Futronic SDK] Dispositivo aberto com sucesso! Handle: {handle}")
+            return True
+
+        except OSError as e:
+            print(f"[Futronic SDK] Erro ao carregar DLL: {e}")
+            return False
+        except Exception as e:
+            print(f"[Futronic SDK] Erro: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+    def fechar(self):
+        """Fecha o dispositivo Futronic."""
+        if self._handle and self._dll:
+            try:
+                self._dll.ftrScanCloseDevice(self._handle)
+                print("[Futronic SDK] Dispositivo fechado")
+            except Exception as e:
+                print(f"[Futronic SDK] Erro ao fechar: {e}")
+
+        self._handle = None
+
+    def capturar(self, timeout_seconds: int = 30):
+        """
+        Captura digital usando o SDK Futronic nativo.
+        Aguarda o usuario colocar o dedo no leitor.
+
+        Retorna: (imagem, error_message) - imagem em escala de cinza (altura x largura, uint8)
+        """
+        self.espera_dedo = None
+        if not self.aberto:
+            return None, "SDK Futronic nao inicializado"
+
+        try:
+            from ctypes import c_int, c_bool, byref, create_string_buffer, Structure
+
+            # Estrutura para tamanho da imagem
+            class FTRSCAN_IMAGE_SIZE(Structure):
+                _fields_ = [
+                    ("nWidth", c_int),
+                    ("nHeight", c_int),
+                    ("nImageSize", c_int)
+                ]
+
+            # Estrutura para parametros de frame
+            class FTRSCAN_FRAME_PARAMETERS(Structure):
+                _fields_ = [
+                    ("nContrastOnDose2", c_int),
+                    ("nContrastOnDose4", c_int),
+                    ("nDose", c_int),
+                    ("nBrightnessOnDose2", c_int),
+                    ("nBrightnessOnDose4", c_int),
+                    ("bFingerPresent", c_bool)
+                ]
+
+            # Obtem tamanho da imagem
+            img_size = FTRSCAN_IMAGE_SIZE()
+            if not self._dll.ftrScanGetImageSize(self._handle, byref(img_size)):
+                # Tenta reconectar e tentar novamente
+                print("[Futronic SDK] Falha ao obter tamanho - tentando reconectar...")
+                self.fechar()
+                self.reconexoes += 1
+                if self.abrir():
+                    if not self._dll.ftrScanGetImageSize(self._handle, byref(img_size)):
+                        return None, "Falha ao obter tamanho da imagem"
+                else:
+                    return None, "Falha ao reconectar com o leitor"
+
+            print(f"[Futronic SDK] Tamanho: {img_size.nWidth}x{img_size.nHeight} ({img_size.nImageSize} bytes)")
+
+            # Aguarda o dedo no leitor
+            print(f"[Futronic SDK] Aguardando dedo no leitor (timeout: {timeout_seconds}s)...")
+            print("[Futronic SDK] COLOQUE O DEDO NO LEITOR...")
+
+            start_time = time.time()
+            frame_params = FTRSCAN_FRAME_PARAMETERS()
+
+            while (time.time() - start_time) < timeout_seconds:
+                try:
+                    # Verifica se tem dedo no leitor
+                    if self._dll.ftrScanIsFingerPresent(self._handle, byref(frame_params)):
+                        if frame_params.bFingerPresent:
+                            self.espera_dedo = time.time() - start_time
+                            print("[Futronic SDK] Dedo detectado! Capturando...")
+                            break
+                except Exception as e:
+                    print(f"[Futronic SDK] Erro ao verificar dedo: {e}")
+                    # Tenta continuar
+                time.sleep(0.1)  # Verifica a cada 100ms
+            else:
+                return None, "Timeout - nenhum dedo detectado"
+
+            # Captura a imagem
+            buffer = create_string_buffer(img_size.nImageSize)
+            if not self._dll.ftrScanGetImage(self._handle, self.DOSE_CAPTURA, buffer):
+                return None, "Falha ao capturar imagem"
+
+            print(f"[Futronic SDK] Imagem capturada! {len(buffer.raw)} bytes")
+
+            imagem = fingerprint.raw_para_imagem(buffer.raw, img_size.nWidth, img_size.nHeight)
+            if imagem is None:
+                return None, "Imagem incompleta retornada pelo leitor"
+
+            return imagem, None
+
+        except OSError as e:
+            # Erro de acesso ao dispositivo - tenta reconectar na proxima vez
+            print(f"[Futronic SDK] Erro de dispositivo: {e}")
+            self.fechar()
+            return None, f"Erro de dispositivo: {e}. Tente novamente."
+        except Exception as e:
+            print(f"[Futronic SDK] Erro na captura: {e}")
+            import traceback
+            traceback.print_exc()
+            return None, str(e)
+
+
+# ============================================
+# SIMULADO (imagens gravadas ou sinteticas)
+# ============================================
+
+EXTENSOES_GRAVADAS = (".png", ".raw", ".bin")
+
+
+def gerar_digital_sintetica(identidade: int, impressao: int = 0,
+                            largura: int = 320, altura: int = 480, semente: int = 0) -> np.ndarray:
+    """
+    Gera uma digital sintetica deterministica.
+
+    O padrao de cristas (campo de fase com singularidades, que viram terminacoes e
+    bifurcacoes) depende apenas de `identidade`; cada `impressao` aplica uma
+    rotacao, deslocamento e ruido diferentes, como um dedo recolocado no leitor.
+    """
+    dedo = np.random.default_rng([semente, identidade])
+    centro_x = largura / 2 + dedo.uniform(-30, 30)
+    centro_y = altura / 2 + dedo.uniform(-40, 40)
+    quantidade = int(dedo.integers(12, 20))
+    singularidades = np.stack([
+        dedo.uniform(40, largura - 40, quantidade),
+        dedo.uniform(60, altura - 60, quantidade)
+    ], axis=1)
+    sinais = dedo.choice([-1, 1], quantidade)
+    frequencia = 2 * np.pi / dedo.uniform(8.5, 10.5)
+
+    colocacao = np.random.default_rng([semente, identidade, impressao])
+    rotacao = colocacao.uniform(-0.15, 0.15)
+    desloc_x, desloc_y = colocacao.uniform(-12, 12, 2)
+    ruido = colocacao.uniform(6, 14)
+
+    # Coordenadas da imagem levadas ao referencial do dedo
+    yy, xx = np.mgrid[0:altura, 0:largura].astype(np.float32)
+    cos_r, sen_r = np.cos(-rotacao), np.sin(-rotacao)
+    px = xx - desloc_x - largura / 2
+    py = yy - desloc_y - altura / 2
+    x = cos_r * px - sen_r * py + largura / 2
+    y = sen_r * px + cos_r * py + altura / 2
+
+    fase = frequencia * np.sqrt((x - centro_x) ** 2 + ((y - centro_y) * 0.8) ** 2 + 400)
+    for (sx, sy), sinal in zip(singularidades, sinais):
+        fase += sinal * np.arctan2(y - sy, x - sx)
+
+    imagem = 128 + 90 * np.cos(fase)
+    contato = ((x - centro_x) / (largura * 0.45)) ** 2 + ((y - centro_y) / (altura * 0.45)) ** 2 < 1
+    imagem = np.where(contato, imagem, 235) + colocacao.normal(0, ruido, imagem.shape)
+    return np.clip(imagem, 0, 255).astype(np.uint8)
+
+
+def dispositivos_simulados(quantidade: int = 1) -> list:
+    """Entradas de inventario dos leitores simulados (SIM:0001, SIM:0002, ...)"""
+    return [
+        {
+            "device_id": f"SIM:{numero:04d}",
+            "description": "Leitor simulado (imagens gravadas/sinteticas)",
+            "manufacturer": "Simulado",
+            "model": "Software",
+            "vid": "0000",
+            "pid": "0000",
+            "method": "simulado",
+            "status": "OK"
+        }
+        for numero in range(1, quantidade + 1)
+    ]
+
+
+def carregar_imagem_gravada(caminho: Path) -> Optional[np.ndarray]:
+    """Le uma captura gravada (PNG ou buffer raw do sensor)"""
+    return fingerprint.decodificar_imagem(caminho.read_bytes())
+
+
+class ScannerSimulado(Scanner):
+    """
+    Leitor em software.
+
+    Ordem das capturas:
+    1. imagens/identidades enfileiradas com enfileirar() (testes deterministicos)
+    2. imagens gravadas de `diretorio`, em ordem alfabetica e em ciclo
+    3. digitais sinteticas: identidade = n % identidades, impressao = n // identidades
+    """
+
+    nome = "Scanner Simulado"
+    sdk = "simulado"
+    simulado = True
+
+    def __init__(self, device_id: str = "SIM:0001", diretorio: Optional[str] = None,
+                 identidades: int = 10, atraso: float = 0.0, semente: int = 0):
+        self.device_id = device_id
+        self.diretorio = Path(diretorio) if diretorio else None
+        self.identidades = max(1, identidades)
+        self.atraso = atraso  # Tempo simulado ate o dedo ser colocado (segundos)
+        self.semente = semente
+        self._lock = threading.Lock()
+        self._fila = deque()
+        self._gravadas = []
+        self._contador = 0
+        self._aberto = False
+
+    @property
+    def aberto(self) -> bool:
+        return self._aberto
+
+    def identificador(self) -> Optional[str]:
+        return self.device_id if self._aberto else None
+
+    @classmethod
+    def atende(cls, device_info: dict) -> bool:
+        return device_info.get('method') == 'simulado'
+
+    def abrir(self) -> bool:
+        with self._lock:
+            self._gravadas = []
+            if self.diretorio:
+                if not self.diretorio.is_dir():
+                    print(f"[Scanner Simulado] Diretorio nao encontrado: {self.diretorio}")
+                    return False
+                self._gravadas = sorted(
+                    p for p in self.diretorio.iterdir() if p.suffix.lower() in EXTENSOES_GRAVADAS
+                )
+                print(f"[Scanner Simulado] {len(self._gravadas)} captura(s) gravada(s) em {self.diretorio}")
+            else:
+                print(f"[Scanner Simulado] Gerando digitais sinteticas ({self.identidades} identidades)")
+            self._contador = 0
+            self._aberto = True
+            return True
+
+    def fechar(self):
+        with self._lock:
+            self._aberto = False
+
+    def enfileirar(self, item):
+        """Define a proxima captura: uma imagem (ndarray) ou o numero de uma identidade sintetica"""
+        with self._lock:
+            self._fila.append(item)
+
+    def capturar(self, timeout_seconds: int = 30):
+        self.espera_dedo = None
+        if not self._aberto:
+            return None, "Scanner simulado fechado"
+
+        if self.atraso:
+            if self.atraso > timeout_seconds:
+                time.sleep(timeout_seconds)
+                return None, "Timeout - nenhum dedo detectado"
+            time.sleep(self.atraso)
+        self.espera_dedo = self.atraso
+
+        with self._lock:
+            numero = self._contador
+            self._contador += 1
+            item = self._fila.popleft() if self._fila else None
+
+        if isinstance(item, np.ndarray):
+            return item, None
+        if item is not None:
+            return gerar_digital_sintetica(int(item), numero, semente=self.semente), None
+
+        if self._gravadas:
+            caminho = self._gravadas[numero % len(self._gravadas)]
+            imagem = carregar_imagem_gravada(caminho)
+            if imagem is None:
+                return None, f"Captura gravada ilegivel: {caminho.name}"
+            return imagem, None
+
+        identidade = numero % self.identidades
+        impressao = numero // self.identidades
+        return gerar_digital_sintetica(identidade, impressao, semente=self.semente), None
+
+
+DRIVERS = {
+    "futronic": FutronicScanner,
+    "simulado": ScannerSimulado,
+}
+
+
+def obter_driver(nome: str) -> type:
+    """Classe do driver pelo nome (FUTRONIC_SCANNER)"""
+    driver = DRIVERS.get(nome.lower())
+    if not driver:
+        raise ValueError(f"Driver de captura desconhecido: {nome} (opcoes: {', '.join(DRIVERS)})")
+    return driver
+
+
+def criar_scanner(nome: str, **opcoes) -> Scanner:
+    """Instancia o driver pelo nome para um leitor"""
+    return obter_driver(nome)(**opcoes)
@@ -0,0 +1,25 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+# Os modulos do servico sao importados a partir do diretorio dele (como no main.py)
+SERVICO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICO))
+sys.path.insert(1, str(SERVICO.parent))
+
+# main.py grava a galeria em ./templates: importado em um diretorio temporario,
+# com TEMPLATES_DIR absoluto para valer depois de voltar ao diretorio anterior
+TEMPORARIO = tempfile.mkdtemp(prefix="futronic-testes-")
+atexit.register(shutil.rmtree, TEMPORARIO, ignore_errors=True)
+
+anterior = os.getcwd()
+os.chdir(TEMPORARIO)
+try:
+    import main
+
+    main.TEMPLATES_DIR = main.TEMPLATES_DIR.resolve()
+finally:
+    os.chdir(anterior)
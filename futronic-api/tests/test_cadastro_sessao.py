@@ -0,0 +1,52 @@
+import base64
+
+import pytest
+from fastapi.testclient import TestClient
+
+import fingerprint
+import main
+import scanners
+
+
+@pytest.fixture(scope="module")
+def cliente():
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="module")
+def amostra():
+    minucias = fingerprint.extrair_minucias(scanners.gerar_digital_sintetica(3, 0))
+    return base64.b64encode(fingerprint.serializar_minucias(minucias, 320, 480)).decode()
+
+
+def iniciar(cliente, capturas):
+    resposta = cliente.post("/cadastro/sessao", json={"funcionario_id": 7, "nome": "Teste", "pis": "1", "capturas": capturas})
+    return resposta.json()["sessao_id"]
+
+
+def test_amostra_alem_das_capturas_e_recusada(cliente, amostra):
+    sessao_id = iniciar(cliente, 1)
+
+    assert cliente.post(f"/cadastro/sessao/{sessao_id}/amostra", json={"template_base64": amostra}).json()["completa"]
+    resposta = cliente.post(f"/cadastro/sessao/{sessao_id}/amostra", json={"template_base64": amostra}).json()
+
+    assert resposta["success"] is False
+    assert resposta["amostras"] == 1
+
+
+def test_amostra_concluida_durante_a_captura_e_recusada(cliente, amostra, monkeypatch):
+    """Outra requisicao completa a sessao enquanto esta espera o leitor"""
+    sessao_id = iniciar(cliente, 1)
+
+    async def captura_concorrente(leitor, timeout, formato):
+        cliente.post(f"/cadastro/sessao/{sessao_id}/amostra", json={"template_base64": amostra})
+        return {"template_base64": amostra}, None
+
+    monkeypatch.setattr(main, "DEVICE_CONNECTED", True)
+    monkeypatch.setattr(main, "reservar_leitor", lambda device: (object(), None))
+    monkeypatch.setattr(main, "executar_captura", captura_concorrente)
+
+    resposta = cliente.post(f"/cadastro/sessao/{sessao_id}/amostra", json={}).json()
+
+    assert resposta["success"] is False
+    assert main.sessoes_cadastro[sessao_id].estado()["amostras"] == 1
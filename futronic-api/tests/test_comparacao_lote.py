@@ -0,0 +1,83 @@
+import base64
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import fingerprint
+import main
+import scanners
+
+
+@pytest.fixture(scope="module")
+def digitais():
+    """4 dedos x 2 impressoes, com tamanhos diferentes (preenchimento do empacotamento)"""
+    minucias = [fingerprint.extrair_minucias(scanners.gerar_digital_sintetica(n % 4, n)) for n in range(8)]
+    minucias[5] = minucias[5][:12]
+    return minucias
+
+
+@pytest.mark.parametrize("ponderar", [False, True])
+def test_galeria_em_lote_igual_a_comparacao_escalar(digitais, ponderar):
+    empacotadas, quantidades = fingerprint.empacotar_minucias(digitais)
+
+    lote = fingerprint.comparar_com_galeria(
+        empacotadas, quantidades, empacotadas, quantidades, np.full(len(digitais), ponderar)
+    )
+    escalar = np.array([[fingerprint.comparar_minucias(a, b, ponderar) for b in digitais] for a in digitais])
+
+    np.testing.assert_allclose(lote, escalar, atol=1e-6)
+
+
+def test_pares_em_lote_igual_a_comparacao_escalar(digitais):
+    a, na = fingerprint.empacotar_minucias(digitais[:4])
+    b, nb = fingerprint.empacotar_minucias(digitais[4:])
+
+    lote = fingerprint.comparar_pares(a, na, b, nb)
+    escalar = [fingerprint.comparar_minucias(x, y) for x, y in zip(digitais[:4], digitais[4:])]
+
+    np.testing.assert_allclose(lote, escalar, atol=1e-6)
+
+
+def test_lote_em_varios_blocos_igual_a_um_bloco(digitais, monkeypatch):
+    empacotadas, quantidades = fingerprint.empacotar_minucias(digitais)
+    um_bloco = fingerprint.comparar_com_galeria(empacotadas, quantidades, empacotadas, quantidades)
+
+    # Um par por bloco
+    monkeypatch.setattr(fingerprint, "ELEMENTOS_POR_BLOCO", 1)
+    varios = fingerprint.comparar_com_galeria(empacotadas, quantidades, empacotadas, quantidades)
+
+    np.testing.assert_array_equal(varios, um_bloco)
+
+
+def test_poucas_minucias_nao_batem(digitais):
+    poucas = digitais[0][:fingerprint.MIN_MINUCIAS_COMPARACAO - 1]
+    a, na = fingerprint.empacotar_minucias([poucas])
+    b, nb = fingerprint.empacotar_minucias([digitais[0]])
+
+    assert fingerprint.comparar_minucias(poucas, digitais[0]) == 0.0
+    assert fingerprint.comparar_pares(a, na, b, nb)[0] == 0.0
+
+
+def test_identificar_lote_com_cadastros_opacos(digitais):
+    """Galeria mista: opacos pela comparacao legada, minucias pela vetorizada"""
+    cliente = TestClient(main.app)
+    cabecalho = {"X-Tenant": "teste-opacos"}
+    opaco = bytes(np.random.default_rng(0).integers(0, 256, 300, dtype=np.uint8))
+    ftm1 = fingerprint.serializar_minucias(digitais[0], 320, 480)
+    for func_id, template in ((21, opaco), (22, ftm1)):
+        resposta = cliente.post("/cadastrar", headers=cabecalho, json={
+            "funcionario_id": func_id, "nome": f"F{func_id}", "pis": "1",
+            "template_base64": base64.b64encode(template).decode(), "qualidade": 80,
+        })
+        assert resposta.json()["success"]
+
+    with main.GALERIAS.usar("teste-opacos") as galeria:
+        assert [func_id for func_id, _ in galeria.obter_empacotada()["opacos"]] == ["21"]
+
+    itens = [{"id": str(n), "template_base64": base64.b64encode(t).decode()} for n, t in enumerate((opaco, ftm1))]
+    resposta = cliente.post("/identificar/lote", headers=cabecalho, json={"itens": itens})
+    linhas = [json.loads(linha) for linha in resposta.text.splitlines()]
+
+    assert [linha["funcionario_id"] for linha in linhas] == [21, 22]
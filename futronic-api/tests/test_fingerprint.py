@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import fingerprint
+import main
+import scanners
+
+
+@pytest.fixture(scope="module")
+def minucias():
+    return fingerprint.extrair_minucias(scanners.gerar_digital_sintetica(1, 0))
+
+
+def test_ftm1_ida_e_volta_preserva_minucias(minucias):
+    dados = fingerprint.serializar_minucias(minucias, 320, 480)
+
+    assert fingerprint.identificar_formato(dados) == fingerprint.FORMATO_MINUCIAS
+    assert len(dados) == fingerprint._CABECALHO.size + 7 * len(minucias)
+
+    lidas, largura, altura = fingerprint.desserializar_minucias(dados)
+    assert (largura, altura) == (320, 480)
+    assert lidas.shape == minucias.shape
+    # Quantizacao do FTM1: posicao em pixels inteiros, angulo em 256 passos de pi, peso em 255 niveis
+    np.testing.assert_allclose(lidas[:, fingerprint.COL_X:fingerprint.COL_Y + 1],
+                               minucias[:, fingerprint.COL_X:fingerprint.COL_Y + 1], atol=0.5)
+    diferenca = np.abs(lidas[:, fingerprint.COL_ANGULO] - minucias[:, fingerprint.COL_ANGULO])
+    assert np.all(np.minimum(diferenca, np.pi - diferenca) <= np.pi / 512 + 1e-6)
+    np.testing.assert_array_equal(lidas[:, fingerprint.COL_TIPO], minucias[:, fingerprint.COL_TIPO])
+    np.testing.assert_allclose(lidas[:, fingerprint.COL_PESO], minucias[:, fingerprint.COL_PESO], atol=1 / 510 + 1e-6)
+
+    # Serializar de novo o que foi lido da os mesmos bytes
+    assert fingerprint.serializar_minucias(lidas, largura, altura) == dados
+
+
+def test_ftm1_sem_minucias():
+    dados = fingerprint.serializar_minucias(np.zeros((0, 5), dtype=np.float32), 320, 480)
+    lidas, _, _ = fingerprint.desserializar_minucias(dados)
+    assert lidas.shape == (0, 5)
+
+
+def test_ftm1_ida_e_volta_mantem_a_decisao(minucias):
+    """A quantizacao do FTM1 muda pouco o score e nao muda a decisao"""
+    relida = fingerprint.desserializar_minucias(fingerprint.serializar_minucias(minucias, 320, 480))[0]
+    mesmo_dedo = fingerprint.extrair_minucias(scanners.gerar_digital_sintetica(1, 1))
+    outro_dedo = fingerprint.extrair_minucias(scanners.gerar_digital_sintetica(2, 0))
+
+    for outra, genuino in ((mesmo_dedo, True), (outro_dedo, False)):
+        original = fingerprint.comparar_minucias(minucias, outra)
+        quantizado = fingerprint.comparar_minucias(relida, outra)
+        assert quantizado == pytest.approx(original, abs=0.05)
+        assert (quantizado >= main.LIMIAR_MATCH) == genuino
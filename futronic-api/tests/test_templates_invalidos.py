@@ -0,0 +1,31 @@
+import base64
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(scope="module")
+def cliente():
+    return TestClient(main.app)
+
+
+def iniciar(cliente, capturas):
+    resposta = cliente.post("/cadastro/sessao", json={"funcionario_id": 7, "nome": "Teste", "pis": "1", "capturas": capturas})
+    return resposta.json()["sessao_id"]
+
+
+@pytest.mark.parametrize("template", [
+    "abc",  # base64 com padding invalido
+    base64.b64encode(b"FTM1\x01").decode(),  # cabecalho FTM1 truncado
+    base64.b64encode(b"FTM1" + bytes([64, 1, 224, 1, 50, 0]) + b"\x00" * 7).decode(),  # 50 minucias declaradas, 1 enviada
+    base64.b64encode(b"\x89PNG\r\n\x1a\nlixo").decode(),  # PNG ilegivel
+])
+def test_template_corrompido_responde_400(cliente, template):
+    sessao_id = iniciar(cliente, 1)
+    resposta = cliente.post(f"/cadastro/sessao/{sessao_id}/amostra", json={"template_base64": template})
+
+    assert resposta.status_code == 400
+    assert resposta.json()["success"] is False
+    assert resposta.json()["error"].startswith("Template invalido")
@@ -53,6 +53,13 @@ export default await Env.create(new URL('../', import.meta.url), {
   */
   DEEPFACE_URL: Env.schema.string.optional(),
 
+  /*
+  |----------------------------------------------------------
+  | Timesheet calculation (threads; 0 = main process)
+  |----------------------------------------------------------
+  */
+  CALCULO_THREADS: Env.schema.number.optional(),
+
   /*
   |----------------------------------------------------------
   | Employer data (Portaria 671)
@@ -0,0 +1,138 @@
+import { test } from '@japa/runner'
+import {
+  bancoHorasSaldoService,
+  efeitoNoSaldo,
+  type MovimentoBancoHoras,
+} from '#services/banco_horas_saldo_service'
+
+/**
+ * Cliente de transação em memória: banco_horas_saldo por funcionário e mês
+ * e banco_horas_saldo_atual, só com as consultas que registrar() faz
+ */
+function clienteEmMemoria() {
+  const meses = new Map<string, Record<string, number>>()
+  const atual = new Map<number, number>()
+
+  return {
+    meses,
+    atual,
+    async query(sql: string, params: any[] = []) {
+      if (sql.includes('INSERT INTO banco_horas_saldo_atual')) {
+        for (const id of params[0]) if (!atual.has(id)) atual.set(id, 0)
+        return { rows: [] }
+      }
+      if (sql.includes('FOR UPDATE')) {
+        return { rows: params[0].map((id: number) => ({ funcionario_id: id, saldo: atual.get(id) ?? 0 })) }
+      }
+      if (sql.includes('INSERT INTO banco_horas_saldo')) {
+        const [ids, anos, mesesLinha, creditos, debitos, compensacoes, pagamentos, variacoes] = params
+        ids.forEach((id: number, i: number) => {
+          const chave = `${id}:${anos[i]}-${mesesLinha[i]}`
+          const linha = meses.get(chave) ?? { creditos: 0, debitos: 0, compensacoes: 0, pagamentos: 0, variacao: 0 }
+          linha.creditos += creditos[i]
+          linha.debitos += debitos[i]
+          linha.compensacoes += compensacoes[i]
+          linha.pagamentos += pagamentos[i]
+          linha.variacao += variacoes[i]
+          meses.set(chave, linha)
+        })
+        return { rows: [] }
+      }
+      if (sql.includes('UPDATE banco_horas_saldo_atual')) {
+        const rows = params[0].map((id: number) => {
+          let saldo = 0
+          for (const [chave, linha] of meses) {
+            if (chave.startsWith(`${id}:`)) saldo += linha.variacao
+          }
+          atual.set(id, saldo)
+          return { funcionario_id: id, saldo }
+        })
+        return { rows }
+      }
+      return { rows: [] }
+    },
+  }
+}
+
+test.group('efeitoNoSaldo', () => {
+  /**
+   * Teste: Crédito e ajuste positivo somam, débitos subtraem o valor absoluto
+   */
+  test('aplica a regra de cada tipo de operação', async ({ assert }) => {
+    assert.equal(efeitoNoSaldo('CREDITO', 60), 60)
+    assert.equal(efeitoNoSaldo('CREDITO', -60), 0)
+    assert.equal(efeitoNoSaldo('AJUSTE', 30), 30)
+    assert.equal(efeitoNoSaldo('AJUSTE', -30), -30)
+    assert.equal(efeitoNoSaldo('DEBITO', 45), -45)
+    assert.equal(efeitoNoSaldo('DEBITO', -45), -45)
+    assert.equal(efeitoNoSaldo('COMPENSACAO', 120), -120)
+    assert.equal(efeitoNoSaldo('PAGAMENTO', -90), -90)
+    assert.equal(efeitoNoSaldo('VENCIMENTO', 15), -15)
+    assert.equal(efeitoNoSaldo('OUTRO', 15), 0)
+    assert.equal(efeitoNoSaldo('CREDITO', '15' as any), 15)
+  })
+})
+
+test.group('BancoHorasSaldoService.registrar', () => {
+  const movimentos: MovimentoBancoHoras[] = [
+    { funcionario_id: 1, data: '2026-03-05', tipo_operacao: 'CREDITO', minutos: 90 },
+    { funcionario_id: 1, data: '2026-03-12', tipo_operacao: 'DEBITO', minutos: 30 },
+    { funcionario_id: 1, data: '2026-03-20', tipo_operacao: 'COMPENSACAO', minutos: 20 },
+    { funcionario_id: 1, data: '2026-04-02', tipo_operacao: 'PAGAMENTO', minutos: 15 },
+    { funcionario_id: 2, data: '2026-03-05', tipo_operacao: 'AJUSTE', minutos: -10 },
+  ]
+
+  /**
+   * Teste: Gravação (sinal 1) soma o efeito de cada movimentação
+   */
+  test('sinal 1 aplica os efeitos ao mês e ao saldo', async ({ assert }) => {
+    const client = clienteEmMemoria()
+    const saldos = await bancoHorasSaldoService.registrar(client, movimentos)
+
+    assert.equal(saldos.get(1), 90 - 30 - 20 - 15)
+    assert.equal(saldos.get(2), -10)
+    assert.deepEqual(client.meses.get('1:2026-3'), {
+      creditos: 90,
+      debitos: 30,
+      compensacoes: 20,
+      pagamentos: 0,
+      variacao: 40,
+    })
+    assert.deepEqual(client.meses.get('1:2026-4'), {
+      creditos: 0,
+      debitos: 0,
+      compensacoes: 0,
+      pagamentos: 15,
+      variacao: -15,
+    })
+    // Ajuste negativo entra como débito
+    assert.equal(client.meses.get('2:2026-3')!.debitos, 10)
+  })
+
+  /**
+   * Teste: Exclusão (sinal -1) desfaz exatamente a gravação
+   */
+  test('sinal -1 desfaz a gravação', async ({ assert }) => {
+    const client = clienteEmMemoria()
+    await bancoHorasSaldoService.registrar(client, movimentos, 1)
+    const saldos = await bancoHorasSaldoService.registrar(client, movimentos, -1)
+
+    assert.equal(saldos.get(1), 0)
+    assert.equal(saldos.get(2), 0)
+    for (const linha of client.meses.values()) {
+      assert.deepEqual(linha, { creditos: 0, debitos: 0, compensacoes: 0, pagamentos: 0, variacao: 0 })
+    }
+  })
+
+  /**
+   * Teste: Excluir só parte das movimentações deixa o saldo das restantes
+   */
+  test('sinal -1 em parte das movimentações', async ({ assert }) => {
+    const client = clienteEmMemoria()
+    await bancoHorasSaldoService.registrar(client, movimentos, 1)
+    const saldos = await bancoHorasSaldoService.registrar(client, [movimentos[1]], -1)
+
+    assert.equal(saldos.get(1), 90 - 20 - 15)
+    assert.equal(client.meses.get('1:2026-3')!.debitos, 0)
+  })
+})
@@ -0,0 +1,48 @@
+import { test } from '@japa/runner'
+import { calculoPontoPool } from '#services/calculo_ponto_pool'
+
+test.group('CalculoPontoPool', (group) => {
+  const pool = calculoPontoPool as any
+
+  group.each.setup(() => {
+    pool.indisponivel = false
+    pool.pausadoAte = 0
+    pool.falhasSeguidas = 0
+  })
+
+  group.each.teardown(() => {
+    pool.indisponivel = false
+    pool.pausadoAte = 0
+    pool.falhasSeguidas = 0
+  })
+
+  /**
+   * Teste: Uma falha ao iniciar as threads só pausa o pool
+   */
+  test('falha ao iniciar pausa com espera crescente', async ({ assert }) => {
+    pool.registrarFalhaInicio()
+    assert.isFalse(calculoPontoPool.disponivel)
+    const primeiraEspera = pool.pausadoAte - Date.now()
+    assert.isAtMost(primeiraEspera, 1000)
+
+    pool.pausadoAte = 0
+    assert.isTrue(calculoPontoPool.disponivel)
+
+    pool.registrarFalhaInicio()
+    assert.isAbove(pool.pausadoAte - Date.now(), primeiraEspera)
+    assert.isFalse(pool.indisponivel)
+  })
+
+  /**
+   * Teste: Falhas seguidas desativam o pool
+   */
+  test('desativa depois de falhas seguidas', async ({ assert }) => {
+    for (let i = 0; i < 4; i++) pool.registrarFalhaInicio()
+    assert.isFalse(pool.indisponivel)
+
+    pool.registrarFalhaInicio()
+    assert.isTrue(pool.indisponivel)
+    pool.pausadoAte = 0
+    assert.isFalse(calculoPontoPool.disponivel)
+  })
+})
@@ -1,5 +1,13 @@
 import { test } from '@japa/runner'
-import { CalculoPontoService } from '#services/calculo_ponto_service'
+import {
+  CalculoPontoService,
+  calculoPontoService,
+  type FolgaProgramada,
+  type RegistroPonto,
+} from '#services/calculo_ponto_service'
+import { dbManager } from '#services/database_manager_service'
+import { escalaPlantaoService } from '#services/escala_plantao_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
 import { DateTime } from 'luxon'
 
 test.group('CalculoPontoService', () => {
@@ -203,3 +211,209 @@ test.group('CalculoPontoService', () => {
     assert.isFalse(CalculoPontoService.isDiaUtil(feriado, true))
   })
 })
+
+test.group('CalculoPontoService.montarEspelho', (group) => {
+  const MUNICIPIO = 9004
+  const FUNCIONARIO = { id: 7, nome: 'Teste', jornada_id: 1, data_admissao: '2020-01-01', data_demissao: null }
+  const originais = {
+    queryMunicipio: dbManager.queryMunicipio,
+    queryMunicipioOne: dbManager.queryMunicipioOne,
+    obterConfiguracao: configuracaoMunicipioService.obter,
+    carregarEscalas: escalaPlantaoService.carregarEscalas,
+  }
+
+  /** Jornada de segunda a sexta 08-12 / 13-17, feriado em 19/03 */
+  function configuracao() {
+    const horarios = new Map()
+    for (let dia = 1; dia <= 5; dia++) {
+      horarios.set(dia, {
+        dia_semana: dia,
+        entrada_1: '08:00',
+        saida_1: '12:00',
+        entrada_2: '13:00',
+        saida_2: '17:00',
+        folga: false,
+      })
+    }
+    return {
+      diaFechamento: 0,
+      dataInicioSistema: null,
+      jornadas: new Map([
+        [
+          1,
+          {
+            id: 1,
+            carga_horaria_diaria: 480,
+            tolerancia_entrada: 10,
+            tolerancia_saida: 10,
+            tipo: 'NORMAL' as const,
+            horas_plantao: null,
+            horas_folga: null,
+            tem_intervalo: true,
+            duracao_intervalo: 60,
+            marcacoes_dia: 4,
+          },
+        ],
+      ]),
+      horarios: new Map([[1, horarios]]),
+      feriadosPorAno: new Map([[2026, new Set(['2026-03-19'])]]),
+      feriadosRecorrentes: new Set<string>(),
+    }
+  }
+
+  /** Marcações de março: um dia com atraso, um com hora extra, um sem marcação e trabalho no sábado */
+  function registrosMarco(): RegistroPonto[] {
+    const marcacoes: Record<string, string[]> = {
+      '2026-03-02': ['08:00', '12:00', '13:00', '17:05'],
+      '2026-03-03': ['08:25', '12:00', '13:00', '17:00'],
+      '2026-03-04': ['08:00', '12:00', '13:00', '18:00'],
+      // 05/03 sem marcação: falta
+      '2026-03-06': ['08:00', '12:00', '13:00'],
+      '2026-03-07': ['08:00', '10:00'],
+      '2026-03-09': ['08:00', '12:00', '13:00', '17:00'],
+      '2026-03-19': ['08:00', '12:00'],
+    }
+    const registros: RegistroPonto[] = []
+    for (const [data, horas] of Object.entries(marcacoes)) {
+      for (const hora of horas) {
+        registros.push({
+          id: registros.length + 1,
+          funcionario_id: FUNCIONARIO.id,
+          data_hora: DateTime.fromISO(`${data}T${hora}`).toISO()!,
+          tipo: 'ORIGINAL',
+          sentido: null,
+          origem: 'EQUIPAMENTO',
+        })
+      }
+    }
+    return registros
+  }
+
+  const folgas: (FolgaProgramada & { funcionario_id: number })[] = [
+    { funcionario_id: FUNCIONARIO.id, data: '2026-03-10', tipo: 'FOLGA', motivo: 'Compensação' },
+  ]
+
+  group.each.setup(() => {
+    ;(configuracaoMunicipioService as any).obter = async () => configuracao()
+    ;(escalaPlantaoService as any).carregarEscalas = async () => new Map()
+    ;(dbManager as any).queryMunicipioOne = async (_municipioId: number, sql: string) =>
+      sql.includes('FROM funcionarios') ? FUNCIONARIO : null
+    ;(dbManager as any).queryMunicipio = async (_municipioId: number, sql: string) => {
+      if (sql.includes('FROM folgas_programadas')) return folgas
+      if (sql.includes('FROM registros_ponto')) return registrosMarco()
+      return []
+    }
+  })
+
+  group.each.teardown(() => {
+    ;(dbManager as any).queryMunicipio = originais.queryMunicipio
+    ;(dbManager as any).queryMunicipioOne = originais.queryMunicipioOne
+    ;(configuracaoMunicipioService as any).obter = originais.obterConfiguracao
+    ;(escalaPlantaoService as any).carregarEscalas = originais.carregarEscalas
+  })
+
+  /**
+   * Teste: calcularEspelho (consultas do banco) e montarEspelho (dados em memória) dão o mesmo espelho
+   */
+  test('montarEspelho igual ao calcularEspelho', async ({ assert }) => {
+    const espelho = await calculoPontoService.calcularEspelho(MUNICIPIO, FUNCIONARIO.id, 3, 2026)
+
+    const contexto = await calculoPontoService.carregarContextoPeriodo(MUNICIPIO, 3, 2026)
+    const montado = CalculoPontoService.montarEspelho(contexto, {
+      funcionario: FUNCIONARIO,
+      registros: registrosMarco(),
+      folgas: new Map(folgas.map((f) => [f.data, f])),
+      ultimoRegistroAnterior: null,
+    })
+
+    assert.deepEqual(JSON.parse(JSON.stringify(montado)), JSON.parse(JSON.stringify(espelho)))
+  })
+
+  /**
+   * Teste: Dias de março seguem as regras do cálculo por funcionário
+   */
+  test('regras de atraso, hora extra, falta, folga e feriado', async ({ assert }) => {
+    const espelho = await calculoPontoService.calcularEspelho(MUNICIPIO, FUNCIONARIO.id, 3, 2026)
+    const dia = (data: string) => espelho.dias.find((d) => d.data === data)!
+
+    assert.lengthOf(espelho.dias, 31)
+
+    // Saída 5 minutos depois: dentro da tolerância
+    assert.include(dia('2026-03-02'), { horasPrevistas: 480, horasTrabalhadas: 485, atraso: 0, horaExtra: 0 })
+    // Entrada 08:25 com 10 minutos de tolerância
+    assert.include(dia('2026-03-03'), { atraso: 15, horaFaltante: 15 })
+    assert.include(dia('2026-03-03').ocorrencias, 'ATRASO 15min')
+    // Saída 18:00: 60 minutos a mais, menos a tolerância
+    assert.include(dia('2026-03-04'), { horaExtra: 50, horaFaltante: 0 })
+    assert.include(dia('2026-03-05'), { falta: true, horasTrabalhadas: 0 })
+    assert.include(dia('2026-03-06').ocorrencias, 'REGISTRO IMPAR')
+    // Sábado trabalhado: tudo hora extra
+    assert.include(dia('2026-03-07'), { folga: true, horasPrevistas: 0, horaExtra: 120 })
+    assert.include(dia('2026-03-10'), { folga: true, falta: false })
+    assert.include(dia('2026-03-10').ocorrencias, 'FOLGA PROGRAMADA - Compensação')
+    assert.include(dia('2026-03-19'), { feriado: true, folga: false, horaExtra: 240 })
+    assert.include(dia('2026-03-19').ocorrencias, 'FERIADO')
+
+    assert.equal(espelho.totais.horasExtras, 50 + 120 + 240)
+    assert.equal(espelho.totais.atrasos, 15)
+  })
+})
+
+test.group('CalculoPontoService.salvarEspelhos', (group) => {
+  const originais = {
+    transactionMunicipio: dbManager.transactionMunicipio,
+    prepararGravacao: calculoPontoService.prepararGravacao,
+  }
+
+  group.each.teardown(() => {
+    ;(dbManager as any).transactionMunicipio = originais.transactionMunicipio
+    ;(calculoPontoService as any).prepararGravacao = originais.prepararGravacao
+  })
+
+  function espelho(funcionarioId: number) {
+    return {
+      funcionario_id: funcionarioId,
+      mes: 3,
+      ano: 2026,
+      dias: [],
+      totais: { diasTrabalhados: 0, horasTrabalhadas: 0, horasExtras: 0, horasFaltantes: 0, atrasos: 0, faltas: 0 },
+    } as any
+  }
+
+  /**
+   * Teste: Espelho regravado ou marcações alteradas depois da carga não são gravados por cima
+   */
+  test('não grava por cima de quem mudou depois da carga', async ({ assert }) => {
+    const carga = { em: new Date('2026-03-20T12:00:00Z'), versoes: new Map([[1, 5], [2, 3]]) }
+    const inseridos: number[] = []
+    const client = {
+      async query(sql: string, params: any[] = []) {
+        if (sql.includes('FROM espelhos_ponto')) {
+          return {
+            rows: [
+              { funcionario_id: 1, updated_at: new Date('2026-03-20T11:00:00Z') },
+              // Atualização incremental gravada depois da carga
+              { funcionario_id: 2, updated_at: new Date('2026-03-20T12:00:05Z') },
+            ],
+          }
+        }
+        if (sql.includes('FROM espelhos_versoes')) {
+          // Funcionário 3 ganhou a primeira marcação do período depois da carga
+          return { rows: [{ funcionario_id: 1, versao: '5' }, { funcionario_id: 2, versao: '3' }, { funcionario_id: 3, versao: '1' }] }
+        }
+        if (sql.includes('INSERT INTO espelhos_ponto')) {
+          for (let i = 2; i < params.length; i += 10) inseridos.push(params[i])
+        }
+        return { rows: [] }
+      },
+    }
+    ;(calculoPontoService as any).prepararGravacao = async () => false
+    ;(dbManager as any).transactionMunicipio = async (_municipioId: number, callback: (c: any) => Promise<any>) =>
+      callback(client)
+
+    const alterados = await calculoPontoService.salvarEspelhos(1, 3, 2026, [espelho(1), espelho(2), espelho(3)], carga)
+
+    assert.sameMembers(alterados, [2, 3])
+    assert.deepEqual(inseridos, [1])
+  })
+})
@@ -0,0 +1,148 @@
+import { test } from '@japa/runner'
+import { DateTime } from 'luxon'
+import { dbManager } from '#services/database_manager_service'
+import { escalaPlantaoService } from '#services/escala_plantao_service'
+import { CalculoPontoNucleo, type ContextoPeriodo } from '#services/calculo_ponto_nucleo'
+
+const ZONA = 'America/Sao_Paulo'
+const MUNICIPIO = 9003
+const INICIO_MARCO = DateTime.fromObject({ year: 2026, month: 3, day: 1 }, { zone: ZONA })
+const FIM_MARCO = INICIO_MARCO.endOf('month')
+
+/** Dias de plantão dentro de março */
+function diasNoMes(escala: Map<string, boolean>): number[] {
+  return [...escala.keys()]
+    .filter((data) => data.startsWith('2026-03-'))
+    .map((data) => Number(data.slice(8)))
+}
+
+test.group('CalculoPontoNucleo.calendarioPlantao', () => {
+  /**
+   * Teste: 12x36 a partir do último plantão do mês anterior
+   */
+  test('12x36 alterna dias a partir da referência', async ({ assert }) => {
+    const referencia = DateTime.fromISO('2026-02-27', { zone: ZONA })
+    const escala = CalculoPontoNucleo.calendarioPlantao(referencia, 12, 36, INICIO_MARCO, FIM_MARCO)
+
+    assert.deepEqual(diasNoMes(escala), Array.from({ length: 16 }, (_, i) => 1 + i * 2))
+    assert.isTrue(escala.get('2026-02-27'))
+  })
+
+  /**
+   * Teste: 24x72 trabalha um dia a cada quatro
+   */
+  test('24x72 trabalha a cada quatro dias', async ({ assert }) => {
+    const referencia = DateTime.fromISO('2026-02-28', { zone: ZONA })
+    const escala = CalculoPontoNucleo.calendarioPlantao(referencia, 24, 72, INICIO_MARCO, FIM_MARCO)
+
+    assert.deepEqual(diasNoMes(escala), [4, 8, 12, 16, 20, 24, 28])
+  })
+
+  /**
+   * Teste: Sem registro anterior a escala começa no primeiro dia do mês
+   */
+  test('sem referência começa no dia 1', async ({ assert }) => {
+    const escala = CalculoPontoNucleo.calendarioPlantao(null, 12, 36, INICIO_MARCO, FIM_MARCO)
+
+    assert.equal(diasNoMes(escala)[0], 1)
+    assert.equal(diasNoMes(escala)[1], 3)
+  })
+})
+
+test.group('EscalaPlantaoService.carregarEscalas', (group) => {
+  const originais = { queryMunicipio: dbManager.queryMunicipio }
+  const referencias: Record<number, string> = { 1: '2026-02-27', 2: '2026-02-27', 3: '2026-02-28' }
+
+  function contexto(): ContextoPeriodo {
+    return {
+      mes: 3,
+      ano: 2026,
+      inicioMes: INICIO_MARCO,
+      fimMes: FIM_MARCO,
+      dataFechamento: FIM_MARCO,
+      dataInicioSistema: null,
+      feriados: new Set(),
+      jornadas: new Map([
+        [
+          10,
+          {
+            id: 10,
+            carga_horaria_diaria: 720,
+            tolerancia_entrada: 10,
+            tolerancia_saida: 10,
+            tipo: 'PLANTAO' as const,
+            horas_plantao: 12,
+            horas_folga: 36,
+            tem_intervalo: false,
+            duracao_intervalo: 0,
+            marcacoes_dia: 2,
+          },
+        ],
+        [
+          20,
+          {
+            id: 20,
+            carga_horaria_diaria: 480,
+            tolerancia_entrada: 10,
+            tolerancia_saida: 10,
+            tipo: 'NORMAL' as const,
+            horas_plantao: null,
+            horas_folga: null,
+            tem_intervalo: true,
+            duracao_intervalo: 60,
+            marcacoes_dia: 4,
+          },
+        ],
+      ]),
+      horarios: new Map(),
+    }
+  }
+
+  function funcionario(id: number, jornadaId: number) {
+    return { id, nome: `F${id}`, jornada_id: jornadaId, data_admissao: '2020-01-01', data_demissao: null }
+  }
+
+  group.each.setup(() => {
+    ;(escalaPlantaoService as any).tabelasVerificadas.add(MUNICIPIO)
+    ;(escalaPlantaoService as any).calendarios.delete(MUNICIPIO)
+    // Referências gravadas em ciclos_plantao com a jornada atual
+    ;(dbManager as any).queryMunicipio = async (_municipioId: number, sql: string, params: any[] = []) => {
+      if (!sql.includes('FROM ciclos_plantao')) return []
+      return (params[0] as number[]).map((id) => ({
+        funcionario_id: id,
+        jornada_id: 10,
+        data_referencia: referencias[id],
+      }))
+    }
+  })
+
+  group.each.teardown(() => {
+    ;(dbManager as any).queryMunicipio = originais.queryMunicipio
+    ;(escalaPlantaoService as any).tabelasVerificadas.delete(MUNICIPIO)
+    ;(escalaPlantaoService as any).calendarios.delete(MUNICIPIO)
+  })
+
+  /**
+   * Teste: Funcionários do mesmo ciclo e referência compartilham o calendário
+   */
+  test('mesmo ciclo e referência compartilham o calendário', async ({ assert }) => {
+    const escalas = await escalaPlantaoService.carregarEscalas(MUNICIPIO, contexto(), [
+      funcionario(1, 10),
+      funcionario(2, 10),
+      funcionario(3, 10),
+      funcionario(4, 20),
+    ])
+
+    assert.strictEqual(escalas.get(1), escalas.get(2))
+    assert.notStrictEqual(escalas.get(1), escalas.get(3))
+    assert.isFalse(escalas.has(4))
+    const esperado = CalculoPontoNucleo.calendarioPlantao(
+      DateTime.fromISO('2026-02-27', { zone: ZONA }),
+      12,
+      36,
+      INICIO_MARCO,
+      FIM_MARCO
+    )
+    assert.deepEqual([...escalas.get(1)!.keys()], [...esperado.keys()])
+  })
+})
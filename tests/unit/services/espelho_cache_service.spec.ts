@@ -0,0 +1,97 @@
+import { test } from '@japa/runner'
+import { dbManager } from '#services/database_manager_service'
+import { calculoPontoService } from '#services/calculo_ponto_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
+import { espelhoCacheService } from '#services/espelho_cache_service'
+
+const MUNICIPIO = 9001
+const FUNCIONARIO = 7
+
+test.group('EspelhoCacheService', (group) => {
+  const originais = {
+    queryMunicipioOne: dbManager.queryMunicipioOne,
+    calcularEspelho: calculoPontoService.calcularEspelho,
+    obterConfiguracao: configuracaoMunicipioService.obter,
+  }
+  let marcacoes: string[] = []
+  let versao = 0
+  let calculos = 0
+
+  /**
+   * Marcação gravada direto em registros_ponto (sem marcarDias): a versão
+   * sobe como no gatilho da migração 019
+   */
+  function inserirMarcacao(dataHora: string) {
+    marcacoes.push(dataHora)
+    versao++
+  }
+
+  group.each.setup(() => {
+    marcacoes = []
+    versao = 0
+    calculos = 0
+    ;(espelhoCacheService as any).entradas.clear()
+    ;(espelhoCacheService as any).tabelasVerificadas.add(MUNICIPIO)
+    ;(dbManager as any).queryMunicipioOne = async (_municipioId: number, sql: string) => {
+      if (sql.includes('espelhos_versoes')) {
+        return {
+          versao: versao > 0 ? String(versao) : null,
+          marcacoes_posteriores: null,
+          espelho_id: null,
+          status: null,
+          espelho_em: null,
+          funcionario_em: null,
+          pendente: false,
+        }
+      }
+      if (sql.includes('FROM espelhos_ponto')) return null
+      return { id: FUNCIONARIO, nome: 'Teste' }
+    }
+    ;(calculoPontoService as any).calcularEspelho = async () => {
+      calculos++
+      return {
+        funcionario_id: FUNCIONARIO,
+        mes: 3,
+        ano: 2026,
+        dias: [{ data: '2026-03-10', registros: [...marcacoes] }],
+        totais: { diasTrabalhados: 1, horasTrabalhadas: 0, horasExtras: 0, horasFaltantes: 0, atrasos: 0, faltas: 0 },
+      }
+    }
+    ;(configuracaoMunicipioService as any).obter = async () => ({ versao: 1 })
+  })
+
+  group.each.teardown(() => {
+    ;(dbManager as any).queryMunicipioOne = originais.queryMunicipioOne
+    ;(calculoPontoService as any).calcularEspelho = originais.calcularEspelho
+    ;(configuracaoMunicipioService as any).obter = originais.obterConfiguracao
+    ;(espelhoCacheService as any).entradas.clear()
+    ;(espelhoCacheService as any).tabelasVerificadas.delete(MUNICIPIO)
+  })
+
+  /**
+   * Teste: A leitura seguinte a uma marcação nova devolve o espelho com ela
+   */
+  test('marcação gravada aparece na leitura seguinte', async ({ assert }) => {
+    inserirMarcacao('2026-03-10T08:00:00-03:00')
+    const antes = await espelhoCacheService.obter(MUNICIPIO, FUNCIONARIO, 3, 2026)
+    assert.deepEqual(antes.dados.dias[0].registros, ['2026-03-10T08:00:00-03:00'])
+
+    inserirMarcacao('2026-03-10T12:00:00-03:00')
+    const depois = await espelhoCacheService.obter(MUNICIPIO, FUNCIONARIO, 3, 2026)
+
+    assert.deepEqual(depois.dados.dias[0].registros, ['2026-03-10T08:00:00-03:00', '2026-03-10T12:00:00-03:00'])
+    assert.equal(calculos, 2)
+  })
+
+  /**
+   * Teste: Sem marcação nova a leitura vem da memória
+   */
+  test('mesma versão é servida da memória', async ({ assert }) => {
+    inserirMarcacao('2026-03-10T08:00:00-03:00')
+    const primeira = await espelhoCacheService.obter(MUNICIPIO, FUNCIONARIO, 3, 2026)
+    const segunda = await espelhoCacheService.obter(MUNICIPIO, FUNCIONARIO, 3, 2026)
+
+    assert.strictEqual(segunda, primeira)
+    assert.equal(calculos, 1)
+  })
+})
@@ -0,0 +1,262 @@
+import { test } from '@japa/runner'
+import { DateTime } from 'luxon'
+import { dbManager } from '#services/database_manager_service'
+import { escalaPlantaoService } from '#services/escala_plantao_service'
+import { espelhoIncrementalService } from '#services/espelho_incremental_service'
+import {
+  CalculoPontoService,
+  calculoPontoService,
+  type ContextoPeriodo,
+  type EspelhoCalculado,
+  type RegistroPonto,
+} from '#services/calculo_ponto_service'
+
+const ZONA = 'America/Sao_Paulo'
+const FUNCIONARIO = { id: 7, nome: 'Teste', jornada_id: 1, data_admissao: '2020-01-01', data_demissao: null }
+
+/**
+ * Março de 2026, jornada de segunda a sexta 08-12 / 13-17
+ */
+function contextoMarco(): ContextoPeriodo {
+  const inicioMes = DateTime.fromObject({ year: 2026, month: 3, day: 1 }, { zone: ZONA }).startOf('day')
+  const fimMes = inicioMes.endOf('month')
+  const horarios = new Map()
+  for (let dia = 1; dia <= 5; dia++) {
+    horarios.set(dia, {
+      dia_semana: dia,
+      entrada_1: '08:00',
+      saida_1: '12:00',
+      entrada_2: '13:00',
+      saida_2: '17:00',
+      folga: false,
+    })
+  }
+  return {
+    mes: 3,
+    ano: 2026,
+    inicioMes,
+    fimMes,
+    dataFechamento: fimMes,
+    dataInicioSistema: null,
+    feriados: new Set(),
+    jornadas: new Map([
+      [
+        1,
+        {
+          id: 1,
+          carga_horaria_diaria: 480,
+          tolerancia_entrada: 10,
+          tolerancia_saida: 10,
+          tipo: 'NORMAL' as const,
+          horas_plantao: null,
+          horas_folga: null,
+          tem_intervalo: true,
+          duracao_intervalo: 60,
+          marcacoes_dia: 4,
+        },
+      ],
+    ]),
+    horarios: new Map([[1, horarios]]),
+  }
+}
+
+/** Quatro marcações em cada dia útil até o dia 20 */
+function registrosMarco(): RegistroPonto[] {
+  const registros: RegistroPonto[] = []
+  for (let dia = 2; dia <= 20; dia++) {
+    const data = DateTime.fromObject({ year: 2026, month: 3, day: dia }, { zone: ZONA })
+    if (data.weekday > 5) continue
+    for (const hora of ['08:00', '12:00', '13:00', '17:05']) {
+      const [h, m] = hora.split(':').map(Number)
+      registros.push({
+        id: registros.length + 1,
+        funcionario_id: FUNCIONARIO.id,
+        data_hora: data.set({ hour: h, minute: m }).toISO()!,
+        tipo: 'ORIGINAL',
+        sentido: null,
+        origem: 'EQUIPAMENTO',
+      })
+    }
+  }
+  return registros
+}
+
+function montar(contexto: ContextoPeriodo, registros: RegistroPonto[]): EspelhoCalculado {
+  return CalculoPontoService.montarEspelho(contexto, {
+    funcionario: FUNCIONARIO,
+    registros,
+    folgas: new Map(),
+    ultimoRegistroAnterior: null,
+  })
+}
+
+/** Como o espelho volta do banco (dados em JSON) */
+function json(valor: any) {
+  return JSON.parse(JSON.stringify(valor))
+}
+
+test.group('EspelhoIncrementalService', (group) => {
+  const originais = {
+    queryMunicipio: dbManager.queryMunicipio,
+    transactionMunicipio: dbManager.transactionMunicipio,
+    carregarEscalas: escalaPlantaoService.carregarEscalas,
+    carregarContextoPeriodo: calculoPontoService.carregarContextoPeriodo,
+    prepararGravacao: calculoPontoService.prepararGravacao,
+    gravarEspelhos: calculoPontoService.gravarEspelhos,
+    calcularDia: CalculoPontoService.calcularDia,
+  }
+  let registrosBanco: RegistroPonto[] = []
+  let gravados: EspelhoCalculado[] = []
+
+  group.each.setup(() => {
+    gravados = []
+    // Banco em memória: registros dos intervalos pedidos, sem folgas
+    ;(dbManager as any).queryMunicipio = async (_municipioId: number, sql: string, params: any[] = []) => {
+      if (!sql.includes('registros_ponto')) return []
+      const [ids, inicios, fins] = params as [number[], string[], string[]]
+      return registrosBanco.filter((r) =>
+        ids.some((id, i) => {
+          const instante = new Date(r.data_hora).getTime()
+          return (
+            r.funcionario_id === id &&
+            instante >= new Date(inicios[i]).getTime() &&
+            instante < new Date(fins[i]).getTime()
+          )
+        })
+      )
+    }
+    ;(escalaPlantaoService as any).carregarEscalas = async () => new Map()
+  })
+
+  group.each.teardown(() => {
+    ;(dbManager as any).queryMunicipio = originais.queryMunicipio
+    ;(dbManager as any).transactionMunicipio = originais.transactionMunicipio
+    ;(escalaPlantaoService as any).carregarEscalas = originais.carregarEscalas
+    ;(calculoPontoService as any).carregarContextoPeriodo = originais.carregarContextoPeriodo
+    ;(calculoPontoService as any).prepararGravacao = originais.prepararGravacao
+    ;(calculoPontoService as any).gravarEspelhos = originais.gravarEspelhos
+    CalculoPontoService.calcularDia = originais.calcularDia
+  })
+
+  async function atualizar(contexto: ContextoPeriodo, salvo: EspelhoCalculado, dias: string[], falhas: any[] = []) {
+    const calculados: EspelhoCalculado[] = await (espelhoIncrementalService as any).atualizarPeriodo(
+      1,
+      contexto,
+      [{ id: 1, funcionario_id: FUNCIONARIO.id, mes: 3, ano: 2026, dados: json(salvo), funcionario: FUNCIONARIO }],
+      new Map([[FUNCIONARIO.id, new Set(dias)]]),
+      falhas
+    )
+    gravados.push(...calculados)
+    return calculados.length
+  }
+
+  /**
+   * Teste: Atualização incremental chega ao mesmo espelho do recálculo completo
+   */
+  test('recalcular só o dia alterado dá o mesmo espelho do recálculo completo', async ({ assert }) => {
+    const contexto = contextoMarco()
+    const antes = registrosMarco()
+    const salvo = montar(contexto, antes)
+
+    // Saída da tarde do dia 10 corrigida e marcações novas no sábado, dia 14
+    registrosBanco = antes.map((r) =>
+      r.data_hora === '2026-03-10T17:05:00.000-03:00' ? { ...r, data_hora: '2026-03-10T19:00:00.000-03:00' } : r
+    )
+    for (const hora of ['2026-03-14T08:00:00.000-03:00', '2026-03-14T12:00:00.000-03:00']) {
+      registrosBanco.push({ ...registrosBanco[0], id: registrosBanco.length + 1, data_hora: hora })
+    }
+
+    const atualizados = await atualizar(contexto, salvo, ['2026-03-10', '2026-03-14'])
+
+    assert.equal(atualizados, 1)
+    assert.lengthOf(gravados, 1)
+    assert.deepEqual(json(gravados[0]), json(montar(contexto, registrosBanco)))
+  })
+
+  /**
+   * Teste: Dias que o espelho salvo ainda não tinha entram no recálculo
+   */
+  test('completa os dias que faltavam no espelho salvo', async ({ assert }) => {
+    const contexto = contextoMarco()
+    registrosBanco = registrosMarco()
+    // Espelho salvo no dia 15: só tem os dias até lá
+    const salvo = montar({ ...contexto, fimMes: contexto.inicioMes.set({ day: 15 }).endOf('day') }, registrosBanco)
+
+    await atualizar(contexto, salvo, ['2026-03-03'])
+
+    assert.deepEqual(json(gravados[0]), json(montar(contexto, registrosBanco)))
+  })
+
+  /**
+   * Teste: Erro em um espelho devolve os dias dele para a fila
+   */
+  test('erro no espelho devolve os dias pendentes', async ({ assert }) => {
+    const contexto = contextoMarco()
+    registrosBanco = registrosMarco()
+    const salvo = montar(contexto, registrosBanco)
+    CalculoPontoService.calcularDia = () => {
+      throw new Error('falha simulada')
+    }
+
+    const falhas: any[] = []
+    const atualizados = await atualizar(contexto, salvo, ['2026-03-10', '2026-03-11'], falhas)
+
+    assert.equal(atualizados, 0)
+    assert.lengthOf(gravados, 0)
+    assert.sameDeepMembers(falhas, [
+      { funcionario_id: FUNCIONARIO.id, data: '2026-03-10' },
+      { funcionario_id: FUNCIONARIO.id, data: '2026-03-11' },
+    ])
+  })
+
+  /**
+   * Teste: O espelho é lido travado e gravado na mesma transação
+   */
+  test('lê e grava o espelho na mesma transação, com a linha travada', async ({ assert }) => {
+    const contexto = contextoMarco()
+    registrosBanco = registrosMarco()
+    const salvo = montar(contexto, registrosBanco)
+    const consultaAnterior = (dbManager as any).queryMunicipio
+    ;(dbManager as any).queryMunicipio = async (municipioId: number, sql: string, params: any[] = []) =>
+      sql.includes('SELECT DISTINCT mes, ano') ? [{ mes: 3, ano: 2026 }] : consultaAnterior(municipioId, sql, params)
+    ;(calculoPontoService as any).carregarContextoPeriodo = async () => contexto
+    ;(calculoPontoService as any).prepararGravacao = async () => false
+
+    const transacao: string[] = []
+    const client = {
+      async query(sql: string) {
+        transacao.push(sql)
+        return { rows: [{ id: 1, funcionario_id: FUNCIONARIO.id, mes: 3, ano: 2026, dados: json(salvo), ...FUNCIONARIO }] }
+      },
+    }
+    ;(dbManager as any).transactionMunicipio = async (_municipioId: number, callback: (c: any) => Promise<any>) => {
+      transacao.push('BEGIN')
+      const resultado = await callback(client)
+      transacao.push('COMMIT')
+      return resultado
+    }
+    ;(calculoPontoService as any).gravarEspelhos = async (
+      clienteGravacao: any,
+      _mes: number,
+      _ano: number,
+      espelhos: EspelhoCalculado[]
+    ) => {
+      assert.strictEqual(clienteGravacao, client)
+      transacao.push('GRAVAR')
+      gravados.push(...espelhos)
+      return []
+    }
+
+    const atualizados = await (espelhoIncrementalService as any).atualizarEspelhos(
+      1,
+      [{ funcionario_id: FUNCIONARIO.id, data: '2026-03-10' }],
+      []
+    )
+
+    assert.equal(atualizados, 1)
+    assert.equal(transacao[0], 'BEGIN')
+    assert.include(transacao[1], 'FOR UPDATE OF e')
+    assert.deepEqual(transacao.slice(2), ['GRAVAR', 'COMMIT'])
+    assert.deepEqual(json(gravados[0]), json(montar(contexto, registrosBanco)))
+  })
+})
@@ -0,0 +1,76 @@
+import { test } from '@japa/runner'
+import { dbManager } from '#services/database_manager_service'
+import { configuracaoMunicipioService } from '#services/configuracao_municipio_service'
+import { fechamentoPeriodoService } from '#services/fechamento_periodo_service'
+
+const MUNICIPIO = 9002
+
+test.group('FechamentoPeriodoService.iniciar', (group) => {
+  const servico = fechamentoPeriodoService as any
+  const originais = {
+    queryMunicipio: dbManager.queryMunicipio,
+    queryMunicipioOne: dbManager.queryMunicipioOne,
+    obterConfiguracao: configuracaoMunicipioService.obter,
+    executar: servico.executar,
+  }
+  let insercoes = 0
+  /** Linha PROCESSANDO criada por outro servidor (o INSERT viola o índice único) */
+  let outroServidor: Record<string, any> | null = null
+
+  group.each.setup(() => {
+    insercoes = 0
+    outroServidor = null
+    servico.tabelasVerificadas.add(MUNICIPIO)
+    servico.executar = async () => {}
+    ;(configuracaoMunicipioService as any).obter = async () => ({ fechamentoConcorrencia: 2 })
+    ;(dbManager as any).queryMunicipio = async () => []
+    ;(dbManager as any).queryMunicipioOne = async (_municipioId: number, sql: string, params: any[] = []) => {
+      if (sql.includes('INSERT INTO processamentos_periodo')) {
+        // Um tick de I/O: os dois pedidos ficariam no meio do início ao mesmo tempo
+        await new Promise((resolve) => setImmediate(resolve))
+        if (outroServidor) throw Object.assign(new Error('duplicate key'), { code: '23505' })
+        insercoes++
+        return { id: insercoes, mes: params[0], ano: params[1], status: 'PROCESSANDO' }
+      }
+      if (sql.includes("WHERE status = 'PROCESSANDO'")) return outroServidor
+      return null
+    }
+  })
+
+  group.each.teardown(() => {
+    ;(dbManager as any).queryMunicipio = originais.queryMunicipio
+    ;(dbManager as any).queryMunicipioOne = originais.queryMunicipioOne
+    ;(configuracaoMunicipioService as any).obter = originais.obterConfiguracao
+    servico.executar = originais.executar
+    servico.execucoes.delete(MUNICIPIO)
+    servico.tabelasVerificadas.delete(MUNICIPIO)
+  })
+
+  /**
+   * Teste: Pedidos simultâneos no mesmo processo iniciam um processamento só
+   */
+  test('pedidos simultâneos criam um processamento só', async ({ assert }) => {
+    const [primeiro, segundo] = await Promise.all([
+      fechamentoPeriodoService.iniciar(MUNICIPIO, 3, 2026),
+      fechamentoPeriodoService.iniciar(MUNICIPIO, 3, 2026),
+    ])
+
+    assert.equal(insercoes, 1)
+    assert.equal(primeiro.situacao, 'NOVO')
+    assert.equal(segundo.situacao, 'EM_ANDAMENTO')
+    assert.equal(segundo.processamento.id, primeiro.processamento.id)
+  })
+
+  /**
+   * Teste: Processamento de outro servidor devolve EM_ANDAMENTO
+   */
+  test('processamento em outro servidor não é duplicado', async ({ assert }) => {
+    outroServidor = { id: 77, mes: 2, ano: 2026, status: 'PROCESSANDO' }
+
+    const { processamento, situacao } = await fechamentoPeriodoService.iniciar(MUNICIPIO, 3, 2026)
+
+    assert.equal(situacao, 'EM_ANDAMENTO')
+    assert.equal(processamento.id, 77)
+    assert.isFalse(servico.execucoes.has(MUNICIPIO))
+  })
+})